@@ -7,7 +7,7 @@ from datetime import datetime
 
 # 1. IMPORT TỪ FACTORY VÀ UTILS
 from factory import create_app
-from utils import login_required, get_user_ip, record_activity # [FIX] Import get_user_ip từ utils
+from utils import login_required, get_user_ip, record_activity, stamp_credential_version, bump_credential_version # [FIX] Import get_user_ip từ utils
 
 # 2. KHỞI TẠO APP TỪ NHÀ MÁY
 app = create_app()
@@ -176,6 +176,7 @@ def login():
             session['chuc_vu'] = str(user.get('CHUC VU') or '').strip().upper()
             
             session['security_hash'] = user.get('PASSWORD')
+            session['cred_ver'] = stamp_credential_version(user.get('USERCODE'))
 
             # Tải quyền hạn
             if user_role == config.ROLE_ADMIN:
@@ -259,6 +260,9 @@ def change_password():
                 update_query = f"UPDATE {config.TEN_BANG_NGUOI_DUNG} SET [PASSWORD] = ? WHERE USERCODE = ?"
                 
                 if app.db_manager.execute_non_query(update_query, (new_password, user_code)):
+                    # Đăng xuất mọi phiên khác; phiên hiện tại đóng dấu phiên bản + mật khẩu mới để giữ đăng nhập
+                    session['cred_ver'] = bump_credential_version(user_code)
+                    session['security_hash'] = new_password
                     app.db_manager.write_audit_log(
                         user_code=user_code, 
                         action_type='CHANGE_PASSWORD', 
@@ -1,6 +1,7 @@
 # services/ar_aging_service.py
 # (ĐÃ CẬP NHẬT: Thêm ReDueDays và TotalOverdueDebt)
 
+from flask import current_app
 from db_manager import DBManager, safe_float
 from datetime import datetime
 import config
@@ -107,36 +108,44 @@ class ARAgingService:
         object_id_param = customer_id
         
         # 3. Gọi SP (Thêm tham số CurrentYear)
-        sp_results = self.db.execute_sp_multi(config.SP_AR_AGING_DETAIL, 
-            (salesman_param, object_id_param, current_year)
-        )
-        
-        data = sp_results[0] if sp_results and len(sp_results) > 0 else []
+        # Đọc theo lô (iter_sp_multi): lọc + định dạng từng lô, chỉ giữ lại các dòng khớp
+        customer_name_lower = customer_name.lower() if customer_name else None
+        data = []
 
-        # 4. Lọc Tên Khách hàng ở Python (nếu cần)
-        if customer_name:
-            data = [
-                row for row in data 
-                if customer_name.lower() in row.get('ShortObjectName', '').lower()
-            ]
+        try:
+            for result_index, batch in self.db.iter_sp_multi(config.SP_AR_AGING_DETAIL, 
+                (salesman_param, object_id_param, current_year)
+            ):
+                # Chỉ dùng Result Set đầu tiên
+                if result_index > 0:
+                    break
 
-        # 5. Định dạng dữ liệu (Đã thay đổi tên cột)
-        for row in data:
-            # RemainingBalance là cột trung gian tổng giá trị chưa thanh toán
-            row['RemainingBalance'] = safe_float(row.get('RemainingBalance'))
-            row['Debt_In_Term'] = safe_float(row.get('Debt_In_Term'))
-            row['Debt_Total_Overdue'] = safe_float(row.get('Debt_Total_Overdue'))
-            row['TotalInvoiceAmount'] = safe_float(row.get('TotalInvoiceAmount'))
-            
-            # Định dạng ngày
-            for key in ['VoucherDate', 'DueDate']:
-                if row.get(key):
-                    try:
-                        row[key] = row[key].strftime('%d/%m/%Y')
-                    except AttributeError:
-                        pass
-                        
-            row['OverdueDays'] = int(max(0, safe_float(row.get('OverdueDays'))))
+                for row in batch:
+                    # 4. Lọc Tên Khách hàng ở Python (nếu cần)
+                    if customer_name_lower and customer_name_lower not in row.get('ShortObjectName', '').lower():
+                        continue
+
+                    # 5. Định dạng dữ liệu (Đã thay đổi tên cột)
+                    # RemainingBalance là cột trung gian tổng giá trị chưa thanh toán
+                    row['RemainingBalance'] = safe_float(row.get('RemainingBalance'))
+                    row['Debt_In_Term'] = safe_float(row.get('Debt_In_Term'))
+                    row['Debt_Total_Overdue'] = safe_float(row.get('Debt_Total_Overdue'))
+                    row['TotalInvoiceAmount'] = safe_float(row.get('TotalInvoiceAmount'))
+                
+                    # Định dạng ngày
+                    for key in ['VoucherDate', 'DueDate']:
+                        if row.get(key):
+                            try:
+                                row[key] = row[key].strftime('%d/%m/%Y')
+                            except AttributeError:
+                                pass
+                            
+                    row['OverdueDays'] = int(max(0, safe_float(row.get('OverdueDays'))))
+                    data.append(row)
+        except Exception as e:
+            # Lỗi giữa chừng -> trả rỗng thay vì danh sách thiếu dòng
+            current_app.logger.error(f"Lỗi SP AR Aging Detail: {e}")
+            return []
                 
         return data
     # Thêm phương thức này vào class ARAgingService
@@ -0,0 +1,68 @@
+# background_refresh.py
+# --- NẠP LẠI ẢNH CHỤP / CHỈ MỤC TRONG RAM Ở LUỒNG NỀN (DÙNG CHUNG) ---
+#
+# Dùng cho StockSnapshot, InventoryAgingSnapshot, CrossSellMatrixCache, CustomerNameIndex,
+# InventorySearchIndex, KnowledgeIndex:
+#   - Tối đa 1 luồng nạp cùng lúc: cờ đang chạy chỉ đọc/ghi trong lock (kể cả lúc luồng kết thúc).
+#   - check(built_at): chưa có / quá refresh_seconds / bị đánh dấu cũ -> kích hoạt nạp nền (không chờ);
+#     trả về ảnh chụp hiện tại còn dùng được không (chưa quá max_age_seconds).
+#   - Lỗi khi nạp -> ghi log, giữ ảnh chụp cũ (hàm nạp chỉ thay nguyên khối khi thành công).
+
+import time
+import threading
+from flask import current_app
+
+
+class BackgroundRefresher:
+    """Chạy hàm `refresh` ở luồng nền `name`, không chồng luồng; log lỗi với tiền tố `label`."""
+
+    def __init__(self, refresh, name, label, refresh_seconds, max_age_seconds=None):
+        self.refresh = refresh
+        self.name = name
+        self.label = label
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds # None -> ảnh chụp cũ vẫn dùng được (chỉ nạp lại ở nền)
+        self._lock = threading.Lock()
+        self._running = False
+
+    def is_running(self):
+        with self._lock:
+            return self._running
+
+    def trigger(self):
+        """Bắt đầu nạp ở nền nếu chưa có luồng nào đang chạy. Trả về True nếu đã tạo luồng mới."""
+        app = current_app._get_current_object()
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+
+        def _run():
+            with app.app_context():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    app.logger.error(f"{self.label}: {e}")
+                finally:
+                    with self._lock:
+                        self._running = False
+
+        try:
+            threading.Thread(target=_run, name=self.name, daemon=True).start()
+        except Exception:
+            with self._lock:
+                self._running = False
+            raise
+        return True
+
+    def check(self, built_at, stale=False):
+        """
+        built_at: time.time() lúc nạp xong ảnh chụp hiện tại (None / 0 = chưa có).
+        Kích hoạt nạp nền khi cần; trả về True nếu ảnh chụp hiện tại còn dùng được.
+        """
+        age = time.time() - built_at if built_at else None
+        if age is None or stale or age > self.refresh_seconds:
+            self.trigger()
+        if age is None:
+            return False
+        return self.max_age_seconds is None or age <= self.max_age_seconds
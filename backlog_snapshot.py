@@ -0,0 +1,151 @@
+# backlog_snapshot.py
+# --- ẢNH CHỤP SALES BACKLOG YTD DÙNG CHUNG (SalesService KPI + kpi_bp realtime_dashboard) ---
+#
+# Thay cho việc mỗi lần cache KPI / realtime hết hạn lại gọi Titan_Get_SalesBacklog (từ 01/01 -> hôm nay),
+# kéo toàn bộ dòng chi tiết về chỉ để cộng GiaTriDonHang theo NVKD:
+#   - Gọi SP 1 lần cho TOÀN BỘ NVKD (không lọc), mỗi BACKLOG_SNAPSHOT_TTL giây; chỉ giữ lại tổng đã gom:
+#       tổng chung, theo NVKD (SalesManID), theo khách hàng -> (Giá trị PO, Đã giao chưa HĐ, Số đơn).
+#   - Nơi gọi lọc 1 NVKD hay lấy tất cả đều đọc cùng 1 ảnh chụp (tra dict).
+#   - Nhiều request cùng lúc khi hết hạn -> chỉ 1 luồng gọi SP, các luồng khác chờ và dùng kết quả đó.
+#   - Bộ đếm trong Redis: số lần phục vụ từ ảnh chụp (= số lần tính lại backlog tránh được) / số lần tính lại.
+
+import time
+import threading
+from datetime import datetime
+from flask import current_app
+from db_manager import safe_float
+import config
+
+_STATS_KEY = 'backlog_snapshot_stats'
+
+
+def _salesman_key(value):
+    """SalesManID / EmployeeID chuẩn hóa như khi gán PO tồn vào KPI (strip + upper)."""
+    return str(value or '').strip().upper()
+
+
+class BacklogTotals:
+    """Tổng backlog YTD đã gom: tổng chung + theo NVKD + theo khách (Giá trị PO, Đã giao chưa HĐ, Số đơn)."""
+
+    def __init__(self, rows, as_of):
+        self.as_of = as_of
+        by_salesman, by_customer = {}, {}
+        all_orders = set()
+        total = shipped = 0.0
+        for row in rows:
+            value = safe_float(row.get('GiaTriDonHang'))
+            shipped_value = safe_float(row.get('GiaTriDaGiao_ChuaHD'))
+            order_id = row.get('OrderID')
+            total += value
+            shipped += shipped_value
+            all_orders.add(order_id)
+
+            customer = str(row.get('ObjectID') or row.get('ClientName') or '').strip()
+            for bucket, key in ((by_salesman, _salesman_key(row.get('SalesManID'))), (by_customer, customer)):
+                acc = bucket.get(key)
+                if acc is None:
+                    acc = bucket[key] = [0.0, 0.0, set()]
+                acc[0] += value
+                acc[1] += shipped_value
+                acc[2].add(order_id)
+
+        # Chỉ giữ tuple tổng (bỏ dòng chi tiết + tập OrderID)
+        self.overall = (total, shipped, len(all_orders))
+        self.by_salesman = {k: (v[0], v[1], len(v[2])) for k, v in by_salesman.items()}
+        self.by_customer = {k: (v[0], v[1], len(v[2])) for k, v in by_customer.items()}
+        self.row_count = len(rows)
+
+    @staticmethod
+    def _summary(totals):
+        total, shipped, count = totals
+        # Chưa Giao = Tổng - Đã Giao (giống get_sales_backlog)
+        return {'total_backlog': total, 'shipped_uninvoiced': shipped, 'pending_delivery': total - shipped, 'count': count}
+
+    def summary(self, salesman_id=None):
+        """Summary giống get_sales_backlog(...)['summary']; salesman_id rỗng/None -> toàn bộ NVKD."""
+        if not salesman_id:
+            return self._summary(self.overall)
+        return self._summary(self.by_salesman.get(_salesman_key(salesman_id), (0.0, 0.0, 0)))
+
+    def salesman_totals(self):
+        """{SalesManID: Tổng GiaTriDonHang} (PO tồn theo NVKD)."""
+        return {k: v[0] for k, v in self.by_salesman.items() if k}
+
+    def customer_totals(self):
+        """{ObjectID/Tên KH: summary} theo khách hàng."""
+        return {k: self._summary(v) for k, v in self.by_customer.items()}
+
+
+class SalesBacklogSnapshot:
+    """Ảnh chụp BacklogTotals YTD năm hiện tại, tính lại tối đa 1 lần mỗi BACKLOG_SNAPSHOT_TTL giây."""
+
+    def __init__(self, db_manager, ttl_seconds=None):
+        self.db = db_manager
+        self.ttl_seconds = ttl_seconds or config.BACKLOG_SNAPSHOT_TTL
+        self._lock = threading.Lock()
+        self._state = None # (khoảng ngày (from, to), BacklogTotals, built_ts)
+
+    @staticmethod
+    def _ytd_range():
+        today = datetime.now()
+        return f"{today.year}-01-01", today.strftime('%Y-%m-%d')
+
+    def _fresh(self, state, date_range):
+        return state is not None and state[0] == date_range and time.time() - state[2] <= self.ttl_seconds
+
+    def _count(self, field):
+        try:
+            current_app.redis_client.hincrby(_STATS_KEY, field, 1)
+        except Exception:
+            pass
+
+    def get(self):
+        """BacklogTotals YTD (tính lại nếu hết hạn / sang ngày mới). Lỗi SP -> None (nơi gọi dùng get_sales_backlog)."""
+        date_range = self._ytd_range()
+        state = self._state
+        if self._fresh(state, date_range):
+            self._count('served')
+            return state[1]
+
+        with self._lock:
+            state = self._state
+            if self._fresh(state, date_range): # Luồng khác vừa tính xong trong lúc chờ khóa
+                self._count('served')
+                return state[1]
+            start = time.perf_counter()
+            try:
+                rows = self.db.fetch_data("EXEC Titan_Get_SalesBacklog ?, ?, ?", date_range + (None,))
+            except Exception as e:
+                current_app.logger.error(f"BacklogSnapshot: lỗi gọi Titan_Get_SalesBacklog: {e}")
+                return None
+            totals = BacklogTotals(rows, datetime.now())
+            self._state = (date_range, totals, time.time())
+            self._count('recomputed')
+            current_app.logger.info(
+                f"BacklogSnapshot: {totals.row_count:,} dòng, {len(totals.by_salesman)} NVKD, "
+                f"{len(totals.by_customer)} KH trong {time.perf_counter() - start:.1f}s"
+            )
+            return totals
+
+    def invalidate(self):
+        self._state = None
+
+    @staticmethod
+    def get_stats():
+        """{'served', 'recomputed', 'avoided_rate'}: served = số lần tính lại backlog đã tránh được."""
+        try:
+            raw = current_app.redis_client.hgetall(_STATS_KEY) or {}
+        except Exception as e:
+            current_app.logger.error(f"Lỗi đọc thống kê backlog snapshot: {e}")
+            return {}
+        served, recomputed = int(raw.get('served', 0)), int(raw.get('recomputed', 0))
+        total = served + recomputed
+        return {'served': served, 'recomputed': recomputed,
+                'avoided_rate': round(served / total * 100, 1) if total else 0}
+
+    @staticmethod
+    def reset_stats():
+        try:
+            current_app.redis_client.delete(_STATS_KEY)
+        except Exception as e:
+            current_app.logger.error(f"Lỗi reset thống kê backlog snapshot: {e}")
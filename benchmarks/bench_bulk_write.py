@@ -0,0 +1,115 @@
+# benchmarks/bench_bulk_write.py
+# --- SO SÁNH GHI TỪNG DÒNG (execute_non_query) VÀ GHI HÀNG LOẠT (bulk_transaction) ---
+# Chạy: python benchmarks/bench_bulk_write.py [số_user] [rtt_ms]
+# Không cần SQL Server: Pool giả lập độ trễ mạng (RTT) cho mỗi round trip
+# (execute, 1 lô executemany với fast_executemany, commit, mượn kết nối từ Pool).
+# Kịch bản giống distribute_daily_questions: 3 câu ghi cho mỗi user.
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+from db_manager import DBManager
+
+
+class Stats:
+    def __init__(self, rtt_ms):
+        self.rtt = rtt_ms / 1000.0
+        self.round_trips = 0
+
+    def trip(self):
+        self.round_trips += 1
+        time.sleep(self.rtt)
+
+
+class FakeCursor:
+    def __init__(self, stats):
+        self.stats = stats
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        self.stats.trip()
+
+    def executemany(self, sql, rows):
+        if self.fast_executemany:
+            self.stats.trip() # Cả lô tham số trong 1 round trip
+        else:
+            for _ in rows:
+                self.stats.trip()
+
+
+class FakeConnection:
+    def __init__(self, stats):
+        self.stats = stats
+        stats.trip() # Reset/ping kết nối khi mượn từ Pool
+
+    def cursor(self):
+        return FakeCursor(self.stats)
+
+    def commit(self):
+        self.stats.trip()
+
+    def rollback(self):
+        self.stats.trip()
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def raw_connection(self):
+        return FakeConnection(self.stats)
+
+
+def make_db(stats):
+    db = DBManager.__new__(DBManager) # Bỏ qua create_engine thật
+    db.engine = FakeEngine(stats)
+    db.profiler = None
+    return db
+
+
+SQL_EXPIRE = "UPDATE TRAINING_DAILY_SESSION SET Status='EXPIRED' WHERE UserCode=? AND Status='PENDING'"
+SQL_SESSION = "INSERT INTO TRAINING_DAILY_SESSION (UserCode, QuestionID, Status, ExpiredAt) VALUES (?, ?, 'PENDING', ?)"
+SQL_MAIL = "INSERT INTO TitanOS_Game_Mailbox (UserCode, Title, Content, CreatedTime, IsClaimed) VALUES (?, ?, ?, GETDATE(), 0)"
+
+
+def run_row_by_row(db, users):
+    expired_at = datetime.now() + timedelta(minutes=15)
+    for idx, user_code in enumerate(users):
+        db.execute_non_query(SQL_EXPIRE, (user_code,))
+        db.execute_non_query(SQL_SESSION, (user_code, idx % 3, expired_at))
+        db.execute_non_query(SQL_MAIL, (user_code, 'title', 'content'))
+
+
+def run_bulk(db, users):
+    expired_at = datetime.now() + timedelta(minutes=15)
+    db.bulk_transaction([
+        (SQL_EXPIRE, [(u,) for u in users]),
+        (SQL_SESSION, [(u, idx % 3, expired_at) for idx, u in enumerate(users)]),
+        (SQL_MAIL, [(u, 'title', 'content') for u in users]),
+    ])
+
+
+def measure(label, fn, n_users, rtt_ms):
+    stats = Stats(rtt_ms)
+    db = make_db(stats)
+    users = [f"KD{i:03d}" for i in range(n_users)]
+    t0 = time.perf_counter()
+    fn(db, users)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<32} | round trips: {stats.round_trips:>6,} | wall: {elapsed:7.2f}s")
+
+
+if __name__ == '__main__':
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    print(f"--- distribute_daily_questions: {n_users} user, RTT giả lập {rtt_ms}ms ---")
+    measure("Trước: execute_non_query x3/user", run_row_by_row, n_users, rtt_ms)
+    measure("Sau: bulk_transaction", run_bulk, n_users, rtt_ms)
@@ -0,0 +1,207 @@
+# benchmarks/bench_client_details.py
+# --- SO SÁNH TRANG sales_detail/<NVKD>: 4 TRUY VẤN RTRIM(...) = ? VÀ 1 TRUY VẤN SET-BASED SARGABLE ---
+# Chạy: python benchmarks/bench_client_details.py [số_dòng_GT9000] [rtt_ms]
+# Không cần SQL Server: sqlite trong bộ nhớ với bảng / index giống ghi chú migration trong
+# sp_GetSalesmanClientDetails.sql, cộng RTT giả lập cho mỗi round trip.
+#   - Trước: 4 câu riêng (Tổng DS đăng ký, Doanh số theo KH, DS đăng ký theo KH, PO chờ giao), điều kiện
+#     RTRIM(cột) = ? (không seek được index), DISTINCT orderID trên toàn bộ GT9000, ghép dict trong Python.
+#   - Sau: 1 câu set-based (như SP), cột = ? (seek index), NOT EXISTS theo từng đơn.
+# In kế hoạch truy vấn (SCAN / SEARCH) và độ trễ trung bình mỗi lần mở trang; 2 cách phải ra cùng kết quả.
+
+import sys
+import time
+import random
+import sqlite3
+from datetime import date, timedelta
+
+YEAR = 2026
+MONTH = 10
+TODAY = date(YEAR, MONTH, 18)
+ORDER_FROM = (TODAY - timedelta(days=365)).isoformat()
+
+SCHEMA = """
+CREATE TABLE GT9000 (SalesManID TEXT, ObjectID TEXT, TranYear INT, TranMonth INT, DebitAccountID TEXT,
+                     CreditAccountID TEXT, VoucherNo TEXT, VoucherTypeID TEXT, OrderID TEXT, ConvertedAmount REAL);
+CREATE TABLE IT1202 (ObjectID TEXT PRIMARY KEY, ShortObjectName TEXT);
+CREATE TABLE DTCL ([PHU TRACH DS] TEXT, [MA KH] TEXT, Nam INT, DK REAL);
+CREATE TABLE OT2001 (SOrderID TEXT, SalesManID TEXT, ObjectID TEXT, OrderStatus INT, OrderDate TEXT, SaleAmount REAL);
+
+CREATE INDEX IX_GT9000_SalesMan_TranYear ON GT9000 (SalesManID, TranYear, DebitAccountID, CreditAccountID,
+                                                    TranMonth, ObjectID, VoucherNo, ConvertedAmount);
+CREATE INDEX IX_GT9000_OrderID_VoucherType ON GT9000 (OrderID, VoucherTypeID);
+CREATE INDEX IX_DTCL_PhuTrachDS_Nam ON DTCL ([PHU TRACH DS], Nam, [MA KH], DK);
+CREATE INDEX IX_OT2001_SalesMan_Status_Date ON OT2001 (SalesManID, OrderStatus, OrderDate, SOrderID, ObjectID, SaleAmount);
+"""
+
+# --- TRƯỚC: 4 câu riêng (giống _client_detail_rows_legacy trước khi bỏ RTRIM) ---
+OLD_TOTAL = "SELECT SUM(IFNULL(DK, 0)) AS TotalRegisteredSalesRaw FROM DTCL WHERE RTRIM([PHU TRACH DS]) = ? AND Nam = ?"
+OLD_SALES = """
+    SELECT RTRIM(T1.ObjectID) AS ClientID, T4.ShortObjectName AS ClientName,
+           SUM(CASE WHEN T1.TranYear = ? THEN T1.ConvertedAmount ELSE 0 END) AS TotalSalesAmount,
+           SUM(CASE WHEN T1.TranMonth = ? AND T1.TranYear = ? THEN T1.ConvertedAmount ELSE 0 END) AS CurrentMonthSales,
+           COUNT(DISTINCT T1.VoucherNo) AS TotalOrders
+    FROM GT9000 AS T1 LEFT JOIN IT1202 AS T4 ON T1.ObjectID = T4.ObjectID
+    WHERE RTRIM(T1.SalesManID) = ? AND T1.DebitAccountID = '13111' AND T1.CreditAccountID LIKE '511%'
+          AND T1.TranYear >= ?
+    GROUP BY RTRIM(T1.ObjectID), T4.ShortObjectName
+"""
+OLD_REGISTERED = """
+    SELECT RTRIM(T1.[MA KH]) AS ClientID, SUM(IFNULL(T1.DK, 0)) AS RegisteredSales
+    FROM DTCL AS T1 WHERE RTRIM(T1.[PHU TRACH DS]) = ? AND T1.Nam = ? GROUP BY RTRIM(T1.[MA KH])
+"""
+OLD_PENDING = """
+    SELECT RTRIM(T1.ObjectID) AS ClientID, SUM(T1.SaleAmount) AS PendingOrdersAmount
+    FROM OT2001 AS T1
+    LEFT JOIN (SELECT DISTINCT G.OrderID FROM GT9000 AS G WHERE G.VoucherTypeID = 'BH') AS Delivered
+           ON T1.SOrderID = Delivered.OrderID
+    WHERE RTRIM(T1.SalesManID) = ? AND T1.OrderStatus = 1 AND Delivered.OrderID IS NULL AND T1.OrderDate >= ?
+    GROUP BY RTRIM(T1.ObjectID)
+"""
+
+# --- SAU: 1 câu set-based (giống sp_GetSalesmanClientDetails, FULL OUTER JOIN thay bằng tập khóa UNION) ---
+NEW_SET_BASED = """
+    WITH Sales AS (
+        SELECT T1.ObjectID AS ClientID, T4.ShortObjectName AS ClientName,
+               SUM(CASE WHEN T1.TranYear = :year THEN T1.ConvertedAmount ELSE 0 END) AS TotalSalesAmount,
+               SUM(CASE WHEN T1.TranMonth = :month AND T1.TranYear = :year THEN T1.ConvertedAmount ELSE 0 END) AS CurrentMonthSales,
+               COUNT(DISTINCT T1.VoucherNo) AS TotalOrders
+        FROM GT9000 AS T1 LEFT JOIN IT1202 AS T4 ON T1.ObjectID = T4.ObjectID
+        WHERE T1.SalesManID = :sm AND T1.DebitAccountID = '13111' AND T1.CreditAccountID LIKE '511%'
+              AND T1.TranYear >= :year - 1
+        GROUP BY T1.ObjectID, T4.ShortObjectName
+    ),
+    Registered AS (
+        SELECT [MA KH] AS ClientID, SUM(IFNULL(DK, 0)) AS RegisteredSales
+        FROM DTCL WHERE [PHU TRACH DS] = :sm AND Nam = :year GROUP BY [MA KH]
+    ),
+    Pending AS (
+        SELECT T1.ObjectID AS ClientID, SUM(T1.SaleAmount) AS PendingOrdersAmount
+        FROM OT2001 AS T1
+        WHERE T1.SalesManID = :sm AND T1.OrderStatus = 1 AND T1.OrderDate >= :order_from
+              AND NOT EXISTS (SELECT 1 FROM GT9000 AS G WHERE G.OrderID = T1.SOrderID AND G.VoucherTypeID = 'BH')
+        GROUP BY T1.ObjectID
+    ),
+    Clients AS (SELECT ClientID FROM Sales UNION SELECT ClientID FROM Registered UNION SELECT ClientID FROM Pending)
+    SELECT C.ClientID, S.ClientName,
+           IFNULL(S.TotalSalesAmount, 0) AS TotalSalesAmount, IFNULL(S.CurrentMonthSales, 0) AS CurrentMonthSales,
+           IFNULL(S.TotalOrders, 0) AS TotalOrders,
+           CASE WHEN S.ClientID IS NOT NULL OR R.RegisteredSales > 0 THEN IFNULL(R.RegisteredSales, 0) ELSE 0 END AS RegisteredSales,
+           IFNULL(P.PendingOrdersAmount, 0) AS PendingOrdersAmount,
+           IFNULL((SELECT SUM(RegisteredSales) FROM Registered), 0) AS TotalRegisteredSalesRaw
+    FROM Clients AS C
+    LEFT JOIN Sales AS S ON S.ClientID = C.ClientID
+    LEFT JOIN Registered AS R ON R.ClientID = C.ClientID
+    LEFT JOIN Pending AS P ON P.ClientID = C.ClientID
+    WHERE S.ClientID IS NOT NULL OR R.RegisteredSales > 0 OR P.PendingOrdersAmount > 0
+"""
+
+
+def build_db(n_ledger, n_salesmen=40, n_clients=3000, seed=7):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    salesmen = [f"KD{i:03d}" for i in range(n_salesmen)]
+    clients = [f"KH{i:05d}" for i in range(n_clients)]
+    owner = {c: rnd.choice(salesmen) for c in clients}
+
+    conn.executemany("INSERT INTO IT1202 VALUES (?, ?)", [(c, f"Khách hàng {c}") for c in clients])
+    ledger = []
+    for i in range(n_ledger):
+        client = rnd.choice(clients)
+        is_sale = rnd.random() < 0.35 # Phần còn lại: bút toán khác (thu tiền, giá vốn...)
+        ledger.append((
+            owner[client], client, rnd.choice((YEAR - 2, YEAR - 1, YEAR)), rnd.randint(1, 12),
+            '13111' if is_sale else rnd.choice(('1111', '632', '331')),
+            rnd.choice(('5111', '5112')) if is_sale else '13111',
+            f"HD{i // 3:07d}", 'BH' if rnd.random() < 0.5 else 'TT', f"DH{rnd.randint(0, n_ledger // 4):07d}",
+            round(rnd.uniform(1e6, 5e8), 0)
+        ))
+    conn.executemany("INSERT INTO GT9000 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", ledger)
+    conn.executemany("INSERT INTO DTCL VALUES (?, ?, ?, ?)", [
+        (owner[c], c, rnd.choice((YEAR - 1, YEAR)), rnd.choice((0, 0, 1e8, 5e8, 2e9))) for c in clients
+    ])
+    conn.executemany("INSERT INTO OT2001 VALUES (?, ?, ?, ?, ?, ?)", [
+        (f"DH{i:07d}", owner[c], c, rnd.choice((0, 1, 1)), (TODAY - timedelta(days=rnd.randint(0, 500))).isoformat(),
+         round(rnd.uniform(1e6, 2e8), 0))
+        for i, c in enumerate(rnd.choice(clients) for _ in range(n_ledger // 10))
+    ])
+    conn.execute("ANALYZE")
+    return conn, salesmen
+
+
+def plan(conn, sql, params):
+    """Các bước SCAN / SEARCH trong kế hoạch truy vấn (bỏ bước phụ như temp B-tree)."""
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [r['detail'] for r in rows if r['detail'].startswith(('SCAN', 'SEARCH'))]
+
+
+def query(conn, rtt, sql, params):
+    time.sleep(rtt) # 1 round trip
+    return [dict(r) for r in conn.execute(sql, params).fetchall()]
+
+
+def run_old(conn, rtt, salesman):
+    total = query(conn, rtt, OLD_TOTAL, (salesman, YEAR))
+    client_dict = {}
+    for row in query(conn, rtt, OLD_SALES, (YEAR, MONTH, YEAR, salesman, YEAR - 1)):
+        client_dict[row['ClientID']] = dict(row, RegisteredSales=0.0, PendingOrdersAmount=0.0)
+    blank = {'ClientName': None, 'TotalSalesAmount': 0.0, 'CurrentMonthSales': 0.0, 'TotalOrders': 0,
+             'RegisteredSales': 0.0, 'PendingOrdersAmount': 0.0}
+    for field, sql, params in (('RegisteredSales', OLD_REGISTERED, (salesman, YEAR)),
+                               ('PendingOrdersAmount', OLD_PENDING, (salesman, ORDER_FROM))):
+        for row in query(conn, rtt, sql, params):
+            value = row[field] or 0.0
+            if row['ClientID'] in client_dict:
+                client_dict[row['ClientID']][field] = value
+            elif value > 0:
+                client_dict[row['ClientID']] = dict(blank, ClientID=row['ClientID'], **{field: value})
+    return client_dict, total[0]['TotalRegisteredSalesRaw'] or 0.0
+
+
+def new_params(salesman):
+    return {'sm': salesman, 'year': YEAR, 'month': MONTH, 'order_from': ORDER_FROM}
+
+
+def run_new(conn, rtt, salesman):
+    rows = query(conn, rtt, NEW_SET_BASED, new_params(salesman))
+    total = rows[0]['TotalRegisteredSalesRaw'] if rows else 0.0
+    return {r.pop('ClientID'): r for r in rows}, total
+
+
+def normalize(result):
+    client_dict, total = result
+    keys = ('TotalSalesAmount', 'CurrentMonthSales', 'TotalOrders', 'RegisteredSales', 'PendingOrdersAmount')
+    return {c: tuple(round(float(row[k] or 0), 2) for k in keys) for c, row in client_dict.items()}, round(total or 0, 2)
+
+
+def measure(label, fn, conn, rtt, salesmen):
+    t0 = time.perf_counter()
+    results = [fn(conn, rtt, s) for s in salesmen]
+    elapsed = (time.perf_counter() - t0) / len(salesmen) * 1000
+    print(f"{label:<36} | {elapsed:8.2f} ms / lần mở trang")
+    return results
+
+
+if __name__ == '__main__':
+    n_ledger = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    conn, salesmen = build_db(n_ledger)
+    print(f"--- sales_detail/<NVKD>: GT9000 {n_ledger:,} dòng, {len(salesmen)} NVKD, RTT giả lập {rtt_ms}ms ---")
+
+    sample = salesmen[0]
+    print("Kế hoạch truy vấn - Trước:")
+    for name, sql, params in (('Tổng DS đăng ký', OLD_TOTAL, (sample, YEAR)),
+                              ('Doanh số theo KH', OLD_SALES, (YEAR, MONTH, YEAR, sample, YEAR - 1)),
+                              ('DS đăng ký theo KH', OLD_REGISTERED, (sample, YEAR)),
+                              ('PO chờ giao', OLD_PENDING, (sample, ORDER_FROM))):
+        print(f"  {name:<20} {'; '.join(plan(conn, sql, params))}")
+    print("Kế hoạch truy vấn - Sau (1 câu):")
+    for step in plan(conn, NEW_SET_BASED, new_params(sample)):
+        print(f"  {step}")
+
+    rtt = rtt_ms / 1000.0
+    old = measure("Trước: 4 câu RTRIM + ghép Python", run_old, conn, rtt, salesmen)
+    new = measure("Sau: 1 câu set-based sargable", run_new, conn, rtt, salesmen)
+    assert [normalize(r) for r in old] == [normalize(r) for r in new], "Kết quả 2 cách khác nhau"
+    print(f"Kết quả khớp cho {len(salesmen)} NVKD.")
@@ -0,0 +1,79 @@
+# benchmarks/bench_customer_resolver.py
+# --- ĐỘ TRỄ TÌM KHÁCH HÀNG: CHỈ MỤC customer_index.py (p50/p95) SO VỚI QUÉT LIKE '%x%' ---
+# Chạy: python benchmarks/bench_customer_resolver.py [số_khách_hàng]
+# Không cần SQL Server: dữ liệu IT1202 giả lập; đường LIKE được mô phỏng bằng quét toàn bộ (cận dưới của đường cũ,
+# chưa tính round trip). Mục tiêu: p95 < 5 ms cho toàn bộ bảng khách hàng.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+from customer_index import CustomerNameIndex
+
+PREFIX = ['Công ty TNHH', 'Công ty CP', 'DNTN', 'Công ty TNHH MTV', 'Tập đoàn']
+WORDS = ['Hoa Sen', 'Thép', 'Việt Nhật', 'Đông Á', 'Phú Mỹ', 'Bình Minh', 'Sài Gòn', 'Hòa Phát', 'Nhựa', 'Xi Măng',
+         'Cơ Khí', 'Điện Lực', 'Thủy Sản', 'Giấy', 'Bao Bì', 'Đường', 'Mía', 'Hóa Chất', 'Năng Lượng', 'Tân Cảng']
+SUFFIX = ['Group', 'Miền Nam', 'Long An', 'Bình Dương', 'Đồng Nai', 'Hà Nội', '', '', '']
+
+QUERIES = ['hoa sen', 'Hoa Sen', 'hòa phát', 'thep viet nhat', 'KH0123', 'dong a binh', 'sai gon', 'x', 'nhựa đn',
+           'tap doan nang luong', 'cty', 'giay bao bi dong nai', 'ximang']
+
+
+def make_records(n, seed=11):
+    rnd = random.Random(seed)
+    records = {}
+    for i in range(n):
+        core = ' '.join(rnd.sample(WORDS, rnd.randint(1, 3)))
+        short = f"{core} {rnd.choice(SUFFIX)}".strip()
+        obj_id = f"KH{i:05d}"
+        records[obj_id] = {
+            'ID': obj_id, 'FullName': short, 'ObjectName': f"{rnd.choice(PREFIX)} {short}",
+            'Address': f"{rnd.randint(1, 999)} Đường số {rnd.randint(1, 50)}",
+        }
+    return records
+
+
+def like_scan(rows, text):
+    needle = text.lower()
+    hits = [r for r in rows if needle in r[0] or needle in r[1] or needle in r[2]]
+    return sorted(hits, key=lambda r: r[1])[:5]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    records = make_records(n)
+    lowered = [(r['ID'].lower(), r['FullName'].lower(), r['ObjectName'].lower()) for r in records.values()]
+
+    index = CustomerNameIndex(db_manager=None, refresh_seconds=10 ** 9, full_reload_seconds=10 ** 9)
+    t0 = time.perf_counter()
+    index.build(records)
+    print(f"--- Chỉ mục {n:,} khách hàng: dựng trong {time.perf_counter() - t0:.2f}s ---")
+    print(f"{'Từ khóa':<24} | {'LIKE scan':>9} | {'Chỉ mục':>8} | {'KQ LIKE':>7} | Kết quả đầu (chỉ mục)")
+
+    all_samples = []
+    for text in QUERIES:
+        t0 = time.perf_counter()
+        like_res = like_scan(lowered, text)
+        like_ms = (time.perf_counter() - t0) * 1000
+
+        samples = []
+        for _ in range(50):
+            t0 = time.perf_counter()
+            result = index.search(text)
+            samples.append((time.perf_counter() - t0) * 1000)
+        all_samples.extend(samples)
+        top = result[0]['FullName'] if result else '-'
+        print(f"{text:<24} | {like_ms:7.2f}ms | {percentile(samples, 0.5):6.2f}ms | {len(like_res):>7} | {top}")
+
+    p95 = percentile(all_samples, 0.95)
+    print(f"\nChỉ mục: p50 {percentile(all_samples, 0.5):.2f} ms | p95 {p95:.2f} ms | max {max(all_samples):.2f} ms")
+    print("ĐẠT" if p95 < 5 else "CHƯA ĐẠT", "mục tiêu p95 < 5 ms")
@@ -0,0 +1,97 @@
+# benchmarks/bench_get_data.py
+# --- SO SÁNH TỐC ĐỘ DỰNG KẾT QUẢ CỦA DBManager.get_data ---
+# Chạy: python benchmarks/bench_get_data.py [số_dòng ...]
+# Không cần kết nối DB: dùng cursor giả lập pyodbc (kiểu cột giống GT9000 / AR aging detail).
+
+import os
+import sys
+import math
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+import pandas as pd
+from db_manager import clean_cell, records_from_cursor
+
+
+class FakeCursor:
+    """Giả lập cursor pyodbc: description (name, type_code, ...) + fetchall() trả list tuple."""
+    def __init__(self, description, rows):
+        self.description = description
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+
+def build_cursor(n_rows):
+    description = [
+        ('VoucherNo', str), ('VoucherDate', datetime), ('ObjectID', str), ('ObjectName', str),
+        ('InventoryID', str), ('Quantity', int), ('ConvertedAmount', Decimal), ('DueDate', date),
+        ('Notes', str), ('IsPaid', bool),
+    ]
+    rows = []
+    for i in range(n_rows):
+        rows.append((
+            f"HD{i:08d}  ",
+            datetime(2024, 1 + i % 12, 1 + i % 28, 8, 30),
+            f"KH{i % 5000:05d}   ",
+            None if i % 17 == 0 else f"  Công ty TNHH {i % 5000}  ",
+            f"VT{i % 20000:06d}",
+            None if i % 101 == 0 else i % 250,
+            Decimal(f"{(i * 7919) % 10000000}.50"),
+            date(2024, 1 + i % 12, 1 + i % 28),
+            None,
+            i % 2 == 0,
+        ))
+    return description, rows
+
+
+def legacy_records(description, rows):
+    """Đường cũ: pd.read_sql (from_records + coerce_float) -> apply(clean_cell) -> to_dict."""
+    columns = [col[0] for col in description]
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for col in df.select_dtypes(include=['object']).columns:
+        df[col] = df[col].apply(clean_cell)
+    return df.to_dict('records')
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    if a is pd.NaT and b is pd.NaT:
+        return True
+    return a == b and type(a) is type(b)
+
+
+def assert_same(old, new):
+    assert len(old) == len(new), "Số dòng khác nhau!"
+    for row_old, row_new in zip(old, new):
+        assert row_old.keys() == row_new.keys(), "Tên cột khác nhau!"
+        for key in row_old:
+            assert _same(row_old[key], row_new[key]), f"Khác ở cột {key}: {row_old[key]!r} vs {row_new[key]!r}"
+
+
+def run(n_rows):
+    description, rows = build_cursor(n_rows)
+
+    t0 = time.perf_counter()
+    records_old = legacy_records(description, rows)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    records_new = records_from_cursor(FakeCursor(description, rows))
+    t_new = time.perf_counter() - t0
+
+    assert_same(records_old, records_new)
+    print(f"{n_rows:>10,} dòng | read_sql+apply+to_dict: {t_old:8.3f}s | records_from_cursor: {t_new:8.3f}s | x{t_old / max(t_new, 1e-9):5.1f}")
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print("--- Benchmark dựng kết quả get_data ---")
+    for n in sizes:
+        run(n)
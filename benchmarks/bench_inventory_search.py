@@ -0,0 +1,80 @@
+# benchmarks/bench_inventory_search.py
+# --- SO SÁNH CHỈ MỤC TRIGRAM (inventory_index.py) VỚI QUÉT LIKE '%x%' ---
+# Chạy: python benchmarks/bench_inventory_search.py [số_mã_hàng]
+# Không cần SQL Server: dữ liệu IT1302 giả lập; đường LIKE được mô phỏng bằng quét toàn bộ (giống Index Scan
+# của SQL Server với LIKE '%x%', chưa tính round trip và GROUP BY back-order) -> đây là cận dưới của đường cũ.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+from inventory_index import InventorySearchIndex
+
+BRANDS = ['SKF', 'NSK', 'FAG', 'NTN', 'KOYO', 'TIMKEN', 'INA', 'THK', 'HIWIN', 'GATES']
+KINDS = ['Vòng bi cầu', 'Vòng bi đũa', 'Gối đỡ', 'Dây curoa', 'Phớt chắn dầu', 'Bạc đạn', 'Mỡ bôi trơn', 'Ống lót']
+SUFFIX = ['2RS', 'ZZ', 'C3', 'E', 'TN9', 'NR', 'K', 'J']
+
+
+def make_rows(n, seed=7):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        brand = rnd.choice(BRANDS)
+        code = f"{rnd.randint(6000, 24000)}{rnd.choice(SUFFIX)}"
+        rows.append({
+            'InventoryID': f"{brand}-{code}-{i:05d}",
+            'InventoryName': f"{rnd.choice(KINDS)} {brand} {code} - Hàng nhập khẩu",
+        })
+    return rows
+
+
+def like_scan(lowered, terms, mode):
+    """Mô phỏng (InventoryID LIKE '%t%' OR InventoryName LIKE '%t%') AND/OR ... (không phân biệt hoa thường)."""
+    terms = [t.lower() for t in terms]
+    check = all if mode == 'AND' else any
+    return sorted(inv for inv, i, n in lowered if check(t in i or t in n for t in terms))
+
+
+QUERIES = [
+    (['skf', '6205'], 'AND'),
+    (['vòng bi', 'nsk'], 'AND'),
+    (['vong bi dua'], 'AND'),          # Không dấu (chỉ mục hỗ trợ, LIKE thì không)
+    (['62', '2rs'], 'AND'),            # Từ khóa ngắn -> quét tuyến tính trong chỉ mục
+    (['SKF-6205', 'NSK-6206', 'FAG-22210'], 'OR'),
+]
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - t0) / repeat * 1000, result
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+    rows = make_rows(n)
+    lowered = [(r['InventoryID'], r['InventoryID'].lower(), r['InventoryName'].lower()) for r in rows]
+
+    index = InventorySearchIndex(db_manager=None, refresh_seconds=10 ** 9)
+    t0 = time.perf_counter()
+    index.build(rows)
+    build_s = time.perf_counter() - t0
+
+    report = index.memory_report()
+    print(f"--- Chỉ mục {n:,} mã hàng: dựng trong {build_s:.2f}s ---")
+    print(f"Trigram: {report['trigrams']:,} | Postings: {report['postings']:,} | "
+          f"RAM ~{report['total_mb']} MB (ids {report['ids_bytes'] / 1048576:.1f} MB, "
+          f"chuỗi tìm {report['haystack_bytes'] / 1048576:.1f} MB, postings {report['postings_bytes'] / 1048576:.1f} MB)")
+    print()
+    print(f"{'Truy vấn':<38} | {'Kiểu':<4} | {'LIKE scan':>10} | {'Trigram':>9} | {'Kết quả':>8}")
+    for terms, mode in QUERIES:
+        like_ms, like_res = timed(lambda: like_scan(lowered, terms, mode), 3)
+        idx_ms, idx_res = timed(lambda: index.search(terms, mode), 20)
+        # Chỉ mục phải trả về ít nhất mọi kết quả của LIKE (thêm kết quả khớp không dấu)
+        assert set(like_res) <= set(idx_res), terms
+        print(f"{', '.join(terms):<38} | {mode:<4} | {like_ms:8.2f}ms | {idx_ms:7.2f}ms | {len(idx_res):>8,}")
@@ -0,0 +1,112 @@
+# benchmarks/bench_knowledge_search.py
+# --- CHẤT LƯỢNG + ĐỘ TRỄ TRA CỨU KIẾN THỨC: BM25 (knowledge_index.py) SO VỚI LIKE + ĐẾM CHUỖI CON (CŨ) ---
+# Chạy: python benchmarks/bench_knowledge_search.py [số_câu_hỏi]
+# Không cần SQL Server: ngân hàng câu hỏi giả lập (cố định theo seed). Mỗi câu truy vấn là 1 câu hỏi trong ngân hàng
+# được viết lại kiểu người dùng gõ (bớt từ, thêm "cho em hỏi", bỏ dấu, đảo thứ tự) -> đáp án đúng = ID câu gốc.
+# Đường cũ được mô phỏng: 4 từ khóa dài nhất "Content LIKE" OR, TOP 50 (theo ID), chấm điểm tỉ lệ từ khóa có trong Content.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+from inventory_index import fold_text
+from knowledge_index import KnowledgeIndex
+
+SUBJECTS = ['vòng bi cầu', 'vòng bi đũa', 'gối đỡ', 'dây curoa', 'phớt chắn dầu', 'mỡ bôi trơn', 'khớp nối',
+            'xích truyền động', 'bạc đạn tang trống', 'ổ trượt', 'bánh răng', 'hộp số', 'động cơ điện', 'puly']
+ASPECTS = ['nhiệt độ làm việc tối đa', 'nguyên nhân hỏng sớm', 'cách lắp đặt đúng', 'khe hở hướng kính C3',
+           'chu kỳ bôi trơn', 'tải trọng động định mức', 'dấu hiệu mòn', 'cách đo độ rung', 'tiêu chuẩn dung sai',
+           'cách bảo quản tồn kho', 'tuổi thọ L10', 'mã hậu tố 2RS', 'vật liệu vòng cách', 'tốc độ giới hạn']
+CONTEXTS = ['trong nhà máy xi măng', 'cho quạt hút công nghiệp', 'trong ngành giấy', 'cho băng tải mỏ than',
+            'ở môi trường ẩm', 'cho máy bơm nước', 'trong lò sấy', 'cho máy nén khí']
+FORMS = ['{a} của {s} {c} là gì?', 'Hãy nêu {a} của {s} {c}.', 'Khi dùng {s} {c}, {a} được xác định thế nào?']
+FILLERS = ['cho em hỏi', 'anh ơi', 'bot ơi', 'mình muốn biết', 'xin hỏi']
+
+
+def make_bank(n, seed=3):
+    rnd = random.Random(seed)
+    combos = [(s, a, c) for s in SUBJECTS for a in ASPECTS for c in CONTEXTS]
+    rnd.shuffle(combos)
+    rows = []
+    for i, (s, a, c) in enumerate(combos[:n], start=1):
+        rows.append({
+            'ID': i,
+            'Content': rnd.choice(FORMS).format(s=s, a=a, c=c),
+            'CorrectAnswer': f"[{a.capitalize()} của {s} phụ thuộc điều kiện {c} và khuyến cáo nhà sản xuất.]",
+            'Explanation': f"Tham khảo catalogue hãng cho {s}.",
+            '_parts': (s, a, c),
+        })
+    return rows
+
+
+def make_queries(rows, n_queries, seed=5):
+    rnd = random.Random(seed)
+    queries = []
+    for row in rnd.sample(rows, min(n_queries, len(rows))):
+        s, a, c = row['_parts']
+        words = f"{a} {s} {c}".split()
+        kept = [w for w in words if rnd.random() > 0.25] or words # Bỏ bớt ~1/4 số từ
+        if rnd.random() < 0.3:
+            rnd.shuffle(kept)
+        text = f"{rnd.choice(FILLERS)} {' '.join(kept)}"
+        if rnd.random() < 0.4:
+            text = fold_text(text) # Gõ không dấu
+        queries.append((text, row['ID']))
+    return queries
+
+
+def old_search(rows, query):
+    """Mô phỏng search_knowledge cũ: trả về list ID theo thứ hạng."""
+    stop_words = {'là', 'gì', 'của', 'hãy', 'nêu', 'cho', 'biết', 'trong', 'với', 'tại', 'sao', 'như', 'thế', 'nào',
+                  'em', 'anh', 'chị', 'ad', 'bot', 'bạn', 'tôi', 'mình'}
+    clean = query.lower()
+    for ch in "?!,.:;\"'()[]{}":
+        clean = clean.replace(ch, ' ')
+    keywords = [w for w in clean.split() if len(w) > 1 and w not in stop_words]
+    if not keywords:
+        return []
+    top_kws = sorted(keywords, key=len, reverse=True)[:4]
+    candidates = [r for r in rows if any(kw in r['Content'].lower() for kw in top_kws)][:50]
+    tokens = set(keywords)
+    scored = [(sum(1 for t in tokens if t in r['Content'].lower()) / len(tokens), r['ID']) for r in candidates]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [doc_id for _, doc_id in scored]
+
+
+def evaluate(label, search, queries):
+    hit1 = hit3 = 0
+    rr = 0.0
+    latencies = []
+    for text, expected in queries:
+        t0 = time.perf_counter()
+        ranked = search(text)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if expected in ranked[:1]:
+            hit1 += 1
+        if expected in ranked[:3]:
+            hit3 += 1
+        if expected in ranked:
+            rr += 1 / (ranked.index(expected) + 1)
+    latencies.sort()
+    n = len(queries)
+    print(f"{label:<28} | hit@1 {hit1 / n:6.1%} | hit@3 {hit3 / n:6.1%} | MRR {rr / n:.3f} | "
+          f"p50 {latencies[n // 2]:6.2f} ms | p95 {latencies[int(n * 0.95)]:6.2f} ms")
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    rows = make_bank(n)
+    queries = make_queries(rows, 300)
+
+    index = KnowledgeIndex(db_manager=None, path=os.devnull, sync_seconds=10 ** 9)
+    index._synced_at = time.time() # Không đồng bộ DB trong benchmark
+    t0 = time.perf_counter()
+    index.build(rows)
+    print(f"--- Ngân hàng {len(rows):,} câu, {len(queries)} truy vấn | dựng BM25 {time.perf_counter() - t0:.2f}s ---")
+
+    evaluate("Cũ: LIKE + đếm chuỗi con", lambda q: old_search(rows, q), queries)
+    evaluate("Mới: BM25 bỏ dấu", lambda q: [r['ID'] for _, _, r in index.search(q, k=10)], queries)
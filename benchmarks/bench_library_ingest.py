@@ -0,0 +1,125 @@
+# benchmarks/bench_library_ingest.py
+# --- NẠP THƯ VIỆN PDF: ĐỌC TUẦN TỰ TỪNG FILE (CŨ) SO VỚI ingest_library.py (SONG SONG + TĂNG DẦN) ---
+# Chạy: python benchmarks/bench_library_ingest.py [số_file] [số_tiến_trình]
+# Cần PyPDF2 (giống môi trường chạy scan_library.py). Không cần DB/AI: chỉ đo phần file (tách text + page map).
+# PDF giả lập được sinh bằng bộ ghi PDF tối giản bên dưới (mỗi file 20-60 trang chữ).
+# Kịch bản:
+#   1. Cũ: mỗi lần chạy đọc lại MỌI PDF tuần tự, ghi page map <pdf>.json
+#   2. Mới, lần đầu: Process Pool, ghi <pdf>.pidx + manifest
+#   3. Mới, chạy lại không đổi gì: bỏ qua nhờ (size, mtime)
+#   4. Mới, 10% file bị chạm mtime (copy lại) + 5% file sửa nội dung: chỉ hash lại / dựng lại đúng các file đó
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+import ingest_library
+from page_index import extract_pdf_pages
+
+WORDS = ('vong bi', 'khe ho', 'boi tron', 'nhiet do', 'khop noi', 'rung dong', 'phot chan', 'dung sai', 'tai trong',
+         'tuoi tho', 'bao quan', 'tieng on', 'bulong', 'truc', 'goi do', 'may bom', 'bang tai', 'quat gio')
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, pages):
+    """PDF 1.4 tối giản: mỗi trang 1 content stream Helvetica, các dòng chữ ASCII."""
+    n = len(pages)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               ("<< /Type /Pages /Kids [%s] /Count %d >>" % (' '.join(f"{4 + 2 * i} 0 R" for i in range(n)), n)).encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, lines in enumerate(pages):
+        stream = "BT /F1 10 Tf 14 TL 50 800 Td " + ' '.join(f"({_pdf_escape(l)}) '" for l in lines) + " ET"
+        objects.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+                        f"/Contents {5 + 2 * i} 0 R >>").encode())
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b''.join(f"{off:010d} 00000 n \n".encode() for off in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def make_doc(rnd, doc_no):
+    return [[f"Tai lieu {doc_no} trang {p + 1}: " + ', '.join(rnd.choice(WORDS) for _ in range(8)) for _ in range(40)]
+            for p in range(rnd.randint(20, 60))]
+
+
+def old_ingest(library_dir):
+    """Cũ: đọc lại mọi PDF tuần tự, ghi page map JSON cạnh file."""
+    for pdf_path in ingest_library.find_pdfs(library_dir):
+        pages = extract_pdf_pages(pdf_path)
+        with open(pdf_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump([{'page': i + 1, 'content': t} for i, t in enumerate(pages)], f, ensure_ascii=False)
+
+
+def timed(label, fn, n_files):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<52} {elapsed:8.2f}s  ({elapsed / n_files * 1000:7.1f} ms/file)")
+    return out
+
+
+def main():
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    rnd = random.Random(16)
+    root = tempfile.mkdtemp(prefix='bench_ingest_')
+    old_dir, new_dir = os.path.join(root, 'old'), os.path.join(root, 'new')
+    os.makedirs(old_dir)
+    try:
+        start = time.perf_counter()
+        for i in range(n_files):
+            write_pdf(os.path.join(old_dir, f"tai_lieu_{i:04d}.pdf"), make_doc(rnd, i))
+        shutil.copytree(old_dir, new_dir)
+        total_mb = sum(os.path.getsize(p) for p in ingest_library.find_pdfs(old_dir)) / 1e6
+        print(f"Sinh {n_files} PDF ({total_mb:.1f} MB) trong {time.perf_counter() - start:.1f}s | {workers} tiến trình\n")
+
+        quiet = lambda *_: None
+        manifest = {}
+
+        def run_new():
+            results, skipped = ingest_library.run_pipeline(new_dir, manifest, workers, progress=quiet)
+            ingest_library.update_manifest(manifest, results)
+            statuses = [r['status'] for r in results]
+            return len(skipped), statuses.count('unchanged'), statuses.count('indexed'), statuses.count('error')
+
+        timed("1. Cũ: tuần tự, đọc lại mọi file", lambda: old_ingest(old_dir), n_files)
+        counts = timed("2. Mới: lần đầu (song song)", run_new, n_files)
+        print(f"   bỏ qua {counts[0]}, hash không đổi {counts[1]}, dựng chỉ mục {counts[2]}, lỗi {counts[3]}")
+        counts = timed("3. Mới: chạy lại, không đổi gì", run_new, n_files)
+        print(f"   bỏ qua {counts[0]}, hash không đổi {counts[1]}, dựng chỉ mục {counts[2]}, lỗi {counts[3]}")
+
+        pdfs = ingest_library.find_pdfs(new_dir)
+        for path in rnd.sample(pdfs, n_files // 10):
+            os.utime(path) # Copy lại / đồng bộ thư mục: mtime đổi, nội dung giữ nguyên
+        for i, path in enumerate(rnd.sample(pdfs, n_files // 20)):
+            write_pdf(path, make_doc(rnd, n_files + i))
+        counts = timed("4. Mới: 10% chạm mtime + 5% sửa nội dung", run_new, n_files)
+        print(f"   bỏ qua {counts[0]}, hash không đổi {counts[1]}, dựng chỉ mục {counts[2]}, lỗi {counts[3]}")
+
+        old_bytes = sum(os.path.getsize(p + '.json') for p in ingest_library.find_pdfs(old_dir))
+        new_bytes = sum(os.path.getsize(p + '.pidx') for p in pdfs)
+        print(f"\nPage map: JSON {old_bytes / 1e6:.1f} MB | .pidx {new_bytes / 1e6:.1f} MB (kèm chỉ mục tìm kiếm)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
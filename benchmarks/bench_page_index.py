@@ -0,0 +1,82 @@
+# benchmarks/bench_page_index.py
+# --- CHAT VỚI TÀI LIỆU: ĐỌC <pdf>.json MỖI CÂU HỎI (CŨ) SO VỚI CHỈ MỤC TRANG <pdf>.pidx (page_index.py) ---
+# Chạy: python benchmarks/bench_page_index.py [số_trang]
+# Không cần PDF/AI: tài liệu giả lập (sổ tay kỹ thuật nhiều trang), mỗi câu hỏi nhắm vào 1 trang biết trước.
+# Đo: I/O + thời gian chuẩn bị context mỗi câu hỏi, số ký tự context gửi AI (~ prompt token), trang đúng có trong context.
+
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+import page_index
+from page_index import write_page_index, open_page_index, retrieve_context
+
+TOPICS = ['lắp đặt vòng bi', 'khe hở hướng kính', 'bôi trơn bằng mỡ', 'đo nhiệt độ ổ trục', 'căn chỉnh khớp nối',
+          'tháo vòng bi bằng cảo', 'gia nhiệt cảm ứng', 'phân tích rung động', 'lựa chọn phớt chắn', 'dung sai trục',
+          'tải trọng tĩnh', 'tuổi thọ danh định', 'bảo quản kho', 'kiểm tra tiếng ồn', 'mô-men xiết bulong']
+FILLER = ('Quy trình bảo trì thiết bị quay cần tuân thủ hướng dẫn của nhà sản xuất, kiểm tra định kỳ và ghi chép '
+          'đầy đủ các thông số vận hành vào sổ theo dõi. ')
+
+
+def make_pages(n, seed=9):
+    rnd = random.Random(seed)
+    pages, facts = [], []
+    for i in range(n):
+        topic = TOPICS[i % len(TOPICS)]
+        code = f"QT-{i + 1:04d}"
+        fact = f"Mục {code}: {topic} cho dòng máy {rnd.choice(['bơm ly tâm', 'quạt gió', 'băng tải', 'máy nghiền'])}"
+        pages.append(f"{fact}. " + FILLER * rnd.randint(12, 20))
+        facts.append((i + 1, f"hướng dẫn {topic} mục {code}"))
+    return pages, facts
+
+
+def old_context(json_path, question):
+    """Logic LibraryService.chat_with_document cũ: nạp toàn bộ JSON, đếm từ khóa, ghép mọi trang có điểm > 0."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        pages = json.load(f)
+    context = ""
+    keywords = question.lower().split()
+    for p in pages:
+        text = p['content'].lower()
+        if sum(1 for kw in keywords if kw in text) > 0:
+            context += f"\n--- [TRANG {p['page']}] ---\n{p['content']}"
+    return context[:10000]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    pages, facts = make_pages(n)
+    questions = random.Random(1).sample(facts, 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, 'manual.pdf')
+        with open(pdf_path + '.json', 'w', encoding='utf-8') as f:
+            json.dump([{'page': i + 1, 'content': t} for i, t in enumerate(pages)], f, ensure_ascii=False)
+        t0 = time.perf_counter()
+        write_page_index(pages, pdf_path + page_index.INDEX_SUFFIX)
+        build_s = time.perf_counter() - t0
+        json_kb = os.path.getsize(pdf_path + '.json') / 1024
+        pidx_kb = os.path.getsize(pdf_path + page_index.INDEX_SUFFIX) / 1024
+
+        print(f"--- Tài liệu {n} trang | .json {json_kb:,.0f} KB | .pidx {pidx_kb:,.0f} KB (dựng {build_s:.2f}s) ---")
+        print(f"{'Cách làm':<26} | {'ms/câu':>7} | {'ký tự context':>13} | {'trang đúng có trong context':>27}")
+
+        for label, build in (
+            ('Cũ: nạp JSON + đếm từ', lambda q: (old_context(pdf_path + '.json', q), None)),
+            ('Mới: chỉ mục trang', lambda q: retrieve_context(open_page_index(pdf_path + page_index.INDEX_SUFFIX), q)),
+        ):
+            total_ms, total_chars, found = 0.0, 0, 0
+            for page_no, question in questions:
+                t0 = time.perf_counter()
+                context, _ = build(question)
+                total_ms += (time.perf_counter() - t0) * 1000
+                total_chars += len(context)
+                found += f"[TRANG {page_no}]" in context
+            k = len(questions)
+            print(f"{label:<26} | {total_ms / k:7.2f} | {total_chars / k:13,.0f} | {found / k:26.0%}")
@@ -0,0 +1,170 @@
+# cache_warmup.py
+# --- LÀM NÓNG CACHE DASHBOARD THEO NVKD (JOB APSCHEDULER) ---
+#
+# sales_dashboard, sales_detail/<NVKD> và portal chỉ được tính khi có người mở -> người xem đầu tiên mỗi sáng
+# (và ngay sau mỗi đợt đồng bộ ERP) phải chờ SP / GT9000 nguội. Job server.py chạy theo config.CACHE_WARMUP_TIMES:
+#   - Danh sách: user bộ phận Kinh doanh + Admin (bảng người dùng).
+#   - Mỗi user: sales_dashboard mặc định (nếu role có quyền VIEW_SALES_DASHBOARD) + mọi khối Portal;
+#     mỗi NVKD: sales_detail/<mã>. Dùng đúng hàm dựng context + cache key của route -> route đọc thấy ngay.
+#   - Tối đa CACHE_WARMUP_WORKERS mục chạy song song (mỗi luồng 1 app context), log tiến độ mỗi ~10%.
+#   - Báo cáo: thời gian / số mục lỗi từng lần chạy trong ngày (Redis) + tỉ lệ hit cache trong ngày (swr_cache).
+
+import json
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import current_app
+from swr_cache import get_daily_cache_stats
+import config
+
+_RUNS_PREFIX = 'cache_warmup:runs:'
+_RUNS_KEEP_SECONDS = 8 * 86400
+_run_lock = threading.Lock()
+
+
+def _normalize(value):
+    return "".join(str(value or '').split()).upper()
+
+
+def get_warmup_targets(db_manager):
+    """[{'user_code', 'is_admin', 'is_salesman', 'division', 'bo_phan', 'role', 'can_view_dashboard'}]."""
+    users = db_manager.get_data(
+        f"""
+        SELECT USERCODE, [ROLE], [BO PHAN], [Division]
+        FROM {config.TEN_BANG_NGUOI_DUNG}
+        WHERE UPPER(LTRIM(RTRIM([ROLE]))) = ? OR REPLACE([BO PHAN], ' ', '') = ?
+        """,
+        (config.ROLE_ADMIN, config.DEPT_KINHDOANH)
+    )
+    dashboard_roles = {
+        _normalize(row['RoleID']) for row in db_manager.get_data(
+            f"SELECT RoleID FROM {config.TABLE_SYS_PERMISSIONS} WHERE FeatureCode = ?", ('VIEW_SALES_DASHBOARD',)
+        )
+    }
+
+    targets = []
+    for user in users:
+        user_code = str(user.get('USERCODE') or '').strip()
+        if not user_code:
+            continue
+        role = _normalize(user.get('ROLE'))
+        is_admin = role == config.ROLE_ADMIN
+        bo_phan = _normalize(user.get('BO PHAN'))
+        targets.append({
+            'user_code': user_code,
+            'is_admin': is_admin,
+            'is_salesman': bo_phan == _normalize(config.DEPT_KINHDOANH),
+            'division': str(user.get('Division') or '').strip().upper(),
+            'bo_phan': bo_phan,
+            'role': role,
+            'can_view_dashboard': is_admin or role in dashboard_roles,
+        })
+    return targets
+
+
+def _build_tasks(targets):
+    """Danh sách (tên mục, hàm) - các hàm chạy trong app context của luồng worker."""
+    # Import cục bộ: blueprint chỉ cần khi job chạy (tránh vòng import lúc khởi động)
+    from blueprints.kpi_bp import prime_sales_dashboard, prime_sales_detail
+
+    tasks = []
+    for t in targets:
+        if t['can_view_dashboard']:
+            tasks.append((f"sales_dashboard/{t['user_code']}",
+                          lambda t=t: prime_sales_dashboard(t['user_code'], t['is_admin'], t['division'])))
+        if t['is_salesman']:
+            tasks.append((f"sales_detail/{t['user_code']}", lambda t=t: prime_sales_detail(t['user_code'])))
+        tasks.append((f"portal/{t['user_code']}",
+                      lambda t=t: current_app.portal_service.get_all_dashboard_data(t['user_code'], t['bo_phan'], t['role'])))
+    return tasks
+
+
+def warm_up_dashboards(trigger='schedule'):
+    """
+    Tính sẵn context Dashboard cho mọi NVKD + Admin. Lần chạy trước chưa xong -> bỏ qua (trả None).
+    Trả về báo cáo lần chạy {'started_at', 'trigger', 'items', 'failed', 'duration_s'}.
+    """
+    if not _run_lock.acquire(blocking=False):
+        current_app.logger.warning("CacheWarmup: lần chạy trước chưa xong, bỏ qua")
+        return None
+
+    try:
+        app = current_app._get_current_object()
+        started_at = datetime.now()
+        start = time.perf_counter()
+        tasks = _build_tasks(get_warmup_targets(app.db_manager))
+        total = len(tasks)
+        step = max(1, total // 10)
+        app.logger.info(f"CacheWarmup: bắt đầu {total} mục ({trigger}), {config.CACHE_WARMUP_WORKERS} luồng")
+
+        def _run(name, fn):
+            with app.app_context():
+                fn()
+            return name
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=config.CACHE_WARMUP_WORKERS, thread_name_prefix='cache_warmup') as pool:
+            futures = {pool.submit(_run, name, fn): name for name, fn in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    app.logger.error(f"CacheWarmup: lỗi {futures[future]}: {e}")
+                if done % step == 0 or done == total:
+                    app.logger.info(
+                        f"CacheWarmup: {done}/{total} ({done * 100 // total}%), "
+                        f"{len(failed)} lỗi, {time.perf_counter() - start:.1f}s"
+                    )
+
+        report = {
+            'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'trigger': trigger,
+            'items': total,
+            'failed': len(failed),
+            'duration_s': round(time.perf_counter() - start, 1),
+        }
+        _save_run(app, started_at, report)
+        app.logger.info(
+            f"CacheWarmup: xong {total} mục trong {report['duration_s']}s ({len(failed)} lỗi). "
+            f"Hit cache hôm nay: {_format_hit_rates(get_daily_cache_stats())}"
+        )
+        return report
+    finally:
+        _run_lock.release()
+
+
+def _save_run(app, started_at, report):
+    try:
+        runs_key = _RUNS_PREFIX + started_at.strftime('%Y%m%d')
+        app.redis_client.rpush(runs_key, json.dumps(report))
+        app.redis_client.expire(runs_key, _RUNS_KEEP_SECONDS)
+    except Exception as e:
+        app.logger.error(f"CacheWarmup: lỗi lưu báo cáo lần chạy: {e}")
+
+
+def _format_hit_rates(stats):
+    return ", ".join(f"{s['group']} {s['hit_rate']}%" for s in stats) or "chưa có lượt xem"
+
+
+def get_warmup_report(day=None):
+    """{'day', 'runs': [báo cáo từng lần chạy], 'cache': thống kê hit theo nhóm trang} của 1 ngày (mặc định hôm nay)."""
+    day = day or datetime.now().strftime('%Y%m%d')
+    try:
+        runs = [json.loads(r) for r in current_app.redis_client.lrange(_RUNS_PREFIX + day, 0, -1)]
+    except Exception as e:
+        current_app.logger.error(f"CacheWarmup: lỗi đọc báo cáo ngày {day}: {e}")
+        runs = []
+    return {'day': day, 'runs': runs, 'cache': get_daily_cache_stats(day)}
+
+
+def log_daily_cache_report():
+    """Ghi log tổng kết trong ngày: thời gian làm nóng từng lần + tỉ lệ hit cache theo trang."""
+    report = get_warmup_report()
+    runs = ", ".join(f"{r['started_at'][11:16]} {r['duration_s']}s ({r['failed']}/{r['items']} lỗi)" for r in report['runs'])
+    current_app.logger.info(
+        f"CacheWarmup ngày {report['day']}: làm nóng [{runs or 'không chạy'}]; "
+        f"hit cache: {_format_hit_rates(report['cache'])}"
+    )
+    return report
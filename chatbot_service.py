@@ -1253,6 +1253,9 @@ class ChatbotService:
                 if bo > 0: line += f"\n  -> *Gợi ý: Mã này đang BackOrder.*"
                 response_lines.append(line)
             
+            if data[0].get('StockAsOf'):
+                response_lines.append(f"_(Tồn/BO cập nhật lúc {data[0]['StockAsOf']})_")
+
             return "\n".join(response_lines)
         except Exception as e: return f"Lỗi tra cứu nhanh: {e}"
 
@@ -0,0 +1,278 @@
+# comparison_engine.py
+# --- SO SÁNH CHỈ SỐ QUẢN TRỊ NHIỀU NĂM (ExecutiveService.get_comparison_data) ---
+#
+# Thay cho get_year_metrics chạy ~8 câu truy vấn riêng cho TỪNG năm (Doanh thu, Chi phí, VIP, OTIF, Dư nợ, Tồn kho...):
+#   - Mỗi nguồn 1 câu gom nhóm cho TẤT CẢ các năm cần tính, 5 câu chạy song song (db.fan_out):
+#       sales    : Doanh thu / Giá vốn theo (năm, tháng)   - fact doanh số tháng nếu sẵn sàng, ngược lại GT9000
+#       expenses : Chi phí theo Ana03ID theo năm           - GT9000
+#       vip      : Doanh số KH mua >= 10 nhóm hàng theo năm - fact / GT9000
+#       otif     : Giao hàng đúng hạn theo năm             - Delivery_Weekly
+#       balances : Dư nợ 131/331, tồn kho 15x tại 31/12 mỗi năm - 1 lần quét GT9000, mỗi năm 1 nhóm cột SUM(CASE ...)
+#   - Năm đã khóa sổ (tháng 12 đã ra khỏi cửa sổ SALES_FACT_OPEN_MONTHS) cache vĩnh viễn trong app.cache,
+#     năm đang mở cache COMPARISON_OPEN_YEAR_TTL giây -> so sánh 3-5 năm thường chỉ phải tính năm hiện tại.
+#   - balances quét toàn bộ lịch sử -> hạn riêng COMPARISON_BALANCES_TIMEOUT. Nguồn nào lỗi/quá hạn thì các chỉ số
+#     của nguồn đó nằm trong entry['unavailable'] (UI báo "chưa tải được" thay vì hiện 0).
+
+from datetime import date, datetime, timedelta
+from flask import current_app
+from db_manager import safe_float
+from sales_fact import get_sales_fact
+import config
+
+_CACHE_PREFIX = 'exec_year_metrics_v1_'
+
+# Nguồn (task fan_out) -> các chỉ số tính từ nguồn đó
+TASK_METRICS = {
+    'sales': ('Revenue', 'GrossProfit', 'NetProfit', 'VIPProfit'),
+    'expenses': ('Expenses', 'NetProfit'),
+    'vip': ('VIPProfit',),
+    'otif': ('OTIF',),
+    'balances': ('AR_Total', 'AR_Risk', 'AP_Total', 'Inv_Total', 'Inv_Risk'),
+}
+METRIC_LABELS = {
+    'Revenue': 'Doanh số', 'GrossProfit': 'Lợi nhuận gộp', 'NetProfit': 'Lợi nhuận ròng',
+    'VIPProfit': 'LNG khách VIP', 'Expenses': 'Chi phí hoạt động', 'OTIF': 'OTIF',
+    'AR_Total': 'Dư nợ phải thu', 'AR_Risk': 'Nợ rủi ro', 'AP_Total': 'Dư nợ phải trả',
+    'Inv_Total': 'Giá trị tồn kho', 'Inv_Risk': 'Tồn kho lâu',
+}
+
+
+def is_closed_year(year, today=None):
+    """Năm đã khóa sổ: tháng 12 của năm đó đã ra khỏi cửa sổ tháng mở của fact doanh số."""
+    today = today or datetime.now()
+    return (today.year * 12 + today.month) - (int(year) * 12 + 12) >= config.SALES_FACT_OPEN_MONTHS
+
+
+class ComparisonEngine:
+    """Chỉ số quản trị (Doanh thu, LNG, Chi phí, VIP, OTIF, Công nợ, Tồn kho) cho N năm, mỗi nguồn 1 lần gom nhóm."""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    # --- CACHE ---
+    @staticmethod
+    def _cache_get(year):
+        try:
+            return current_app.cache.get(f"{_CACHE_PREFIX}{year}")
+        except Exception:
+            return None
+
+    @staticmethod
+    def _cache_set(year, entry):
+        timeout = 0 if is_closed_year(year) else config.COMPARISON_OPEN_YEAR_TTL # 0 = không hết hạn
+        try:
+            current_app.cache.set(f"{_CACHE_PREFIX}{year}", entry, timeout=timeout)
+        except Exception as e:
+            current_app.logger.warning(f"ComparisonEngine: không ghi được cache năm {year}: {e}")
+
+    @staticmethod
+    def invalidate(*years):
+        """Xóa cache các năm (VD: sau khi mở lại tháng đã khóa bằng sp_RefreshSalesFactMonthly @ReopenFrom)."""
+        for year in years:
+            current_app.cache.delete(f"{_CACHE_PREFIX}{year}")
+
+    # --- TRUY VẤN (mỗi hàm trả về (query, params) cho fan_out) ---
+    @staticmethod
+    def _in_clause(years):
+        return ', '.join(['?'] * len(years)), tuple(years)
+
+    def _sales_query(self, years, use_fact):
+        marks, params = self._in_clause(years)
+        if use_fact:
+            return f"""
+                SELECT TranYear, TranMonth, SUM(RevenueOT) as Revenue, SUM(COGSOT) as COGS
+                FROM {config.CRM_SALES_FACT_MONTHLY}
+                WHERE TranYear IN ({marks})
+                GROUP BY TranYear, TranMonth
+            """, params
+        return f"""
+            SELECT TranYear, TranMonth,
+                SUM(CASE WHEN CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN ConvertedAmount ELSE 0 END) as Revenue,
+                SUM(CASE WHEN DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN ConvertedAmount ELSE 0 END) as COGS
+            FROM {config.ERP_GIAO_DICH}
+            WHERE TranYear IN ({marks}) AND OTransactionID IS NOT NULL
+            GROUP BY TranYear, TranMonth
+        """, params
+
+    def _expenses_query(self, years):
+        marks, params = self._in_clause(years)
+        return f"""
+            SELECT TranYear, SUM(ConvertedAmount) as Expenses
+            FROM {config.ERP_GIAO_DICH}
+            WHERE TranYear IN ({marks})
+              AND Ana03ID IS NOT NULL
+              AND Ana03ID <> ''
+              AND Ana03ID <> '{config.EXCLUDE_ANA03_CP2014}'
+            GROUP BY TranYear
+        """, params
+
+    def _vip_query(self, years, use_fact):
+        marks, params = self._in_clause(years)
+        if use_fact:
+            return f"""
+                WITH VipCustomers AS (
+                    SELECT TranYear, ObjectID
+                    FROM {config.CRM_SALES_FACT_MONTHLY}
+                    WHERE TranYear IN ({marks}) AND I04ID <> ''
+                    GROUP BY TranYear, ObjectID
+                    HAVING COUNT(DISTINCT I04ID) >= 10
+                )
+                SELECT F.TranYear, SUM(F.Revenue) as VIP_Sales
+                FROM {config.CRM_SALES_FACT_MONTHLY} F
+                INNER JOIN VipCustomers V ON F.TranYear = V.TranYear AND F.ObjectID = V.ObjectID
+                GROUP BY F.TranYear
+            """, params
+        return f"""
+            WITH VipCustomers AS (
+                SELECT G.TranYear, G.ObjectID
+                FROM {config.ERP_GIAO_DICH} G
+                INNER JOIN {config.ERP_IT1302} I ON G.InventoryID = I.InventoryID
+                WHERE G.TranYear IN ({marks})
+                AND I.I04ID IS NOT NULL AND I.I04ID <> ''
+                AND (G.CreditAccountID LIKE '{config.ACC_DOANH_THU}' OR G.DebitAccountID LIKE '{config.ACC_GIA_VON}')
+                GROUP BY G.TranYear, G.ObjectID
+                HAVING COUNT(DISTINCT I.I04ID) >= 10
+            )
+            SELECT T1.TranYear, SUM(T1.ConvertedAmount) as VIP_Sales
+            FROM {config.ERP_GIAO_DICH} T1
+            INNER JOIN VipCustomers V ON T1.TranYear = V.TranYear AND T1.ObjectID = V.ObjectID
+            WHERE T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}'
+            GROUP BY T1.TranYear
+        """, params
+
+    def _otif_query(self, years):
+        marks, params = self._in_clause(years)
+        return f"""
+            SELECT
+                YEAR(ActualDeliveryDate) as TranYear,
+                COUNT(*) as Total,
+                SUM(CASE WHEN ActualDeliveryDate <= DATEADD(day, 7, ISNULL(EarliestRequestDate, ActualDeliveryDate))
+                    THEN 1 ELSE 0 END) as OnTime
+            FROM {config.DELIVERY_WEEKLY_VIEW}
+            WHERE DeliveryStatus = '{config.DELIVERY_STATUS_DONE}'
+            AND ActualDeliveryDate >= ? AND ActualDeliveryDate < ?
+            AND YEAR(ActualDeliveryDate) IN ({marks})
+            GROUP BY YEAR(ActualDeliveryDate)
+        """, (date(min(years), 1, 1), date(max(years) + 1, 1, 1)) + params
+
+    def _balances_query(self, years):
+        """
+        Dư cuối kỳ tại 31/12 từng năm trong 1 lần quét: mỗi dòng sổ cái quy về số có dấu (AR/AP/INV),
+        mỗi năm 1 nhóm SUM(CASE WHEN VoucherDate <= 31/12/năm ...). Kèm phát sinh Nợ 131 trong 180 ngày
+        và Nợ 15x trong 730 ngày cuối năm (ước tính nợ rủi ro / tồn kho > 2 năm như logic cũ).
+        """
+        cols, params = [], []
+        for y in years:
+            end = date(y, 12, 31)
+            ar_cut, inv_cut = end - timedelta(days=180), end - timedelta(days=730)
+            cols += [
+                f"SUM(CASE WHEN VoucherDate <= ? THEN AR ELSE 0 END) AS AR_Total_{y}",
+                f"SUM(CASE WHEN VoucherDate <= ? THEN AP ELSE 0 END) AS AP_Total_{y}",
+                f"SUM(CASE WHEN VoucherDate <= ? THEN INV ELSE 0 END) AS Inv_Total_{y}",
+                f"SUM(CASE WHEN VoucherDate > ? AND VoucherDate <= ? THEN AR_Debit ELSE 0 END) AS AR_Recent_{y}",
+                f"SUM(CASE WHEN VoucherDate > ? AND VoucherDate <= ? THEN INV_Debit ELSE 0 END) AS Inv_Recent_{y}",
+            ]
+            params += [end, end, end, ar_cut, end, inv_cut, end]
+        params.append(date(max(years), 12, 31))
+
+        def signed(debit_prefix, credit_prefix):
+            return (f"(CASE WHEN DebitAccountID LIKE '{debit_prefix}' THEN ConvertedAmount ELSE 0 END) - "
+                    f"(CASE WHEN CreditAccountID LIKE '{credit_prefix}' THEN ConvertedAmount ELSE 0 END)")
+
+        query = f"""
+            SELECT {', '.join(cols)}
+            FROM (
+                SELECT VoucherDate,
+                    {signed('131%', '131%')} AS AR,
+                    -({signed('331%', '331%')}) AS AP,
+                    {signed('15%', '15%')} AS INV,
+                    CASE WHEN DebitAccountID LIKE '131%' THEN ConvertedAmount ELSE 0 END AS AR_Debit,
+                    CASE WHEN DebitAccountID LIKE '15%' THEN ConvertedAmount ELSE 0 END AS INV_Debit
+                FROM {config.ERP_GIAO_DICH}
+                WHERE VoucherDate <= ?
+                AND (DebitAccountID LIKE '131%' OR CreditAccountID LIKE '131%'
+                     OR DebitAccountID LIKE '331%' OR CreditAccountID LIKE '331%'
+                     OR DebitAccountID LIKE '15%' OR CreditAccountID LIKE '15%')
+            ) Bal
+        """
+        return query, tuple(params)
+
+    # --- TÍNH TOÁN ---
+    def _compute(self, years):
+        """Tính các năm chưa có cache. Trả về ({năm: entry}, có lỗi hay không)."""
+        use_fact = get_sales_fact() is not None
+        results, errors = self.db.fan_out({
+            'sales': self._sales_query(years, use_fact),
+            'expenses': self._expenses_query(years),
+            'vip': self._vip_query(years, use_fact),
+            'otif': self._otif_query(years),
+            'balances': self._balances_query(years),
+        }, timeouts={'balances': config.COMPARISON_BALANCES_TIMEOUT}, readonly=True)
+        unavailable = sorted({metric for task in errors for metric in TASK_METRICS.get(task, ())})
+
+        by_year = {y: {'revenue': 0.0, 'cogs': 0.0, 'monthly': [0] * 12} for y in years}
+        for row in results['sales'] or []:
+            acc = by_year.get(int(row['TranYear']))
+            if acc is None:
+                continue
+            rev = safe_float(row['Revenue'])
+            acc['revenue'] += rev
+            acc['cogs'] += safe_float(row['COGS'])
+            acc['monthly'][int(row['TranMonth']) - 1] = rev
+        expenses = {int(r['TranYear']): safe_float(r['Expenses']) for r in results['expenses'] or []}
+        vip_sales = {int(r['TranYear']): safe_float(r['VIP_Sales']) for r in results['vip'] or []}
+        otif = {int(r['TranYear']): r for r in results['otif'] or []}
+        balances = (results['balances'] or [{}])[0]
+
+        entries = {}
+        for y in years:
+            revenue, cogs = by_year[y]['revenue'], by_year[y]['cogs']
+            gross_profit = revenue - cogs
+            avg_margin_rate = (gross_profit / revenue) if revenue > 0 else 0 # Margin VIP ước tính
+            otif_row = otif.get(y)
+            otif_total = safe_float(otif_row['Total']) if otif_row else 0
+            ar_total = safe_float(balances.get(f'AR_Total_{y}'))
+            inv_total = safe_float(balances.get(f'Inv_Total_{y}'))
+            entries[y] = {
+                'metrics': {
+                    'Revenue': revenue,
+                    'GrossProfit': gross_profit,
+                    'Expenses': expenses.get(y, 0),
+                    'NetProfit': gross_profit - expenses.get(y, 0),
+                    'VIPProfit': vip_sales.get(y, 0) * avg_margin_rate,
+                    'OTIF': (safe_float(otif_row['OnTime']) / otif_total * 100) if otif_total > 0 else 0,
+                    'AR_Total': ar_total,
+                    'AR_Risk': max(0, ar_total - safe_float(balances.get(f'AR_Recent_{y}'))),
+                    'AP_Total': safe_float(balances.get(f'AP_Total_{y}')),
+                    'Inv_Total': inv_total,
+                    'Inv_Risk': max(0, inv_total - safe_float(balances.get(f'Inv_Recent_{y}'))),
+                },
+                'monthly': by_year[y]['monthly'],
+                'unavailable': unavailable,
+            }
+        if errors:
+            current_app.logger.error(f"ComparisonEngine: lỗi tính năm {years}: {errors}")
+        return entries, bool(errors)
+
+    def get_years(self, years):
+        """
+        {năm: {'metrics': {...}, 'monthly': [12 tháng doanh thu]}} cho mọi năm yêu cầu.
+        Năm có cache đọc thẳng; các năm còn lại tính chung trong 1 lượt (5 truy vấn song song).
+        Lượt tính có lỗi -> không ghi cache, chỉ số thiếu = 0 và được liệt kê trong entry['unavailable'].
+        """
+        years = sorted({int(y) for y in years})
+        entries, missing = {}, []
+        for y in years:
+            cached = self._cache_get(y)
+            if cached is not None:
+                entries[y] = cached
+            else:
+                missing.append(y)
+
+        if missing:
+            computed, failed = self._compute(missing)
+            for y, entry in computed.items():
+                entries[y] = entry
+                if not failed:
+                    self._cache_set(y, entry)
+        return entries
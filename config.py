@@ -30,6 +30,129 @@ REDIS_HOST = os.getenv('REDIS_HOST') or 'localhost'
 REDIS_PORT = int(os.getenv('REDIS_PORT') or 6379)
 REDIS_CHANNEL = 'crm_task_notifications_channel'
 
+# Giám sát SQL (sql_profiler.py)
+SQL_PROFILER_ENABLED = True
+SQL_SLOW_QUERY_MS = 500           # Câu SQL chậm hơn mức này ghi vào logs/slow_queries.log
+SQL_N_PLUS_ONE_THRESHOLD = 5      # Cùng 1 fingerprint lặp >= số lần này trong 1 request -> cảnh báo N+1
+
+# Pool kết nối OLTP + chạy song song truy vấn độc lập (DBManager.fan_out)
+# Ngân sách kết nối mỗi Pool (DBManager._check_pool_budget cảnh báo lúc khởi động nếu vượt), mỗi luồng giữ tối đa 1:
+#   waitress + fan-out + làm mới nền SWR + làm nóng cache + BackgroundRefresher (1 luồng / chỉ mục - ảnh chụp bật)
+#   + job APScheduler + dự phòng <= pool_size + max_overflow
+#   12 + 8 + 2 + 3 + 6 + 3 + 4 = 38 <= 15 + 25 (Pool OLTP) và <= REPORT_POOL_SIZE + REPORT_MAX_OVERFLOW (Pool báo cáo).
+# 8 luồng fan-out (dùng chung toàn app, kể cả fan-out bên trong làm nóng cache): Cockpit (7) chạy trọn 1 lượt;
+# Portal (9) / nhiều trang cùng lúc xếp hàng ngắn (DB_FANOUT_QUEUE_TIMEOUT) thay vì chờ kết nối Pool.
+WAITRESS_THREADS = 12
+DB_POOL_SIZE = 15
+DB_MAX_OVERFLOW = 25
+DB_FANOUT_MAX_WORKERS = 8
+DB_POOL_HEADROOM = 4              # Kết nối để trống cho script quản trị / luồng ngoài ngân sách
+SCHEDULER_MAX_WORKERS = 3         # Số job APScheduler (server.py) chạy cùng lúc, job thừa xếp hàng
+DB_FANOUT_TIMEOUT = 30            # Giây tối đa mỗi truy vấn, tính từ lúc task BẮT ĐẦU chạy (pyodbc Connection.timeout)
+DB_FANOUT_QUEUE_TIMEOUT = 10      # Giây tối đa 1 task chờ luồng trống; quá hạn -> hủy, báo lỗi cho nơi gọi
+
+# Cache kết quả truy vấn danh mục (DBManager.get_data_cached) - Tag theo bảng nguồn
+DB_QUERY_CACHE_TTL = 3600         # Giây (mặc định 1 tiếng)
+CACHE_TAG_IT1302 = 'IT1302'           # Vật tư ERP (InventoryID -> I04ID)
+CACHE_TAG_NOI_DUNG_HD = 'NOI_DUNG_HD' # Tên nhóm I04
+CACHE_TAG_NGUOI_DUNG = 'NGUOI_DUNG'   # Bảng người dùng
+CACHE_TAG_DTCL = 'DTCL'               # Doanh số chỉ tiêu (Target)
+
+# Chỉ mục trigram tra cứu mã hàng trong RAM (inventory_index.py)
+INVENTORY_INDEX_ENABLED = True
+INVENTORY_INDEX_REFRESH_SECONDS = 900  # Nạp lại IT1302 mỗi 15 phút (nền)
+INVENTORY_LOOKUP_CHUNK = 1000          # Số InventoryID tối đa mỗi câu IN (giới hạn 2100 tham số SQL Server)
+
+# Ảnh chụp Tồn/BO theo mã hàng trong RAM (stock_snapshot.py) thay GROUP BY view Back Order mỗi lần tra
+STOCK_SNAPSHOT_ENABLED = True
+STOCK_SNAPSHOT_REFRESH_SECONDS = 120   # Gom nhóm lại view mỗi 2 phút (job server.py / luồng nền)
+STOCK_SNAPSHOT_MAX_AGE = 900           # Ảnh chụp cũ hơn 15 phút -> bỏ qua, đọc view trực tiếp
+
+# Ảnh chụp SP tuổi tồn dạng DataFrame (inventory_aging_snapshot.py) cho trang Tuổi tồn + biểu đồ Cockpit
+INVENTORY_AGING_SNAPSHOT_ENABLED = True
+INVENTORY_AGING_REFRESH_SECONDS = 600  # Gọi lại SP mỗi 10 phút (job server.py / luồng nền)
+INVENTORY_AGING_MAX_AGE = 3600         # Ảnh chụp cũ hơn 1 tiếng -> bỏ qua, gọi SP trực tiếp
+
+# Chỉ mục tên khách hàng IT1202 trong RAM (customer_index.py) cho autocomplete / chatbot
+CUSTOMER_INDEX_ENABLED = True
+CUSTOMER_INDEX_REFRESH_SECONDS = 120        # Kéo các dòng thay đổi (theo cột dưới) mỗi 2 phút
+CUSTOMER_INDEX_FULL_RELOAD_SECONDS = 3600   # Nạp lại toàn bộ mỗi giờ (bắt khách bị xóa)
+CUSTOMER_INDEX_MODIFIED_COLUMN = 'LastModifyDate'  # None -> luôn nạp toàn bộ
+
+# Ma trận bán chéo khách × nhóm I04 trong RAM (cross_sell_matrix.py) cho Dashboard DNA / chi tiết khách
+CROSS_SELL_MATRIX_ENABLED = True
+CROSS_SELL_MATRIX_REFRESH_HOUR = 5         # Job server.py dựng lại lúc 5:30 mỗi sáng
+CROSS_SELL_MATRIX_REFRESH_SECONDS = 86400  # Quá 1 ngày (lỡ job) -> tự dựng lại ở nền khi có người mở
+CROSS_SELL_MATRIX_MAX_AGE = 172800         # Ma trận cũ hơn 2 ngày -> bỏ qua, truy vấn trực tiếp như cũ
+
+# Chỉ mục BM25 ngân hàng câu hỏi (knowledge_index.py) cho Chatbot lookup_knowledge
+KNOWLEDGE_INDEX_ENABLED = True
+KNOWLEDGE_INDEX_PATH = os.path.abspath(os.path.join('cache', 'knowledge_index.pkl'))
+KNOWLEDGE_INDEX_SYNC_SECONDS = 300   # So checksum với TRAINING_QUESTION_BANK mỗi 5 phút (nền)
+
+# Chỉ mục trang cho Chat với tài liệu (page_index.py, file <pdf>.pidx)
+PAGE_INDEX_CACHE_SIZE = 16           # Số tài liệu giữ từ điển/postings trong RAM (LRU)
+DOC_CHAT_TOP_PAGES = 4               # Số trang liên quan nhất gửi cho AI
+DOC_CHAT_MAX_CONTEXT_CHARS = 12000   # Tổng ký tự context tối đa
+
+# Nạp thư viện PDF song song + tăng dần (ingest_library.py)
+LIBRARY_DIR = 'static/uploads/library'
+LIBRARY_MANIFEST_PATH = os.path.abspath(os.path.join('cache', 'library_manifest.json'))
+
+# Fact doanh số theo tháng (sales_fact.py + sp_RefreshSalesFactMonthly) thay cho gom nhóm GT9000 mỗi màn hình
+SALES_FACT_ENABLED = True
+SALES_FACT_OPEN_MONTHS = 2            # Tháng hiện tại + tháng trước còn mở (hạch toán bổ sung), tháng cũ hơn đã khóa
+SALES_FACT_REFRESH_SECONDS = 900      # Job server.py tính lại các tháng mở mỗi 15 phút
+SALES_FACT_MAX_AGE = 3600             # Tháng hiện tại nạp cũ hơn 1 tiếng (job lỗi) -> đọc GT9000 như cũ
+SALES_FACT_STATUS_TTL = 60            # Giây giữ kết quả kiểm tra độ tươi trong RAM
+COMPARISON_OPEN_YEAR_TTL = 600        # So sánh nhiều năm: năm chưa khóa sổ cache 10 phút (năm đã khóa cache vĩnh viễn)
+COMPARISON_BALANCES_TIMEOUT = 120     # Dư nợ/tồn kho cuối năm quét toàn bộ lịch sử GT9000 -> hạn riêng, dài hơn DB_FANOUT_TIMEOUT
+
+USER_CONTEXT_CACHE_TTL = 300      # Cache Navbar (inject_user) theo user: Profile/Stats/Theme
+
+# Cache Stale-While-Revalidate cho Dashboard nặng (swr_cache.py)
+SWR_REFRESH_WORKERS = 2           # Số luồng làm mới nền
+SWR_LOCK_TIMEOUT = 120            # Giây giữ lock tính lại (> thời gian tính lâu nhất)
+SWR_WAIT_TIMEOUT = 30             # Cache trống: chờ worker khác tính tối đa bấy nhiêu giây
+SWR_POLL_INTERVAL = 0.5
+COCKPIT_CACHE_SOFT_TTL = 600      # CEO Cockpit: tươi 10 phút
+COCKPIT_CACHE_HARD_TTL = 3600     # Giữ bản cũ tối đa 1 tiếng
+SALES_DASHBOARD_SOFT_TTL = 21600  # sales_dashboard: 6 tiếng
+SALES_DASHBOARD_HARD_TTL = 43200
+REALTIME_DASHBOARD_SOFT_TTL = 18600  # Lưới an toàn: entry lưu phiên bản dữ liệu, khác phiên bản -> làm mới nền ngay
+REALTIME_DASHBOARD_HARD_TTL = 37200
+SALES_DETAIL_SOFT_TTL = 3600      # sales_detail/<NVKD>: 1 tiếng
+SALES_DETAIL_HARD_TTL = 21600
+
+# Phát hiện thay đổi dữ liệu bán hàng (data_version.py): mốc nước OT2001 / OT2101 / GT9000 -> phiên bản trong Redis
+DATA_VERSION_ENABLED = True
+DATA_VERSION_POLL_SECONDS = 60             # Job server.py đọc mốc nước mỗi phút
+DATA_VERSION_MODIFIED_COLUMN = 'LastModifyDate'  # Cột ngày sửa của OT2001/OT2101, None -> chỉ dùng số dòng/ngày CT/trạng thái
+
+# Ảnh chụp Sales Backlog YTD dùng chung (backlog_snapshot.py): KPI Sales + Realtime Dashboard
+BACKLOG_SNAPSHOT_ENABLED = True
+BACKLOG_SNAPSHOT_TTL = 300        # Gọi lại Titan_Get_SalesBacklog (toàn bộ NVKD) tối đa 1 lần / 5 phút
+
+# Portal: cache riêng từng khối theo user (giây). Khối ERP / Task / Báo cáo còn tự làm mới khi data_version đổi
+PORTAL_WIDGET_DEFAULT_TTL = 1800
+PORTAL_WIDGET_TTL = {
+    'sales_kpi': 1800,
+    'tasks': 600,
+    'overdue_debt': 3600,          # CRM_AR_AGING_SUMMARY do job AR cập nhật
+    'orders_stat': 1800,
+    'active_quotes': 1800,
+    'pending_deliveries': 900,
+    'orders_flow': 1800,
+    'urgent_replenish': 21600,     # SP dự phòng nặng, gợi ý thay đổi theo ngày
+    'recent_reports': 1800,
+}
+
+# Làm nóng cache Dashboard theo NVKD (cache_warmup.py, job server.py): sales_dashboard, sales_detail, portal
+CACHE_WARMUP_ENABLED = True
+CACHE_WARMUP_TIMES = ('06:45', '12:20', '17:20')  # Trước giờ làm + sau các đợt đồng bộ ERP (HH:MM)
+CACHE_WARMUP_WORKERS = 3                          # Số user tính song song (mỗi luồng 1 kết nối Pool + fan-out bên trong)
+CACHE_WARMUP_REPORT_TIME = '18:30'                # Ghi log báo cáo hit cache trong ngày
+
 # --- CẤU HÌNH KẾT NỐI CSDL (HYBRID) ---
 
 # 1. Chuỗi kết nối gốc (Legacy - dùng cho các script backup hoặc debug)
@@ -44,6 +167,23 @@ CONNECTION_STRING = (
 params = urllib.parse.quote_plus(CONNECTION_STRING)
 SQLALCHEMY_DATABASE_URI = f"mssql+pyodbc:///?odbc_connect={params}"
 
+# 3. Engine BÁO CÁO (Chỉ đọc) - Pool riêng cho Dashboard/Report nặng (get_data(..., readonly=True))
+# Tách khỏi Pool OLTP để 1 loạt refresh Cockpit không chiếm hết kết nối của Task/Duyệt/Audit log.
+REPORT_DB_ENABLED = (os.getenv('REPORT_DB_ENABLED') or '1') == '1'
+REPORT_DB_SERVER = os.getenv('REPORT_DB_SERVER') or DB_SERVER    # Có thể trỏ sang bản sao AlwaysOn
+REPORT_DB_READONLY_INTENT = (os.getenv('REPORT_DB_READONLY_INTENT') or '0') == '1'  # ApplicationIntent=ReadOnly
+REPORT_POOL_SIZE = 15
+REPORT_MAX_OVERFLOW = 25
+REPORT_POOL_TIMEOUT = 15          # Giây chờ lấy kết nối báo cáo
+REPORT_QUERY_TIMEOUT = 120        # Giây tối đa cho 1 câu báo cáo (pyodbc Connection.timeout)
+
+REPORT_CONNECTION_STRING = (
+    f"DRIVER={DB_DRIVER};SERVER={REPORT_DB_SERVER};DATABASE={DB_NAME};"
+    f"UID={DB_UID};" f"PWD={DB_PWD};"
+    + ("ApplicationIntent=ReadOnly;" if REPORT_DB_READONLY_INTENT else "")
+)
+REPORT_SQLALCHEMY_DATABASE_URI = f"mssql+pyodbc:///?odbc_connect={urllib.parse.quote_plus(REPORT_CONNECTION_STRING)}"
+
 # =========================================================================
 # 2. CẤU HÌNH TÀI CHÍNH & KẾ TOÁN (ACCOUNT MAPPING)
 # =========================================================================
@@ -241,6 +381,8 @@ ERP_DELIVERY_MASTER = f'{ERP_DB}.[dbo].[OT2301]'
 # --- C. VIEWS ---
 CRM_AR_AGING_SUMMARY = '[dbo].[CRM_AR_AGING_SUMMARY]' # Dùng bản HN
 CRM_AP_AGING_SUMMARY = '[dbo].[CRM_AP_AGING_SUMMARY]'
+CRM_SALES_FACT_MONTHLY = '[dbo].[CRM_SALES_FACT_MONTHLY]' # Fact doanh số tháng (sp_RefreshSalesFactMonthly)
+CRM_SALES_FACT_PERIODS = '[dbo].[CRM_SALES_FACT_PERIODS]' # Trạng thái mở/khóa từng tháng của fact
 
 DELIVERY_WEEKLY_VIEW = '[dbo].[Delivery_Weekly]'
 VIEW_BACK_ORDER = f'{ERP_DB}.[dbo].[CRM_TON KHO BACK ORDER]'
@@ -268,6 +410,8 @@ SP_REPLENISH_GROUP = 'dbo.sp_GetReplenishmentGroupDetails'
 # Phân tích Lợi nhuận (Dùng trong sales_service.get_profit_analysis)
 SP_SALES_GROSS_PROFIT = 'dbo.sp_GetSalesGrossProfit_Analysis' 
 SP_AP_AGING_DETAIL = 'dbo.sp_GetAPAgingDetail'
+# Chi tiết KH theo NVKD (Dùng trong sales_service.get_client_details_for_salesman, 1 round trip)
+SP_SALESMAN_CLIENT_DETAILS = 'dbo.sp_GetSalesmanClientDetails'
 # Tính Hoa hồng (Dùng trong commission_service)
 SP_CREATE_COMMISSION = 'dbo.sp_CreateCommissionProposal'
 
@@ -284,6 +428,7 @@ TABLE_TITAN_INVENTORY = '[dbo].[TitanOS_UserInventory]'
 # =========================================================================
 SP_JOB_UPDATE_AR_AGING = 'dbo.sp_UpdateARAgingSummary'       # Job cập nhật Công nợ
 SP_JOB_CALC_VELOCITY = 'dbo.sp_CalculateAllSalesVelocity'    # Job tính tốc độ bán
+SP_JOB_REFRESH_SALES_FACT = 'dbo.sp_RefreshSalesFactMonthly' # Job làm mới fact doanh số tháng
 SP_SALES_LOOKUP_COMMON = 'dbo.sp_GetSalesLookup_Common'      # Tra cứu chung (Dự phòng)
 
 QUOTE_STATUS_PENDING = 'CHỜ'
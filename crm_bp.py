@@ -4,6 +4,7 @@ from flask import current_app
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 # FIX: Import đầy đủ từ utils
 from utils import login_required, truncate_content, save_uploaded_files, permission_required, get_user_ip, record_activity 
+from data_version import bump_data_version
 from datetime import datetime, timedelta
 import config 
 from config import TEN_BANG_NGUOI_DUNG, TEN_BANG_LOAI_BAO_CAO, TEN_BANG_BAO_CAO, TEN_BANG_KHACH_HANG, TEN_BANG_NHAN_SU_LH
@@ -341,6 +342,7 @@ def nhap_lieu():
                 except Exception as e:
                     # Log lỗi nhưng KHÔNG chặn dòng chảy chính (User vẫn thấy báo cáo thành công)
                     current_app.logger.error(f"Lỗi cộng điểm Gamification: {e}")
+                bump_data_version('reports') # Khối "Báo cáo vừa làm" trên Portal
                 # 3. Phản hồi về Client    
                 return redirect(url_for('crm_bp.dashboard_reports', success_message='Lưu thành công!'))
             
@@ -12,11 +12,8 @@ cross_sell_bp = Blueprint('cross_sell_bp', __name__)
 def dashboard():
     """Giao diện chính Cross-Sell DNA."""
     
-    # Import tại chỗ để tránh vòng lặp
-    db_manager = current_app.db_manager 
-    from services.cross_sell_service import CrossSellService
-    
-    service = CrossSellService(db_manager)
+    # Service dùng chung của app (giữ ma trận bán chéo trong RAM giữa các request)
+    service = current_app.cross_sell_service
     
     current_year = datetime.now().year
     
@@ -35,10 +32,7 @@ def dashboard():
 @login_required
 def api_detail(client_id):
     """API trả về chi tiết (cho phần mở rộng của bảng)."""
-    db_manager = current_app.db_manager
-    from services.cross_sell_service import CrossSellService
-    
-    service = CrossSellService(db_manager)
+    service = current_app.cross_sell_service
     current_year = datetime.now().year
     
     result = service.get_customer_gap_analysis(client_id, year=current_year)
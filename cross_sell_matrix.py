@@ -0,0 +1,207 @@
+# cross_sell_matrix.py
+# --- MA TRẬN BÁN CHÉO KHÁCH HÀNG × NHÓM HÀNG I04 (NumPy, TRONG RAM) ---
+#
+# Thay cho get_cross_sell_dna dựng dict/set cho từng khách rồi phân hạng bằng vòng lặp ở MỖI lần mở Dashboard,
+# và get_customer_gap_analysis truy vấn lại doanh số cho từng khách khi mở rộng 1 dòng:
+#   - 1 lần nạp (12 tháng gần nhất, cùng truy vấn với Dashboard) -> ma trận C×G (khách × nhóm I04):
+#       revenue, cogs (float64), purchased = revenue > 0 (bool). Cột = danh sách I04 chuẩn (IT1302).
+#   - Vector hóa: tổng doanh số / lãi gộp, số nhóm đã mua, phân hạng (np.select), độ phủ từng nhóm,
+#     ma trận đồng xuất hiện G×G (P.T @ P) -> điểm "khách giống vậy cũng mua" cho mọi (khách, nhóm).
+#   - Dashboard dựng 1 lần cho mỗi lần nạp; chi tiết 1 khách = đọc 1 hàng ma trận, O(số nhóm).
+#   - Làm mới hằng ngày (job server.py) + tự nạp lại ở nền khi quá CROSS_SELL_MATRIX_REFRESH_SECONDS;
+#     quá CROSS_SELL_MATRIX_MAX_AGE (job lỗi liên tục) -> None, CrossSellService truy vấn như cũ.
+
+import time
+import threading
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from db_manager import safe_float
+from background_refresh import BackgroundRefresher
+import config
+
+LOW_MARGIN_THRESHOLD = 10.0
+BUCKET_KEYS = ('titan', 'diamond', 'growth', 'opp')
+# Điểm đồng xuất hiện -> nhãn tiềm năng của nhóm chưa mua
+POTENTIAL_LEVELS = ((0.5, 'High'), (0.2, 'Medium'), (0.0, 'Low'))
+
+
+class CrossSellMatrix:
+    """Ma trận khách × nhóm I04 đã tính sẵn (bất biến sau khi dựng, thay nguyên khối khi nạp lại)."""
+
+    def __init__(self, rows, master_codes, names):
+        codes = list(master_codes)
+        col = {code: i for i, code in enumerate(codes)}
+        # Nhóm có doanh số nhưng chưa có trong danh sách chuẩn (cache IT1302 cũ hơn dữ liệu): vẫn đếm, không hiển thị
+        extra = sorted({r['I04ID'] for r in rows if r['I04ID'] not in col})
+        for code in extra:
+            col[code] = len(col)
+        self.codes = codes + extra
+        self.n_master = len(codes)
+        self.group_names = [names.get(code, code) for code in self.codes]
+
+        self.client_ids, self.client_names, self.row_of = [], [], {}
+        client_idx = np.empty(len(rows), dtype=np.int64)
+        group_idx = np.empty(len(rows), dtype=np.int64)
+        rev = np.empty(len(rows), dtype=np.float64)
+        cogs = np.empty(len(rows), dtype=np.float64)
+        for i, r in enumerate(rows):
+            client_id = str(r['ClientID']).strip()
+            pos = self.row_of.get(client_id)
+            if pos is None:
+                pos = self.row_of[client_id] = len(self.client_ids)
+                self.client_ids.append(client_id)
+                self.client_names.append(r['ClientName'] or client_id)
+            client_idx[i] = pos
+            group_idx[i] = col[r['I04ID']]
+            rev[i] = safe_float(r['Revenue'])
+            cogs[i] = safe_float(r['COGS'])
+
+        shape = (len(self.client_ids), len(self.codes))
+        self.revenue = np.zeros(shape)
+        self.cogs = np.zeros(shape)
+        np.add.at(self.revenue, (client_idx, group_idx), rev)
+        np.add.at(self.cogs, (client_idx, group_idx), cogs)
+        self.purchased = self.revenue > 0
+
+        profit = self.revenue - self.cogs
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.margin = np.where(self.purchased, profit / self.revenue * 100, 0.0)
+        self.total_revenue = self.revenue.sum(axis=1)
+        self.total_profit = profit.sum(axis=1)
+        self.group_count = self.purchased.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.avg_margin = np.where(self.total_revenue > 0, self.total_profit / self.total_revenue * 100, 0.0)
+        # 0 titan (>15 nhóm), 1 diamond (10-15), 2 growth (4-9), 3 opp (còn lại)
+        self.bucket = np.select(
+            [self.group_count > 15, self.group_count >= 10, self.group_count >= 4], [0, 1, 2], default=3
+        )
+
+        # Độ phủ nhóm + điểm "khách giống vậy cũng mua":
+        #   cond[h, g] = P(mua g | mua h); score[c, g] = trung bình cond[h, g] trên các nhóm h khách c đã mua.
+        P = self.purchased.astype(np.float32)
+        buyers = P.sum(axis=0)
+        self.penetration = buyers / max(len(self.client_ids), 1)
+        co = P.T @ P
+        cond = np.divide(co, buyers[:, None], out=np.zeros_like(co), where=buyers[:, None] > 0)
+        self.score = np.divide(P @ cond, self.group_count[:, None].astype(np.float32),
+                               out=np.zeros(shape, dtype=np.float32), where=self.group_count[:, None] > 0)
+        self._dashboard = None
+        self._dashboard_lock = threading.Lock()
+
+    # --- DASHBOARD ---
+    def _client_card(self, c, empty_segments):
+        segments = list(empty_segments) # Ô chưa mua dùng chung dict theo nhóm, chỉ ô đã mua tạo dict riêng
+        for g in np.flatnonzero(self.purchased[c, :self.n_master]):
+            margin = float(self.margin[c, g])
+            segments[g] = {
+                'status': 'active-low-margin' if margin < LOW_MARGIN_THRESHOLD else 'active',
+                'code': self.codes[g],
+                'tooltip': f"{self.group_names[g]}: {margin:.1f}%"
+            }
+        return {
+            'ClientID': self.client_ids[c],
+            'ClientName': self.client_names[c],
+            'TotalRevenue': float(self.total_revenue[c]),
+            'TotalProfit': float(self.total_profit[c]),
+            'I04_Count': int(self.group_count[c]),
+            'AvgMargin': float(self.avg_margin[c]),
+            'DNA_Visual': segments
+        }
+
+    def dashboard(self):
+        """Kết quả get_cross_sell_dna (buckets đã sắp theo doanh số giảm dần), dựng 1 lần rồi dùng lại."""
+        with self._dashboard_lock:
+            if self._dashboard is None:
+                empty_segments = [
+                    {'status': '', 'code': code, 'tooltip': f"{name}: Chưa mua"}
+                    for code, name in zip(self.codes[:self.n_master], self.group_names)
+                ]
+                order = np.argsort(-self.total_revenue, kind='stable')
+                buckets = {key: [] for key in BUCKET_KEYS}
+                for c in order:
+                    buckets[BUCKET_KEYS[self.bucket[c]]].append(self._client_card(c, empty_segments))
+
+                penetration = [
+                    {'I04ID': self.codes[g], 'GroupName': self.group_names[g],
+                     'Customers': int(self.purchased[:, g].sum()), 'Share': float(self.penetration[g])}
+                    for g in np.argsort(-self.penetration[:self.n_master], kind='stable')
+                ]
+                self._dashboard = {
+                    'buckets': buckets,
+                    'master_dna': self.codes[:self.n_master],
+                    'penetration': penetration,
+                    'summary': {f"{key}_count": len(buckets[key]) for key in BUCKET_KEYS}
+                }
+            return self._dashboard
+
+    # --- CHI TIẾT 1 KHÁCH ---
+    def gap_analysis(self, client_id):
+        """
+        Kết quả get_customer_gap_analysis: nhóm đã mua (sắp theo % lãi tăng dần) và nhóm chưa mua
+        (white space, sắp theo điểm đồng xuất hiện giảm dần). Khách không có doanh số -> điểm = độ phủ nhóm.
+        """
+        c = self.row_of.get(str(client_id).strip())
+        if c is None:
+            purchased, scores = np.zeros(self.n_master, dtype=bool), self.penetration
+        else:
+            purchased, scores = self.purchased[c], self.score[c]
+
+        bought, white_space = [], []
+        for g in range(self.n_master):
+            if purchased[g]:
+                revenue = float(self.revenue[c, g])
+                bought.append({
+                    'I04ID': self.codes[g],
+                    'GroupName': self.group_names[g],
+                    'Revenue': revenue,
+                    'Profit': revenue - float(self.cogs[c, g]),
+                    'Margin': float(self.margin[c, g])
+                })
+            else:
+                score = float(scores[g])
+                white_space.append({
+                    'I04ID': self.codes[g],
+                    'GroupName': self.group_names[g],
+                    'Potential': next(label for level, label in POTENTIAL_LEVELS if score >= level),
+                    'Score': score,
+                    'Penetration': float(self.penetration[g])
+                })
+
+        bought.sort(key=lambda x: x['Margin'])
+        white_space.sort(key=lambda x: x['Score'], reverse=True)
+        return {'bought': bought, 'white_space': white_space}
+
+
+class CrossSellMatrixCache:
+    """Giữ CrossSellMatrix mới nhất của CrossSellService, nạp lại hằng ngày (job) hoặc ở nền khi quá hạn."""
+
+    def __init__(self, service, refresh_seconds=None, max_age_seconds=None):
+        self.service = service
+        self._refresher = BackgroundRefresher(
+            self.refresh, 'cross_sell_matrix_refresh', 'CrossSellMatrix: lỗi dựng ma trận bán chéo',
+            refresh_seconds or config.CROSS_SELL_MATRIX_REFRESH_SECONDS,
+            max_age_seconds or config.CROSS_SELL_MATRIX_MAX_AGE
+        )
+        self._state = None # (CrossSellMatrix, as_of datetime, built_ts)
+
+    # --- NẠP / LÀM MỚI ---
+    def refresh(self):
+        """Nạp doanh số 12 tháng + dựng ma trận (đồng bộ). Lỗi -> raise, giữ ma trận cũ."""
+        start = time.perf_counter()
+        query, params = self.service._rolling_sales_query()
+        rows = self.service.db.fetch_data(query, params, readonly=True)
+        matrix = CrossSellMatrix(rows, self.service.get_i04_master_list(), self.service.get_i04_name_map())
+        self._state = (matrix, datetime.now(), time.time())
+        current_app.logger.info(
+            f"CrossSellMatrix: {len(matrix.client_ids):,} khách × {len(matrix.codes)} nhóm "
+            f"({len(rows):,} dòng) trong {time.perf_counter() - start:.1f}s"
+        )
+
+    # --- ĐỌC ---
+    def get(self):
+        """CrossSellMatrix nếu còn dùng được, ngược lại None. Tự kích hoạt nạp lại ở nền khi quá refresh_seconds."""
+        state = self._state
+        if not self._refresher.check(state[2] if state else None):
+            return None
+        return state[0]
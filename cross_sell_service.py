@@ -2,6 +2,8 @@
 
 from flask import current_app
 from db_manager import DBManager, safe_float
+from sales_fact import get_sales_fact, since_month_clause
+from cross_sell_matrix import CrossSellMatrixCache
 from datetime import datetime
 import config
 
@@ -9,10 +11,12 @@ class CrossSellService:
     """
     Service xử lý logic phân tích bán chéo (Cross-selling) dựa trên nhóm vật tư (I04ID).
     [UPDATED]: Sử dụng Rolling 12 Months (365 ngày gần nhất) thay vì YTD.
+    Dashboard / chi tiết đọc từ ma trận khách × nhóm trong RAM (cross_sell_matrix.py) khi đã dựng xong.
     """
     
     def __init__(self, db_manager: DBManager):
         self.db = db_manager
+        self.matrix = CrossSellMatrixCache(self) if config.CROSS_SELL_MATRIX_ENABLED else None
 
     def get_i04_master_list(self):
         """Lấy danh sách mã I04ID chuẩn."""
@@ -22,51 +26,77 @@ class CrossSellService:
             WHERE I04ID IS NOT NULL AND I04ID <> ''
             ORDER BY I04ID
         """
-        data = self.db.get_data(query)
+        data = self.db.get_data_cached(query, tags=[config.CACHE_TAG_IT1302], readonly=True)
         return [row['I04ID'] for row in data] if data else []
 
     def get_i04_name_map(self):
         """Lấy Mapping Mã -> Tên Nhóm từ bảng [NOI DUNG HD]."""
         try:
             query = f"SELECT [LOAI], [TEN] FROM {config.TEN_BANG_NOI_DUNG_HD}"
-            data = self.db.get_data(query)
+            data = self.db.get_data_cached(query, tags=[config.CACHE_TAG_NOI_DUNG_HD], readonly=True)
             return {row['LOAI']: row['TEN'] for row in data} if data else {}
         except Exception as e:
             current_app.logger.error(f"Lỗi lấy tên nhóm I04: {e}")
             return {}
 
+    def _rolling_sales_query(self):
+        """
+        Doanh số / Giá vốn theo (Khách, Nhóm I04) trong 12 tháng gần nhất (Dashboard + ma trận bán chéo).
+        Trả về (query, params).
+        """
+        params = None
+        # Fact doanh số tháng sẵn sàng -> 12 tháng gần nhất (theo kỳ hạch toán) đọc từ fact, không quét GT9000
+        if get_sales_fact():
+            month_filter, params = since_month_clause(12)
+            query = f"""
+                SELECT 
+                    F.ObjectID AS ClientID,
+                    ISNULL(T3.ShortObjectName, T3.ObjectName) AS ClientName,
+                    F.I04ID,
+                    SUM(F.Revenue) as Revenue,
+                    SUM(F.COGS) as COGS
+                FROM {config.CRM_SALES_FACT_MONTHLY} F
+                LEFT JOIN {config.ERP_IT1202} T3 ON F.ObjectID = T3.ObjectID
+                WHERE {month_filter} AND F.I04ID <> ''
+                GROUP BY F.ObjectID, T3.ShortObjectName, T3.ObjectName, F.I04ID
+            """
+        else:
+            query = f"""
+                SELECT 
+                    T1.ObjectID AS ClientID,
+                    ISNULL(T3.ShortObjectName, T3.ObjectName) AS ClientName,
+                    T2.I04ID,
+                    SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) as Revenue,
+                    SUM(CASE WHEN T1.DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN T1.ConvertedAmount ELSE 0 END) as COGS
+                FROM {config.ERP_GIAO_DICH} T1
+                INNER JOIN {config.ERP_IT1302} T2 ON T1.InventoryID = T2.InventoryID
+                LEFT JOIN {config.ERP_IT1202} T3 ON T1.ObjectID = T3.ObjectID
+                WHERE 
+                    T1.VoucherDate >= DATEADD(day, -365, GETDATE()) 
+                    AND T2.I04ID IS NOT NULL AND T2.I04ID <> ''
+                    AND (T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' OR T1.DebitAccountID LIKE '{config.ACC_GIA_VON}')
+                GROUP BY T1.ObjectID, T3.ShortObjectName, T3.ObjectName, T2.I04ID
+            """
+        return query, params
+
     def get_cross_sell_dna(self, year=None): # Tham số 'year' giữ lại để tương thích nhưng không dùng nữa
         """
         Lấy dữ liệu tổng hợp DNA bán chéo cho Dashboard.
         Logic: Lấy dữ liệu trong 365 ngày gần nhất (Rolling Year).
         """
+        # Ma trận trong RAM đã dựng -> trả thẳng kết quả tính sẵn
+        matrix = self.matrix.get() if self.matrix else None
+        if matrix is not None:
+            return matrix.dashboard()
         
         # 1. Lấy danh sách Master & Tên Nhóm
         master_i04_list = self.get_i04_master_list()
         i04_names = self.get_i04_name_map()
         
-        # 2. Truy vấn Doanh số (SỬA ĐỔI LOGIC TẠI ĐÂY)
-        # Thay vì: T1.TranYear = ? 
-        # Thành: T1.VoucherDate >= DATEADD(day, -365, GETDATE())
+        # 2. Truy vấn Doanh số (Rolling 12 tháng)
+        query, params = self._rolling_sales_query()
         
-        query = f"""
-            SELECT 
-                T1.ObjectID AS ClientID,
-                ISNULL(T3.ShortObjectName, T3.ObjectName) AS ClientName,
-                T2.I04ID,
-                SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) as Revenue,
-                SUM(CASE WHEN T1.DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN T1.ConvertedAmount ELSE 0 END) as COGS
-            FROM {config.ERP_GIAO_DICH} T1
-            INNER JOIN {config.ERP_IT1302} T2 ON T1.InventoryID = T2.InventoryID
-            LEFT JOIN {config.ERP_IT1202} T3 ON T1.ObjectID = T3.ObjectID
-            WHERE 
-                T1.VoucherDate >= DATEADD(day, -365, GETDATE()) 
-                AND T2.I04ID IS NOT NULL AND T2.I04ID <> ''
-                AND (T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' OR T1.DebitAccountID LIKE '{config.ACC_GIA_VON}')
-            GROUP BY T1.ObjectID, T3.ShortObjectName, T3.ObjectName, T2.I04ID
-        """
-        
-        raw_data = self.db.get_data(query) # Không cần truyền tham số năm nữa
+        raw_data = self.db.get_data(query, params, readonly=True) # Không cần truyền tham số năm nữa
         
         if not raw_data:
             return {'buckets': {'titan': [], 'diamond': [], 'growth': [], 'opp': []}, 
@@ -150,25 +180,41 @@ class CrossSellService:
         """
         API Detail: Trả về chi tiết theo 12 tháng gần nhất.
         """
+        matrix = self.matrix.get() if self.matrix else None
+        if matrix is not None:
+            return matrix.gap_analysis(client_id) # 1 hàng ma trận, không truy vấn
+
         master_i04 = self.get_i04_master_list()
         i04_names = self.get_i04_name_map()
         
         # Cập nhật query chi tiết cũng dùng Rolling 12 Months
-        query = f"""
-            SELECT 
-                T2.I04ID,
-                SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) as Revenue,
-                SUM(CASE WHEN T1.DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN T1.ConvertedAmount ELSE 0 END) as COGS
-            FROM {config.ERP_GIAO_DICH} T1
-            INNER JOIN {config.ERP_IT1302} T2 ON T1.InventoryID = T2.InventoryID
-            WHERE 
-                T1.ObjectID = ? 
-                AND T1.VoucherDate >= DATEADD(day, -365, GETDATE()) -- Lọc 365 ngày
-                AND T2.I04ID IS NOT NULL
-            GROUP BY T2.I04ID
-            HAVING SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) > 0
-        """
-        purchased_data = self.db.get_data(query, (client_id,))
+        if get_sales_fact():
+            month_filter, month_params = since_month_clause(12)
+            query = f"""
+                SELECT F.I04ID, SUM(F.Revenue) as Revenue, SUM(F.COGS) as COGS
+                FROM {config.CRM_SALES_FACT_MONTHLY} F
+                WHERE F.ObjectID = ? AND {month_filter} AND F.I04ID <> ''
+                GROUP BY F.I04ID
+                HAVING SUM(F.Revenue) > 0
+            """
+            params = (client_id,) + month_params
+        else:
+            query = f"""
+                SELECT 
+                    T2.I04ID,
+                    SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) as Revenue,
+                    SUM(CASE WHEN T1.DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN T1.ConvertedAmount ELSE 0 END) as COGS
+                FROM {config.ERP_GIAO_DICH} T1
+                INNER JOIN {config.ERP_IT1302} T2 ON T1.InventoryID = T2.InventoryID
+                WHERE 
+                    T1.ObjectID = ? 
+                    AND T1.VoucherDate >= DATEADD(day, -365, GETDATE()) -- Lọc 365 ngày
+                    AND T2.I04ID IS NOT NULL
+                GROUP BY T2.I04ID
+                HAVING SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) > 0
+            """
+            params = (client_id,)
+        purchased_data = self.db.get_data(query, params, readonly=True)
         
         purchased_map = {}
         if purchased_data:
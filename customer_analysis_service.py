@@ -1,5 +1,6 @@
 from flask import current_app
 from db_manager import DBManager, safe_float
+from sales_fact import get_sales_fact
 from datetime import datetime
 import config
 
@@ -89,69 +90,82 @@ class CustomerAnalysisService:
     # =========================================================================
     # 2. HEADER METRICS (6 KHỐI KPI)
     # =========================================================================
+    # Tên hiển thị từng truy vấn của Header (báo chỉ số không tải được)
+    HEADER_METRIC_LABELS = {
+        'reports': 'Báo cáo', 'counts': 'Báo giá / Đơn hàng', 'sales': 'Doanh số YTD',
+        'target': 'Target', 'debt': 'Công nợ', 'otif': 'OTIF'
+    }
+
     def get_header_metrics(self, object_id):
         """
         Lấy 6 chỉ số KPI quan trọng cho Header (Đồng bộ logic CEO Cockpit).
         1. Báo cáo, 2. Báo giá/ĐH, 3. Thanh toán, 4. Doanh số vs Target, 5. Công nợ, 6. OTIF
         """
         current_year = datetime.now().year
+
+        # Doanh số YTD: fact doanh số tháng nếu sẵn sàng, ngược lại GT9000
+        if get_sales_fact():
+            sales_query = f"""
+                SELECT SUM(RevenueOT) as SalesYTD
+                FROM {config.CRM_SALES_FACT_MONTHLY}
+                WHERE ObjectID = ? AND TranYear = ?
+            """
+        else:
+            sales_query = f"""
+                SELECT SUM(ConvertedAmount) as SalesYTD
+                FROM {config.ERP_GIAO_DICH}
+                WHERE ObjectID = ? AND TranYear = ? 
+                AND CreditAccountID LIKE '{config.ACC_DOANH_THU}'
+                AND OTransactionID IS NOT NULL
+            """
         
-        # --- 1. SỐ LƯỢNG BÁO CÁO (Task/Note) ---
-        try:
-            q_rep = f"SELECT COUNT(*) as Cnt FROM {config.TASK_TABLE} WHERE ObjectID = ?"
-            rep_data = self.db.get_data(q_rep, (object_id,))
-            report_count = rep_data[0]['Cnt'] if rep_data else 0
-        except: report_count = 0
+        # 6 truy vấn độc lập -> chạy song song (fan_out); truy vấn lỗi/quá hạn -> chỉ số về 0
+        # và được liệt kê trong 'Unavailable' để giao diện báo thiếu dữ liệu
+        results, errors = self.db.fan_out({
+            # --- 1. SỐ LƯỢNG BÁO CÁO (Task/Note) ---
+            'reports': (f"SELECT COUNT(*) as Cnt FROM {config.TASK_TABLE} WHERE ObjectID = ?", (object_id,)),
+            # --- 2. BÁO GIÁ & ĐƠN HÀNG YTD ---
+            'counts': (f"""
+                SELECT 
+                    (SELECT COUNT(*) FROM {config.ERP_QUOTES} WHERE ObjectID = ? AND YEAR(QuotationDate) = ?) as QuoteCount,
+                    (SELECT COUNT(*) FROM {config.ERP_OT2001} WHERE ObjectID = ? AND YEAR(OrderDate) = ? AND OrderStatus = 1) as OrderCount
+            """, (object_id, current_year, object_id, current_year)),
+            # --- 4. DOANH SỐ YTD ---
+            'sales': (sales_query, (object_id, current_year)),
+            # Target (DTCL)
+            'target': (f"SELECT SUM(DK) as Target FROM {config.CRM_DTCL} WHERE [Ma KH] = ? AND [Nam] = ?", (object_id, current_year)),
+            # --- 5. CÔNG NỢ (Hiện tại vs Quá hạn) ---
+            'debt': (f"SELECT TotalDebt, TotalOverdueDebt FROM {config.CRM_AR_AGING_SUMMARY} WHERE ObjectID = ?", (object_id,)),
+            # --- 6. OTIF (Giao hàng đúng hạn) ---
+            'otif': (f"""
+                SELECT COUNT(*) as Total, 
+                       SUM(CASE WHEN ActualDeliveryDate <= DATEADD(day, 7, ISNULL(EarliestRequestDate, ActualDeliveryDate)) THEN 1 ELSE 0 END) as OnTime
+                FROM {config.DELIVERY_WEEKLY_VIEW}
+                WHERE ObjectID = ? AND DeliveryStatus = '{config.DELIVERY_STATUS_DONE}' AND YEAR(ActualDeliveryDate) = ?
+            """, (object_id, current_year)),
+        }, readonly=True)
 
-        # --- 2. BÁO GIÁ & ĐƠN HÀNG YTD ---
-        q_counts = f"""
-            SELECT 
-                (SELECT COUNT(*) FROM {config.ERP_QUOTES} WHERE ObjectID = ? AND YEAR(QuotationDate) = ?) as QuoteCount,
-                (SELECT COUNT(*) FROM {config.ERP_OT2001} WHERE ObjectID = ? AND YEAR(OrderDate) = ? AND OrderStatus = 1) as OrderCount
-        """
-        res_counts = self.db.get_data(q_counts, (object_id, current_year, object_id, current_year))
+        rep_data = results['reports'] or []
+        report_count = rep_data[0]['Cnt'] if rep_data else 0
+
+        res_counts = results['counts'] or []
         quote_ytd = res_counts[0]['QuoteCount'] if res_counts else 0
         order_ytd = res_counts[0]['OrderCount'] if res_counts else 0
 
         # --- 3. THỜI GIAN THANH TOÁN TB ---
         avg_payment_days = 30 # Logic placeholder (hoặc query thực tế nếu có)
 
-        # --- 4. DOANH SỐ YTD VS TARGET ---
-        q_sales = f"""
-            SELECT SUM(ConvertedAmount) as SalesYTD
-            FROM {config.ERP_GIAO_DICH}
-            WHERE ObjectID = ? AND TranYear = ? 
-            AND CreditAccountID LIKE '{config.ACC_DOANH_THU}'
-            AND OTransactionID IS NOT NULL
-        """
-        sales_data = self.db.get_data(q_sales, (object_id, current_year))
+        sales_data = results['sales'] or []
         sales_ytd = safe_float(sales_data[0]['SalesYTD']) if sales_data else 0
         
-        # Target (DTCL)
-        try:
-            q_target = f"SELECT SUM(DK) as Target FROM {config.CRM_DTCL} WHERE [Ma KH] = ? AND [Nam] = ?"
-            target_data = self.db.get_data(q_target, (object_id, current_year))
-            target_year = safe_float(target_data[0]['Target']) if target_data else 0
-        except: target_year = 0
+        target_data = results['target'] or []
+        target_year = safe_float(target_data[0]['Target']) if target_data else 0
 
-        # --- 5. CÔNG NỢ (Hiện tại vs Quá hạn) ---
-        try:
-            q_debt = f"SELECT TotalDebt, TotalOverdueDebt FROM {config.CRM_AR_AGING_SUMMARY} WHERE ObjectID = ?"
-            debt_data = self.db.get_data(q_debt, (object_id,))
-            curr_debt = safe_float(debt_data[0]['TotalDebt']) if debt_data else 0
-            over_debt = safe_float(debt_data[0]['TotalOverdueDebt']) if debt_data else 0
-        except:
-            curr_debt = 0
-            over_debt = 0
-
-        # --- 6. OTIF (Giao hàng đúng hạn) ---
-        q_otif = f"""
-            SELECT COUNT(*) as Total, 
-                   SUM(CASE WHEN ActualDeliveryDate <= DATEADD(day, 7, ISNULL(EarliestRequestDate, ActualDeliveryDate)) THEN 1 ELSE 0 END) as OnTime
-            FROM {config.DELIVERY_WEEKLY_VIEW}
-            WHERE ObjectID = ? AND DeliveryStatus = '{config.DELIVERY_STATUS_DONE}' AND YEAR(ActualDeliveryDate) = ?
-        """
-        otif_data = self.db.get_data(q_otif, (object_id, current_year))
+        debt_data = results['debt'] or []
+        curr_debt = safe_float(debt_data[0]['TotalDebt']) if debt_data else 0
+        over_debt = safe_float(debt_data[0]['TotalOverdueDebt']) if debt_data else 0
+
+        otif_data = results['otif'] or []
         otif_score = 0
         if otif_data and safe_float(otif_data[0]['Total']) > 0:
             otif_score = (safe_float(otif_data[0]['OnTime']) / safe_float(otif_data[0]['Total'])) * 100
@@ -162,7 +176,8 @@ class CustomerAnalysisService:
             'AvgPaymentDays': avg_payment_days,
             'SalesYTD': sales_ytd, 'TargetYear': target_year,
             'DebtCurrent': curr_debt, 'DebtOverdue': over_debt,
-            'OTIF': round(otif_score, 1)
+            'OTIF': round(otif_score, 1),
+            'Unavailable': [self.HEADER_METRIC_LABELS.get(name, name) for name in errors]
         }
 
     # =========================================================================
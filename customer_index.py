@@ -0,0 +1,237 @@
+# customer_index.py
+# --- CHỈ MỤC TÊN KHÁCH HÀNG TRONG RAM (IT1202) - TÌM KHÔNG DẤU, XẾP HẠNG ---
+#
+# Thay cho "ShortObjectName LIKE '%x%' OR ObjectID LIKE '%x%' OR ObjectName LIKE '%x%'" mỗi lần gõ/chat:
+#   - Mỗi khách -> ObjectID, ShortObjectName, ObjectName đã bỏ dấu + chữ thường (fold_text) và tách token.
+#   - Xếp hạng theo tầng, tầng trước đủ `limit` kết quả thì dừng:
+#       1. Mã / tên tắt trùng khớp từ khóa
+#       2. Mã / tên tắt bắt đầu bằng từ khóa ("hoa sen" -> "Hoa Sen Group")
+#       3. Mọi từ là tiền tố 1 token của tên tắt, không cần đúng thứ tự ("sen hoa" -> "Hoa Sen")
+#       4. Như 3 nhưng trên cả mã + tên đầy đủ ("tnhh hoa" -> "Công ty TNHH Hoa Sen")
+#       5. Chuỗi con (giống LIKE cũ) bằng str.find trên 1 chuỗi gộp
+#   - Trong cùng tầng: tên tắt ngắn hơn trước, rồi theo ABC (entries đã sắp sẵn -> vị trí = thứ hạng).
+# Làm mới tăng dần: chỉ kéo các dòng có LastModifyDate mới hơn lần nạp trước; định kỳ nạp lại toàn bộ (bắt dòng bị xóa).
+
+import re
+import time
+import bisect
+import heapq
+import pandas as pd
+from flask import current_app
+from inventory_index import fold_text
+from background_refresh import BackgroundRefresher
+import config
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_SEP = '\n'
+_MAX_CHAR = '￿'
+_FILTER_THRESHOLD = 256 # Ít ứng viên hơn mức này -> lọc trực tiếp trên token của từng ứng viên thay vì giao tập
+
+
+def _tokens(folded):
+    return _TOKEN_RE.findall(folded)
+
+
+class _TokenIndex:
+    """token -> list vị trí, tra theo tiền tố bằng bisect trên danh sách token đã sắp xếp."""
+
+    def __init__(self, token_sets):
+        postings = {}
+        for pos, tokens in enumerate(token_sets):
+            for tok in tokens:
+                lst = postings.get(tok)
+                if lst is None:
+                    postings[tok] = lst = []
+                lst.append(pos)
+        self.postings = postings
+        self.sorted_tokens = sorted(postings)
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self.sorted_tokens, prefix)
+        hi = bisect.bisect_left(self.sorted_tokens, prefix + _MAX_CHAR)
+        return self.sorted_tokens[lo:hi]
+
+    def estimate(self, prefix):
+        return sum(len(self.postings[tok]) for tok in self._range(prefix))
+
+    def positions(self, prefix):
+        positions = set()
+        for tok in self._range(prefix):
+            positions.update(self.postings[tok])
+        return positions
+
+    def match_all(self, q_tokens, token_sets):
+        """Vị trí mà MỌI từ khóa là tiền tố của ít nhất 1 token."""
+        ordered = sorted(q_tokens, key=self.estimate)
+        result = self.positions(ordered[0])
+        for q in ordered[1:]:
+            if not result:
+                break
+            if len(result) < _FILTER_THRESHOLD:
+                result = {pos for pos in result if any(t.startswith(q) for t in token_sets[pos])}
+            else:
+                result &= self.positions(q)
+        return result
+
+
+class CustomerNameIndex:
+    """Chỉ mục (ObjectID, ShortObjectName, ObjectName) của IT1202, làm mới tăng dần theo LastModifyDate."""
+
+    def __init__(self, db_manager, refresh_seconds=None, full_reload_seconds=None):
+        self.db = db_manager
+        self.full_reload_seconds = full_reload_seconds or config.CUSTOMER_INDEX_FULL_RELOAD_SECONDS
+        self._refresher = BackgroundRefresher(
+            self.refresh, 'customer_index_refresh', 'CustomerIndex: lỗi nạp chỉ mục khách hàng',
+            refresh_seconds or config.CUSTOMER_INDEX_REFRESH_SECONDS
+        )
+        self._records = {}        # ObjectID -> dict dòng gốc (ID, FullName, ObjectName, Address)
+        self._watermark = None    # LastModifyDate lớn nhất đã nạp
+        self._full_loaded_at = 0
+        self._built_at = 0
+        self._state = None        # dict các cấu trúc tìm kiếm, thay nguyên khối khi dựng lại
+
+    # --- NẠP / LÀM MỚI ---
+    def _load_rows(self, since=None):
+        modified_col = config.CUSTOMER_INDEX_MODIFIED_COLUMN
+        select_modified = f", {modified_col} AS ModifiedAt" if modified_col else ""
+        query = f"""
+            SELECT ObjectID AS ID, ShortObjectName AS FullName, ObjectName, Address{select_modified}
+            FROM {config.ERP_IT1202}
+            WHERE ObjectID IS NOT NULL
+        """
+        params = None
+        if since is not None:
+            query += f" AND {modified_col} >= ?"
+            params = (since,)
+        return self.db.fetch_data(query, params, readonly=True)
+
+    def build(self, records):
+        """Dựng chỉ mục từ dict {ObjectID: dòng} (dùng chung cho benchmark)."""
+        entries = []
+        for row in records.values():
+            obj_id = str(row['ID']).strip()
+            short = str(row.get('FullName') or '').strip()
+            id_f, short_f, name_f = fold_text(obj_id), fold_text(short), fold_text(row.get('ObjectName'))
+            entries.append((len(short_f), short_f, id_f, name_f, obj_id, short, row.get('Address')))
+        entries.sort()
+
+        short_tokens = [frozenset(_tokens(e[1])) for e in entries]
+        all_tokens = [st.union(_tokens(e[2]), _tokens(e[3])) for st, e in zip(short_tokens, entries)]
+
+        # Chuỗi gộp để tìm chuỗi con bằng str.find (C), offsets[i] = vị trí bắt đầu của entries[i]
+        parts, offsets, cursor = [], [], 0
+        for e in entries:
+            text = f"{e[2]}\t{e[1]}\t{e[3]}"
+            offsets.append(cursor)
+            parts.append(text)
+            cursor += len(text) + len(_SEP)
+
+        self._state = {
+            'entries': entries,
+            'by_short': sorted((e[1], pos) for pos, e in enumerate(entries)),
+            'by_id': sorted((e[2], pos) for pos, e in enumerate(entries)),
+            'short_tokens': short_tokens,
+            'all_tokens': all_tokens,
+            'short_index': _TokenIndex(short_tokens),
+            'all_index': _TokenIndex(all_tokens),
+            'blob': _SEP.join(parts),
+            'offsets': offsets,
+        }
+        self._built_at = time.time()
+
+    def refresh(self, force_full=False):
+        """Nạp toàn bộ hoặc chỉ phần thay đổi từ DB (đồng bộ), rồi dựng lại chỉ mục. Lỗi -> raise, giữ chỉ mục cũ."""
+        start = time.perf_counter()
+        full = (force_full or self._watermark is None or not config.CUSTOMER_INDEX_MODIFIED_COLUMN
+                or time.time() - self._full_loaded_at > self.full_reload_seconds)
+        rows = self._load_rows(None if full else self._watermark)
+
+        records = {} if full else dict(self._records)
+        watermark = None if full else self._watermark
+        changed = 0
+        for row in rows:
+            obj_id = str(row['ID']).strip()
+            # Điều kiện ">= watermark" luôn trả lại các dòng ở đúng mốc đã nạp -> chỉ đếm dòng thực sự khác
+            if records.get(obj_id) != row:
+                changed += 1
+            records[obj_id] = row
+            modified = row.get('ModifiedAt')
+            # LastModifyDate NULL về từ fetch_data là NaT: bỏ qua, không để NaT thành mốc (NaT so sánh luôn False)
+            if not pd.isna(modified) and (watermark is None or modified > watermark):
+                watermark = modified
+
+        if full or changed:
+            self.build(records)
+        else:
+            self._built_at = time.time() # Không có thay đổi: chỉ đánh dấu vừa làm mới
+        self._records = records
+        self._watermark = watermark
+        if full:
+            self._full_loaded_at = time.time()
+        current_app.logger.info(
+            f"CustomerIndex: {'nạp toàn bộ' if full else 'cập nhật'} {len(rows):,} dòng ({changed:,} thay đổi), "
+            f"tổng {len(records):,} KH trong {time.perf_counter() - start:.2f}s"
+        )
+
+    def is_ready(self):
+        return self._state is not None
+
+    def _ensure_fresh(self):
+        self._refresher.check(self._built_at if self._state is not None else None)
+
+    # --- TÌM KIẾM ---
+    @staticmethod
+    def _starts_with(sorted_pairs, query):
+        """(trùng khớp, bắt đầu bằng) trên list (chuỗi, vị trí) đã sắp xếp."""
+        lo = bisect.bisect_left(sorted_pairs, (query,))
+        hi = bisect.bisect_left(sorted_pairs, (query + _MAX_CHAR,))
+        matched = sorted_pairs[lo:hi]
+        return {pos for text, pos in matched if text == query}, {pos for _, pos in matched}
+
+    @staticmethod
+    def _substring_positions(needle, blob, offsets, limit):
+        positions, start = set(), 0
+        while len(positions) < limit:
+            hit = blob.find(needle, start)
+            if hit < 0:
+                break
+            pos = bisect.bisect_right(offsets, hit) - 1
+            positions.add(pos)
+            start = offsets[pos + 1] if pos + 1 < len(offsets) else len(blob)
+        return positions
+
+    def search(self, text, limit=5):
+        """
+        Trả về list dict {'ID', 'FullName', 'Address'} (tối đa `limit`, đã xếp hạng) khớp `text`
+        (không phân biệt hoa thường/dấu). Trả về None nếu chỉ mục chưa sẵn sàng (nơi gọi dùng LIKE).
+        """
+        self._ensure_fresh()
+        state = self._state
+        if state is None:
+            return None
+
+        query = fold_text(text).strip()
+        q_tokens = set(_tokens(query))
+        if not q_tokens:
+            return []
+
+        exact_short, prefix_short = self._starts_with(state['by_short'], query)
+        exact_id, prefix_id = self._starts_with(state['by_id'], query)
+        tiers = (
+            lambda: exact_id | exact_short,
+            lambda: prefix_id | prefix_short,
+            lambda: state['short_index'].match_all(q_tokens, state['short_tokens']),
+            lambda: state['all_index'].match_all(q_tokens, state['all_tokens']),
+            lambda: self._substring_positions(query, state['blob'], state['offsets'], limit * 4),
+        )
+
+        picked, seen = [], set()
+        for tier in tiers:
+            for pos in heapq.nsmallest(limit - len(picked), tier() - seen):
+                picked.append(pos)
+                seen.add(pos)
+            if len(picked) >= limit:
+                break
+
+        entries = state['entries']
+        return [{'ID': entries[pos][4], 'FullName': entries[pos][5], 'Address': entries[pos][6]} for pos in picked]
@@ -3,12 +3,15 @@
 from datetime import datetime, timedelta
 import pandas as pd 
 from db_manager import DBManager, safe_float
+from customer_index import CustomerNameIndex
 import config
 
 class CustomerService:
     def __init__(self, db_manager: DBManager):
         self.db = db_manager
         # Đã chuyển RISK_CONFIG sang config.py
+        # Chỉ mục tên KH trong RAM (tìm không dấu, xếp hạng), nạp nền + làm mới tăng dần
+        self.customer_index = CustomerNameIndex(db_manager) if config.CUSTOMER_INDEX_ENABLED else None
 
     def _calculate_quote_risk(self, quote, current_status):
         """Tính toán điểm rủi ro (Risk Score) cho từng báo giá."""
@@ -155,11 +158,21 @@ class CustomerService:
             
         return quotes
     
-    def get_customer_by_name(self, name_fragment):
-        """Tìm kiếm khách hàng (cho Chatbot)."""
+    def get_customer_by_name(self, name_fragment, limit=5):
+        """
+        Tìm kiếm khách hàng (Chatbot + Autocomplete /api/khachhang).
+        Dùng chỉ mục trong RAM (không phân biệt dấu, xếp hạng theo độ khớp); chỉ mục chưa sẵn sàng -> LIKE trên IT1202.
+        """
+        if not name_fragment or not name_fragment.strip():
+            return []
+        if self.customer_index:
+            result = self.customer_index.search(name_fragment, limit)
+            if result is not None:
+                return result
+
         # [CONFIG]: ERP_IT1202
         query = f"""
-            SELECT TOP 5 
+            SELECT TOP {int(limit)} 
                 T1.ObjectID AS ID, 
                 T1.ShortObjectName AS FullName,
                 T1.Address AS Address
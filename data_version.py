@@ -0,0 +1,85 @@
+# data_version.py
+# --- PHIÊN BẢN DỮ LIỆU BÁN HÀNG: ĐỔI KHI ERP THỰC SỰ THAY ĐỔI ---
+#
+# Realtime Dashboard cache toàn bộ kết quả sp_GetRealtimeSalesKPI (5 bảng kết quả, rất nặng) nhiều giờ.
+# Thay vì rút ngắn TTL (gọi SP liên tục dù không có gì mới):
+#   - Job server.py mỗi DATA_VERSION_POLL_SECONDS giây chạy 1 câu nhẹ lấy "mốc nước" của OT2001 (Đơn hàng),
+#     OT2101 (Chào giá), GT9000 (Sổ cái năm hiện tại): số dòng, ngày chứng từ lớn nhất, LastModifyDate lớn nhất,
+#     checksum (mã, trạng thái) để bắt duyệt / hủy không đổi ngày.
+#   - Mốc khác lần trước (lưu trong Redis) -> INCR khóa phiên bản. Entry cache của Realtime Dashboard lưu kèm phiên bản
+#     -> trang giữ cache đến khi dữ liệu đổi; đổi rồi thì lượt xem kế tiếp nhận bản cũ ngay và tính lại ở nền.
+#   - Nhiều tiến trình cùng poll vẫn an toàn: chỉ tiến trình thấy mốc khác mới tăng phiên bản.
+#
+# Dữ liệu do chính app ghi (Task, Báo cáo...) không cần poll: nơi ghi gọi bump_data_version(tên) sau khi lưu.
+
+import json
+from datetime import date
+from flask import current_app
+import config
+
+_VERSION_PREFIX = 'data_version:'
+_VERSION_KEY = _VERSION_PREFIX + 'sales'
+_MARKS_KEY = 'data_version:sales_marks'
+
+
+def _marks_query():
+    modified = config.DATA_VERSION_MODIFIED_COLUMN
+    modified_max = f"MAX({modified})" if modified else "NULL"
+    return f"""
+        SELECT O.*, Q.*, G.*
+        FROM (
+            SELECT COUNT_BIG(*) AS OrderRows, MAX(OrderDate) AS OrderMaxDate, {modified_max} AS OrderModified,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(SOrderID, OrderStatus)) AS OrderStatusSum
+            FROM {config.ERP_OT2001} WHERE OrderDate >= ?
+        ) O
+        CROSS JOIN (
+            SELECT COUNT_BIG(*) AS QuoteRows, MAX(QuotationDate) AS QuoteMaxDate, {modified_max} AS QuoteModified,
+                   CHECKSUM_AGG(BINARY_CHECKSUM(QuotationID, OrderStatus)) AS QuoteStatusSum
+            FROM {config.ERP_QUOTES} WHERE QuotationDate >= ?
+        ) Q
+        CROSS JOIN (
+            SELECT COUNT_BIG(*) AS LedgerRows, MAX(VoucherDate) AS LedgerMaxDate
+            FROM {config.ERP_GIAO_DICH} WHERE TranYear = ?
+        ) G
+    """
+
+
+def poll_sales_changes(db_manager):
+    """
+    Đọc mốc nước hiện tại, so với lần trước; khác -> tăng phiên bản. Trả về True nếu đã tăng.
+    Lỗi DB -> raise (job ghi log, phiên bản giữ nguyên -> cache hiện tại vẫn dùng được).
+    """
+    today = date.today()
+    # Realtime KPI đọc đơn / chào giá từ đầu năm trước (so sánh cùng kỳ, đơn tồn), sổ cái năm hiện tại
+    since = date(today.year - 1, 1, 1)
+    rows = db_manager.fetch_data(_marks_query(), (since, since, today.year), readonly=True)
+    marks = json.dumps(rows[0] if rows else {}, default=str, sort_keys=True)
+
+    redis_client = current_app.redis_client
+    previous = redis_client.getset(_MARKS_KEY, marks)
+    if previous == marks:
+        return False
+    version = redis_client.incr(_VERSION_KEY)
+    current_app.logger.info(f"DataVersion: dữ liệu bán hàng thay đổi -> phiên bản {version}")
+    return True
+
+
+def get_data_version(name):
+    """Phiên bản hiện tại của nhóm dữ liệu `name` (chuỗi, dùng trong cache key). Redis lỗi -> '0'."""
+    try:
+        return str(current_app.redis_client.get(_VERSION_PREFIX + name) or 0)
+    except Exception:
+        return '0'
+
+
+def bump_data_version(name):
+    """Tăng phiên bản nhóm dữ liệu `name` sau khi ghi -> mọi cache key chứa phiên bản cũ hết hiệu lực. Lỗi chỉ ghi log."""
+    try:
+        current_app.redis_client.incr(_VERSION_PREFIX + name)
+    except Exception as e:
+        current_app.logger.error(f"DataVersion: lỗi tăng phiên bản '{name}': {e}")
+
+
+def get_sales_data_version():
+    """Phiên bản dữ liệu bán hàng hiện tại. Redis lỗi -> '0'."""
+    return get_data_version('sales')
@@ -1,12 +1,18 @@
 ﻿# db_manager.py
 
-from flask import current_app
+from flask import current_app, has_app_context
 import pandas as pd
 from sqlalchemy import create_engine, text
 import config
 import time
 import math
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal
 import logging  # <--- Thêm dòng này
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from sql_profiler import QueryProfiler
 # =========================================================================
 # HÀM HELPER XỬ LÝ DỮ LIỆU
 # =========================================================================
@@ -54,6 +60,87 @@ def evaluate_condition(value, operator, threshold):
     elif operator == '!=': return value != threshold
     return True
 
+def clean_cell(x):
+    """Làm sạch 1 ô: None -> '', bytes -> decode utf-8, còn lại -> str().strip()."""
+    if x is None: return ''
+    if isinstance(x, bytes):
+        return x.decode('utf-8', errors='ignore')
+    return str(x).strip()
+
+def _materialize_column(values, type_code):
+    """
+    Chuyển 1 cột (list giá trị thô từ pyodbc) về đúng dạng mà pd.read_sql + clean_cell trả ra:
+    - Cột toàn NULL             -> '' (pandas coi là object)
+    - int không NULL / bool không NULL -> giữ nguyên
+    - int có NULL, float, Decimal      -> float, NULL = NaN (read_sql mặc định coerce_float)
+    - datetime                  -> pd.Timestamp, NULL = NaT (box cả cột 1 lần qua DatetimeIndex)
+    - date                      -> chuỗi 'YYYY-MM-DD' (giống str(date)), NULL = ''
+    - Còn lại (str, bytes...)          -> clean_cell
+    """
+    has_null = False
+    all_null = True
+    for v in values:
+        if v is None:
+            has_null = True
+        else:
+            all_null = False
+        if has_null and not all_null:
+            break
+
+    if all_null:
+        return [''] * len(values)
+    if type_code is bool:
+        return values if not has_null else [clean_cell(v) for v in values]
+    if type_code is int:
+        if not has_null:
+            return values
+        return [float(v) if v is not None else math.nan for v in values]
+    if type_code in (float, Decimal):
+        return [float(v) if v is not None else math.nan for v in values]
+    if type_code is datetime:
+        return list(pd.DatetimeIndex(values))
+    if type_code is date:
+        return [v.isoformat() if v is not None else '' for v in values]
+    return [clean_cell(v) for v in values]
+
+def records_from_cursor(cursor):
+    """
+    Dựng list[dict] trực tiếp từ cursor pyodbc (không qua DataFrame).
+    Xử lý theo cột thay vì từng ô, kết quả giống pd.read_sql -> clean_cell -> to_dict('records').
+    """
+    if not cursor.description:
+        return []
+    return _records_from_rows(cursor.description, cursor.fetchall())
+
+def _records_from_rows(description, rows):
+    """Dựng list[dict] từ description + list tuple (dùng chung cho fetchall và fetchmany)."""
+    if not rows:
+        return []
+    columns = [col[0] for col in description]
+    column_values = [list(col) for col in zip(*rows)]
+    cleaned = [
+        _materialize_column(values, desc[1])
+        for values, desc in zip(column_values, description)
+    ]
+    return [dict(zip(columns, row)) for row in zip(*cleaned)]
+
+def _apply_query_timeout(conn, seconds):
+    """Đặt thời hạn mỗi câu cho kết nối vừa mượn (pyodbc Connection.timeout, giây; 0 = không giới hạn)."""
+    try:
+        getattr(conn, 'dbapi_connection', conn).timeout = seconds
+    except Exception:
+        pass
+
+# Key Redis cho query cache (get_data_cached)
+_QUERY_CACHE_PREFIX = 'dbq:'
+_TAG_VERSION_KEY = 'dbq_tagver:'
+_TAG_STATS_KEY = 'dbq_stats'
+
+# Đánh dấu luồng đang chạy bên trong fan_out (chống gọi lồng nhau gây deadlock) + hạn chót của task đang chạy
+_fanout_local = threading.local()
+_FANOUT_POLL_SECONDS = 0.05 # Chu kỳ kiểm tra task còn xếp hàng
+_FANOUT_DRIVER_GRACE = 2    # Giây chờ thêm sau hạn để driver kịp hủy câu và trả lỗi
+
 # =========================================================================
 # DATA ACCESS LAYER (DAL)
 # =========================================================================
@@ -65,38 +152,93 @@ class DBManager:
         logging.info(f"--- Init DB Connection Pool to {config.DB_SERVER} ---")
         self.engine = create_engine(
             config.SQLALCHEMY_DATABASE_URI,
-            pool_size=10,
-            max_overflow=20,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
             pool_timeout=30,
             pool_recycle=1800,
             fast_executemany=True 
         )
+        # ENGINE BÁO CÁO (Chỉ đọc): Pool riêng cho truy vấn nặng (readonly=True)
+        if config.REPORT_DB_ENABLED:
+            logging.info(f"--- Init Report Pool to {config.REPORT_DB_SERVER} ---")
+            self.report_engine = create_engine(
+                config.REPORT_SQLALCHEMY_DATABASE_URI,
+                pool_size=config.REPORT_POOL_SIZE,
+                max_overflow=config.REPORT_MAX_OVERFLOW,
+                pool_timeout=config.REPORT_POOL_TIMEOUT,
+                pool_recycle=1800
+            )
+        else:
+            self.report_engine = self.engine
+        self._check_pool_budget()
+        # Đo đếm SQL theo request + N+1 + slow log (xem sql_profiler.py)
+        self.profiler = QueryProfiler() if config.SQL_PROFILER_ENABLED else None
+        # Pool luồng cho fan_out (tạo khi cần)
+        self._fanout_executor = None
+        self._fanout_lock = threading.Lock()
+
+    @staticmethod
+    def _pool_budget():
+        """Số kết nối tối đa có thể bị giữ cùng lúc, theo từng nguồn luồng (mỗi luồng giữ tối đa 1 kết nối)."""
+        refreshers = sum(1 for enabled in (
+            config.INVENTORY_INDEX_ENABLED, config.STOCK_SNAPSHOT_ENABLED, config.INVENTORY_AGING_SNAPSHOT_ENABLED,
+            config.CUSTOMER_INDEX_ENABLED, config.CROSS_SELL_MATRIX_ENABLED, config.KNOWLEDGE_INDEX_ENABLED,
+        ) if enabled)
+        return {
+            'luồng waitress': config.WAITRESS_THREADS,
+            'luồng fan-out': config.DB_FANOUT_MAX_WORKERS,
+            'làm mới nền SWR': config.SWR_REFRESH_WORKERS,
+            'làm nóng cache': config.CACHE_WARMUP_WORKERS if config.CACHE_WARMUP_ENABLED else 0,
+            'BackgroundRefresher': refreshers,
+            'job APScheduler': config.SCHEDULER_MAX_WORKERS,
+            'dự phòng': config.DB_POOL_HEADROOM,
+        }
+
+    @classmethod
+    def _check_pool_budget(cls):
+        """Cảnh báo khi số luồng có thể giữ kết nối cùng lúc vượt sức chứa Pool (request sẽ chờ pool_timeout)."""
+        budget = cls._pool_budget()
+        needed = sum(budget.values())
+        pools = [('OLTP', config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW)]
+        if config.REPORT_DB_ENABLED:
+            pools.append(('báo cáo', config.REPORT_POOL_SIZE + config.REPORT_MAX_OVERFLOW))
+        for name, capacity in pools:
+            if needed > capacity:
+                logging.warning(
+                    f"Pool {name}: {capacity} kết nối < {needed} cần khi cao điểm ("
+                    + ' + '.join(f"{count} {source}" for source, count in budget.items()) + ")"
+                )
+
+    def _raw_connection(self, readonly=False):
+        """
+        Lấy kết nối thô từ Pool (readonly=True -> Pool báo cáo), được bọc bởi profiler nếu bật.
+        Mỗi lần mượn đều đặt lại thời hạn câu lệnh: trong task fan_out = số giây còn lại của task
+        (driver hủy câu quá hạn, trả luồng + kết nối ngay); ngoài fan_out = mặc định của Pool.
+        """
+        deadline = getattr(_fanout_local, 'deadline', None)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Task fan_out đã quá hạn trước khi lấy kết nối")
+            seconds = max(1, math.ceil(remaining))
+        else:
+            seconds = config.REPORT_QUERY_TIMEOUT if readonly and config.REPORT_DB_ENABLED else 0
+        conn = (self.report_engine if readonly else self.engine).raw_connection()
+        _apply_query_timeout(conn, seconds)
+        if self.profiler:
+            return self.profiler.wrap_connection(conn)
+        return conn
         
     # 1. PHƯƠNG THỨC TỐI ƯU (Dùng cho Dashboard/Report - Chỉ đọc)
-    def get_data(self, query, params=None):
+    def get_data(self, query, params=None, readonly=False):
         """
-        Thực thi SELECT dùng SQLAlchemy Pool + Pandas.
+        Thực thi SELECT dùng SQLAlchemy Pool.
+        Dựng records thẳng từ cursor (records_from_cursor) thay vì pd.read_sql + apply từng ô,
+        output giữ nguyên như đường Pandas cũ.
+        readonly=True: chạy trên Pool báo cáo (truy vấn phân tích nặng, không ghi).
         """
         try:
-            # Tự động lấy kết nối từ Pool
-            with self.engine.connect() as conn:
-                if params:
-                    # Pandas read_sql hỗ trợ tốt việc truyền params qua SQLAlchemy driver
-                    df = pd.read_sql(query, conn, params=params)
-                else:
-                    df = pd.read_sql(query, conn)
-                
-                # Logic làm sạch dữ liệu
-                for col in df.select_dtypes(include=['object']).columns:
-                    def clean_cell(x):
-                        if x is None: return ''
-                        if isinstance(x, bytes):
-                            return x.decode('utf-8', errors='ignore')
-                        return str(x).strip()
-                    
-                    df[col] = df[col].apply(clean_cell)
-                
-                return df.to_dict('records')
+            return self.fetch_data(query, params, readonly)
 
         except Exception as e:
             # Chỉ in mã lỗi dạng ASCII an toàn hoặc encode/replace
@@ -108,6 +250,130 @@ class DBManager:
                 
             return []
 
+    def fetch_data(self, query, params=None, readonly=False):
+        """Giống get_data nhưng KHÔNG nuốt lỗi (để nơi gọi tự báo lỗi từng phần, VD: fan_out)."""
+        conn = None
+        try:
+            # Lấy kết nối thô từ Pool (hỗ trợ cú pháp '?' giống read_sql)
+            conn = self._raw_connection(readonly)
+            cursor = conn.cursor()
+            
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            
+            return records_from_cursor(cursor)
+        finally:
+            if conn: conn.close() # Trả kết nối về Pool
+
+    # 1b. CHẠY SONG SONG CÁC TRUY VẤN ĐỘC LẬP (FAN-OUT)
+    def fan_out(self, tasks, timeout=None, timeouts=None, readonly=False):
+        """
+        Chạy song song các truy vấn độc lập, mỗi truy vấn 1 kết nối Pool riêng.
+        tasks: dict {tên: (query, params)} hoặc {tên: callable không tham số}.
+        timeout: số giây tối đa cho mỗi task (mặc định config.DB_FANOUT_TIMEOUT), tính từ lúc task BẮT ĐẦU chạy
+                 (thời gian xếp hàng không tính); timeouts: dict {tên: giây} để ghi đè riêng từng task.
+                 Hạn được đặt xuống driver (pyodbc Connection.timeout) -> câu quá hạn bị hủy thật,
+                 luồng và kết nối Pool được trả lại thay vì chạy tiếp sau khi nơi gọi đã bỏ cuộc.
+        readonly: các task dạng (query, params) chạy trên Pool báo cáo.
+        Trả về (results, errors): results[tên] = kết quả (None nếu lỗi/quá hạn), errors[tên] = thông báo lỗi.
+        Nơi gọi phải xem errors: results[tên] = None là "không có dữ liệu", không phải rỗng / 0.
+
+        Số luồng bị chặn bởi config.DB_FANOUT_MAX_WORKERS (dùng chung toàn app) để tổng kết nối
+        (waitress + fan-out + các luồng nền, xem _pool_budget) luôn nằm trong pool_size + max_overflow.
+        Task chờ luồng trống quá config.DB_FANOUT_QUEUE_TIMEOUT giây -> hủy (chưa chạy) và báo lỗi.
+        Nếu gọi lồng nhau từ bên trong 1 luồng fan-out -> chạy tuần tự (vẫn theo hạn của task cha) để tránh deadlock.
+        """
+        timeout = timeout or config.DB_FANOUT_TIMEOUT
+        timeouts = timeouts or {}
+        results, errors = {}, {}
+
+        def _runner(spec):
+            if callable(spec):
+                return spec
+            query, params = spec
+            return lambda: self.fetch_data(query, params, readonly)
+
+        # Gọi lồng nhau -> chạy tuần tự trên luồng hiện tại
+        if getattr(_fanout_local, 'active', False) or len(tasks) <= 1:
+            for name, spec in tasks.items():
+                try:
+                    results[name] = _runner(spec)()
+                except Exception as e:
+                    results[name] = None
+                    errors[name] = str(e)
+            return results, errors
+
+        app = current_app._get_current_object() if has_app_context() else None
+        profiler_ctx = self.profiler.capture_context() if self.profiler else None
+        limits = {name: timeouts.get(name, timeout) for name in tasks}
+        started = {} # tên -> thời điểm task bắt đầu chạy trên luồng fan-out
+
+        def _run_in_worker(name, fn):
+            started[name] = time.monotonic()
+            _fanout_local.active = True
+            _fanout_local.deadline = started[name] + limits[name]
+            try:
+                if app is None:
+                    return fn()
+                with app.app_context():
+                    if profiler_ctx is not None:
+                        self.profiler.bind_context(profiler_ctx)
+                    return fn()
+            finally:
+                _fanout_local.active = False
+                _fanout_local.deadline = None
+
+        executor = self._get_fanout_executor()
+        submitted = time.monotonic()
+        futures = {name: executor.submit(_run_in_worker, name, _runner(spec)) for name, spec in tasks.items()}
+
+        for name, future in futures.items():
+            try:
+                results[name] = self._await_fanout_task(future, lambda name=name: started.get(name), limits[name], submitted)
+            except FutureTimeoutError as e:
+                results[name] = None
+                errors[name] = str(e) or f"Quá thời gian {limits[name]}s"
+            except Exception as e:
+                results[name] = None
+                errors[name] = str(e)
+
+        if errors and app is not None:
+            app.logger.warning(f"fan_out lỗi một phần: {errors}")
+        return results, errors
+
+    @staticmethod
+    def _await_fanout_task(future, started_at, limit, submitted):
+        """
+        Chờ kết quả 1 task fan_out. Đang xếp hàng: chờ tối đa DB_FANOUT_QUEUE_TIMEOUT rồi hủy (chưa chạy nên hủy được).
+        Đã chạy: chờ đến started + limit (+ thời gian để driver kịp hủy câu quá hạn và trả lỗi).
+        """
+        while True:
+            begun = started_at()
+            if begun is None:
+                queue_left = submitted + config.DB_FANOUT_QUEUE_TIMEOUT - time.monotonic()
+                if queue_left <= 0 and future.cancel():
+                    raise FutureTimeoutError(f"Chờ luồng fan-out quá {config.DB_FANOUT_QUEUE_TIMEOUT}s")
+                wait = min(max(queue_left, 0.0), _FANOUT_POLL_SECONDS)
+            else:
+                wait = max(0.0, begun + limit + _FANOUT_DRIVER_GRACE - time.monotonic())
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeoutError:
+                if begun is not None:
+                    raise # Driver chưa trả lỗi sau hạn (task không phải truy vấn DB): bỏ kết quả
+
+    def _get_fanout_executor(self):
+        """ThreadPoolExecutor dùng chung (khởi tạo lười, thread-safe)."""
+        if self._fanout_executor is None:
+            with self._fanout_lock:
+                if self._fanout_executor is None:
+                    self._fanout_executor = ThreadPoolExecutor(
+                        max_workers=config.DB_FANOUT_MAX_WORKERS, thread_name_prefix='db_fanout'
+                    )
+        return self._fanout_executor
+
     # 2. PHƯƠNG THỨC THỰC THI (QUAN TRỌNG: ĐÃ SỬA ĐỂ DÙNG RAW CONNECTION)
     def execute_non_query(self, query, params=None):
         """
@@ -117,7 +383,7 @@ class DBManager:
         conn = None
         try:
             # Lấy kết nối thô từ Pool
-            conn = self.engine.raw_connection()
+            conn = self._raw_connection()
             cursor = conn.cursor()
             
             if params:
@@ -133,11 +399,54 @@ class DBManager:
         finally:
             if conn: conn.close()
 
+    # 2b. GHI HÀNG LOẠT (executemany + fast_executemany, 1 transaction)
+    def bulk_transaction(self, steps, chunk_size=1000):
+        """
+        Thực thi nhiều câu ghi hàng loạt trong CÙNG 1 transaction trên 1 kết nối.
+        steps: list các cặp (query, rows) với rows là list tuple tham số.
+        Mỗi câu chạy executemany theo lô chunk_size. Lỗi ở bất kỳ bước nào -> rollback toàn bộ.
+        """
+        steps = [(query, list(rows)) for query, rows in steps]
+        if not any(rows for _, rows in steps):
+            return True
+
+        conn = None
+        try:
+            conn = self._raw_connection()
+            cursor = conn.cursor()
+            cursor.fast_executemany = True # Gửi cả lô tham số trong 1 round trip
+
+            for query, rows in steps:
+                for i in range(0, len(rows), chunk_size):
+                    cursor.executemany(query, rows[i:i + chunk_size])
+
+            conn.commit()
+            return True
+        except Exception as e:
+            current_app.logger.error(f"Lỗi bulk_transaction: {e}")
+            if conn:
+                try: conn.rollback()
+                except Exception: pass
+            return False
+        finally:
+            if conn: conn.close()
+
+    def bulk_execute(self, query, rows, chunk_size=1000):
+        """Thực thi 1 câu INSERT/UPDATE/DELETE cho nhiều bộ tham số (executemany, 1 transaction)."""
+        return self.bulk_transaction([(query, rows)], chunk_size)
+
+    def bulk_insert(self, table, columns, rows, chunk_size=1000):
+        """INSERT hàng loạt: rows là list tuple theo đúng thứ tự columns."""
+        column_list = ', '.join(f"[{col}]" for col in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        query = f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})"
+        return self.bulk_execute(query, rows, chunk_size)
+
     # 3. PHƯƠNG THỨC TƯƠNG THÍCH NGƯỢC (LEGACY SUPPORT)
 
     def get_transaction_connection(self):
         """Trả về kết nối thô (Raw PyODBC Connection) từ Pool."""
-        return self.engine.raw_connection()
+        return self._raw_connection()
     
     def commit(self, conn):
         conn.commit()
@@ -153,12 +462,12 @@ class DBManager:
             cursor.execute(query)
         return cursor
 
-    def execute_sp_multi(self, sp_name, params=None):
-        """Thực thi Stored Procedure trả về NHIỀU bảng (Multi-ResultSet)."""
+    def execute_sp_multi(self, sp_name, params=None, readonly=False):
+        """Thực thi Stored Procedure trả về NHIỀU bảng (Multi-ResultSet). readonly=True -> Pool báo cáo."""
         conn = None
         results = []
         try:
-            conn = self.engine.raw_connection() # Lấy kết nối từ Pool
+            conn = self._raw_connection(readonly) # Lấy kết nối từ Pool
             cursor = conn.cursor()
             
             # Xây dựng câu lệnh EXEC
@@ -197,12 +506,171 @@ class DBManager:
             if conn:
                 conn.close() # Trả kết nối về Pool
 
+    # 4. PHƯƠNG THỨC STREAMING (Dùng cho kết quả lớn - Không giữ toàn bộ trong RAM)
+
+    def iter_data(self, query, params=None, batch_size=5000, readonly=False):
+        """
+        Generator thực thi SELECT và trả về từng lô (list[dict]) tối đa batch_size dòng.
+        Dùng fetchmany trên 1 kết nối Pool, kết nối được trả lại khi duyệt hết hoặc khi đóng generator.
+        Lưu ý: kiểu dữ liệu được suy ra theo từng lô (VD: cột int có NULL trong lô -> float/NaN).
+        Lỗi (kể cả giữa chừng) -> ghi log rồi raise lại: nơi gọi cộng dồn theo lô không được coi kết quả dở dang là đủ.
+        """
+        conn = None
+        try:
+            conn = self._raw_connection(readonly)
+            cursor = conn.cursor()
+
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+
+            if not cursor.description:
+                return
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield _records_from_rows(cursor.description, rows)
+
+        except Exception as e:
+            current_app.logger.error(f"Lỗi iter_data: {e}")
+            raise
+        finally:
+            if conn: conn.close() # Trả kết nối về Pool
+
+    def iter_sp_multi(self, sp_name, params=None, batch_size=5000, readonly=False):
+        """
+        Phiên bản streaming của execute_sp_multi.
+        Yield (result_index, batch) cho từng lô của từng Result Set, theo đúng thứ tự SP trả về.
+        Result Set rỗng không yield lô nào. Lỗi -> ghi log rồi raise lại (giống iter_data).
+        """
+        conn = None
+        try:
+            conn = self._raw_connection(readonly)
+            cursor = conn.cursor()
+
+            param_placeholders = ', '.join(['?' for _ in params]) if params else ''
+            sql = f"EXEC {sp_name} {param_placeholders}"
+
+            if params:
+                cursor.execute(sql, params)
+            else:
+                cursor.execute(sql)
+
+            result_index = 0
+            while True:
+                if cursor.description:
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield result_index, _records_from_rows(cursor.description, rows)
+                    result_index += 1
+
+                if not cursor.nextset():
+                    break
+
+            conn.commit() # Commit nếu SP có ghi dữ liệu tạm
+
+        except Exception as e:
+            current_app.logger.error(f"Lỗi iter_sp_multi: {e}")
+            raise
+        finally:
+            if conn: conn.close() # Trả kết nối về Pool
+
+    # 5. CACHE KẾT QUẢ TRUY VẤN (Redis - gắn tag theo bảng nguồn)
+
+    def get_data_cached(self, query, params=None, ttl=None, tags=None, readonly=False):
+        """
+        Giống get_data nhưng lưu kết quả vào Redis Cache (app.cache) trong ttl giây.
+        tags: danh sách bảng nguồn (VD: ['IT1302']) -> invalidate_tags('IT1302') làm mọi entry gắn tag đó hết hiệu lực.
+        Cơ chế: mỗi tag có 1 số phiên bản trong Redis, được đưa vào cache key; invalidate = tăng phiên bản (O(1)).
+        Lỗi DB không được cache. Nếu Redis lỗi -> đọc thẳng DB.
+        """
+        tags = list(tags or [])
+        ttl = ttl or config.DB_QUERY_CACHE_TTL
+        try:
+            cache = current_app.cache
+            redis_client = current_app.redis_client
+            versions = redis_client.mget([_TAG_VERSION_KEY + t for t in tags]) if tags else []
+            raw_key = f"{query}|{params!r}|{readonly}|{versions!r}"
+            cache_key = _QUERY_CACHE_PREFIX + hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+            cached = cache.get(cache_key)
+        except Exception as e:
+            current_app.logger.warning(f"Query cache không khả dụng: {e}")
+            return self.get_data(query, params, readonly)
+
+        self._count_cache_usage(redis_client, tags, hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        try:
+            data = self.fetch_data(query, params, readonly)
+        except Exception as e:
+            current_app.logger.error(f"Lỗi get_data_cached: {e}")
+            return []
+
+        try:
+            cache.set(cache_key, data, timeout=ttl)
+        except Exception as e:
+            current_app.logger.warning(f"Không ghi được query cache: {e}")
+        return data
+
+    def invalidate_tags(self, *tags):
+        """Vô hiệu hóa mọi kết quả cache gắn các tag này (gọi sau khi ghi vào bảng nguồn)."""
+        if not tags:
+            return
+        try:
+            pipe = current_app.redis_client.pipeline()
+            for t in tags:
+                pipe.incr(_TAG_VERSION_KEY + t)
+            pipe.execute()
+        except Exception as e:
+            current_app.logger.error(f"Lỗi invalidate_tags {tags}: {e}")
+
+    def _count_cache_usage(self, redis_client, tags, hit):
+        field = 'hit' if hit else 'miss'
+        try:
+            pipe = redis_client.pipeline()
+            for t in (tags or ['_untagged']):
+                pipe.hincrby(_TAG_STATS_KEY, f"{t}:{field}", 1)
+            pipe.execute()
+        except Exception:
+            pass
+
+    def get_query_cache_stats(self):
+        """Số lần hit/miss theo tag: [{'tag', 'hits', 'misses', 'hit_rate'}], sắp xếp theo tổng lượt gọi."""
+        try:
+            raw = current_app.redis_client.hgetall(_TAG_STATS_KEY) or {}
+        except Exception as e:
+            current_app.logger.error(f"Lỗi đọc thống kê query cache: {e}")
+            return []
+
+        stats = {}
+        for field, count in raw.items():
+            tag, _, kind = field.rpartition(':')
+            entry = stats.setdefault(tag, {'tag': tag, 'hits': 0, 'misses': 0})
+            entry['hits' if kind == 'hit' else 'misses'] += int(count)
+
+        for entry in stats.values():
+            total = entry['hits'] + entry['misses']
+            entry['hit_rate'] = round(entry['hits'] / total * 100, 1) if total else 0
+        return sorted(stats.values(), key=lambda e: e['hits'] + e['misses'], reverse=True)
+
+    def reset_query_cache_stats(self):
+        try:
+            current_app.redis_client.delete(_TAG_STATS_KEY)
+        except Exception as e:
+            current_app.logger.error(f"Lỗi reset thống kê query cache: {e}")
+
     # --- CÁC HÀM CỤ THỂ KHÁC ---
 
     def write_audit_log(self, user_code, action_type, severity, details, ip_address):
         """Ghi log hệ thống (Dùng raw_connection để an toàn)."""
         try:
-            conn = self.engine.raw_connection()
+            conn = self._raw_connection()
             cursor = conn.cursor()
             query = "INSERT INTO dbo.AUDIT_LOGS (UserCode, ActionType, Severity, Details, IPAddress) VALUES (?, ?, ?, ?, ?)"
             cursor.execute(query, (user_code, action_type, severity, details, ip_address))
@@ -215,7 +683,7 @@ class DBManager:
         """Ghi log Task (Dùng OUTPUT INSERTED -> Bắt buộc Raw Connection)."""
         conn = None
         try:
-            conn = self.engine.raw_connection()
+            conn = self._raw_connection()
             cursor = conn.cursor()
             query = f"""
                 INSERT INTO {config.TASK_LOG_TABLE} (
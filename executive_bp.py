@@ -107,6 +107,7 @@ def comparison_dashboard():
         m1=metrics['y1'], m2=metrics['y2'],
         delta=delta,
         chart_data=comp_data['chart'],
+        unavailable=comp_data.get('unavailable', {}),
         user_context=user_context
     )
 
@@ -2,50 +2,64 @@
 
 from flask import current_app
 from db_manager import DBManager, safe_float
-from datetime import datetime, timedelta
+from swr_cache import get_or_refresh
+from sales_fact import get_sales_fact, since_month_clause
+from comparison_engine import ComparisonEngine, METRIC_LABELS
+from inventory_aging_snapshot import get_inventory_aging_snapshot
+from datetime import datetime
 import config
 
 class ExecutiveService:
     """
     Service chuyên biệt cho CEO Cockpit (Version 3.2 - Fix Conflict).
     """
+
+    # Tên hiển thị các khối Cockpit (báo khối không tải được)
+    COCKPIT_BLOCK_LABELS = {
+        'kpi': 'Chỉ số KPI', 'inventory': 'Tuổi tồn kho', 'category': 'Nhóm hàng',
+        'financial': 'Xu hướng lợi nhuận', 'funnel': 'Phễu bán hàng', 'top_sales': 'Top NVKD',
+        'actions': 'Việc chờ duyệt'
+    }
     
     def __init__(self, db_manager: DBManager):
         self.db = db_manager
 
     def get_dashboard_data_cached(self, year, month):
+        # Stale-while-revalidate: hết hạn mềm -> trả bản cũ, 1 worker duy nhất tính lại ở nền
         cache_key = f"ceo_cockpit_data_{year}_{month}"
-        try:
-            cached_data = current_app.cache.get(cache_key)
-            if cached_data:
-                current_app.logger.info(f"CEO Cockpit: HIT Global Cache ({cache_key})")
-                return cached_data
-        except Exception as e:
-            current_app.logger.warning(f"Cache Warning: {e}")
-
-        current_app.logger.info(f"CEO Cockpit: MISS Cache -> Calculating DB...")
-        data = self._calculate_dashboard_data(year, month)
-        
-        try:
-            current_app.cache.set(cache_key, data, timeout=600)
-        except Exception:
-            pass
-            
-        return data
+        return get_or_refresh(
+            cache_key,
+            lambda: self._calculate_dashboard_data(year, month),
+            soft_ttl=config.COCKPIT_CACHE_SOFT_TTL,
+            hard_ttl=config.COCKPIT_CACHE_HARD_TTL,
+            is_partial=lambda data: bool(data.get('unavailable'))
+        )
 
     def _calculate_dashboard_data(self, current_year, current_month):
-        kpi_data = self.get_kpi_scorecards(current_year, current_month)
+        # Các khối độc lập -> chạy song song (mỗi khối 1 kết nối Pool), khối lỗi/quá hạn trả mặc định rỗng
+        # và được liệt kê trong 'unavailable' để giao diện báo "không có dữ liệu" thay vì hiện 0
+        results, errors = self.db.fan_out({
+            'kpi': lambda: self.get_kpi_scorecards(current_year, current_month),
+            'inventory': self.get_inventory_aging_chart_data,
+            'category': lambda: self.get_top_categories_performance(current_year),
+            'financial': self.get_profit_trend_chart,
+            'funnel': self.get_sales_funnel_data,
+            'top_sales': lambda: self.get_top_sales_leaderboard(current_year),
+            'actions': self.get_pending_actions_count
+        })
+
+        kpi_data = results['kpi'] or {}
         
         charts = {
-            'inventory': self.get_inventory_aging_chart_data(),
-            'category': self.get_top_categories_performance(current_year),
-            'financial': self.get_profit_trend_chart(),
-            'funnel': self.get_sales_funnel_data()
+            'inventory': results['inventory'] or {'labels': [], 'series': [], 'drilldown': {}},
+            'category': results['category'] or {'categories': [], 'revenue': [], 'profit': [], 'margin': []},
+            'financial': results['financial'] or {'categories': [], 'revenue': [], 'profit': [], 'expenses': [], 'net_profit': []},
+            'funnel': results['funnel'] or {}
         }
         
         lists = {
-            'top_sales': self.get_top_sales_leaderboard(current_year),
-            'actions': self.get_pending_actions_count()
+            'top_sales': results['top_sales'] or [],
+            'actions': results['actions'] or {'Quotes': 0, 'Budgets': 0, 'Orders': 0, 'UrgentTasks': 0, 'Total': 0}
         }
 
         profit_summary = {
@@ -70,7 +84,8 @@ class ExecutiveService:
             'lists': lists,
             'profit_summary': profit_summary,
             'finance_summary': finance_summary,
-            'risk_summary': risk_summary
+            'risk_summary': risk_summary,
+            'unavailable': [self.COCKPIT_BLOCK_LABELS.get(name, name) for name in errors]
         }
 
     def get_kpi_scorecards(self, current_year, current_month):
@@ -86,7 +101,7 @@ class ExecutiveService:
         }
 
         try:
-            result = self.db.execute_sp_multi('sp_GetExecutiveKPI', (current_year, current_month))
+            result = self.db.execute_sp_multi('sp_GetExecutiveKPI', (current_year, current_month), readonly=True)
             if result and result[0]:
                 row = result[0][0]
                 kpi_data['Sales_YTD'] = safe_float(row.get('Sales_YTD', 0))
@@ -114,7 +129,7 @@ class ExecutiveService:
             sp_inv = f"{{CALL {config.SP_GET_INVENTORY_AGING_SUMMARY} (?)}}"
             
             # SP Summary trả về: Bảng 1 (Tổng), Bảng 2 (Nhóm)
-            inv_results = self.db.execute_sp_multi(config.SP_GET_INVENTORY_AGING_SUMMARY, (None,))
+            inv_results = self.db.execute_sp_multi(config.SP_GET_INVENTORY_AGING_SUMMARY, (None,), readonly=True)
             
             if inv_results and inv_results[0]:
                  # Bảng 1, dòng 1, cột LongTerm hoặc tính tổng
@@ -134,7 +149,7 @@ class ExecutiveService:
                 FROM {config.DELIVERY_WEEKLY_VIEW}
                 WHERE DeliveryStatus = '{config.DELIVERY_STATUS_DONE}' AND YEAR(ActualDeliveryDate) = ?
             """
-            otif_data = self.db.get_data(query_otif, (current_month, current_year, current_month, current_year, current_year))
+            otif_data = self.db.get_data(query_otif, (current_month, current_year, current_month, current_year, current_year), readonly=True)
             if otif_data:
                 row = otif_data[0]
                 del_m = safe_float(row['Delivered_Month'])
@@ -152,60 +167,78 @@ class ExecutiveService:
     def get_inventory_aging_chart_data(self):
         """
         [FIXED] Sử dụng SP Summary (đã cộng gộp) để vẽ biểu đồ nhanh.
+        Ảnh chụp tuổi tồn (dùng chung với trang Tuổi tồn) còn dùng được -> cộng gộp từ DataFrame, không gọi SP.
         """
         try:
+            state = get_inventory_aging_snapshot()
+            if state:
+                summary, by_group = state[0].aging_buckets()
+                return self._inventory_chart_payload(summary, by_group)
+
             # [FIX] Dùng biến config MỚI: SP_GET_INVENTORY_AGING_SUMMARY
             sp_query = f"{{CALL {config.SP_GET_INVENTORY_AGING_SUMMARY} (?)}}"
-            results = self.db.execute_sp_multi(config.SP_GET_INVENTORY_AGING_SUMMARY, (None,))
+            results = self.db.execute_sp_multi(config.SP_GET_INVENTORY_AGING_SUMMARY, (None,), readonly=True)
             
             if not results or not results[0]: 
                 return {'labels': [], 'series': [], 'drilldown': {}}
 
-            # 1. Xử lý biểu đồ tổng (Donut Chart)
-            summary_row = results[0][0]
-            labels = ['An toàn (< 6 Tháng)', 'Ổn định (6-12 Tháng)', 'Chậm (1-2 Năm)', 'Tồn Lâu (> 2 Năm)', 'Hàng CLC (Rủi ro cao)']
-            series = [
-                safe_float(summary_row.get('Safe', 0)),
-                safe_float(summary_row.get('Stable', 0)),
-                safe_float(summary_row.get('Slow', 0)),
-                safe_float(summary_row.get('LongTerm', 0)),
-                safe_float(summary_row.get('Risk', 0))
-            ]
-
-            # 2. Xử lý Drill-down (Chi tiết nhóm)
-            drilldown = {label: [] for label in labels}
-            
-            if len(results) > 1:
-                detail_rows = results[1]
-                for row in detail_rows:
-                    group_name = row.get('GroupID', 'UNK')
-                    # Map dữ liệu vào từng nhóm drilldown
-                    drilldown['An toàn (< 6 Tháng)'].append({'name': group_name, 'value': safe_float(row['Safe'])})
-                    drilldown['Ổn định (6-12 Tháng)'].append({'name': group_name, 'value': safe_float(row['Stable'])})
-                    drilldown['Chậm (1-2 Năm)'].append({'name': group_name, 'value': safe_float(row['Slow'])})
-                    drilldown['Tồn Lâu (> 2 Năm)'].append({'name': group_name, 'value': safe_float(row['LongTerm'])})
-                    drilldown['Hàng CLC (Rủi ro cao)'].append({'name': group_name, 'value': safe_float(row['Risk'])})
-
-            return {'labels': labels, 'series': series, 'drilldown': drilldown}
+            return self._inventory_chart_payload(results[0][0], results[1] if len(results) > 1 else [])
 
         except Exception as e:
             current_app.logger.error(f"Lỗi chart tồn kho (Optimized): {e}")
             return {'labels': [], 'series': [], 'drilldown': {}}
 
+    @staticmethod
+    def _inventory_chart_payload(summary_row, detail_rows):
+        """Donut 5 khung tuổi + drill-down theo nhóm từ dòng tổng và các dòng theo GroupID."""
+        # 1. Xử lý biểu đồ tổng (Donut Chart)
+        labels = ['An toàn (< 6 Tháng)', 'Ổn định (6-12 Tháng)', 'Chậm (1-2 Năm)', 'Tồn Lâu (> 2 Năm)', 'Hàng CLC (Rủi ro cao)']
+        series = [
+            safe_float(summary_row.get('Safe', 0)),
+            safe_float(summary_row.get('Stable', 0)),
+            safe_float(summary_row.get('Slow', 0)),
+            safe_float(summary_row.get('LongTerm', 0)),
+            safe_float(summary_row.get('Risk', 0))
+        ]
+
+        # 2. Xử lý Drill-down (Chi tiết nhóm)
+        drilldown = {label: [] for label in labels}
+        for row in detail_rows:
+            group_name = row.get('GroupID', 'UNK')
+            # Map dữ liệu vào từng nhóm drilldown
+            drilldown['An toàn (< 6 Tháng)'].append({'name': group_name, 'value': safe_float(row['Safe'])})
+            drilldown['Ổn định (6-12 Tháng)'].append({'name': group_name, 'value': safe_float(row['Stable'])})
+            drilldown['Chậm (1-2 Năm)'].append({'name': group_name, 'value': safe_float(row['Slow'])})
+            drilldown['Tồn Lâu (> 2 Năm)'].append({'name': group_name, 'value': safe_float(row['LongTerm'])})
+            drilldown['Hàng CLC (Rủi ro cao)'].append({'name': group_name, 'value': safe_float(row['Risk'])})
+
+        return {'labels': labels, 'series': series, 'drilldown': drilldown}
+
     # ... (Giữ nguyên các hàm khác: get_profit_trend_chart, get_pending_actions_count...)
     def get_profit_trend_chart(self):
-        query = f"""
-            SELECT TOP 12 TranYear, TranMonth,
-                SUM(CASE WHEN CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN ConvertedAmount ELSE 0 END) as Revenue,
-                SUM(CASE WHEN DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN ConvertedAmount ELSE 0 END) as COGS
-            FROM {config.ERP_GIAO_DICH}
-            WHERE VoucherDate >= DATEADD(month, -11, GETDATE())
-            AND OTransactionID IS NOT NULL
-            GROUP BY TranYear, TranMonth
-            ORDER BY TranYear ASC, TranMonth ASC
-        """
+        params = None
+        if get_sales_fact():
+            month_filter, params = since_month_clause(12)
+            query = f"""
+                SELECT TranYear, TranMonth, SUM(RevenueOT) as Revenue, SUM(COGSOT) as COGS
+                FROM {config.CRM_SALES_FACT_MONTHLY} F
+                WHERE {month_filter}
+                GROUP BY TranYear, TranMonth
+                ORDER BY TranYear ASC, TranMonth ASC
+            """
+        else:
+            query = f"""
+                SELECT TOP 12 TranYear, TranMonth,
+                    SUM(CASE WHEN CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN ConvertedAmount ELSE 0 END) as Revenue,
+                    SUM(CASE WHEN DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN ConvertedAmount ELSE 0 END) as COGS
+                FROM {config.ERP_GIAO_DICH}
+                WHERE VoucherDate >= DATEADD(month, -11, GETDATE())
+                AND OTransactionID IS NOT NULL
+                GROUP BY TranYear, TranMonth
+                ORDER BY TranYear ASC, TranMonth ASC
+            """
         try:
-            data = self.db.get_data(query)
+            data = self.db.get_data(query, params, readonly=True)
             chart_data = {'categories': [], 'revenue': [], 'profit': [], 'expenses': [], 'net_profit': []}
             if data:
                 for row in data:
@@ -223,39 +256,48 @@ class ExecutiveService:
     def get_pending_actions_count(self):
         counts = {'Quotes': 0, 'Budgets': 0, 'Orders': 0, 'UrgentTasks': 0, 'Total': 0}
         try:
-            c_q = self.db.get_data(f"SELECT COUNT(*) FROM {config.ERP_QUOTES} WHERE OrderStatus = 0")
+            c_q = self.db.get_data(f"SELECT COUNT(*) FROM {config.ERP_QUOTES} WHERE OrderStatus = 0", readonly=True)
             counts['Quotes'] = safe_float(list(c_q[0].values())[0]) if c_q else 0
-            c_b = self.db.get_data(f"SELECT COUNT(*) FROM {config.TABLE_EXPENSE_REQUEST} WHERE Status = 'PENDING'")
+            c_b = self.db.get_data(f"SELECT COUNT(*) FROM {config.TABLE_EXPENSE_REQUEST} WHERE Status = 'PENDING'", readonly=True)
             counts['Budgets'] = safe_float(list(c_b[0].values())[0]) if c_b else 0
-            c_o = self.db.get_data(f"SELECT COUNT(*) FROM {config.ERP_OT2001} WHERE OrderStatus = 0")
+            c_o = self.db.get_data(f"SELECT COUNT(*) FROM {config.ERP_OT2001} WHERE OrderStatus = 0", readonly=True)
             counts['Orders'] = safe_float(list(c_o[0].values())[0]) if c_o else 0
             q_task = f"""
                 SELECT COUNT(*) FROM {config.TASK_TABLE} 
                 WHERE Status IN ('{config.TASK_STATUS_BLOCKED}', '{config.TASK_STATUS_HELP}') 
                 OR (Priority = 'HIGH' AND Status NOT IN ('{config.TASK_STATUS_COMPLETED}', 'CANCELLED'))
             """
-            c_t = self.db.get_data(q_task)
+            c_t = self.db.get_data(q_task, readonly=True)
             counts['UrgentTasks'] = safe_float(list(c_t[0].values())[0]) if c_t else 0
             counts['Total'] = int(counts['Quotes'] + counts['Budgets'] + counts['Orders'] + counts['UrgentTasks'])
         except Exception: pass
         return counts
 
     def get_top_sales_leaderboard(self, current_year):
+        if get_sales_fact():
+            actual_source = f"""
+                SELECT SalesManID, SUM(Revenue) as Sale
+                FROM {config.CRM_SALES_FACT_MONTHLY}
+                WHERE TranYear = ?
+                GROUP BY SalesManID
+            """
+        else:
+            actual_source = f"""
+                SELECT SalesManID, SUM(ConvertedAmount) as Sale 
+                FROM {config.ERP_GIAO_DICH} 
+                WHERE TranYear = ? AND CreditAccountID LIKE '{config.ACC_DOANH_THU}' 
+                GROUP BY SalesManID
+            """
         query = f"""
             SELECT T1.[PHU TRACH DS] as UserCode, SUM(T1.DK) as Target, T2.SHORTNAME,
                    ISNULL(Actual.Sale, 0) as ActualSales
             FROM {config.CRM_DTCL} T1
             LEFT JOIN {config.TEN_BANG_NGUOI_DUNG} T2 ON T1.[PHU TRACH DS] = T2.USERCODE
-            LEFT JOIN (
-                SELECT SalesManID, SUM(ConvertedAmount) as Sale 
-                FROM {config.ERP_GIAO_DICH} 
-                WHERE TranYear = ? AND CreditAccountID LIKE '{config.ACC_DOANH_THU}' 
-                GROUP BY SalesManID
-            ) Actual ON T1.[PHU TRACH DS] = Actual.SalesManID
+            LEFT JOIN ({actual_source}) Actual ON T1.[PHU TRACH DS] = Actual.SalesManID
             WHERE T1.[Nam] = ?
             GROUP BY T1.[PHU TRACH DS], T2.SHORTNAME, Actual.Sale
         """
-        data = self.db.get_data(query, (current_year, current_year))
+        data = self.db.get_data(query, (current_year, current_year), readonly=True)
         board = []
         if data:
             for row in data:
@@ -267,20 +309,33 @@ class ExecutiveService:
         return board[:5]
 
     def get_top_categories_performance(self, current_year):
-        query = f"""
-            SELECT TOP 10
-                ISNULL(T3.TEN, T2.I04ID) as CategoryName,
-                SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) as Revenue,
-                (SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) -
-                 SUM(CASE WHEN T1.DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN T1.ConvertedAmount ELSE 0 END)) as GrossProfit
-            FROM {config.ERP_GIAO_DICH} T1
-            INNER JOIN {config.ERP_IT1302} T2 ON T1.InventoryID = T2.InventoryID
-            LEFT JOIN {config.TEN_BANG_NOI_DUNG_HD} T3 ON T2.I04ID = T3.LOAI 
-            WHERE T1.TranYear = ? AND T1.OTransactionID IS NOT NULL
-            GROUP BY ISNULL(T3.TEN, T2.I04ID)
-            ORDER BY Revenue DESC
-        """
-        data = self.db.get_data(query, (current_year,))
+        if get_sales_fact():
+            query = f"""
+                SELECT TOP 10
+                    ISNULL(T3.TEN, F.I04ID) as CategoryName,
+                    SUM(F.RevenueOT) as Revenue,
+                    SUM(F.RevenueOT) - SUM(F.COGSOT) as GrossProfit
+                FROM {config.CRM_SALES_FACT_MONTHLY} F
+                LEFT JOIN {config.TEN_BANG_NOI_DUNG_HD} T3 ON F.I04ID = T3.LOAI
+                WHERE F.TranYear = ? AND F.ItemMatched = 1 -- Giống INNER JOIN IT1302 của nhánh GT9000
+                GROUP BY ISNULL(T3.TEN, F.I04ID)
+                ORDER BY Revenue DESC
+            """
+        else:
+            query = f"""
+                SELECT TOP 10
+                    ISNULL(T3.TEN, T2.I04ID) as CategoryName,
+                    SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) as Revenue,
+                    (SUM(CASE WHEN T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN T1.ConvertedAmount ELSE 0 END) -
+                     SUM(CASE WHEN T1.DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN T1.ConvertedAmount ELSE 0 END)) as GrossProfit
+                FROM {config.ERP_GIAO_DICH} T1
+                INNER JOIN {config.ERP_IT1302} T2 ON T1.InventoryID = T2.InventoryID
+                LEFT JOIN {config.TEN_BANG_NOI_DUNG_HD} T3 ON T2.I04ID = T3.LOAI 
+                WHERE T1.TranYear = ? AND T1.OTransactionID IS NOT NULL
+                GROUP BY ISNULL(T3.TEN, T2.I04ID)
+                ORDER BY Revenue DESC
+            """
+        data = self.db.get_data(query, (current_year,), readonly=True)
         result = {'categories': [], 'revenue': [], 'profit': [], 'margin': []}
         if data:
             for row in data:
@@ -298,7 +353,7 @@ class ExecutiveService:
             today = datetime.now()
             start_date = f"{today.year}-01-01"
             end_date = today.strftime('%Y-%m-%d')
-            result = self.db.execute_sp_multi('sp_GetSalesFunnel', (start_date, end_date))
+            result = self.db.execute_sp_multi('sp_GetSalesFunnel', (start_date, end_date), readonly=True)
             data = {'categories': ['Chào giá', 'Đơn hàng', 'Doanh số (Tỷ)'], 'quotes': [], 'orders': [], 'revenue': []}
             if result and result[0]:
                 rows = result[0]
@@ -316,178 +371,21 @@ class ExecutiveService:
         """
         Lấy dữ liệu so sánh chỉ số quản trị giữa 2 năm bất kỳ.
         [UPDATED]: Logic GrossProfit (OTransactionID), Expense (Ana03), Debt (Snapshot).
+        Tính qua ComparisonEngine: mỗi nguồn 1 truy vấn gom nhóm cho cả 2 năm, năm đã khóa sổ đọc cache.
         """
-        def get_year_metrics(y):
-            # 1. TÀI CHÍNH (Flow)
-            
-            # A. Doanh thu & Giá vốn ([NEW] OTransactionID IS NOT NULL)
-            query_profit = f"""
-                SELECT 
-                    SUM(CASE WHEN CreditAccountID LIKE '{config.ACC_DOANH_THU}' THEN ConvertedAmount ELSE 0 END) as Revenue,
-                    SUM(CASE WHEN DebitAccountID LIKE '{config.ACC_GIA_VON}' THEN ConvertedAmount ELSE 0 END) as COGS
-                FROM {config.ERP_GIAO_DICH}
-                WHERE TranYear = ? AND OTransactionID IS NOT NULL
-            """
-            prof = self.db.get_data(query_profit, (y,))[0]
-            revenue = safe_float(prof['Revenue'])
-            cogs = safe_float(prof['COGS'])
-            gross_profit = revenue - cogs
-
-            # B. Chi phí ([NEW] Chỉ dựa vào Ana03ID, bỏ AccountID)
-            query_exp = f"""
-                SELECT SUM(ConvertedAmount) as Expenses
-                FROM {config.ERP_GIAO_DICH}
-                WHERE TranYear = ? 
-                  AND Ana03ID IS NOT NULL 
-                  AND Ana03ID <> ''
-                  AND Ana03ID <> '{config.EXCLUDE_ANA03_CP2014}'
-            """
-            exp_data = self.db.get_data(query_exp, (y,))
-            expenses = safe_float(exp_data[0]['Expenses']) if exp_data else 0
-            
-            net_profit = gross_profit - expenses
-
-            # 2. KHÁCH HÀNG VIP (Cross-sell: Mua >= 10 nhóm hàng trong năm)
-            query_vip = f"""
-                SELECT SUM(T1.ConvertedAmount) as VIP_Sales
-                FROM {config.ERP_GIAO_DICH} T1
-                WHERE T1.TranYear = ? 
-                AND T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}'
-                AND T1.ObjectID IN (
-                    SELECT G.ObjectID
-                    FROM {config.ERP_GIAO_DICH} G
-                    INNER JOIN {config.ERP_IT1302} I ON G.InventoryID = I.InventoryID
-                    WHERE G.TranYear = ? 
-                    AND I.I04ID IS NOT NULL AND I.I04ID <> ''
-                    AND (G.CreditAccountID LIKE '{config.ACC_DOANH_THU}' OR G.DebitAccountID LIKE '{config.ACC_GIA_VON}')
-                    GROUP BY G.ObjectID
-                    HAVING COUNT(DISTINCT I.I04ID) >= 10
-                )
-            """
-            vip_data = self.db.get_data(query_vip, (y, y))
-            vip_sales = safe_float(vip_data[0]['VIP_Sales']) if vip_data else 0
-            # Margin VIP ước tính
-            avg_margin_rate = (gross_profit / revenue) if revenue > 0 else 0
-            vip_profit = vip_sales * avg_margin_rate
-
-            # 3. VẬN HÀNH (OTIF)
-            otif_score = 0
-            try:
-                query_otif = f"""
-                    SELECT 
-                        COUNT(*) as Total,
-                        SUM(CASE WHEN ActualDeliveryDate <= DATEADD(day, 7, ISNULL(EarliestRequestDate, ActualDeliveryDate)) 
-                            THEN 1 ELSE 0 END) as OnTime
-                    FROM {config.DELIVERY_WEEKLY_VIEW}
-                    WHERE DeliveryStatus = '{config.DELIVERY_STATUS_DONE}' 
-                    AND YEAR(ActualDeliveryDate) = ?
-                """
-                otif_data = self.db.get_data(query_otif, (y,))
-                if otif_data and safe_float(otif_data[0]['Total']) > 0:
-                    otif_score = (safe_float(otif_data[0]['OnTime']) / safe_float(otif_data[0]['Total'])) * 100
-            except: pass
-
-            # 4. TÀI SẢN & CÔNG NỢ (Snapshot cuối năm)
-            # [NEW] Logic tính Dư nợ và Tuổi nợ tại thời điểm 31/12/Y
-            end_date = f"{y}-12-31"
-            
-            # Query tính Dư nợ Phải thu (131) & Phải trả (331) cuối kỳ
-            query_balance = f"""
-                SELECT 
-                    SUM(CASE WHEN AccountID LIKE '131%' THEN (Debit - Credit) ELSE 0 END) as AR_Total,
-                    SUM(CASE WHEN AccountID LIKE '331%' THEN (Credit - Debit) ELSE 0 END) as AP_Total
-                FROM (
-                    SELECT CreditAccountID as AccountID, ConvertedAmount as Credit, 0 as Debit 
-                    FROM {config.ERP_GIAO_DICH} WHERE VoucherDate <= ?
-                    UNION ALL
-                    SELECT DebitAccountID as AccountID, 0 as Credit, ConvertedAmount as Debit 
-                    FROM {config.ERP_GIAO_DICH} WHERE VoucherDate <= ?
-                ) Bal
-            """
-            bal_data = self.db.get_data(query_balance, (end_date, end_date))
-            ar_total = safe_float(bal_data[0]['AR_Total']) if bal_data else 0
-            ap_total = safe_float(bal_data[0]['AP_Total']) if bal_data else 0
-
-            # Tính AR Rủi ro (>180 ngày):
-            # Logic ước tính: Rủi ro = Tổng Dư Nợ - (Phát sinh Nợ trong 180 ngày cuối năm)
-            # Tức là: Những khoản nợ còn lại mà không được tạo ra trong 6 tháng gần nhất -> ắt hẳn là nợ cũ > 6 tháng.
-            date_180_ago = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=180)).strftime("%Y-%m-%d")
-            
-            query_ar_recent = f"""
-                SELECT SUM(ConvertedAmount) as RecentDebt
-                FROM {config.ERP_GIAO_DICH}
-                WHERE DebitAccountID LIKE '131%' 
-                AND VoucherDate > ? AND VoucherDate <= ?
-            """
-            ar_recent_data = self.db.get_data(query_ar_recent, (date_180_ago, end_date))
-            ar_recent = safe_float(ar_recent_data[0]['RecentDebt']) if ar_recent_data else 0
-            
-            ar_risk = max(0, ar_total - ar_recent)
-
-            # Tính AP Quá hạn (Tương tự logic trên hoặc lấy tổng dư nợ nếu coi tất cả dư cuối năm là nợ phải trả)
-            # Ở đây ta lấy Tổng AP
-            
-            # Tồn kho cuối kỳ
-            query_inv = f"""
-                SELECT SUM(Debit - Credit) as Inventory_EndYear
-                FROM (
-                    SELECT DebitAccountID as AccountID, ConvertedAmount as Debit, 0 as Credit 
-                    FROM {config.ERP_GIAO_DICH} WHERE DebitAccountID LIKE '15%' AND VoucherDate <= ?
-                    UNION ALL
-                    SELECT CreditAccountID as AccountID, 0 as Debit, ConvertedAmount as Credit 
-                    FROM {config.ERP_GIAO_DICH} WHERE CreditAccountID LIKE '15%' AND VoucherDate <= ?
-                ) Inv
-            """
-            inv_data = self.db.get_data(query_inv, (end_date, end_date))
-            inv_balance = safe_float(inv_data[0]['Inventory_EndYear']) if inv_data else 0
-
-            # Tính CLC (>2 năm) tại thời điểm đó (Ước tính: Tồn kho - Nhập kho 2 năm gần nhất)
-            date_2y_ago = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=730)).strftime("%Y-%m-%d")
-            query_inv_recent = f"""
-                SELECT SUM(ConvertedAmount) as RecentImport
-                FROM {config.ERP_GIAO_DICH}
-                WHERE DebitAccountID LIKE '15%' AND VoucherDate > ? AND VoucherDate <= ?
-            """
-            inv_rec_data = self.db.get_data(query_inv_recent, (date_2y_ago, end_date))
-            inv_recent = safe_float(inv_rec_data[0]['RecentImport']) if inv_rec_data else 0
-            inv_risk = max(0, inv_balance - inv_recent)
-
-            return {
-                'Revenue': revenue,
-                'GrossProfit': gross_profit,
-                'Expenses': expenses,
-                'NetProfit': net_profit,
-                'VIPProfit': vip_profit,
-                'OTIF': otif_score,
-                'AR_Total': ar_total,
-                'AR_Risk': ar_risk,
-                'AP_Total': ap_total,
-                'Inv_Total': inv_balance,
-                'Inv_Risk': inv_risk
-            }
-
-        # --- EXECUTE ---
-        m1 = get_year_metrics(year1)
-        m2 = get_year_metrics(year2)
-
-        # Chart Data (Giữ nguyên)
-        query_chart = f"""
-            SELECT TranYear, TranMonth, SUM(ConvertedAmount) as Rev
-            FROM {config.ERP_GIAO_DICH}
-            WHERE TranYear IN (?, ?) AND CreditAccountID LIKE '{config.ACC_DOANH_THU}'
-            AND OTransactionID IS NOT NULL
-            GROUP BY TranYear, TranMonth
-            ORDER BY TranYear, TranMonth
-        """
-        chart_raw = self.db.get_data(query_chart, (year1, year2))
-        series_y1 = [0]*12; series_y2 = [0]*12
-        if chart_raw:
-            for row in chart_raw:
-                idx = int(row['TranMonth']) - 1
-                if row['TranYear'] == int(year1): series_y1[idx] = safe_float(row['Rev'])
-                elif row['TranYear'] == int(year2): series_y2[idx] = safe_float(row['Rev'])
+        years = self.get_multi_year_comparison([year1, year2])
+        y1, y2 = years[int(year1)], years[int(year2)]
+        # Chỉ số có nguồn lỗi/quá hạn (ở 1 trong 2 năm) -> {mã: nhãn} để giao diện đánh dấu thay vì hiện 0
+        missing = set(y1.get('unavailable') or []) | set(y2.get('unavailable') or [])
+        return {
+            'metrics': {'y1': y1['metrics'], 'y2': y2['metrics']},
+            'chart': {'y1': y1['monthly'], 'y2': y2['monthly']},
+            'unavailable': {key: METRIC_LABELS.get(key, key) for key in sorted(missing)}
+        }
 
-        return { 'metrics': {'y1': m1, 'y2': m2}, 'chart': {'y1': series_y1, 'y2': series_y2} }
+    def get_multi_year_comparison(self, years):
+        """{năm: {'metrics': {...}, 'monthly': [12 tháng doanh thu]}} cho N năm (3-5 năm vẫn chỉ 5 truy vấn)."""
+        return ComparisonEngine(self.db).get_years(years)
 
     def get_drilldown_data(self, metric_type, year):
         """
@@ -498,7 +396,7 @@ class ExecutiveService:
         data = []
         
         if metric_type == 'GROSS_PROFIT': # [REQ 2] Top 30 Khách hàng
-            raw = self.db.execute_sp_multi('sp_GetGrossProfit_By_Customer', (year,))[0]
+            raw = self.db.execute_sp_multi('sp_GetGrossProfit_By_Customer', (year,), readonly=True)[0]
             for row in raw:
                 # Value = Profit, SubValue = Revenue
                 prof = safe_float(row['Value'])
@@ -513,7 +411,7 @@ class ExecutiveService:
                 })
 
         elif metric_type == 'VIP_PROFIT': # [REQ 3] VIP Performance
-            raw = self.db.execute_sp_multi('sp_GetVIP_Performance', (year,))[0]
+            raw = self.db.execute_sp_multi('sp_GetVIP_Performance', (year,), readonly=True)[0]
             for row in raw:
                 data.append({
                     'Label': f"Nhóm {row['Label']}", 
@@ -524,7 +422,7 @@ class ExecutiveService:
                 })
 
         elif metric_type == 'EXPENSE': # [REQ 1] Chi phí theo ReportGroup
-            raw = self.db.execute_sp_multi('sp_GetExpenses_By_Group', (year, config.EXCLUDE_ANA03_CP2014))[0]
+            raw = self.db.execute_sp_multi('sp_GetExpenses_By_Group', (year, config.EXCLUDE_ANA03_CP2014), readonly=True)[0]
             for row in raw:
                 data.append({
                     'Label': row['Label'], 
@@ -533,7 +431,7 @@ class ExecutiveService:
                 })
 
         elif metric_type == 'INVENTORY': # [REQ 5] Tồn kho theo I04ID
-            raw = self.db.execute_sp_multi('sp_GetInventory_By_I04', ())[0]
+            raw = self.db.execute_sp_multi('sp_GetInventory_By_I04', (), readonly=True)[0]
             for row in raw:
                 stock = safe_float(row['TotalStock'])
                 risk = safe_float(row['Value']) # Tồn > 2 năm
@@ -548,7 +446,7 @@ class ExecutiveService:
                 })
 
         elif metric_type == 'AR': # Công nợ (Giữ nguyên logic cũ hoặc gọi SP mới nếu cần)
-            raw = self.db.execute_sp_multi('sp_GetDebt_Breakdown', ('AR',))[0]
+            raw = self.db.execute_sp_multi('sp_GetDebt_Breakdown', ('AR',), readonly=True)[0]
             for row in raw:
                 data.append({'Label': row['Label'], 'Value': safe_float(row['Amount'])})
 
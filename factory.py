@@ -13,6 +13,7 @@ from flask_caching import Cache  # <--- IMPORT MỚI
 
 # 1. Import DB Manager & Services
 from db_manager import DBManager
+from sales_fact import SalesFactCube
 from sales_service import SalesService, InventoryService
 from customer_service import CustomerService
 from quotation_approval_service import QuotationApprovalService
@@ -54,6 +55,94 @@ from blueprints.training_bp import training_bp         # <--- [THÊM MỚI]
 # Khởi tạo đối tượng Cache (chưa gắn app)
 cache = Cache()
 
+
+# 5. Inject User Context (ĐÃ FIX LỖI)
+# Đặt ở cấp module để create_app đăng ký và test gọi được trực tiếp.
+def inject_user():
+    def check_permission(feature_code):
+        user_role = session.get('user_role', '').strip().upper()
+        if user_role == config.ROLE_ADMIN: return True
+        permissions = session.get('permissions', [])
+        return feature_code in permissions
+
+    # Dữ liệu mặc định (Tránh lỗi NoneType khi chưa login)
+    user_code = session.get('user_code')
+    user_data_combined = {
+        'Level': 1, 'CurrentXP': 0, 'TotalCoins': 0, 
+        'NextLevelXP': 100, 'ProgressPercent': 0,
+        'AvatarUrl': '', 'ThemeColor': 'light', 
+        'EquippedPet': '', 'Title': 'Newbie'
+    }
+    unlocked_themes = ['light'] # Mặc định luôn có Light
+
+    # [NEW] LẤY DỮ LIỆU TỪ DB NẾU ĐÃ LOGIN
+    if user_code:
+        try:
+            # 1. Lấy Full Profile (Stats + Visuals) + Theme đã mở khóa từ cache theo user
+            # (user_service.get_user_context, bị xóa khi XP/Coins/Trang bị/Inventory thay đổi)
+            user_context = current_app.user_service.get_user_context(user_code)
+            profile_data = user_context['profile']
+            
+            if profile_data:
+                user_data_combined.update(profile_data)
+                
+                # [LOGIC MỚI] Ưu tiên Nickname
+                if profile_data.get('Nickname'):
+                    # Ghi đè SHORTNAME hiển thị bằng Nickname
+                    session['user_shortname'] = profile_data['Nickname'] 
+                    # Hoặc tạo biến riêng hiển thị
+                    user_data_combined['DisplayName'] = profile_data['Nickname']
+                else:
+                    user_data_combined['DisplayName'] = session.get('user_shortname')
+
+            # 2. Danh sách Theme đã mở khóa
+            unlocked_themes = user_context['unlocked_themes']
+
+        except Exception as e:
+            current_app.logger.error(f"Lỗi load User Context: {e}")
+
+    # Tính toán danh hiệu (Title) hiển thị nếu DB chưa có
+    try:
+        lvl = int(user_data_combined.get('Level', 1))
+    except (ValueError, TypeError):
+        lvl = 1 # Fallback về level 1 nếu lỗi
+    
+    # [QUAN TRỌNG] Cập nhật lại vào dictionary để template nhận được số INT
+    user_data_combined['Level'] = lvl 
+        
+    if not user_data_combined.get('Title'):
+        if lvl < 5: title = "Newbie (Tập sự)"
+        elif lvl < 20: title = "Junior (Nhân viên)"
+        elif lvl < 30: title = "Senior (Chuyên viên)"
+        else: title = "Master (Doanh nhân)"
+        user_data_combined['Title'] = title
+
+    # Đóng gói dữ liệu trả về template
+    final_context = {
+        'is_authenticated': session.get('logged_in', False),
+        'usercode': user_code,
+        'username': session.get('username'),
+        'shortname': session.get('user_shortname'),
+        'role': session.get('user_role'),
+        'bo_phan': session.get('bo_phan'),
+        'can': check_permission,
+        
+        # --- DỮ LIỆU GAME & UI ---
+        # Ưu tiên lấy Theme từ DB (Equipped), nếu không có thì lấy Session
+        'theme': user_data_combined.get('ThemeColor') or session.get('theme', 'light'),
+        
+        # Truyền object chứa toàn bộ thông tin (Level, XP, Coin, Frame...)
+        'stats': user_data_combined, 
+        'current_user': user_data_combined, # Alias để dùng biến nào cũng được
+        
+        'unlocked_themes': unlocked_themes,
+        'title': user_data_combined['Title']
+    }
+
+    # Trả về 2 biến global để template dùng: user_context và current_user
+    return dict(user_context=final_context, current_user=final_context)
+
+
 def create_app():
     """Nhà máy khởi tạo ứng dụng Flask"""
     app = Flask(__name__, static_url_path='/static', static_folder='static')
@@ -127,6 +216,11 @@ def create_app():
     # Gắn DB và Redis vào app
     app.db_manager = db_manager
     app.redis_client = redis_client
+    app.sales_fact = SalesFactCube(db_manager) # Fact doanh số tháng dùng chung cho các Service (sales_fact.get_sales_fact)
+
+    # Gắn hook đo đếm SQL theo request (N+1, slow query log)
+    if db_manager.profiler:
+        db_manager.profiler.init_app(app)
 
     # Khởi tạo các Service và gắn vào app
     app.sales_service = SalesService(db_manager)
@@ -178,101 +272,8 @@ def create_app():
     app.register_blueprint(customer_analysis_bp) # Đường dẫn mặc định sẽ theo định nghĩa trong bp
     app.register_blueprint(training_bp) # <--- [THÊM MỚI] Đăng ký đường dẫn /training
     # 5. Inject User Context
-   
-    @app.context_processor
-    # 5. Inject User Context (ĐÃ FIX LỖI)
-    def inject_user():
-        def check_permission(feature_code):
-            user_role = session.get('user_role', '').strip().upper()
-            if user_role == config.ROLE_ADMIN: return True
-            permissions = session.get('permissions', [])
-            return feature_code in permissions
-
-        # Dữ liệu mặc định (Tránh lỗi NoneType khi chưa login)
-        user_code = session.get('user_code')
-        user_data_combined = {
-            'Level': 1, 'CurrentXP': 0, 'TotalCoins': 0, 
-            'NextLevelXP': 100, 'ProgressPercent': 0,
-            'AvatarUrl': '', 'ThemeColor': 'light', 
-            'EquippedPet': '', 'Title': 'Newbie'
-        }
-        unlocked_themes = ['light'] # Mặc định luôn có Light
-
-        # [NEW] LẤY DỮ LIỆU TỪ DB NẾU ĐÃ LOGIN
-        if user_code:
-            try:
-                # 1. Gọi Service lấy Full Profile (Gộp cả Stats + Visuals)
-                # Hàm này đã có cơ chế "Self-healing" (Tự tạo data nếu thiếu)
-                profile_data = current_app.user_service.get_user_profile(user_code)
-                
-                if profile_data:
-                    user_data_combined.update(profile_data)
-                    
-                    # [LOGIC MỚI] Ưu tiên Nickname
-                    if profile_data.get('Nickname'):
-                        # Ghi đè SHORTNAME hiển thị bằng Nickname
-                        session['user_shortname'] = profile_data['Nickname'] 
-                        # Hoặc tạo biến riêng hiển thị
-                        user_data_combined['DisplayName'] = profile_data['Nickname']
-                    else:
-                        user_data_combined['DisplayName'] = session.get('user_shortname')
-
-                # 2. Lấy danh sách Theme đã mở khóa (Query trực tiếp bảng Inventory)
-                # Vì UserService không return full inventory trong hàm get_user_profile
-                inv_query = "SELECT ItemCode FROM TitanOS_UserInventory WHERE UserCode = ?"
-                inv_data = current_app.db_manager.get_data(inv_query, (user_code,))
-                
-                if inv_data:
-                    owned_items = [row['ItemCode'] for row in inv_data]
-                    # Chỉ lọc lấy các item là theme để đưa vào switcher
-                    valid_themes = ['dark', 'fantasy', 'adorable']
-                    for t in valid_themes:
-                        if t in owned_items:
-                            unlocked_themes.append(t)
-
-            except Exception as e:
-                current_app.logger.error(f"Lỗi load User Context: {e}")
-
-        # Tính toán danh hiệu (Title) hiển thị nếu DB chưa có
-        try:
-            lvl = int(user_data_combined.get('Level', 1))
-        except (ValueError, TypeError):
-            lvl = 1 # Fallback về level 1 nếu lỗi
-        
-        # [QUAN TRỌNG] Cập nhật lại vào dictionary để template nhận được số INT
-        user_data_combined['Level'] = lvl 
-            
-        if not user_data_combined.get('Title'):
-            if lvl < 5: title = "Newbie (Tập sự)"
-            elif lvl < 20: title = "Junior (Nhân viên)"
-            elif lvl < 30: title = "Senior (Chuyên viên)"
-            else: title = "Master (Doanh nhân)"
-            user_data_combined['Title'] = title
-
-        # Đóng gói dữ liệu trả về template
-        final_context = {
-            'is_authenticated': session.get('logged_in', False),
-            'usercode': user_code,
-            'username': session.get('username'),
-            'shortname': session.get('user_shortname'),
-            'role': session.get('user_role'),
-            'bo_phan': session.get('bo_phan'),
-            'can': check_permission,
-            
-            # --- DỮ LIỆU GAME & UI ---
-            # Ưu tiên lấy Theme từ DB (Equipped), nếu không có thì lấy Session
-            'theme': user_data_combined.get('ThemeColor') or session.get('theme', 'light'),
-            
-            # Truyền object chứa toàn bộ thông tin (Level, XP, Coin, Frame...)
-            'stats': user_data_combined, 
-            'current_user': user_data_combined, # Alias để dùng biến nào cũng được
-            
-            'unlocked_themes': unlocked_themes,
-            'title': user_data_combined['Title']
-        }
+    app.context_processor(inject_user)
 
-        # Trả về 2 biến global để template dùng: user_context và current_user
-        return dict(user_context=final_context, current_user=final_context)
 # 6. Global Before Request (Chạy trước mỗi request)
     @app.before_request
     def before_request():
@@ -39,38 +39,41 @@ class GamificationService:
 
         count_sent = 0
 
+        # --- [LOGIC MỚI] CHECK TRÙNG LẶP ---
+        # Lấy 1 lần danh sách user đã nhận thư tổng kết hôm nay (thay vì 1 query/user)
+        check_mail_sql = """
+            SELECT DISTINCT UserCode FROM TitanOS_Game_Mailbox 
+            WHERE Title LIKE ?
+        """
+        # Dùng LIKE để tìm tiêu đề chứa ngày hôm nay
+        rewarded_users = {row['UserCode'] for row in self.db.get_data(check_mail_sql, (f"{mail_title_prefix}%",))}
+
+        # 2. Lấy chi tiết log của TẤT CẢ user trong 1 query, gom theo UserCode
+        log_sql = """
+            SELECT L.UserCode, L.ActivityCode, COUNT(*) as Count, A.XP_Reward, A.Coin_Reward, A.Description, A.Daily_Limit
+            FROM TitanOS_Game_DailyLogs L
+            JOIN TitanOS_Game_Activities A ON L.ActivityCode = A.ActivityCode
+            WHERE L.IsProcessed = 0
+            GROUP BY L.UserCode, L.ActivityCode, A.XP_Reward, A.Coin_Reward, A.Description, A.Daily_Limit
+        """
+        logs_by_user = {}
+        for log in self.db.get_data(log_sql):
+            logs_by_user.setdefault(log['UserCode'], []).append(log)
+
+        mail_rows = []
+        processed_rows = []
+
         for u in users:
             user_code = u['UserCode']
             
-            # --- [LOGIC MỚI] CHECK TRÙNG LẶP ---
-            # Kiểm tra xem user này đã nhận thư tổng kết hôm nay chưa
-            check_mail_sql = """
-                SELECT MailID FROM TitanOS_Game_Mailbox 
-                WHERE UserCode = ? AND Title LIKE ?
-            """
-            # Dùng LIKE để tìm tiêu đề chứa ngày hôm nay
-            is_rewarded = self.db.get_data(check_mail_sql, (user_code, f"{mail_title_prefix}%"))
-            
-            if is_rewarded:
+            if user_code in rewarded_users:
                 print(f"⚠️ User {user_code} đã nhận quà hôm nay rồi -> Bỏ qua.")
                 # Tùy chọn: Có thể update luôn các log còn sót thành đã xử lý để dọn dẹp
-                self.db.execute_non_query(
-                    "UPDATE TitanOS_Game_DailyLogs SET IsProcessed = 1 WHERE UserCode = ? AND IsProcessed = 0", 
-                    (user_code,)
-                )
+                processed_rows.append((user_code,))
                 continue
             # -----------------------------------
 
-            # 2. Tính toán điểm thưởng
-            # Lấy chi tiết log
-            log_sql = """
-                SELECT L.ActivityCode, COUNT(*) as Count, A.XP_Reward, A.Coin_Reward, A.Description, A.Daily_Limit
-                FROM TitanOS_Game_DailyLogs L
-                JOIN TitanOS_Game_Activities A ON L.ActivityCode = A.ActivityCode
-                WHERE L.UserCode = ? AND L.IsProcessed = 0
-                GROUP BY L.ActivityCode, A.XP_Reward, A.Coin_Reward, A.Description, A.Daily_Limit
-            """
-            logs = self.db.get_data(log_sql, (user_code,))
+            logs = logs_by_user.get(user_code)
             
             if not logs: continue
 
@@ -102,19 +105,25 @@ class GamificationService:
 
             # 3. Gửi thư (Insert Mailbox)
             if total_xp > 0 or total_coins > 0:
-                mail_sql = """
-                    INSERT INTO TitanOS_Game_Mailbox 
-                    (UserCode, Title, Content, Total_XP, Total_Coins, CreatedTime, IsClaimed)
-                    VALUES (?, ?, ?, ?, ?, GETDATE(), 0)
-                """
-                self.db.execute_non_query(mail_sql, (user_code, mail_title_prefix, details_html, total_xp, total_coins))
+                mail_rows.append((user_code, mail_title_prefix, details_html, total_xp, total_coins))
                 count_sent += 1
 
             # 4. Đánh dấu Log đã xử lý
-            self.db.execute_non_query(
-                "UPDATE TitanOS_Game_DailyLogs SET IsProcessed = 1 WHERE UserCode = ? AND IsProcessed = 0", 
-                (user_code,)
-            )
+            processed_rows.append((user_code,))
+
+        # Ghi hàng loạt: thư + đánh dấu log trong 1 transaction
+        mail_sql = """
+            INSERT INTO TitanOS_Game_Mailbox 
+            (UserCode, Title, Content, Total_XP, Total_Coins, CreatedTime, IsClaimed)
+            VALUES (?, ?, ?, ?, ?, GETDATE(), 0)
+        """
+        success = self.db.bulk_transaction([
+            (mail_sql, mail_rows),
+            ("UPDATE TitanOS_Game_DailyLogs SET IsProcessed = 1 WHERE UserCode = ? AND IsProcessed = 0", processed_rows),
+        ])
+        if not success:
+            print(">>> Lỗi ghi hàng loạt, chưa gửi quà.")
+            return
 
         print(f">>> Hoàn tất. Đã gửi quà cho {count_sent} user.")
 
@@ -0,0 +1,236 @@
+# ingest_library.py
+# --- NẠP THƯ VIỆN PDF: SONG SONG + TĂNG DẦN THEO HASH NỘI DUNG ---
+# Thay phần đọc PDF tuần tự (PyPDF2, từng file, đọc lại cả file không đổi) của scan_library*.py:
+#   1. Duyệt thư mục; file có (size, mtime) khớp manifest và đã có <pdf>.pidx -> bỏ qua, không mở file.
+#   2. File còn lại đưa vào Process Pool: tính SHA1; hash không đổi -> bỏ qua; đổi/mới -> tách text từng trang
+#      và ghi chỉ mục trang <pdf>.pidx (page_index.py, nhị phân gọn) ngay trong tiến trình con.
+#   3. Cập nhật TRAINING_MATERIALS theo lô trong 1 transaction (UPDATE TotalPages / INSERT tài liệu mới).
+#   4. Ghi manifest (cache/library_manifest.json) sau khi DB thành công -> lần chạy lỗi sẽ được làm lại.
+#      Mỗi file có cờ db_synced: chạy --no-db ghi False -> lần chạy có DB sau vẫn đưa file vào bước 3
+#      (dù bước 1-2 bỏ qua vì không đổi).
+# Tóm tắt/Phân loại bằng AI vẫn do scan_library*.py đảm nhiệm; --summarize để tóm tắt luôn tài liệu mới.
+#
+# Chạy: python ingest_library.py [--dir static/uploads/library] [--workers 4] [--force] [--no-db] [--summarize]
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import config
+from page_index import extract_pdf_pages, write_page_index, index_path_for
+
+_HASH_CHUNK = 1 << 20
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def web_path(pdf_path):
+    """Đường dẫn lưu DB (giống scan_library.py): '/' + đường dẫn tương đối thư mục chạy, dấu '/'."""
+    return '/' + os.path.relpath(pdf_path, start=os.getcwd()).replace('\\', '/')
+
+
+# --- MANIFEST ---
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+# --- XỬ LÝ 1 FILE (CHẠY TRONG TIẾN TRÌNH CON) ---
+def ingest_one(pdf_path, known_sha1=None, force=False):
+    """Hash + (nếu đổi) tách trang và ghi .pidx. Trả về dict kết quả (không raise)."""
+    result = {'path': pdf_path, 'status': 'error', 'pages': None}
+    try:
+        stat = os.stat(pdf_path)
+        result.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha1=file_sha1(pdf_path))
+        if not force and result['sha1'] == known_sha1 and os.path.exists(index_path_for(pdf_path)):
+            result['status'] = 'unchanged'
+            return result
+
+        pages = extract_pdf_pages(pdf_path)
+        write_page_index(pages, index_path_for(pdf_path))
+        result.update(status='indexed', pages=len(pages), intro='\n'.join(pages[:5])[:5000],
+                      scanned=not any(p.strip() for p in pages))
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+# --- PIPELINE PHÍA FILE ---
+def find_pdfs(library_dir):
+    pdfs = []
+    for root, _dirs, files in os.walk(library_dir):
+        pdfs.extend(os.path.join(root, name) for name in files if name.lower().endswith('.pdf'))
+    return sorted(pdfs)
+
+
+def run_pipeline(library_dir, manifest, workers=None, force=False, progress=print):
+    """
+    Quét + xử lý song song. Trả về (results, skipped) với results là list dict của ingest_one,
+    skipped là list đường dẫn bỏ qua nhờ (size, mtime) khớp manifest.
+    """
+    todo, skipped = [], []
+    for pdf_path in find_pdfs(library_dir):
+        entry = manifest.get(web_path(pdf_path))
+        stat = os.stat(pdf_path)
+        if (not force and entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns
+                and os.path.exists(index_path_for(pdf_path))):
+            skipped.append(pdf_path)
+        else:
+            todo.append((pdf_path, entry.get('sha1') if entry else None))
+
+    progress(f"📚 {len(todo) + len(skipped)} PDF | bỏ qua nhanh {len(skipped)} (không đổi) | cần kiểm tra {len(todo)}")
+    results = []
+    if not todo:
+        return results, skipped
+
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(ingest_one, path, sha1, force) for path, sha1 in todo]
+        for done, future in enumerate(as_completed(futures), start=1):
+            res = future.result()
+            results.append(res)
+            elapsed = time.perf_counter() - start
+            eta = elapsed / done * (len(todo) - done)
+            icon = {'indexed': '✅', 'unchanged': '⏩', 'error': '❌'}[res['status']]
+            detail = f"{res['pages']} trang" if res['status'] == 'indexed' else res.get('error', 'hash không đổi')
+            progress(f"[{done:>4}/{len(todo)}] {elapsed:6.1f}s ETA {eta:5.0f}s {icon} "
+                     f"{os.path.basename(res['path'])} ({detail})")
+    return results, skipped
+
+
+# --- CẬP NHẬT DB THEO LÔ ---
+def sync_materials(db, results, summarize=False):
+    """UPDATE TotalPages cho tài liệu đã có, INSERT tài liệu mới (1 transaction). Trả về (số cập nhật, số thêm)."""
+    indexed = [r for r in results if r['status'] == 'indexed']
+    if not indexed:
+        return 0, 0
+
+    existing = {
+        str(row['FilePath']).replace('\\', '/'): row['MaterialID']
+        for row in db.get_data("SELECT MaterialID, FilePath FROM TRAINING_MATERIALS") or []
+    }
+    summarizer = None
+    if summarize:
+        import google.generativeai as genai
+        from library_service import LibraryService
+        genai.configure(api_key=config.GEMINI_API_KEY)
+        summarizer = LibraryService(db)._ai_categorize_document
+
+    updates, inserts = [], []
+    for r in indexed:
+        path = web_path(r['path'])
+        if path in existing:
+            updates.append((r['pages'], existing[path]))
+        else:
+            summary = summarizer(r['intro']) if summarizer and r.get('intro') and not r['scanned'] else None
+            inserts.append((os.path.basename(r['path']), path, r['pages'], summary, 1 if summary else 0))
+
+    ok = db.bulk_transaction([
+        ("UPDATE TRAINING_MATERIALS SET TotalPages = ? WHERE MaterialID = ?", updates),
+        ("INSERT INTO TRAINING_MATERIALS (FileName, FilePath, TotalPages, Summary, CreatedDate, AI_Processed) "
+         "VALUES (?, ?, ?, ?, GETDATE(), ?)", inserts),
+    ])
+    if not ok:
+        raise RuntimeError("Cập nhật TRAINING_MATERIALS thất bại (đã rollback).")
+    return len(updates), len(inserts)
+
+
+def pending_db_results(manifest, results, skipped):
+    """
+    File không đổi (bỏ qua / hash trùng) nhưng chưa ghi TRAINING_MATERIALS (db_synced=False, VD: lần chạy --no-db)
+    -> dict cùng dạng kết quả 'indexed' (số trang lấy từ manifest, không có intro để tóm tắt).
+    """
+    unchanged = list(skipped) + [r['path'] for r in results if r['status'] == 'unchanged']
+    pending = []
+    for pdf_path in unchanged:
+        entry = manifest.get(web_path(pdf_path)) or {}
+        if entry.get('db_synced', True) is False and entry.get('pages') is not None:
+            pending.append({'path': pdf_path, 'status': 'indexed', 'pages': entry['pages'], 'intro': '', 'scanned': False})
+    return pending
+
+
+def update_manifest(manifest, results, db_synced=True):
+    """
+    Ghi kết quả vào manifest. db_synced: lần chạy này đã ghi TRAINING_MATERIALS chưa.
+    File dựng lại chỉ mục nhận đúng cờ đó; file không đổi giữ cờ cũ, trừ khi lần này đã ghi DB.
+    """
+    for r in results:
+        if r['status'] in ('indexed', 'unchanged'):
+            previous = manifest.get(web_path(r['path']), {})
+            synced = db_synced if r['status'] == 'indexed' else (db_synced or previous.get('db_synced', True))
+            manifest[web_path(r['path'])] = {
+                'sha1': r['sha1'], 'size': r['size'], 'mtime_ns': r['mtime_ns'],
+                'pages': r['pages'] if r['pages'] is not None else previous.get('pages'),
+                'db_synced': synced,
+            }
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nạp thư viện PDF song song, chỉ xử lý file mới/thay đổi.")
+    parser.add_argument('--dir', default=config.LIBRARY_DIR, help="Thư mục PDF (mặc định: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="Số tiến trình (mặc định: số CPU)")
+    parser.add_argument('--force', action='store_true', help="Xử lý lại mọi file, bỏ qua manifest")
+    parser.add_argument('--no-db', action='store_true', help="Chỉ dựng chỉ mục trang, không ghi TRAINING_MATERIALS (lần chạy có DB sau sẽ ghi bù)")
+    parser.add_argument('--summarize', action='store_true', help="Gọi AI tóm tắt tài liệu mới (tuần tự)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.dir):
+        print(f"❌ Thư mục {args.dir} không tồn tại!")
+        return 1
+
+    manifest = load_manifest(config.LIBRARY_MANIFEST_PATH)
+    start = time.perf_counter()
+    results, skipped = run_pipeline(args.dir, manifest, args.workers, args.force)
+
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('indexed', 'unchanged', 'error')}
+    pending = pending_db_results(manifest, results, skipped)
+    if not args.no_db:
+        if counts['indexed'] or pending:
+            from flask import Flask
+            from db_manager import DBManager
+            app = Flask(__name__) # DBManager cần app context để ghi log
+            with app.app_context():
+                updated, inserted = sync_materials(DBManager(), results + pending, args.summarize)
+            print(f"🗄️  TRAINING_MATERIALS: cập nhật {updated}, thêm mới {inserted} "
+                  f"(ghi bù {len(pending)} file từ lần chạy --no-db)")
+        for r in pending:
+            manifest[web_path(r['path'])]['db_synced'] = True
+    elif counts['indexed'] or pending:
+        print(f"⚠️  --no-db: {counts['indexed'] + len(pending)} file chưa ghi TRAINING_MATERIALS (lần chạy có DB sẽ ghi bù)")
+
+    save_manifest(config.LIBRARY_MANIFEST_PATH, update_manifest(manifest, results, db_synced=not args.no_db))
+    print(f"\n🎉 Xong trong {time.perf_counter() - start:.1f}s | dựng chỉ mục {counts['indexed']} | "
+          f"không đổi {len(skipped) + counts['unchanged']} | lỗi {counts['error']}")
+    return 1 if counts['error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# inventory_aging_snapshot.py
+# --- ẢNH CHỤP TUỔI HÀNG TỒN KHO (DataFrame TRONG RAM) ---
+#
+# Thay cho InventoryService.get_inventory_aging_data gọi lại SP tuổi tồn + nạp map IT1302 / [NOI DUNG HD]
+# rồi duyệt từng dòng (safe_float, lọc chuỗi, evaluate_condition) ở MỖI lần đổi bộ lọc:
+#   - 1 lần nạp (luồng nền hoặc job server.py): kết quả SP + nhóm I04 + tên nhóm -> DataFrame kiểu cố định
+#     (cột số float64, cột chữ đã chuẩn hóa để lọc), sắp sẵn theo (CLC, >720 ngày) giảm dần.
+#   - Lọc (từ khóa, loại hàng, I05, điều kiện SL / giá trị) = mặt nạ boolean; gom nhóm I04 bằng groupby.
+#   - Dòng chi tiết (dict cho template) dựng 1 lần mỗi lần nạp, truy vấn chỉ chọn theo vị trí.
+#   - Dùng chung cho trang Tuổi tồn, lazy-load chi tiết nhóm và biểu đồ tồn kho CEO Cockpit.
+#   - Ảnh chụp quá INVENTORY_AGING_MAX_AGE giây -> coi như chưa có, nơi gọi dùng SP như cũ.
+
+import time
+import operator
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from flask import current_app
+from db_manager import parse_filter_string
+from background_refresh import BackgroundRefresher
+import config
+
+VALUE_COLUMNS = ['TotalCurrentValue', 'TotalCurrentQuantity', 'Range_0_180_V', 'Range_181_360_V',
+                 'Range_361_540_V', 'Range_541_720_V', 'Range_Over_720_V']
+OTHER_GROUP = 'KHÁC'
+OTHER_GROUP_NAME = 'Khác / Chưa phân loại'
+
+# Giống evaluate_condition nhưng trên cả cột; toán tử lạ -> không lọc
+_OPERATORS = {'>': operator.gt, '<': operator.lt, '=': operator.eq, '==': operator.eq,
+              '>=': operator.ge, '<=': operator.le, '!=': operator.ne}
+
+
+def _numeric(series):
+    """safe_float cho cả cột: None / '' / 'nan' / inf -> 0.0."""
+    return pd.to_numeric(series, errors='coerce').replace([np.inf, -np.inf], np.nan).fillna(0.0).astype(np.float64)
+
+
+def _text(df, column):
+    return df[column].fillna('').astype(str) if column in df else pd.Series('', index=df.index)
+
+
+def _negated(filter_value):
+    return filter_value.startswith(('!=', '<>'))
+
+
+def _strip_negation(filter_value):
+    return filter_value.replace('!=', '').replace('<>', '').strip()
+
+
+class InventoryAgingSnapshot:
+    """Kết quả SP tuổi tồn + nhóm I04 dạng DataFrame, làm mới định kỳ, thay nguyên khối khi nạp lại."""
+
+    def __init__(self, db_manager, refresh_seconds=None, max_age_seconds=None):
+        self.db = db_manager
+        self._refresher = BackgroundRefresher(
+            self.refresh, 'inventory_aging_refresh', 'InventoryAgingSnapshot: lỗi nạp ảnh chụp tuổi tồn',
+            refresh_seconds or config.INVENTORY_AGING_REFRESH_SECONDS,
+            max_age_seconds or config.INVENTORY_AGING_MAX_AGE
+        )
+        self._state = None # (InventoryAgingFrame, as_of datetime, built_ts)
+
+    # --- NẠP / LÀM MỚI ---
+    def _load_group_maps(self):
+        i04_map, name_map = {}, {}
+        i04_data = self.db.get_data_cached(
+            f"SELECT InventoryID, I04ID FROM {config.ERP_IT1302}", tags=[config.CACHE_TAG_IT1302], readonly=True
+        )
+        for row in i04_data or []:
+            i04_map[row['InventoryID']] = row['I04ID'] if row['I04ID'] and row['I04ID'].strip() else OTHER_GROUP
+        name_data = self.db.get_data_cached(
+            f"SELECT [LOAI], [TEN] FROM {config.TEN_BANG_NOI_DUNG_HD}", tags=[config.CACHE_TAG_NOI_DUNG_HD]
+        )
+        for row in name_data or []:
+            name_map[row['LOAI']] = row['TEN']
+        return i04_map, name_map
+
+    def refresh(self):
+        """Gọi SP tuổi tồn + dựng DataFrame (đồng bộ). Lỗi -> raise, giữ ảnh chụp cũ."""
+        start = time.perf_counter()
+        rows = self.db.fetch_data(f"{{CALL {config.SP_GET_INVENTORY_AGING} (?)}}", (None,), readonly=True)
+        i04_map, name_map = self._load_group_maps()
+        frame = InventoryAgingFrame(rows, i04_map, name_map)
+        self._state = (frame, datetime.now(), time.time())
+        current_app.logger.info(
+            f"InventoryAgingSnapshot: {len(frame.df):,} mã, {frame.df['GroupID'].nunique()} nhóm "
+            f"trong {time.perf_counter() - start:.1f}s"
+        )
+
+    # --- ĐỌC ---
+    def get_state(self):
+        """
+        Trả về (InventoryAgingFrame, as_of) nếu ảnh chụp còn dùng được, ngược lại None (nơi gọi gọi SP trực tiếp).
+        Tự kích hoạt nạp lại ở nền khi quá refresh_seconds.
+        """
+        state = self._state
+        if not self._refresher.check(state[2] if state else None):
+            return None
+        return state[0], state[1]
+
+
+class InventoryAgingFrame:
+    """1 ảnh chụp bất biến: DataFrame đã chuẩn hóa + dict dòng chi tiết theo cùng thứ tự."""
+
+    def __init__(self, rows, i04_map, name_map):
+        df = pd.DataFrame.from_records(rows) if rows else pd.DataFrame(columns=['InventoryID', 'InventoryName'])
+        df['_Seq'] = np.arange(len(df)) # Thứ tự gốc của SP (giữ thứ tự nhóm khi bằng điểm như cách cũ)
+        for col in VALUE_COLUMNS:
+            df[col] = _numeric(df[col]) if col in df else 0.0
+        # Cột StockClass gốc giữ nguyên trong dòng chi tiết; bản chuẩn hóa để so sánh nằm ở cột riêng
+        df['_stock_class'] = _text(df, 'StockClass').str.strip().str.upper()
+        # [CONFIG]: RISK_INVENTORY_VALUE
+        df['Risk_CLC_Value'] = np.where(
+            (df['_stock_class'] != 'D') & (df['Range_Over_720_V'] > config.RISK_INVENTORY_VALUE), df['Range_Over_720_V'], 0.0
+        )
+
+        group_id = df['InventoryID'].map(i04_map).fillna(OTHER_GROUP)
+        df['GroupID'] = group_id
+        df['GroupName'] = group_id.map(lambda code: OTHER_GROUP_NAME if code == OTHER_GROUP else name_map.get(code, code))
+
+        # Cột chữ thường phục vụ lọc (không đưa vào dòng chi tiết)
+        df['_inv'] = _text(df, 'InventoryID').str.lower()
+        df['_name'] = _text(df, 'InventoryName').str.lower()
+        df['_cat'] = _text(df, 'InventoryTypeName').str.lower()
+        df['_cat_code'] = _text(df, 'ItemCategory').str.lower()
+
+        df = df.sort_values(['Risk_CLC_Value', 'Range_Over_720_V', '_Seq'], ascending=[False, False, True], kind='mergesort')
+        self.df = df.reset_index(drop=True)
+        item_columns = [c for c in self.df.columns if not c.startswith('_') and c not in ('GroupID', 'GroupName')]
+        self.items = self.df[item_columns].to_dict('records')
+
+    # --- LỌC ---
+    def mask(self, item_filter_term='', category_filter='', qty_filter='', value_filter='', i05id_filter=''):
+        df = self.df
+        mask = np.ones(len(df), dtype=bool)
+
+        search_terms = [t.strip().lower() for t in (item_filter_term or '').split(';') if t.strip()]
+        if search_terms:
+            hit = np.zeros(len(df), dtype=bool)
+            for term in search_terms:
+                hit |= (df['_inv'].str.contains(term, regex=False) | df['_name'].str.contains(term, regex=False)).to_numpy()
+            mask &= hit
+
+        if category_filter:
+            cat_val = _strip_negation(category_filter).lower()
+            is_cat = (df['_cat'].str.contains(cat_val, regex=False) | (df['_cat_code'] == cat_val)).to_numpy()
+            mask &= ~is_cat if _negated(category_filter) else is_cat
+
+        if i05id_filter:
+            is_class = (df['_stock_class'] == _strip_negation(i05id_filter).upper()).to_numpy()
+            mask &= ~is_class if _negated(i05id_filter) else is_class
+
+        for column, filter_str in (('TotalCurrentQuantity', qty_filter), ('TotalCurrentValue', value_filter)):
+            op, threshold = parse_filter_string(filter_str)
+            if threshold is not None and op in _OPERATORS:
+                mask &= _OPERATORS[op](df[column].to_numpy(), threshold)
+        return mask
+
+    # --- GOM NHÓM ---
+    def grouped(self, mask):
+        """(sorted_groups, totals) cùng cấu trúc get_inventory_aging_data cũ."""
+        sel = self.df[mask]
+        totals = {
+            'total_inventory': float(sel['TotalCurrentValue'].sum()),
+            'total_quantity': float(sel['TotalCurrentQuantity'].sum()),
+            'total_new_6_months': float(sel['Range_0_180_V'].sum()),
+            'total_over_2_years': float(sel['Range_Over_720_V'].sum()),
+            'total_clc_value': float(sel['Risk_CLC_Value'].sum())
+        }
+        if sel.empty:
+            return [], totals
+
+        agg = sel.groupby('GroupID', sort=False).agg(
+            GroupName=('GroupName', 'first'),
+            Group_TotalVal=('TotalCurrentValue', 'sum'),
+            Group_TotalQty=('TotalCurrentQuantity', 'sum'),
+            Group_Over720=('Range_Over_720_V', 'sum'),
+            Group_CLC=('Risk_CLC_Value', 'sum'),
+            FirstSeq=('_Seq', 'min')
+        ).sort_values(['Group_CLC', 'Group_Over720', 'FirstSeq'], ascending=[False, False, True], kind='mergesort')
+
+        positions = np.flatnonzero(mask)
+        members = sel.groupby('GroupID', sort=False).indices # vị trí trong sel, tăng dần = đúng thứ tự đã sắp
+        groups = []
+        for group_id, row in agg.iterrows():
+            groups.append({
+                'GroupID': group_id,
+                'GroupName': row['GroupName'],
+                'Items': [self.items[i] for i in positions[members[group_id]]],
+                'Group_TotalVal': float(row['Group_TotalVal']),
+                'Group_TotalQty': float(row['Group_TotalQty']),
+                'Group_Over720': float(row['Group_Over720']),
+                'Group_CLC': float(row['Group_CLC'])
+            })
+        return groups, totals
+
+    def group_items(self, group_id):
+        """Dòng chi tiết 1 nhóm (không lọc) cho lazy-load; nhóm không tồn tại -> None."""
+        positions = np.flatnonzero((self.df['GroupID'] == group_id).to_numpy())
+        return [self.items[i] for i in positions] if len(positions) else None
+
+    # --- BIỂU ĐỒ COCKPIT ---
+    def aging_buckets(self):
+        """Tổng theo 5 khung tuổi (An toàn, Ổn định, Chậm, Tồn lâu, CLC): tổng chung + theo từng nhóm I04."""
+        df = self.df
+        buckets = pd.DataFrame({
+            'GroupID': df['GroupID'],
+            'Safe': df['Range_0_180_V'],
+            'Stable': df['Range_181_360_V'],
+            'Slow': df['Range_361_540_V'] + df['Range_541_720_V'],
+            'LongTerm': df['Range_Over_720_V'],
+            'Risk': df['Risk_CLC_Value'],
+            'Total': df['TotalCurrentValue']
+        })
+        by_group = buckets.groupby('GroupID', sort=False).sum().sort_values('Total', ascending=False, kind='mergesort')
+        return buckets.drop(columns='GroupID').sum().to_dict(), by_group.reset_index().to_dict('records')
+
+
+def get_inventory_aging_snapshot():
+    """(InventoryAgingFrame, as_of) của InventoryService dùng chung nếu còn dùng được, ngược lại None."""
+    service = getattr(current_app, 'inventory_service', None)
+    snapshot = getattr(service, 'aging_snapshot', None)
+    return snapshot.get_state() if snapshot is not None else None
@@ -0,0 +1,174 @@
+# inventory_index.py
+# --- CHỈ MỤC TRIGRAM TRONG RAM CHO TRA CỨU MÃ HÀNG (IT1302) ---
+#
+# Thay cho chuỗi "InventoryID LIKE '%x%' OR InventoryName LIKE '%x%'" trên IT1302:
+#   - Mỗi mã hàng -> chuỗi tìm kiếm = mã (thường) + tên (thường) + tên bỏ dấu.
+#   - Trigram -> danh sách vị trí (array 'I'); từ khóa >= 3 ký tự: giao các danh sách rồi kiểm tra lại bằng 'in'.
+#   - Từ khóa < 3 ký tự: quét tuyến tính (vẫn chỉ vài ms).
+# Chỉ mục được nạp lại định kỳ ở luồng nền; trong lúc chưa sẵn sàng, search() trả None -> nơi gọi dùng đường LIKE cũ.
+
+import sys
+import time
+import unicodedata
+from array import array
+from flask import current_app
+from background_refresh import BackgroundRefresher
+import config
+
+_SEP = '\x00' # Ngăn trigram/substring khớp xuyên qua ranh giới mã|tên
+
+
+def fold_text(text):
+    """Chữ thường + bỏ dấu tiếng Việt (VD: 'Vòng Bi Đũa' -> 'vong bi dua')."""
+    if not text:
+        return ''
+    text = str(text).lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFD', text)
+    return ''.join(ch for ch in text if unicodedata.category(ch) != 'Mn')
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class InventorySearchIndex:
+    """Chỉ mục trigram (ID, Tên, Tên bỏ dấu) của IT1302, làm mới định kỳ."""
+
+    def __init__(self, db_manager, refresh_seconds=None):
+        self.db = db_manager
+        self._refresher = BackgroundRefresher(
+            self.refresh, 'inventory_index_refresh', 'InventoryIndex: lỗi nạp chỉ mục',
+            refresh_seconds or config.INVENTORY_INDEX_REFRESH_SECONDS
+        )
+        self._stale = False
+        self._state = None # (ids, haystacks, postings, built_at) - thay nguyên khối khi nạp lại
+
+    # --- NẠP / LÀM MỚI ---
+    def _load_rows(self):
+        query = f"SELECT InventoryID, InventoryName FROM {config.ERP_IT1302} WHERE InventoryID IS NOT NULL"
+        return self.db.fetch_data(query, readonly=True)
+
+    def build(self, rows):
+        """Dựng chỉ mục từ list[dict] có InventoryID, InventoryName (dùng chung cho benchmark)."""
+        rows = sorted(rows, key=lambda r: str(r['InventoryID']))
+        ids, haystacks = [], []
+        postings = {}
+        for pos, row in enumerate(rows):
+            inv_id = str(row['InventoryID']).strip()
+            name = str(row.get('InventoryName') or '').strip()
+            hay = f"{inv_id.lower()}{_SEP}{name.lower()}{_SEP}{fold_text(name)}"
+            ids.append(inv_id)
+            haystacks.append(hay)
+            for tri in _trigrams(hay):
+                lst = postings.get(tri)
+                if lst is None:
+                    postings[tri] = lst = []
+                lst.append(pos)
+
+        # Nén danh sách vị trí sang array('I') (4 byte/phần tử thay vì 8 byte con trỏ + object int)
+        postings = {tri: array('I', lst) for tri, lst in postings.items()}
+        self._state = (ids, haystacks, postings, time.time())
+        self._stale = False
+
+    def refresh(self):
+        """Nạp lại từ DB (đồng bộ). Lỗi -> giữ chỉ mục cũ."""
+        start = time.perf_counter()
+        rows = self._load_rows()
+        self.build(rows)
+        report = self.memory_report()
+        current_app.logger.info(
+            f"InventoryIndex: nạp {report['items']:,} mã, {report['trigrams']:,} trigram, "
+            f"~{report['total_mb']} MB trong {time.perf_counter() - start:.1f}s"
+        )
+
+    def mark_stale(self):
+        """Đánh dấu cần nạp lại (VD: sau khi đồng bộ danh mục hàng)."""
+        self._stale = True
+
+    def is_ready(self):
+        return self._state is not None
+
+    def _ensure_fresh(self):
+        state = self._state
+        self._refresher.check(state[3] if state else None, stale=self._stale)
+
+    # --- TÌM KIẾM ---
+    def _match_term(self, term, ids, haystacks, postings):
+        variants = {term.lower(), fold_text(term)}
+        matched = set()
+        for variant in variants:
+            if not variant:
+                continue
+            if len(variant) < 3:
+                candidates = range(len(haystacks))
+            else:
+                lists = []
+                for tri in _trigrams(variant):
+                    lst = postings.get(tri)
+                    if lst is None:
+                        lists = None
+                        break
+                    lists.append(lst)
+                if not lists:
+                    continue
+                lists.sort(key=len)
+                candidates = set(lists[0])
+                for lst in lists[1:]:
+                    candidates.intersection_update(lst)
+                    if not candidates:
+                        break
+            matched.update(pos for pos in candidates if variant in haystacks[pos])
+        return matched
+
+    def search(self, terms, mode='AND'):
+        """
+        Trả về list InventoryID (sắp xếp tăng dần) khớp các từ khóa (chuỗi con, không phân biệt hoa thường/dấu).
+        mode='AND': khớp tất cả từ khóa; 'OR': khớp ít nhất 1.
+        Trả về None nếu chỉ mục chưa sẵn sàng (nơi gọi dùng đường LIKE).
+        """
+        self._ensure_fresh()
+        state = self._state
+        if state is None:
+            return None
+        ids, haystacks, postings, _ = state
+
+        result = None
+        for term in terms:
+            term = term.strip()
+            if not term:
+                continue
+            matched = self._match_term(term, ids, haystacks, postings)
+            if result is None:
+                result = matched
+            elif mode == 'AND':
+                result &= matched
+            else:
+                result |= matched
+            if mode == 'AND' and not result:
+                break
+
+        return [ids[pos] for pos in sorted(result or ())]
+
+    # --- BÁO CÁO BỘ NHỚ ---
+    def memory_report(self):
+        """Ước lượng dung lượng RAM của chỉ mục (byte/MB) + số mã, số trigram, số phần tử postings."""
+        state = self._state
+        if state is None:
+            return {'ready': False}
+        ids, haystacks, postings, built_at = state
+
+        ids_bytes = sys.getsizeof(ids) + sum(sys.getsizeof(s) for s in ids)
+        hay_bytes = sys.getsizeof(haystacks) + sum(sys.getsizeof(s) for s in haystacks)
+        post_bytes = sys.getsizeof(postings) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in postings.items())
+        total = ids_bytes + hay_bytes + post_bytes
+        return {
+            'ready': True,
+            'items': len(ids),
+            'trigrams': len(postings),
+            'postings': sum(len(v) for v in postings.values()),
+            'ids_bytes': ids_bytes,
+            'haystack_bytes': hay_bytes,
+            'postings_bytes': post_bytes,
+            'total_mb': round(total / 1024 / 1024, 1),
+            'built_at': built_at,
+        }
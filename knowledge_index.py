@@ -0,0 +1,204 @@
+# knowledge_index.py
+# --- CHỈ MỤC BM25 CHO NGÂN HÀNG CÂU HỎI (TRAINING_QUESTION_BANK) ---
+#
+# Thay cho 4 điều kiện "Content LIKE '%kw%'" OR + chấm điểm đếm chuỗi con trong Python:
+#   - Token hóa bỏ dấu (fold_text) trên Content (trọng số x2), CorrectAnswer, Explanation; bỏ stop word.
+#   - Chỉ mục ngược term -> {ID: tf}, xếp hạng BM25 (k1=1.5, b=0.75).
+#   - Lưu ra đĩa (pickle, ghi nguyên tử) -> khởi động lại không phải dựng lại.
+#   - Đồng bộ tăng dần: chỉ đọc (ID, BINARY_CHECKSUM) cả bảng, so với bản đã lưu, rồi nạp nội dung
+#     của các câu mới/đã sửa (VD: scan_quiz_full.py thêm câu, process_answers_ai.py cập nhật đáp án).
+
+import os
+import re
+import math
+import time
+import pickle
+import threading
+from collections import Counter
+from flask import current_app
+from inventory_index import fold_text
+from background_refresh import BackgroundRefresher
+import config
+
+_FORMAT_VERSION = 1
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_CONTENT_WEIGHT = 2 # Token trong Content được tính 2 lần (câu hỏi khớp quan trọng hơn lời giải thích)
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+_FETCH_CHUNK = 500
+
+STOP_WORDS = frozenset(fold_text(w) for w in (
+    'là', 'gì', 'của', 'hãy', 'nêu', 'cho', 'biết', 'trong', 'với', 'tại', 'sao', 'như', 'thế', 'nào',
+    'em', 'anh', 'chị', 'ad', 'bot', 'bạn', 'tôi', 'mình', 'và', 'có', 'được', 'các', 'những', 'một', 'thì', 'mà',
+))
+
+
+def tokenize(text):
+    """Bỏ dấu + chữ thường, tách token chữ/số, bỏ stop word và token 1 ký tự."""
+    return [t for t in _TOKEN_RE.findall(fold_text(text)) if len(t) > 1 and t not in STOP_WORDS]
+
+
+def _doc_terms(row):
+    terms = Counter()
+    for tok in tokenize(row.get('Content')):
+        terms[tok] += _CONTENT_WEIGHT
+    terms.update(tokenize(row.get('CorrectAnswer')))
+    terms.update(tokenize(row.get('Explanation')))
+    return terms
+
+
+class KnowledgeIndex:
+    """Chỉ mục BM25 (Content, CorrectAnswer, Explanation) của TRAINING_QUESTION_BANK, lưu đĩa + đồng bộ tăng dần."""
+
+    def __init__(self, db_manager, path=None, sync_seconds=None):
+        self.db = db_manager
+        self.path = path or config.KNOWLEDGE_INDEX_PATH
+        self._lock = threading.Lock()      # Ghi chỉ mục (sync) tuần tự
+        # Đồng bộ nền: tối đa 1 luồng, cờ đang chạy đọc/ghi trong lock của BackgroundRefresher
+        self._syncer = BackgroundRefresher(
+            self.sync, 'knowledge_index_sync', 'KnowledgeIndex: lỗi đồng bộ',
+            sync_seconds or config.KNOWLEDGE_INDEX_SYNC_SECONDS
+        )
+        self._synced_at = 0
+        # (docs, postings, total_length) - sync dựng bản sao rồi thay nguyên khối, search không bị sửa giữa chừng
+        #   docs: ID -> {'row': {...}, 'checksum': int, 'length': int, 'terms': Counter}
+        #   postings: term -> {ID: tf}
+        self._state = ({}, {}, 0)
+        self._loaded = self._load()
+
+    # --- LƯU / NẠP ĐĨA ---
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != _FORMAT_VERSION:
+                return False
+            self._state = (data['docs'], data['postings'], data['total_length'])
+            return True
+        except Exception:
+            return False
+
+    def save(self):
+        """Ghi nguyên tử (file tạm + os.replace) để tiến trình khác không đọc phải file dở dang."""
+        docs, postings, total_length = self._state
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'version': _FORMAT_VERSION, 'docs': docs, 'postings': postings, 'total_length': total_length,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    # --- CẬP NHẬT TĂNG DẦN (trên bản sao docs/postings, trả về chênh lệch tổng độ dài) ---
+    @staticmethod
+    def _remove(docs, postings, doc_id):
+        doc = docs.pop(doc_id, None)
+        if not doc:
+            return 0
+        for term in doc['terms']:
+            plist = postings.get(term)
+            if plist is not None:
+                plist.pop(doc_id, None)
+                if not plist:
+                    del postings[term]
+        return -doc['length']
+
+    @classmethod
+    def _upsert(cls, docs, postings, row, checksum=None):
+        doc_id = row['ID']
+        delta = cls._remove(docs, postings, doc_id)
+        terms = _doc_terms(row)
+        length = sum(terms.values())
+        docs[doc_id] = {
+            'row': {k: row.get(k) for k in ('ID', 'Content', 'CorrectAnswer', 'Explanation')},
+            'checksum': checksum, 'length': length, 'terms': terms,
+        }
+        for term, tf in terms.items():
+            postings.setdefault(term, {})[doc_id] = tf
+        return delta + length
+
+    def build(self, rows):
+        """Dựng lại toàn bộ từ list dict (ID, Content, CorrectAnswer, Explanation) - dùng cho benchmark."""
+        docs, postings, total_length = {}, {}, 0
+        for row in rows:
+            total_length += self._upsert(docs, postings, row)
+        self._state = (docs, postings, total_length)
+        self._loaded = True
+
+    def sync(self):
+        """
+        Đồng bộ với DB: so checksum từng câu, nạp lại câu mới/đã sửa, xóa câu không còn. Có thay đổi -> lưu đĩa.
+        Trả về (số câu thêm/sửa, số câu xóa).
+        """
+        with self._lock:
+            start = time.perf_counter()
+            rows = self.db.fetch_data(
+                "SELECT ID, BINARY_CHECKSUM(Content, CorrectAnswer, Explanation) AS Checksum "
+                "FROM TRAINING_QUESTION_BANK WHERE CorrectAnswer IS NOT NULL"
+            )
+            current = {row['ID']: row['Checksum'] for row in rows}
+            docs, postings, total_length = self._state
+            changed = [doc_id for doc_id, checksum in current.items()
+                       if doc_id not in docs or docs[doc_id]['checksum'] != checksum]
+            removed = [doc_id for doc_id in docs if doc_id not in current]
+
+            if changed or removed:
+                docs = dict(docs)
+                postings = {term: dict(plist) for term, plist in postings.items()}
+                for doc_id in removed:
+                    total_length += self._remove(docs, postings, doc_id)
+                for i in range(0, len(changed), _FETCH_CHUNK):
+                    chunk = changed[i:i + _FETCH_CHUNK]
+                    placeholders = ', '.join(['?'] * len(chunk))
+                    for row in self.db.fetch_data(
+                        f"SELECT ID, Content, CorrectAnswer, Explanation FROM TRAINING_QUESTION_BANK WHERE ID IN ({placeholders})",
+                        tuple(chunk)
+                    ):
+                        total_length += self._upsert(docs, postings, row, current.get(row['ID']))
+                self._state = (docs, postings, total_length)
+                self.save()
+            self._loaded = True
+            self._synced_at = time.time()
+            current_app.logger.info(
+                f"KnowledgeIndex: +{len(changed)} / -{len(removed)} câu, tổng {len(docs):,} "
+                f"trong {time.perf_counter() - start:.2f}s"
+            )
+            return len(changed), len(removed)
+
+    def is_ready(self):
+        return self._loaded
+
+    # --- TÌM KIẾM ---
+    def search(self, query, k=5):
+        """
+        Trả về list (bm25, coverage, row) tốt nhất, coverage = tỉ lệ từ khóa (khác nhau) có trong câu hỏi.
+        Trả về None nếu chỉ mục chưa có dữ liệu (nơi gọi dùng LIKE).
+        """
+        self._syncer.check(self._synced_at)
+        if not self._loaded:
+            return None
+
+        docs, postings, total_length = self._state
+        q_terms = set(tokenize(query))
+        n_docs = len(docs)
+        if not q_terms or not n_docs:
+            return []
+        avg_len = total_length / n_docs
+
+        scores, hits = Counter(), Counter()
+        for term in q_terms:
+            plist = postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, tf in plist.items():
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * docs[doc_id]['length'] / avg_len)
+                scores[doc_id] += idf * tf * (_BM25_K1 + 1) / (tf + norm)
+                hits[doc_id] += 1
+
+        return [
+            (score, hits[doc_id] / len(q_terms), docs[doc_id]['row'])
+            for doc_id, score in scores.most_common(k)
+        ]
@@ -6,6 +6,8 @@ from datetime import datetime, timedelta
 # Import các thư viện tiêu chuẩn không phụ thuộc vào app.py
 from db_manager import safe_float 
 from operator import itemgetter 
+from swr_cache import get_or_refresh, prime
+from data_version import get_sales_data_version
 import config 
 
 # Khởi tạo Blueprint (Không cần url_prefix vì các route này là routes cấp cao)
@@ -37,41 +39,29 @@ def make_dashboard_cache_key():
         date_to = request.args.get('date_to', 'def_to')
         salesman = request.args.get('salesman_id', 'all')
         
-    # Key ví dụ: sales_dash_KD010_2025-01-01_2025-01-31_all
+    return sales_dashboard_cache_key(user_code, date_from, date_to, salesman)
+
+def sales_dashboard_cache_key(user_code, date_from='def_from', date_to='def_to', salesman='all'):
+    # Key ví dụ: sales_dash_KD010_2025-01-01_2025-01-31_all (mặc định, không lọc: sales_dash_KD010_def_from_def_to_all)
     return f"sales_dash_{user_code}_{date_from}_{date_to}_{salesman}"
 
+def prime_sales_dashboard(user_code, is_admin, user_division):
+    """Làm nóng sales_dashboard mặc định (không lọc) của 1 user vào đúng key route đọc (cache_warmup.py)."""
+    prime(
+        sales_dashboard_cache_key(user_code),
+        lambda: _build_sales_dashboard_context(user_code, is_admin, user_division, None),
+        soft_ttl=config.SALES_DASHBOARD_SOFT_TTL,
+        hard_ttl=config.SALES_DASHBOARD_HARD_TTL
+    )
+
 @kpi_bp.route('/sales_dashboard', methods=['GET', 'POST'])
 @login_required
 @permission_required('VIEW_SALES_DASHBOARD') # Áp dụng quyền mới
 def sales_dashboard():
-    """ROUTE: Bảng Tổng hợp Hiệu suất Sales (ĐÃ CÓ CACHE)"""
+    """ROUTE: Bảng Tổng hợp Hiệu suất Sales (CACHE STALE-WHILE-REVALIDATE)"""
     
-    # 1. TẠO KEY VÀ KIỂM TRA CACHE
-    # Chỉ cache khi request là GET (xem mặc định) hoặc POST (Lọc).
-    # Tuy nhiên, cẩn thận với Flash message, cache HTML sẽ lưu luôn flash message cũ.
     # Giải pháp an toàn nhất cho Dashboard nặng: Cache DỮ LIỆU TÍNH TOÁN, không cache HTML.
-    
-    cache_key = make_dashboard_cache_key()
-    
-    # Thử lấy dữ liệu đã tính toán từ Redis
-    # current_app.cache được lấy từ factory đã setup
-    cached_data = current_app.cache.get(cache_key)
-    
-    if cached_data:
-        # HIT CACHE: Có dữ liệu rồi -> Render ngay lập tức
-        current_app.logger.info(f"CACHE HIT: {cache_key}")
-        # Giải nén dữ liệu từ cache và return template
-        return render_template('sales_dashboard.html', **cached_data)
-
-    # =========================================================
-    # MISS CACHE: Nếu không có cache, chạy logic tính toán cũ
-    # =========================================================
-    
-    sales_service = current_app.sales_service
-    db_manager = current_app.db_manager
-    
-    current_year = datetime.now().year
-    
+    # Hết hạn mềm -> trả bản cũ, 1 worker duy nhất tính lại ở nền (swr_cache.py)
     user_role = session.get('user_role', '').strip().upper()
     is_admin = (user_role == config.ROLE_ADMIN) 
     user_code = session.get('user_code')
@@ -81,6 +71,25 @@ def sales_dashboard():
         flash("Lỗi phiên đăng nhập: Không tìm thấy mã nhân viên.", 'danger')
         return redirect(url_for('login'))
 
+    cache_key = make_dashboard_cache_key()
+    ip_address = get_user_ip()
+
+    render_context = get_or_refresh(
+        cache_key,
+        lambda: _build_sales_dashboard_context(user_code, is_admin, user_division, ip_address),
+        soft_ttl=config.SALES_DASHBOARD_SOFT_TTL,
+        hard_ttl=config.SALES_DASHBOARD_HARD_TTL,
+        stats_group='sales_dashboard'
+    )
+    return render_template('sales_dashboard.html', **render_context)
+
+def _build_sales_dashboard_context(user_code, is_admin, user_division, ip_address):
+    """Tính dữ liệu sales_dashboard (không dùng request/session -> chạy được ở luồng nền)."""
+    sales_service = current_app.sales_service
+    db_manager = current_app.db_manager
+    
+    current_year = datetime.now().year
+
     # 1. Lấy dữ liệu
     summary_data = sales_service.get_sales_performance_data(
         current_year, 
@@ -116,12 +125,19 @@ def sales_dashboard():
         'PendingOrdersAmount': total_pending_orders_amount_raw
     }
 
-    # =========================================================
-    # LƯU VÀO CACHE TRƯỚC KHI TRẢ VỀ
-    # =========================================================
-    
+    # 4. Ghi Log (mỗi lần tính lại; ip_address None = job làm nóng cache, không phải lượt truy cập)
+    if ip_address is not None:
+        try:
+            db_manager.write_audit_log(
+                user_code, 'VIEW_SALES_DASHBOARD', 'INFO', 
+                "Truy cập Dashboard Tổng hợp Hiệu suất Sales", 
+                ip_address
+            )
+        except Exception as e:
+            current_app.logger.error(f"Lỗi ghi log: {e}")
+
     # Đóng gói toàn bộ biến cần thiết cho template vào 1 dictionary
-    render_context = {
+    return {
         'summary': summary_data,
         'current_year': current_year,
         'kpi_summary': kpi_summary,
@@ -131,30 +147,47 @@ def sales_dashboard():
         'total_orders': total_orders_raw,
         'total_pending_orders_amount': total_pending_orders_amount_raw
     }
-    
-    # Lưu vào Redis trong 6 tiếng
-    current_app.cache.set(cache_key, render_context, timeout=21600)
 
-    # 4. Ghi Log
+@kpi_bp.route('/sales_detail/<string:employee_id>', methods=['GET'])
+@login_required
+def sales_detail(employee_id):
+    """ROUTE: Chi tiết Hiệu suất theo Khách hàng (CACHE STALE-WHILE-REVALIDATE theo NVKD)."""
+    
+    render_context = get_or_refresh(
+        sales_detail_cache_key(employee_id),
+        lambda: _build_sales_detail_context(employee_id),
+        soft_ttl=config.SALES_DETAIL_SOFT_TTL,
+        hard_ttl=config.SALES_DETAIL_HARD_TTL,
+        stats_group='sales_detail'
+    )
+    
+    # LOG VIEW_SALES_DETAIL (BỔ SUNG)
     try:
-        db_manager.write_audit_log(
-            user_code, 'VIEW_SALES_DASHBOARD', 'INFO', 
-            "Truy cập Dashboard Tổng hợp Hiệu suất Sales", 
+        current_app.db_manager.write_audit_log(
+            session.get('user_code'), 'VIEW_SALES_DETAIL', 'INFO', 
+            f"Xem chi tiết hiệu suất cho NV: {employee_id}", 
             get_user_ip()
         )
     except Exception as e:
-        current_app.logger.error(f"Lỗi ghi log: {e}")
-        
-    # 5. Render Template
-    return render_template('sales_dashboard.html', **render_context)
+        current_app.logger.error(f"Lỗi ghi log VIEW_SALES_DETAIL: {e}")
 
-@kpi_bp.route('/sales_detail/<string:employee_id>', methods=['GET'])
-@login_required
-def sales_detail(employee_id):
-    """ROUTE: Chi tiết Hiệu suất theo Khách hàng."""
-    
-    # FIX: Import DBManager và Sales Service Cục bộ
-    
+    return render_template('sales_details.html', **render_context)
+
+def sales_detail_cache_key(employee_id):
+    # Key ví dụ: sales_detail_KD010_2025 (dùng chung cho mọi người xem cùng 1 NVKD)
+    return f"sales_detail_{employee_id}_{datetime.now().year}"
+
+def prime_sales_detail(employee_id):
+    """Làm nóng sales_detail/<employee_id> vào đúng key route đọc (cache_warmup.py)."""
+    prime(
+        sales_detail_cache_key(employee_id),
+        lambda: _build_sales_detail_context(employee_id),
+        soft_ttl=config.SALES_DETAIL_SOFT_TTL,
+        hard_ttl=config.SALES_DETAIL_HARD_TTL
+    )
+
+def _build_sales_detail_context(employee_id):
+    """Tính dữ liệu sales_detail (không dùng request/session -> chạy được ở luồng nền)."""
     db_manager  = current_app.db_manager
     sales_service  = current_app.sales_service 
 
@@ -166,7 +199,7 @@ def sales_detail(employee_id):
         sales_service.get_client_details_for_salesman(employee_id, current_year)
     
     # Lấy tên nhân viên
-    salesman_name_data = db_manager.get_data(f"SELECT SHORTNAME FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?", (employee_id,))
+    salesman_name_data = db_manager.get_data_cached(f"SELECT SHORTNAME FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?", (employee_id,), tags=[config.CACHE_TAG_NGUOI_DUNG])
     salesman_name = salesman_name_data[0]['SHORTNAME'] if salesman_name_data else employee_id
 
     final_client_summary = registered_clients + new_business_clients
@@ -176,28 +209,17 @@ def sales_detail(employee_id):
     total_monthly_sales = sum(row.get('CurrentMonthSales', 0) for row in final_client_summary)
     
     total_registered_sales_display = total_registered_sales_raw / DIVISOR
-    
-    # LOG VIEW_SALES_DETAIL (BỔ SUNG)
-    try:
-        db_manager.write_audit_log(
-            session.get('user_code'), 'VIEW_SALES_DETAIL', 'INFO', 
-            f"Xem chi tiết hiệu suất cho NV: {employee_id}", 
-            get_user_ip()
-        )
-    except Exception as e:
-        current_app.logger.error(f"Lỗi ghi log VIEW_SALES_DETAIL: {e}")
 
-    return render_template(
-        'sales_details.html', 
-        employee_id=employee_id,
-        salesman_name=salesman_name,
-        client_summary=final_client_summary,
-        total_registered_sales=total_registered_sales_display,
-        total_ytd_sales=total_ytd_sales,
-        total_monthly_sales=total_monthly_sales,
-        total_poa_amount=total_poa_amount_raw / DIVISOR, 
-        current_year=current_year
-    )
+    return {
+        'employee_id': employee_id,
+        'salesman_name': salesman_name,
+        'client_summary': final_client_summary,
+        'total_registered_sales': total_registered_sales_display,
+        'total_ytd_sales': total_ytd_sales,
+        'total_monthly_sales': total_monthly_sales,
+        'total_poa_amount': total_poa_amount_raw / DIVISOR, 
+        'current_year': current_year
+    }
 
 def make_realtime_cache_key():
     """Key phụ thuộc vào User đang xem và Filter Salesman họ chọn"""
@@ -210,36 +232,16 @@ def make_realtime_cache_key():
         # Nếu GET (mặc định vào trang), filter có thể rỗng
         salesman_filter = request.args.get('salesman_filter', 'all')
         
-    # Key ví dụ: realtime_KD010_all_2025
+    # Key ví dụ: realtime_KD010_all_2025 - key cố định; phiên bản dữ liệu (data_version.py) lưu trong entry,
+    # đổi phiên bản -> bản cũ vẫn trả ngay và được tính lại ở nền (get_or_refresh(version=...))
     return f"realtime_{user_code}_{salesman_filter}_{datetime.now().year}"
 
 @kpi_bp.route('/realtime_dashboard', methods=['GET', 'POST'])
 @login_required
 @permission_required('VIEW_REALTIME_KPI') # Áp dụng quyền mới
 def realtime_dashboard():
-    """ROUTE: Dashboard KPI Bán hàng Thời gian thực (CACHE 60s)."""
-    
-    # =========================================================
-    # 1. KIỂM TRA CACHE
-    # =========================================================
-    cache_key = make_realtime_cache_key()
-    
-    # Thử lấy dữ liệu từ Redis
-    cached_data = current_app.cache.get(cache_key)
-    
-    if cached_data:
-        # HIT CACHE: Có dữ liệu -> Render ngay (Siêu nhanh)
-        # Vì là realtime nên log mức debug hoặc info tùy bạn
-        # current_app.logger.info(f"REALTIME CACHE HIT: {cache_key}")
-        return render_template('realtime_dashboard.html', **cached_data)
-
-    # =========================================================
-    # 2. MISS CACHE: TÍNH TOÁN DỮ LIỆU (LOGIC CŨ)
-    # =========================================================
+    """ROUTE: Dashboard KPI Bán hàng Thời gian thực (CACHE STALE-WHILE-REVALIDATE)."""
     
-    db_manager = current_app.db_manager 
-
-    current_year = datetime.now().year
     user_division = session.get('division')
     user_code = session.get('user_code')
     user_role = session.get('user_role', '').strip().upper()
@@ -256,7 +258,28 @@ def realtime_dashboard():
             selected_salesman = None
     else:
         selected_salesman = user_code
-        
+
+    # Hết hạn mềm -> trả bản cũ, 1 worker duy nhất tính lại ở nền (swr_cache.py)
+    render_context = get_or_refresh(
+        make_realtime_cache_key(),
+        lambda: _build_realtime_context(is_admin, user_division, selected_salesman),
+        soft_ttl=config.REALTIME_DASHBOARD_SOFT_TTL,
+        hard_ttl=config.REALTIME_DASHBOARD_HARD_TTL,
+        stats_group='realtime_dashboard',
+        version=get_sales_data_version()
+    )
+
+    if render_context.get('data_warning'):
+        flash(render_context['data_warning'], 'warning')
+    
+    return render_template('realtime_dashboard.html', **render_context)
+
+def _build_realtime_context(is_admin, user_division, selected_salesman):
+    """Tính dữ liệu realtime_dashboard (không dùng request/session -> chạy được ở luồng nền)."""
+    db_manager = current_app.db_manager 
+
+    current_year = datetime.now().year
+
     users_data = []
     if is_admin:
         query_users = f"""
@@ -271,18 +294,20 @@ def realtime_dashboard():
         
     salesman_name = "TẤT CẢ NHÂN VIÊN"
     if selected_salesman and selected_salesman.strip():
-        name_data = db_manager.get_data(f"SELECT SHORTNAME FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?", (selected_salesman,))
+        name_data = db_manager.get_data_cached(f"SELECT SHORTNAME FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?", (selected_salesman,), tags=[config.CACHE_TAG_NGUOI_DUNG])
         salesman_name = name_data[0]['SHORTNAME'] if name_data else selected_salesman
     
+    data_warning = None
+
     # Chuẩn bị tham số cho SP
     salesman_param_for_sp = selected_salesman.strip() if selected_salesman else None
     sp_params = (salesman_param_for_sp, current_year)
     
     # Gọi SP (Nặng)
-    all_results = db_manager.execute_sp_multi(config.SP_GET_REALTIME_KPI, sp_params)
+    all_results = db_manager.execute_sp_multi(config.SP_GET_REALTIME_KPI, sp_params, readonly=True)
 
     if not all_results or len(all_results) < 5:
-        flash("Lỗi dữ liệu: SP không trả về đủ 5 bảng kết quả.", 'warning')
+        data_warning = "Lỗi dữ liệu: SP không trả về đủ 5 bảng kết quả."
         kpi_summary = {}
         pending_orders = []
         top_orders = []
@@ -295,16 +320,14 @@ def realtime_dashboard():
         top_quotes = all_results[3] if all_results[3] else []
         upcoming_deliveries = all_results[4] if all_results[4] else []
     
-    # Đồng bộ số liệu Backlog (Logic Fix lệch số)
+    # Đồng bộ số liệu Backlog (Logic Fix lệch số) - đọc từ ảnh chụp backlog YTD dùng chung
     sales_service = current_app.sales_service
-    start_date = f"{current_year}-01-01"
-    end_date = datetime.now().strftime('%Y-%m-%d')
 
     try:
-        backlog_data = sales_service.get_sales_backlog(start_date, end_date, salesman_param_for_sp)
+        backlog_summary = sales_service.get_ytd_backlog_summary(salesman_param_for_sp)
         
-        real_pending_value = backlog_data['summary']['total_backlog']
-        real_pending_count = backlog_data['summary']['count']
+        real_pending_value = backlog_summary['total_backlog']
+        real_pending_count = backlog_summary['count']
         
         if kpi_summary:
             kpi_summary['PendingValue'] = real_pending_value
@@ -313,12 +336,8 @@ def realtime_dashboard():
     except Exception as e:
         current_app.logger.error(f"Lỗi đồng bộ Backlog Realtime: {e}")
 
-    # =========================================================
-    # 3. LƯU CACHE VÀ RETURN
-    # =========================================================
-    
     # Đóng gói dữ liệu vào Dictionary context
-    render_context = {
+    return {
         'kpi_summary': kpi_summary,
         'pending_orders': pending_orders,
         'top_orders': top_orders,
@@ -328,13 +347,9 @@ def realtime_dashboard():
         'selected_salesman': selected_salesman,
         'salesman_name': salesman_name,
         'current_year': current_year,
-        'is_admin': is_admin
+        'is_admin': is_admin,
+        'data_warning': data_warning
     }
-    
-    # Lưu Cache trong 6 tiếng (Vì là Realtime nên time ngắn)
-    current_app.cache.set(cache_key, render_context, timeout=18600)
-    
-    return render_template('realtime_dashboard.html', **render_context)
 
 @kpi_bp.route('/inventory_aging', methods=['GET', 'POST'])
 @login_required
@@ -397,22 +412,14 @@ def api_inventory_group_detail(group_id):
     """
     inventory_service = current_app.inventory_service
     
-    # 1. Lấy toàn bộ dữ liệu (Vì đang dùng Cache nên tốc độ rất nhanh, không lo query lại DB)
-    # Nếu muốn tối ưu hơn nữa, bạn cần viết hàm service get_items_by_group_id(group_id) riêng.
-    # Nhưng với Cache hiện tại, lọc từ RAM Python vẫn cực nhanh.
-    all_groups, _ = inventory_service.get_inventory_aging_data(
-        item_filter_term='', category_filter='', qty_filter='', value_filter='', i05id_filter=''
-    )
-    
-    # 2. Tìm nhóm đang cần
-    # Giả định GroupID là mã nhóm
-    group_data = next((g for g in all_groups if g['GroupID'] == group_id), None)
+    # 1. Lấy các dòng của nhóm (GroupID là mã nhóm I04) từ ảnh chụp tuổi tồn trong RAM
+    items = inventory_service.get_inventory_group_items(group_id)
     
-    if not group_data:
+    if not items:
         return '<tr class="bg-light"><td colspan="10" class="text-center text-muted p-3">Không tìm thấy dữ liệu.</td></tr>'
 
-    # 3. Trả về Partial HTML (chỉ các dòng tr)
-    return render_template('partials/_inventory_lazy_items.html', items=group_data['Items'])
+    # 2. Trả về Partial HTML (chỉ các dòng tr)
+    return render_template('partials/_inventory_lazy_items.html', items=items)
 
 @kpi_bp.route('/ar_aging', methods=['GET', 'POST'])
 @login_required
@@ -1,42 +1,37 @@
 import os
-import PyPDF2
 from flask import current_app
 import google.generativeai as genai
-import json
+from page_index import (extract_pdf_pages, write_page_index, index_path_for, ensure_page_index, retrieve_context,
+                        resolve_page_citations)
 
 class LibraryService:
     def __init__(self, db_manager):
         self.db = db_manager
 
+    def _real_path(self, file_path):
+        """FilePath trong DB dạng '/static/...' (tương đối thư mục app) hoặc đường dẫn tuyệt đối."""
+        if file_path and file_path.startswith('/'):
+            return os.path.join(current_app.root_path, file_path.lstrip('/'))
+        return file_path
+
     # --- 1. XỬ LÝ FILE PDF KHI UPLOAD ---
     def process_new_document(self, file_path, material_id):
         """
-        Đọc PDF, tách text theo từng trang và lưu lại để AI tra cứu sau này.
-        (Trong thực tế, đoạn này nên lưu vào Vector DB như ChromaDB/FAISS)
+        Đọc PDF, tách text theo từng trang và dựng chỉ mục trang (<pdf>.pidx, xem page_index.py)
+        để Chat với tài liệu chỉ đọc đúng các trang liên quan.
         """
         try:
-            reader = PyPDF2.PdfReader(file_path)
-            total_pages = len(reader.pages)
-            
-            full_text_map = [] # Lưu dạng: [{"page": 1, "text": "..."}, ...]
+            pages = extract_pdf_pages(file_path)
+            total_pages = len(pages)
             
             # Chỉ lấy text của 5 trang đầu để AI tóm tắt tổng quan
-            intro_text = ""
-            
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if i < 5: intro_text += text + "\n"
-                full_text_map.append({"page": i + 1, "content": text})
+            intro_text = "\n".join(pages[:5])
             
             # Gọi AI tóm tắt & Phân loại ngay khi upload
             summary = self._ai_categorize_document(intro_text)
             
-            # Cập nhật DB
-            # Lưu full_text_map vào file JSON riêng hoặc Column riêng để Chatbot đọc nhanh
-            # Ở đây tôi giả định lưu path json
-            json_path = file_path + ".json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(full_text_map, f, ensure_ascii=False)
+            # Lưu chỉ mục trang (nhị phân gọn: từ điển + postings + nội dung trang nén)
+            write_page_index(pages, index_path_for(file_path))
 
             sql = "UPDATE TRAINING_MATERIALS SET TotalPages=?, Summary=?, AI_Processed=1 WHERE MaterialID=?"
             self.db.execute_non_query(sql, (total_pages, summary, material_id))
@@ -67,35 +62,21 @@ class LibraryService:
         Hàm xử lý logic Chat Split View.
         Đặc biệt: Phải tìm ra SỐ TRANG (Page Number) để UI cuộn tới.
         """
-        # 1. Lấy đường dẫn file JSON content
+        # 1. Lấy đường dẫn file
         sql = "SELECT FilePath, FileName FROM TRAINING_MATERIALS WHERE MaterialID = ?"
         data = self.db.get_data(sql, (material_id,))
         if not data: return {"text": "Tài liệu không tồn tại.", "page": None}
         
-        file_path = data[0]['FilePath']
-        json_path = file_path + ".json"
-        
-        if not os.path.exists(json_path):
+        try:
+            index = ensure_page_index(self._real_path(data[0]['FilePath']))
+        except Exception as e:
+            current_app.logger.error(f"Lỗi chỉ mục trang tài liệu {material_id}: {e}")
+            index = None
+        if index is None:
             return {"text": "Tài liệu này chưa được AI xử lý (Index).", "page": None}
 
-        # 2. Load nội dung (Trong thực tế nên dùng Vector Search, ở đây dùng Keyword Search đơn giản)
-        with open(json_path, 'r', encoding='utf-8') as f:
-            pages = json.load(f)
-            
-        # Tìm các trang có liên quan nhất tới câu hỏi (Keyword matching đơn giản)
-        # Sếp có thể nâng cấp phần này bằng thư viện `difflib` hoặc Vector Embeddings
-        relevant_context = ""
-        user_keywords = user_question.lower().split()
-        
-        for p in pages:
-            score = 0
-            page_text = p['content'].lower()
-            for kw in user_keywords:
-                if kw in page_text: score += 1
-            
-            if score > 0:
-                # Đánh dấu số trang vào context để AI biết
-                relevant_context += f"\n--- [TRANG {p['page']}] ---\n{p['content']}"
+        # 2. Chỉ mục trang (BM25) chọn top-k trang liên quan, chỉ đọc đúng các trang đó
+        relevant_context, ranked_pages = retrieve_context(index, user_question)
 
         if not relevant_context:
             return {"text": "Tôi không tìm thấy thông tin liên quan trong tài liệu này.", "page": None}
@@ -108,7 +89,7 @@ class LibraryService:
         CÂU HỎI: "{user_question}"
         
         DỮ LIỆU TỪ TÀI LIỆU (Đã đánh dấu trang):
-        {relevant_context[:10000]} (Cắt bớt nếu quá dài)
+        {relevant_context}
         
         YÊU CẦU:
         1. Trả lời câu hỏi dựa trên dữ liệu.
@@ -121,14 +102,9 @@ class LibraryService:
             response = model.generate_content(prompt)
             reply = response.text
             
-            # 4. Trích xuất số trang từ câu trả lời để Frontend cuộn
-            target_page = None
-            import re
-            match = re.search(r'\[\[PAGE:(\d+)\]\]', reply)
-            if match:
-                target_page = int(match.group(1))
-                # Xóa tag system khỏi câu trả lời cho đẹp
-                reply = reply.replace(match.group(0), f"(Xem trang {target_page})")
+            # 4. Số trang để Frontend cuộn: trang khớp nhất theo chỉ mục
+            #    (AI trích dẫn trang khác trong số trang đã gửi thì theo AI, trang không được gửi -> bỏ tag)
+            reply, target_page = resolve_page_citations(reply, ranked_pages)
             
             return {
                 "text": reply,
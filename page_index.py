@@ -0,0 +1,247 @@
+# page_index.py
+# --- CHỈ MỤC TRANG CHO CHAT VỚI TÀI LIỆU (FILE NHỊ PHÂN <pdf>.pidx) ---
+#
+# Thay cho việc đọc toàn bộ <pdf>.json (hoặc đọc lại PDF) ở mỗi câu hỏi rồi gửi cả khối lớn cho AI:
+#   - Dựng 1 lần khi nạp tài liệu (LibraryService.process_new_document).
+#   - File gồm: header + từ điển term + postings (trang, tf) + nội dung từng trang nén zlib.
+#   - Khi hỏi: chỉ đọc phần header/từ điển (cache trong RAM theo mtime), chấm BM25 theo trang,
+#     rồi seek đọc đúng top-k trang cần gửi cho AI. Số trang để UI cuộn lấy từ kết quả chỉ mục.
+#
+# Bố cục (little-endian):
+#   HEADER  <4sHIIII : magic, version, n_pages, n_terms, n_postings, terms_bytes
+#   page_offsets  Q * (n_pages + 1)   vị trí (tính từ đầu khối nội dung) của trang nén i
+#   page_lengths  I * n_pages         số token mỗi trang (BM25)
+#   terms         terms_bytes         UTF-8, các term nối bằng '\n', đã sắp xếp
+#   post_offsets  I * (n_terms + 1)
+#   post_pages    I * n_postings      chỉ số trang (0-based)
+#   post_tf       H * n_postings
+#   <khối nội dung: zlib(trang 1) zlib(trang 2) ...>
+
+import os
+import re
+import sys
+import json
+import math
+import zlib
+import struct
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from knowledge_index import tokenize
+import config
+
+MAGIC = b'TPIX'
+VERSION = 1
+INDEX_SUFFIX = '.pidx'
+_HEADER = struct.Struct('<4sHIIII')
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+_PAGE_TAG_RE = re.compile(r'([ \t]*)\[\[PAGE:(\d+)\]\]')
+
+_cache = OrderedDict() # path -> (mtime_ns, size, PageIndex)
+_cache_lock = threading.Lock()
+
+
+def index_path_for(pdf_path):
+    return pdf_path + INDEX_SUFFIX
+
+
+def _to_le_bytes(arr):
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_le_bytes(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+
+def write_page_index(pages, out_path):
+    """
+    Ghi chỉ mục trang. pages: list nội dung text theo thứ tự trang (phần tử 0 = trang 1).
+    Ghi nguyên tử (file tạm + os.replace). Trả về số byte đã ghi.
+    """
+    postings = {}
+    page_lengths = array('I')
+    for page_no, text in enumerate(pages):
+        terms = Counter(tokenize(text))
+        page_lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append((page_no, min(tf, 65535)))
+
+    terms = sorted(postings)
+    post_offsets, post_pages, post_tf = array('I', [0]), array('I'), array('H')
+    for term in terms:
+        for page_no, tf in postings[term]:
+            post_pages.append(page_no)
+            post_tf.append(tf)
+        post_offsets.append(len(post_pages))
+
+    blobs = [zlib.compress((text or '').encode('utf-8'), 6) for text in pages]
+    page_offsets = array('Q', [0])
+    for blob in blobs:
+        page_offsets.append(page_offsets[-1] + len(blob))
+
+    terms_bytes = '\n'.join(terms).encode('utf-8')
+    parts = [
+        _HEADER.pack(MAGIC, VERSION, len(pages), len(terms), len(post_pages), len(terms_bytes)),
+        _to_le_bytes(page_offsets), _to_le_bytes(page_lengths), terms_bytes,
+        _to_le_bytes(post_offsets), _to_le_bytes(post_pages), _to_le_bytes(post_tf),
+    ] + blobs
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for part in parts:
+            f.write(part)
+    os.replace(tmp_path, out_path)
+    return sum(len(p) for p in parts)
+
+
+class PageIndex:
+    """Phần tìm kiếm của 1 file .pidx (header, từ điển, postings) trong RAM; nội dung trang đọc theo nhu cầu."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, n_pages, n_terms, n_postings, terms_bytes = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"File chỉ mục trang không hợp lệ: {path}")
+            self.n_pages = n_pages
+            self.page_offsets = _from_le_bytes('Q', f.read(8 * (n_pages + 1)))
+            self.page_lengths = _from_le_bytes('I', f.read(4 * n_pages))
+            terms = f.read(terms_bytes).decode('utf-8').split('\n') if n_terms else []
+            self.term_ids = {term: i for i, term in enumerate(terms)}
+            self.post_offsets = _from_le_bytes('I', f.read(4 * (n_terms + 1)))
+            self.post_pages = _from_le_bytes('I', f.read(4 * n_postings))
+            self.post_tf = _from_le_bytes('H', f.read(2 * n_postings))
+            self.text_start = f.tell()
+        self.avg_length = (sum(self.page_lengths) / n_pages) if n_pages else 0
+
+    def search(self, question, k=4):
+        """Top-k trang theo BM25: list (số_trang 1-based, điểm), điểm giảm dần. Không khớp -> []."""
+        scores = Counter()
+        for term in set(tokenize(question)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.post_offsets[term_id], self.post_offsets[term_id + 1]
+            idf = math.log(1 + (self.n_pages - (end - start) + 0.5) / ((end - start) + 0.5))
+            for i in range(start, end):
+                page, tf = self.post_pages[i], self.post_tf[i]
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self.page_lengths[page] / (self.avg_length or 1))
+                scores[page] += idf * tf * (_BM25_K1 + 1) / (tf + norm)
+        return [(page + 1, score) for page, score in scores.most_common(k)]
+
+    def read_pages(self, page_numbers):
+        """{số_trang: nội dung} cho các trang yêu cầu (1-based), chỉ seek/đọc đúng các trang đó."""
+        result = {}
+        with open(self.path, 'rb') as f:
+            for page_no in sorted(set(page_numbers)):
+                if not 1 <= page_no <= self.n_pages:
+                    continue
+                start, end = self.page_offsets[page_no - 1], self.page_offsets[page_no]
+                f.seek(self.text_start + start)
+                result[page_no] = zlib.decompress(f.read(end - start)).decode('utf-8')
+        return result
+
+
+def open_page_index(path):
+    """Mở .pidx (cache LRU theo đường dẫn + mtime, file được dựng lại sẽ tự nạp lại). Không có file -> None."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            _cache.move_to_end(path)
+            return cached[2]
+    index = PageIndex(path)
+    with _cache_lock:
+        _cache[path] = (stat.st_mtime_ns, stat.st_size, index)
+        _cache.move_to_end(path)
+        while len(_cache) > config.PAGE_INDEX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def extract_pdf_pages(pdf_path):
+    """Text từng trang của PDF (trang lỗi/không có chữ -> chuỗi rỗng)."""
+    import PyPDF2 # Chỉ cần khi dựng chỉ mục; đường đọc/tìm kiếm không phụ thuộc thư viện PDF
+    reader = PyPDF2.PdfReader(pdf_path)
+    pages = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or '')
+        except Exception:
+            pages.append('')
+    return pages
+
+
+def ensure_page_index(pdf_path):
+    """
+    Mở chỉ mục trang của PDF; chưa có thì dựng 1 lần (ưu tiên đọc PDF, không còn PDF thì dùng <pdf>.json cũ).
+    Không có nguồn nào -> None.
+    """
+    idx_path = index_path_for(pdf_path)
+    index = open_page_index(idx_path)
+    if index is not None:
+        return index
+
+    legacy_json = pdf_path + '.json'
+    if os.path.exists(pdf_path):
+        pages = extract_pdf_pages(pdf_path)
+    elif os.path.exists(legacy_json):
+        with open(legacy_json, 'r', encoding='utf-8') as f:
+            page_map = json.load(f)
+        pages = [''] * max((int(p['page']) for p in page_map), default=0)
+        for p in page_map:
+            pages[int(p['page']) - 1] = p.get('content') or ''
+    else:
+        return None
+
+    write_page_index(pages, idx_path)
+    return open_page_index(idx_path)
+
+
+def retrieve_context(index, question, k=None, max_chars=None):
+    """
+    Chọn top-k trang cho câu hỏi và ghép context (theo thứ tự trang, có đánh dấu [TRANG n]).
+    Trả về (context, danh_sách_trang_theo_điểm). Không trang nào khớp -> ('', []).
+    """
+    k = k or config.DOC_CHAT_TOP_PAGES
+    max_chars = max_chars or config.DOC_CHAT_MAX_CONTEXT_CHARS
+    ranked = [page for page, _ in index.search(question, k)]
+    if not ranked:
+        return '', []
+    texts = index.read_pages(ranked)
+    per_page = max_chars // len(ranked)
+    context = ''.join(f"\n--- [TRANG {page}] ---\n{texts[page][:per_page]}" for page in sorted(texts))
+    return context, ranked
+
+
+def resolve_page_citations(reply, ranked_pages):
+    """
+    Xử lý tag [[PAGE:n]] AI chèn vào câu trả lời. Trả về (reply, trang_để_UI_cuộn).
+    Trang nằm trong số trang đã gửi -> "(Xem trang n)"; trang AI tự bịa (không được gửi) -> xóa tag.
+    Trang để cuộn: trang đầu tiên AI trích hợp lệ, không có thì trang khớp nhất theo chỉ mục.
+    """
+    sent = set(ranked_pages)
+    cited = []
+
+    def _replace(match):
+        page = int(match.group(2))
+        if page not in sent:
+            return '' # Bỏ cả khoảng trắng trước tag
+        cited.append(page)
+        return f"{match.group(1)}(Xem trang {page})"
+
+    reply = _PAGE_TAG_RE.sub(_replace, reply)
+    target_page = cited[0] if cited else (ranked_pages[0] if ranked_pages else None)
+    return reply, target_page
@@ -1,76 +1,69 @@
 # portal_bp.py
-from flask import Blueprint, render_template, session, redirect, url_for, current_app, flash, request
+from flask import Blueprint, render_template, session, redirect, url_for, current_app, flash, request, jsonify, get_template_attribute
 from datetime import datetime
 from utils import login_required, permission_required, get_user_ip, record_activity, save_uploaded_files
+from swr_cache import record_cache_lookup
 
 portal_bp = Blueprint('portal_bp', __name__)
 
 # ---------------------------------------------------------
-# [NEW] HÀM TẠO KEY CACHE CHO PORTAL
+# CÁC KHỐI (WIDGET) PORTAL
+# Mỗi khối cache riêng trong PortalService (TTL + data_version riêng). Trang /portal render ngay với các khối
+# đã có trong cache, các khối còn lại hiện spinner và được JS gọi song song qua /api/portal/widget/<key>
+# -> khối nặng (Dự phòng) không chặn các khối nhanh.
 # ---------------------------------------------------------
-def make_portal_cache_key():
-    """Key cache phụ thuộc vào User đang đăng nhập"""
-    user_code = session.get('user_code', 'anon')
-    # Key ví dụ: portal_data_KD010
-    return f"portal_data_{user_code}"
+# key dữ liệu -> các phần HTML (id phần tử, macro trong partials/_portal_widgets.html)
+PORTAL_WIDGET_PARTS = {
+    'sales_kpi': (('pw-sales-kpi', 'sales_kpi_stat'),),
+    'tasks': (('pw-tasks-stat', 'tasks_stat'), ('pw-tasks', 'tasks_list')),
+    'overdue_debt': (('pw-debt-stat', 'debt_stat'), ('pw-debt', 'debt_list')),
+    'orders_stat': (('pw-orders-stat', 'orders_stat'),),
+    'active_quotes': (('pw-quotes', 'quotes_list'),),
+    'pending_deliveries': (('pw-deliveries', 'deliveries_list'),),
+    'orders_flow': (('pw-orders-flow', 'orders_flow_list'),),
+    'urgent_replenish': (('pw-replenish', 'replenish_list'),),
+    'recent_reports': (('pw-reports', 'reports_list'),),
+}
+
+def _portal_user():
+    return session.get('user_code'), session.get('bo_phan', '').strip().upper()
 
 @portal_bp.route('/portal')
 def portal_dashboard():
     # Kiểm tra đăng nhập (Giữ nguyên logic của bạn)
     if not session.get('logged_in'):
         return redirect(url_for('login'))
-    
-    # 1. KIỂM TRA CACHE
-    cache_key = make_portal_cache_key()
-    
-    # Thử lấy dữ liệu Dashboard từ Redis
-    # Lưu ý: Chỉ cache cục dữ liệu nặng (dashboard_data), không cache session hay datetime
-    dashboard_data = current_app.cache.get(cache_key)
-    
-    # 2. MISS CACHE: TÍNH TOÁN DỮ LIỆU TỪ SQL
-    if not dashboard_data:
-        # current_app.logger.info(f"PORTAL CACHE MISS: {cache_key}")
-        
-        portal_service = current_app.portal_service
-        # db_manager = current_app.db_manager (Không dùng thì bỏ qua)
 
-        user_code = session.get('user_code')
-        bo_phan = session.get('bo_phan', '').strip().upper()
-        role = session.get('user_role', '').strip().upper()
-        
-        try:
-            # Gọi Service (Query nặng)
-            dashboard_data = portal_service.get_all_dashboard_data(user_code, bo_phan, role)
-            
-            # Lưu vào Redis trong 3 tiếng (300 giây)
-            if dashboard_data:
-                current_app.cache.set(cache_key, dashboard_data, timeout=10800)
-                
-        except Exception as e:
-            current_app.logger.error(f"Lỗi tải dữ liệu Portal: {e}")
-            dashboard_data = {} # Trả về rỗng để không crash trang
+    # Chỉ đọc cache (1 lần cho mọi khối), không chạy truy vấn nào -> trang hiện ngay
+    user_code, _ = _portal_user()
+    widgets = current_app.portal_service.get_cached_widgets(user_code)
+    record_cache_lookup('portal', 'hit', len(widgets))
+    record_cache_lookup('portal', 'miss', len(PORTAL_WIDGET_PARTS) - len(widgets))
 
-    # 3. RENDER TEMPLATE
-    # Kết hợp dữ liệu từ Cache (dashboard_data) và dữ liệu thực (session, datetime)
     return render_template(
         'portal_dashboard.html',
         user=session,                                   # Luôn lấy session hiện tại
         now_date=datetime.now().strftime('%d/%m/%Y'),   # Luôn lấy giờ hiện tại
-        
-        # Sử dụng .get() để an toàn hơn nếu cache cũ thiếu key
-        sales_kpi=dashboard_data.get('sales_kpi'),
-        tasks=dashboard_data.get('tasks'),
-        # approvals=dashboard_data.get('approvals'), <-- Đã xóa theo code cũ
-        orders_stat=dashboard_data.get('orders_stat'),
-        overdue_debt=dashboard_data.get('overdue_debt'),
-        active_quotes=dashboard_data.get('active_quotes'),
-        pending_deliveries=dashboard_data.get('pending_deliveries'),
-        orders_flow=dashboard_data.get('orders_flow'),
-        recent_reports=dashboard_data.get('recent_reports'),
-        urgent_replenish=dashboard_data.get('urgent_replenish'),
-        errors=dashboard_data.get('errors') 
+        widgets=widgets
     )
 
+@portal_bp.route('/api/portal/widget/<key>')
+@login_required
+def api_portal_widget(key):
+    """HTML đã render của 1 khối Portal (cache riêng theo user). Dữ liệu thô (Decimal, datetime) không gửi ra."""
+    parts = PORTAL_WIDGET_PARTS.get(key)
+    if parts is None:
+        return jsonify({'error': f'Khối không tồn tại: {key}'}), 404
+
+    user_code, bo_phan = _portal_user()
+    data, error = current_app.portal_service.get_widget(key, user_code, bo_phan)
+    html = {
+        part_id: str(get_template_attribute('partials/_portal_widgets.html', macro)(data))
+        for part_id, macro in parts
+    }
+    # Chi tiết lỗi đã ghi log ở PortalService, không gửi thông báo lỗi DB ra trình duyệt
+    return jsonify({'key': key, 'html': html, 'error': 'Không tải được dữ liệu khối.' if error else None})
+
 # ---------------------------------------------------------
 # [NEW] ROUTE LÀM MỚI DỮ LIỆU (XÓA CACHE)
 # Gọi link này khi user bấm nút "Làm mới" trên giao diện
@@ -80,8 +73,8 @@ def refresh_portal():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
         
-    cache_key = make_portal_cache_key()
-    current_app.cache.delete(cache_key)
+    user_code, _ = _portal_user()
+    current_app.portal_service.invalidate_widgets(user_code)
     
     flash("Đã cập nhật dữ liệu mới nhất.", "success")
     return redirect(url_for('portal_bp.portal_dashboard'))
@@ -1,7 +1,9 @@
 # services/portal_service.py
 
-import pyodbc
+from flask import current_app
 from db_manager import DBManager, safe_float
+from sales_fact import get_sales_fact
+from data_version import get_data_version
 import config
 from datetime import datetime, timedelta
 
@@ -50,261 +52,341 @@ class PortalService:
             
         return ordered_groups
 
-    def get_all_dashboard_data(self, user_code, bo_phan, role):
-        data = {
-            'sales_kpi': {'actual': 0, 'target': 0, 'percent': 0},
-            'tasks': [], 
-            'overdue_debt': [], 
-            'orders_stat': 0, 
-            'active_quotes': [], 
-            'pending_deliveries': [],
-            'orders_flow': [], 
-            'urgent_replenish': [], 
-            'recent_reports': [],
-            'errors': {} 
-        }
+    # Các khối (widget) Portal: (key dữ liệu, key lỗi, hàm nạp, nhóm data_version làm mất hiệu lực cache).
+    # Mỗi khối cache riêng theo user, TTL theo config.PORTAL_WIDGET_TTL; key cache chứa phiên bản dữ liệu:
+    #   'sales'   = ERP thay đổi (job poll data_version), 'tasks' / 'reports' = tăng khi ghi Task / Báo cáo,
+    #   None      = chỉ theo TTL (Công nợ do job AR cập nhật, Dự phòng là SP nặng, gợi ý theo ngày).
+    DASHBOARD_SECTIONS = (
+        ('sales_kpi', 'kpi', '_load_sales_kpi', 'sales'),
+        ('tasks', 'tasks', '_load_tasks', 'tasks'),
+        ('overdue_debt', 'debt', '_load_overdue_debt', None),
+        ('orders_stat', 'orders_stat', '_load_orders_stat', 'sales'),
+        ('active_quotes', 'quotes', '_load_active_quotes', 'sales'),
+        ('pending_deliveries', 'delivery', '_load_pending_deliveries', 'sales'),
+        ('orders_flow', 'orders', '_load_orders_flow', 'sales'),
+        ('urgent_replenish', 'replenish', '_load_urgent_replenish', None),
+        ('recent_reports', 'reports', '_load_recent_reports', 'reports'),
+    )
+    SECTION_KEYS = tuple(s[0] for s in DASHBOARD_SECTIONS)
 
-        current_year = datetime.now().year
-        current_month = datetime.now().month
-        
-        # --- LOGIC LỌC CHUNG ---
+    # Giá trị mặc định của từng khối khi chưa nạp được / lỗi
+    SECTION_DEFAULTS = {
+        'sales_kpi': {'actual': 0, 'target': 0, 'percent': 0},
+        'tasks': [],
+        'overdue_debt': [],
+        'orders_stat': 0,
+        'active_quotes': [],
+        'pending_deliveries': [],
+        'orders_flow': [],
+        'urgent_replenish': [],
+        'recent_reports': [],
+    }
+
+    def _get_filter_column(self, bo_phan):
         # [CONFIG]: Dùng mã phòng ban từ Config
         # Sử dụng getattr để tránh lỗi nếu config thiếu biến
         dept_thuky = getattr(config, 'DEPT_THUKY', '3.THUKY')
         is_thu_ky = str(bo_phan).strip() == str(dept_thuky).strip()
-        col_filter_erp = "EmployeeID" if is_thu_ky else "SalesManID"
-        
-        TABLE_CUSTOMER_ERP = config.ERP_IT1202
+        return "EmployeeID" if is_thu_ky else "SalesManID"
 
-        # [FIX KẾT NỐI]: Thay thế pyodbc.connect bằng self.db.get_transaction_connection()
-        conn = None
+    def _query_rows(self, query, params):
+        """Chạy 1 câu SELECT trên kết nối riêng từ Pool, trả về list[dict] giá trị thô (không làm sạch)."""
+        conn = self.db.get_transaction_connection()
         try:
-            conn = self.db.get_transaction_connection()
             cursor = conn.cursor()
-        except Exception as e:
-            data['errors']['connection'] = f"Lỗi kết nối DB: {str(e)}"
-            return data
+            cursor.execute(query, params)
+            if not cursor.description:
+                return []
+            cols = [c[0] for c in cursor.description]
+            return [dict(zip(cols, r)) for r in cursor.fetchall()]
+        finally:
+            # Raw Connection lấy từ pool, .close() sẽ trả nó về pool.
+            conn.close()
+
+    def _query_scalar(self, query, params):
+        rows = self._query_rows(query, params)
+        return list(rows[0].values())[0] if rows else None
 
-        # --- 1. KPI: DOANH SỐ ---
+    # --- CACHE TỪNG KHỐI ---
+    def _widget_cache_key(self, section, user_code):
+        data_key, _, _, version = section
+        token = get_data_version(version) if version else '0'
+        # Key ví dụ: portal_widget_tasks_KD010_v12
+        return f"portal_widget_{data_key}_{user_code}_v{token}"
+
+    def _cache_widget(self, section, user_code, value):
+        ttl = config.PORTAL_WIDGET_TTL.get(section[0], config.PORTAL_WIDGET_DEFAULT_TTL)
         try:
-            cursor.execute(f"SELECT SUM([DK]) FROM {config.CRM_DTCL} WHERE [Nam]=? AND [PHU TRACH DS]=?", (current_year, user_code))
-            row = cursor.fetchone()
-            monthly_target = (safe_float(row[0]) / 12) if row and row[0] else 0
-            
-            # [CONFIG]: ACC_PHAI_THU_KH (13111), ACC_DOANH_THU (511%)
-            cursor.execute(f"""
-                SELECT SUM(ConvertedAmount) FROM {config.ERP_GIAO_DICH} 
-                WHERE SalesManID=? AND TranMonth=? AND TranYear=? 
-                AND DebitAccountID='{config.ACC_PHAI_THU_KH}' 
-                AND CreditAccountID LIKE '{config.ACC_DOANH_THU}'
-            """, (user_code, current_month, current_year))
-            row = cursor.fetchone()
-            actual_sales = safe_float(row[0]) if row and row[0] else 0
-            
-            percent = (actual_sales / monthly_target * 100) if monthly_target > 0 else 0
-            data['sales_kpi'] = {'actual': actual_sales, 'target': monthly_target, 'percent': round(percent, 1)}
+            current_app.cache.set(self._widget_cache_key(section, user_code), value, timeout=ttl)
         except Exception as e:
-            data['errors']['kpi'] = str(e)
+            current_app.logger.error(f"Portal: lỗi ghi cache khối {section[0]}: {e}")
 
-        # --- 2. TASK ---
+    def get_cached_widgets(self, user_code):
+        """{key dữ liệu: giá trị} của các khối đang có trong cache (1 lần đọc cache cho tất cả khối)."""
+        keys = [self._widget_cache_key(section, user_code) for section in self.DASHBOARD_SECTIONS]
         try:
-            # [CONFIG]: TASK_TABLE, TASK_LOG_TABLE, TASK STATUSES
-            cursor.execute(f"""
-                SELECT TOP 20 M.TaskID, M.Title, M.Status, M.Priority, M.LastUpdated, M.ObjectID,
-                (SELECT COUNT(*) FROM {config.TASK_LOG_TABLE} L WHERE L.TaskID = M.TaskID) as UpdateCount,
-                CASE WHEN M.LastUpdated >= DATEADD(hour, -24, GETDATE()) THEN 1 ELSE 0 END as IsNewUpdate
-                FROM {config.TASK_TABLE} M
-                WHERE (M.UserCode=? OR M.CapTren=?) 
-                AND M.Status IN ('{config.TASK_STATUS_OPEN}', '{config.TASK_STATUS_PENDING}', '{config.TASK_STATUS_HELP}', '{config.TASK_STATUS_BLOCKED}')
-                ORDER BY CASE WHEN M.Priority='HIGH' THEN 0 ELSE 1 END, M.LastUpdated DESC
-            """, (user_code, user_code))
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                data['tasks'] = [dict(zip(cols, r)) for r in cursor.fetchall()]
+            values = current_app.cache.get_many(*keys)
         except Exception as e:
-            data['errors']['tasks'] = str(e)
+            current_app.logger.error(f"Portal: lỗi đọc cache khối: {e}")
+            return {}
+        return {data_key: value for data_key, value in zip(self.SECTION_KEYS, values) if value is not None}
 
-        # --- 3. CÔNG NỢ ---
+    def get_widget(self, data_key, user_code, bo_phan):
+        """
+        Dữ liệu 1 khối Portal: (giá trị, lỗi). Có trong cache -> trả ngay; chưa có -> chạy hàm nạp rồi cache.
+        Lỗi -> (giá trị mặc định, thông báo lỗi), không cache để lần sau thử lại.
+        """
+        section = self.DASHBOARD_SECTIONS[self.SECTION_KEYS.index(data_key)]
+        cached = None
         try:
-            # [CONFIG]: CRM_AR_AGING_SUMMARY, RISK_DEBT_VALUE
-            cursor.execute(f"""
-                SELECT TOP 20 
-                    T1.ObjectID, 
-                    ISNULL(C.ShortObjectName, T1.ObjectName) as ObjectName, 
-                    T1.TotalOverdueDebt, 
-                    T1.ReDueDays
-                FROM {config.CRM_AR_AGING_SUMMARY} AS T1
-                LEFT JOIN {TABLE_CUSTOMER_ERP} C ON T1.ObjectID = C.ObjectID 
-                INNER JOIN {config.CRM_DTCL} AS T2 ON T1.ObjectID = T2.[MA KH]
-                WHERE T2.[Nam]=? AND T2.[PHU TRACH DS]=? 
-                AND T1.TotalOverdueDebt > {config.RISK_DEBT_VALUE}
-                ORDER BY T1.TotalOverdueDebt DESC
-            """, (current_year, user_code))
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                debt = [dict(zip(cols, r)) for r in cursor.fetchall()]
-                for d in debt: 
-                    d['TotalOverdueDebtFmt'] = "{:,.0f}".format(safe_float(d['TotalOverdueDebt']))
-                data['overdue_debt'] = debt
+            cached = current_app.cache.get(self._widget_cache_key(section, user_code))
         except Exception as e:
-            data['errors']['debt'] = str(e)
+            current_app.logger.error(f"Portal: lỗi đọc cache khối {data_key}: {e}")
+        if cached is not None:
+            return cached, None
 
-        # --- 4. THỐNG KÊ ĐƠN TRONG THÁNG ---
         try:
-            query_stat = f"""
-                SELECT COUNT(DISTINCT T1.SOrderID)
-                FROM {config.ERP_SALES_DETAIL} T2
-                INNER JOIN {config.ERP_OT2001} T1 ON T2.SOrderID = T1.SOrderID
-                WHERE T1.{col_filter_erp} = ? 
-                AND MONTH(T2.Date01) = MONTH(GETDATE()) AND YEAR(T2.Date01) = YEAR(GETDATE())
-                AND T1.OrderStatus = 1 
-                AND NOT EXISTS (
-                    SELECT 1 FROM {config.ERP_GOODS_RECEIPT_DETAIL} W2
-                    INNER JOIN {config.ERP_GOODS_RECEIPT_MASTER} W1 ON W2.VoucherID = W1.VoucherID
-                    WHERE W2.OTransactionID = T2.TransactionID AND W1.VoucherTypeID = 'PX'
-                )
-            """
-            cursor.execute(query_stat, (user_code,))
-            row = cursor.fetchone()
-            data['orders_stat'] = row[0] if row else 0
+            value = getattr(self, section[2])(user_code, self._get_filter_column(bo_phan))
         except Exception as e:
-            data['errors']['orders_stat'] = str(e)
+            current_app.logger.error(f"Portal: lỗi nạp khối {data_key} ({user_code}): {e}")
+            return self.SECTION_DEFAULTS[data_key], str(e)
+        if value is None:
+            return self.SECTION_DEFAULTS[data_key], None
+        self._cache_widget(section, user_code, value)
+        return value, None
 
-        # --- 5. BÁO GIÁ ---
+    def invalidate_widgets(self, user_code):
+        """Xóa cache mọi khối Portal của 1 user (nút Làm mới)."""
         try:
-            query = f"""
-                SELECT TOP 40 
-                    T1.QuotationNo as VoucherNo, 
-                    T1.QuotationDate, 
-                    T1.ObjectID, 
-                    ISNULL(C.ShortObjectName, T1.ObjectName) as CustomerName, 
-                    T1.SaleAmount as TotalAmount
-                FROM {config.ERP_QUOTES} T1
-                LEFT JOIN {TABLE_CUSTOMER_ERP} C ON T1.ObjectID = C.ObjectID
-                WHERE T1.{col_filter_erp}=? 
-                AND T1.QuotationDate > DATEADD(day, -30, GETDATE())
-                AND NOT EXISTS (
-                    SELECT 1 FROM {config.ERP_QUOTE_DETAILS} D1 
-                    JOIN {config.ERP_SALES_DETAIL} D2 ON D1.TransactionID = D2.RetransactionID 
-                    WHERE D1.QuotationID = T1.QuotationID
-                )
-                ORDER BY T1.QuotationDate DESC
-            """
-            cursor.execute(query, (user_code,))
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                raw_quotes = [dict(zip(cols, r)) for r in cursor.fetchall()]
-                for q in raw_quotes: q['TotalAmount'] = safe_float(q.get('TotalAmount', 0))
-                
-                data['active_quotes'] = self._group_by_customer(raw_quotes, name_key='CustomerName', id_key='ObjectID')
+            current_app.cache.delete_many(*[self._widget_cache_key(s, user_code) for s in self.DASHBOARD_SECTIONS])
         except Exception as e:
-            data['errors']['quotes'] = str(e)
+            current_app.logger.error(f"Portal: lỗi xóa cache khối ({user_code}): {e}")
 
-        # --- 6. LXH - PENDING DELIVERIES ---
-        try:
-            # [CONFIG]: DELIVERY_WEEKLY_VIEW, DELIVERY_STATUS_DONE
-            query = f"""
-                SELECT DISTINCT TOP 40 
-                    DW.VoucherNo, 
-                    DW.VoucherDate as Request_Day, 
-                    DW.Planned_Day,
-                    DW.ObjectID,
-                    ISNULL(C.ShortObjectName, DW.ObjectName) as ObjectName,
-                    DATEDIFF(day, DW.VoucherDate, GETDATE()) as DaysPending,
-                    DW.DeliveryStatus
-                FROM {config.DELIVERY_WEEKLY_VIEW} DW
-                LEFT JOIN {TABLE_CUSTOMER_ERP} C ON DW.ObjectID = C.ObjectID
-                INNER JOIN {config.ERP_DELIVERY_DETAIL} T2 ON DW.VoucherID = T2.VoucherID
-                INNER JOIN {config.ERP_OT2001} T3 ON T2.RespVoucherID = T3.SOrderID
-                WHERE DW.DeliveryStatus <> '{config.DELIVERY_STATUS_DONE}' 
-                AND T3.{col_filter_erp} = ? 
-                ORDER BY DW.VoucherDate ASC
-            """
-            cursor.execute(query, (user_code,))
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                raw_dels = [dict(zip(cols, r)) for r in cursor.fetchall()]
-                for d in raw_dels: 
-                    d['IsOverdue'] = (d['DaysPending'] or 0) > 3
-                    d['Planned_Day'] = self._fix_date(d.get('Planned_Day'))
-                    d['Request_Day'] = self._fix_date(d.get('Request_Day'))
-                
-                data['pending_deliveries'] = self._group_by_customer(raw_dels, name_key='ObjectName', id_key='ObjectID')
+    def get_all_dashboard_data(self, user_code, bo_phan, role):
+        """Toàn bộ khối Portal: khối đã cache lấy từ cache, các khối còn lại nạp song song rồi cache riêng từng khối."""
+        data = dict(self.SECTION_DEFAULTS)
+        data['errors'] = {}
 
-        except Exception as e:
-            data['errors']['delivery'] = str(e)
+        # --- LOGIC LỌC CHUNG ---
+        col_filter_erp = self._get_filter_column(bo_phan)
 
-        # --- 7. LỊCH GIAO HÀNG ---
-        try:
-            query = f"""
-                SELECT TOP 40 
-                    T1.VoucherNo, 
-                    MIN(T2.Date01) as DeliveryDate, 
-                    T1.ObjectID,
-                    ISNULL(C.ShortObjectName, T1.ObjectName) as CustomerName,
-                    SUM(T2.ConvertedAmount) as SaleAmount
-                FROM {config.ERP_SALES_DETAIL} T2
-                INNER JOIN {config.ERP_OT2001} T1 ON T2.SOrderID = T1.SOrderID
-                LEFT JOIN {TABLE_CUSTOMER_ERP} C ON T1.ObjectID = C.ObjectID
-                WHERE 
-                    T1.{col_filter_erp} = ? 
-                    AND T2.Date01 BETWEEN DATEADD(day, -30, GETDATE()) AND DATEADD(day, 30, GETDATE())
-                    AND T1.VoucherTypeID <> 'DTK' 
-                    AND T1.OrderStatus = 1
-                    AND NOT EXISTS (
-                        SELECT 1
-                        FROM {config.ERP_GOODS_RECEIPT_DETAIL} W2
-                        INNER JOIN {config.ERP_GOODS_RECEIPT_MASTER} W1 ON W2.VoucherID = W1.VoucherID
-                        WHERE W2.OTransactionID = T2.TransactionID
-                        AND W1.VoucherTypeID = 'PX'
-                    )
-                GROUP BY T1.VoucherNo, T1.ObjectID, T1.ObjectName, C.ShortObjectName
-                ORDER BY MIN(T2.Date01) ASC
-            """
-            cursor.execute(query, (user_code,))
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                raw_orders = [dict(zip(cols, r)) for r in cursor.fetchall()]
-                for o in raw_orders: 
-                    o['IsOverdue'] = o['DeliveryDate'] < datetime.now()
-                
-                data['orders_flow'] = self._group_by_customer(raw_orders, name_key='CustomerName', id_key='ObjectID')
+        cached = self.get_cached_widgets(user_code)
+        missing = [section for section in self.DASHBOARD_SECTIONS if section[0] not in cached]
 
-        except Exception as e:
-            data['errors']['orders'] = str(e)
+        # Mỗi khối 1 kết nối Pool riêng, chạy song song; khối lỗi giữ giá trị mặc định + ghi lỗi
+        results, errors = self.db.fan_out({
+            data_key: (lambda loader=getattr(self, loader_name): loader(user_code, col_filter_erp))
+            for data_key, _, loader_name, _ in missing
+        }) if missing else ({}, {})
 
-        # --- 8. DỰ PHÒNG ---
-        try:
-            # Kiểm tra SP tồn tại trong config
-            sp_name = getattr(config, 'SP_REPLENISH_PORTAL', 'sp_GetCustomerReplenishmentSuggest')
-            cursor.execute(f"{{CALL {sp_name} (?, ?)}}", (user_code, current_year))
+        for section in self.DASHBOARD_SECTIONS:
+            data_key, error_key = section[0], section[1]
+            if data_key in cached:
+                data[data_key] = cached[data_key]
+            elif data_key in errors:
+                data['errors'][error_key] = errors[data_key]
+            elif results.get(data_key) is not None:
+                data[data_key] = results[data_key]
+                self._cache_widget(section, user_code, results[data_key])
             
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                replenish_items = [dict(zip(cols, r)) for r in cursor.fetchall()]
-                
-                if replenish_items:
-                    replenish_items = replenish_items[:40]
-                    for item in replenish_items:
-                        item['QuantitySuggestion'] = "{:,.0f}".format(safe_float(item.get('QuantitySuggestion', 0)))
-                    
-                    data['urgent_replenish'] = self._group_by_customer(replenish_items, name_key='CustomerName', id_key='ItemID')
+        return data
 
-        except Exception as e:
-            data['errors']['replenish'] = str(e)
+    # --- 1. KPI: DOANH SỐ ---
+    def _load_sales_kpi(self, user_code, col_filter_erp):
+        current_year = datetime.now().year
+        current_month = datetime.now().month
 
-        # --- 9. BÁO CÁO ---
-        try:
-            cursor.execute(f"SELECT TOP 20 STT, NGAY, [KHACH HANG] as [TEN DOI TUONG], [NOI DUNG 4] as MucDich FROM {config.TEN_BANG_BAO_CAO} WHERE NGUOI=? AND NGAY >= DATEADD(day, -7, GETDATE()) ORDER BY NGAY DESC", (user_code,))
-            if cursor.description:
-                cols = [c[0] for c in cursor.description]
-                data['recent_reports'] = [dict(zip(cols, r)) for r in cursor.fetchall()]
-        except Exception as e:
-            data['errors']['reports'] = str(e)
+        target = self._query_scalar(f"SELECT SUM([DK]) FROM {config.CRM_DTCL} WHERE [Nam]=? AND [PHU TRACH DS]=?", (current_year, user_code))
+        monthly_target = (safe_float(target) / 12) if target else 0
+        
+        # [CONFIG]: ACC_PHAI_THU_KH (13111), ACC_DOANH_THU (511%) - RevenueAR của fact doanh số tháng
+        if get_sales_fact():
+            actual = self._query_scalar(f"""
+                SELECT SUM(RevenueAR) FROM {config.CRM_SALES_FACT_MONTHLY}
+                WHERE SalesManID=? AND TranMonth=? AND TranYear=?
+            """, (user_code, current_month, current_year))
+        else:
+            actual = self._query_scalar(f"""
+                SELECT SUM(ConvertedAmount) FROM {config.ERP_GIAO_DICH} 
+                WHERE SalesManID=? AND TranMonth=? AND TranYear=? 
+                AND DebitAccountID='{config.ACC_PHAI_THU_KH}' 
+                AND CreditAccountID LIKE '{config.ACC_DOANH_THU}'
+            """, (user_code, current_month, current_year))
+        actual_sales = safe_float(actual) if actual else 0
+        
+        percent = (actual_sales / monthly_target * 100) if monthly_target > 0 else 0
+        return {'actual': actual_sales, 'target': monthly_target, 'percent': round(percent, 1)}
 
-        # Quan trọng: Trả kết nối về Pool (Dùng close() với Raw Connection cũng được nhưng an toàn hơn là gọi qua DBManager nếu có API)
-        # Vì đây là Raw Connection lấy từ pool, .close() sẽ trả nó về pool.
-        if conn:
-            conn.close()
-            
-        return data
\ No newline at end of file
+    # --- 2. TASK ---
+    def _load_tasks(self, user_code, col_filter_erp):
+        # [CONFIG]: TASK_TABLE, TASK_LOG_TABLE, TASK STATUSES
+        # Lấy TOP 20 task trước, rồi đếm log 1 lần (GROUP BY) chỉ cho 20 task đó thay vì COUNT(*) lồng theo từng dòng
+        return self._query_rows(f"""
+            WITH TopTasks AS (
+                SELECT TOP 20 M.TaskID, M.Title, M.Status, M.Priority, M.LastUpdated, M.ObjectID,
+                CASE WHEN M.Priority='HIGH' THEN 0 ELSE 1 END as PrioritySort
+                FROM {config.TASK_TABLE} M
+                WHERE (M.UserCode=? OR M.CapTren=?) 
+                AND M.Status IN ('{config.TASK_STATUS_OPEN}', '{config.TASK_STATUS_PENDING}', '{config.TASK_STATUS_HELP}', '{config.TASK_STATUS_BLOCKED}')
+                ORDER BY PrioritySort, M.LastUpdated DESC
+            )
+            SELECT T.TaskID, T.Title, T.Status, T.Priority, T.LastUpdated, T.ObjectID,
+            ISNULL(L.UpdateCount, 0) as UpdateCount,
+            CASE WHEN T.LastUpdated >= DATEADD(hour, -24, GETDATE()) THEN 1 ELSE 0 END as IsNewUpdate
+            FROM TopTasks T
+            LEFT JOIN (
+                SELECT TaskID, COUNT(*) as UpdateCount
+                FROM {config.TASK_LOG_TABLE}
+                WHERE TaskID IN (SELECT TaskID FROM TopTasks)
+                GROUP BY TaskID
+            ) L ON L.TaskID = T.TaskID
+            ORDER BY T.PrioritySort, T.LastUpdated DESC
+        """, (user_code, user_code))
+
+    # --- 3. CÔNG NỢ ---
+    def _load_overdue_debt(self, user_code, col_filter_erp):
+        current_year = datetime.now().year
+        # [CONFIG]: CRM_AR_AGING_SUMMARY, RISK_DEBT_VALUE
+        debt = self._query_rows(f"""
+            SELECT TOP 20 
+                T1.ObjectID, 
+                ISNULL(C.ShortObjectName, T1.ObjectName) as ObjectName, 
+                T1.TotalOverdueDebt, 
+                T1.ReDueDays
+            FROM {config.CRM_AR_AGING_SUMMARY} AS T1
+            LEFT JOIN {config.ERP_IT1202} C ON T1.ObjectID = C.ObjectID 
+            INNER JOIN {config.CRM_DTCL} AS T2 ON T1.ObjectID = T2.[MA KH]
+            WHERE T2.[Nam]=? AND T2.[PHU TRACH DS]=? 
+            AND T1.TotalOverdueDebt > {config.RISK_DEBT_VALUE}
+            ORDER BY T1.TotalOverdueDebt DESC
+        """, (current_year, user_code))
+        for d in debt: 
+            d['TotalOverdueDebtFmt'] = "{:,.0f}".format(safe_float(d['TotalOverdueDebt']))
+        return debt
+
+    # --- 4. THỐNG KÊ ĐƠN TRONG THÁNG ---
+    def _load_orders_stat(self, user_code, col_filter_erp):
+        query_stat = f"""
+            SELECT COUNT(DISTINCT T1.SOrderID)
+            FROM {config.ERP_SALES_DETAIL} T2
+            INNER JOIN {config.ERP_OT2001} T1 ON T2.SOrderID = T1.SOrderID
+            WHERE T1.{col_filter_erp} = ? 
+            AND MONTH(T2.Date01) = MONTH(GETDATE()) AND YEAR(T2.Date01) = YEAR(GETDATE())
+            AND T1.OrderStatus = 1 
+            AND NOT EXISTS (
+                SELECT 1 FROM {config.ERP_GOODS_RECEIPT_DETAIL} W2
+                INNER JOIN {config.ERP_GOODS_RECEIPT_MASTER} W1 ON W2.VoucherID = W1.VoucherID
+                WHERE W2.OTransactionID = T2.TransactionID AND W1.VoucherTypeID = 'PX'
+            )
+        """
+        rows = self._query_rows(query_stat, (user_code,))
+        return list(rows[0].values())[0] if rows else 0
+
+    # --- 5. BÁO GIÁ ---
+    def _load_active_quotes(self, user_code, col_filter_erp):
+        query = f"""
+            SELECT TOP 40 
+                T1.QuotationNo as VoucherNo, 
+                T1.QuotationDate, 
+                T1.ObjectID, 
+                ISNULL(C.ShortObjectName, T1.ObjectName) as CustomerName, 
+                T1.SaleAmount as TotalAmount
+            FROM {config.ERP_QUOTES} T1
+            LEFT JOIN {config.ERP_IT1202} C ON T1.ObjectID = C.ObjectID
+            WHERE T1.{col_filter_erp}=? 
+            AND T1.QuotationDate > DATEADD(day, -30, GETDATE())
+            AND NOT EXISTS (
+                SELECT 1 FROM {config.ERP_QUOTE_DETAILS} D1 
+                JOIN {config.ERP_SALES_DETAIL} D2 ON D1.TransactionID = D2.RetransactionID 
+                WHERE D1.QuotationID = T1.QuotationID
+            )
+            ORDER BY T1.QuotationDate DESC
+        """
+        raw_quotes = self._query_rows(query, (user_code,))
+        for q in raw_quotes: q['TotalAmount'] = safe_float(q.get('TotalAmount', 0))
+        
+        return self._group_by_customer(raw_quotes, name_key='CustomerName', id_key='ObjectID')
+
+    # --- 6. LXH - PENDING DELIVERIES ---
+    def _load_pending_deliveries(self, user_code, col_filter_erp):
+        # [CONFIG]: DELIVERY_WEEKLY_VIEW, DELIVERY_STATUS_DONE
+        query = f"""
+            SELECT DISTINCT TOP 40 
+                DW.VoucherNo, 
+                DW.VoucherDate as Request_Day, 
+                DW.Planned_Day,
+                DW.ObjectID,
+                ISNULL(C.ShortObjectName, DW.ObjectName) as ObjectName,
+                DATEDIFF(day, DW.VoucherDate, GETDATE()) as DaysPending,
+                DW.DeliveryStatus
+            FROM {config.DELIVERY_WEEKLY_VIEW} DW
+            LEFT JOIN {config.ERP_IT1202} C ON DW.ObjectID = C.ObjectID
+            INNER JOIN {config.ERP_DELIVERY_DETAIL} T2 ON DW.VoucherID = T2.VoucherID
+            INNER JOIN {config.ERP_OT2001} T3 ON T2.RespVoucherID = T3.SOrderID
+            WHERE DW.DeliveryStatus <> '{config.DELIVERY_STATUS_DONE}' 
+            AND T3.{col_filter_erp} = ? 
+            ORDER BY DW.VoucherDate ASC
+        """
+        raw_dels = self._query_rows(query, (user_code,))
+        for d in raw_dels: 
+            d['IsOverdue'] = (d['DaysPending'] or 0) > 3
+            d['Planned_Day'] = self._fix_date(d.get('Planned_Day'))
+            d['Request_Day'] = self._fix_date(d.get('Request_Day'))
+        
+        return self._group_by_customer(raw_dels, name_key='ObjectName', id_key='ObjectID')
+
+    # --- 7. LỊCH GIAO HÀNG ---
+    def _load_orders_flow(self, user_code, col_filter_erp):
+        query = f"""
+            SELECT TOP 40 
+                T1.VoucherNo, 
+                MIN(T2.Date01) as DeliveryDate, 
+                T1.ObjectID,
+                ISNULL(C.ShortObjectName, T1.ObjectName) as CustomerName,
+                SUM(T2.ConvertedAmount) as SaleAmount
+            FROM {config.ERP_SALES_DETAIL} T2
+            INNER JOIN {config.ERP_OT2001} T1 ON T2.SOrderID = T1.SOrderID
+            LEFT JOIN {config.ERP_IT1202} C ON T1.ObjectID = C.ObjectID
+            WHERE 
+                T1.{col_filter_erp} = ? 
+                AND T2.Date01 BETWEEN DATEADD(day, -30, GETDATE()) AND DATEADD(day, 30, GETDATE())
+                AND T1.VoucherTypeID <> 'DTK' 
+                AND T1.OrderStatus = 1
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM {config.ERP_GOODS_RECEIPT_DETAIL} W2
+                    INNER JOIN {config.ERP_GOODS_RECEIPT_MASTER} W1 ON W2.VoucherID = W1.VoucherID
+                    WHERE W2.OTransactionID = T2.TransactionID
+                    AND W1.VoucherTypeID = 'PX'
+                )
+            GROUP BY T1.VoucherNo, T1.ObjectID, T1.ObjectName, C.ShortObjectName
+            ORDER BY MIN(T2.Date01) ASC
+        """
+        raw_orders = self._query_rows(query, (user_code,))
+        for o in raw_orders: 
+            o['IsOverdue'] = o['DeliveryDate'] < datetime.now()
+        
+        return self._group_by_customer(raw_orders, name_key='CustomerName', id_key='ObjectID')
+
+    # --- 8. DỰ PHÒNG ---
+    def _load_urgent_replenish(self, user_code, col_filter_erp):
+        current_year = datetime.now().year
+        # Kiểm tra SP tồn tại trong config
+        sp_name = getattr(config, 'SP_REPLENISH_PORTAL', 'sp_GetCustomerReplenishmentSuggest')
+        replenish_items = self._query_rows(f"{{CALL {sp_name} (?, ?)}}", (user_code, current_year))
+        
+        if not replenish_items:
+            return []
+
+        replenish_items = replenish_items[:40]
+        for item in replenish_items:
+            item['QuantitySuggestion'] = "{:,.0f}".format(safe_float(item.get('QuantitySuggestion', 0)))
+        
+        return self._group_by_customer(replenish_items, name_key='CustomerName', id_key='ItemID')
+
+    # --- 9. BÁO CÁO ---
+    def _load_recent_reports(self, user_code, col_filter_erp):
+        return self._query_rows(
+            f"SELECT TOP 20 STT, NGAY, [KHACH HANG] as [TEN DOI TUONG], [NOI DUNG 4] as MucDich FROM {config.TEN_BANG_BAO_CAO} WHERE NGUOI=? AND NGAY >= DATEADD(day, -7, GETDATE()) ORDER BY NGAY DESC",
+            (user_code,)
+        )
@@ -0,0 +1,85 @@
+# sales_fact.py
+# --- FACT DOANH SỐ THEO THÁNG (CRM_SALES_FACT_MONTHLY) ---
+#
+# Thay cho việc mỗi màn hình tự gom nhóm lại sổ cái GT9000 (CreditAccountID LIKE '511%' / DebitAccountID LIKE '632%'):
+#   - Bảng tổng hợp sẵn theo (Năm, Tháng, KH, NVKD, I04ID, Mã hàng): Revenue/RevenueOT/RevenueAR, COGS/COGSOT, OrderCount.
+#     ItemMatched = 0: mã hàng không có trong IT1302 (báo cáo theo nhóm hàng lọc ItemMatched = 1).
+#   - sp_RefreshSalesFactMonthly (job server.py) chỉ tính lại các tháng còn mở; tháng đã khóa không bao giờ tính lại.
+#   - Nơi đọc gọi get_sales_fact(): có bảng fact còn tươi -> đọc fact, ngược lại (job lỗi/chưa triển khai SP) -> GT9000 như cũ.
+
+import time
+import threading
+from datetime import datetime
+from flask import current_app
+import config
+
+
+class SalesFactCube:
+    """Làm mới + kiểm tra độ tươi của bảng fact doanh số tháng (dữ liệu nằm trong SQL Server)."""
+
+    def __init__(self, db_manager, max_age_seconds=None):
+        self.db = db_manager
+        self.max_age_seconds = max_age_seconds or config.SALES_FACT_MAX_AGE
+        self._lock = threading.Lock()
+        self._ready = False
+        self._checked_at = 0
+
+    # --- LÀM MỚI ---
+    def refresh(self, reopen_from=None):
+        """
+        Tính lại các tháng còn mở (đồng bộ, dùng cho job). reopen_from: 'YYYY-MM-DD' để mở lại các tháng đã khóa.
+        Trả về (số tháng, số dòng) hoặc None nếu lỗi.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            result = self.db.execute_sp_multi(
+                config.SP_JOB_REFRESH_SALES_FACT, (config.SALES_FACT_OPEN_MONTHS, reopen_from)
+            )
+            self._checked_at = 0 # Lần đọc sau kiểm tra lại trạng thái
+            if not result or not result[-1]:
+                current_app.logger.error("SalesFact: làm mới thất bại, nơi đọc dùng GT9000 đến khi job chạy lại.")
+                return None
+            row = result[-1][0]
+            months, rows = int(row.get('MonthsRefreshed') or 0), int(row.get('RowsLoaded') or 0)
+            current_app.logger.info(
+                f"SalesFact: tính lại {months} tháng, {rows:,} dòng trong {time.perf_counter() - start:.1f}s"
+            )
+            return months, rows
+
+    # --- TRẠNG THÁI ---
+    def _current_month_age(self):
+        today = datetime.now()
+        rows = self.db.get_data(
+            f"SELECT DATEDIFF(second, RefreshedAt, GETDATE()) AS AgeSeconds "
+            f"FROM {config.CRM_SALES_FACT_PERIODS} WHERE TranYear = ? AND TranMonth = ?",
+            (today.year, today.month), readonly=True
+        )
+        return rows[0]['AgeSeconds'] if rows else None
+
+    def is_ready(self):
+        """Tháng hiện tại đã được nạp trong max_age_seconds gần nhất (kết quả kiểm tra giữ SALES_FACT_STATUS_TTL giây)."""
+        now = time.time()
+        if now - self._checked_at > config.SALES_FACT_STATUS_TTL:
+            age = self._current_month_age()
+            self._ready = age is not None and age <= self.max_age_seconds
+            self._checked_at = now
+        return self._ready
+
+
+def get_sales_fact():
+    """SalesFactCube của app nếu đã bật và còn tươi, ngược lại None (nơi gọi đọc GT9000 như cũ)."""
+    if not config.SALES_FACT_ENABLED:
+        return None
+    cube = getattr(current_app, 'sales_fact', None)
+    return cube if cube is not None and cube.is_ready() else None
+
+
+def since_month_clause(months, alias='F'):
+    """
+    Điều kiện '`months` tháng gần nhất (kể cả tháng hiện tại)' trên (TranYear, TranMonth) của fact,
+    viết dạng so sánh trực tiếp để dùng được khóa chính. Trả về (sql, params).
+    """
+    today = datetime.now()
+    year, month = divmod(today.year * 12 + today.month - months, 12)
+    month += 1
+    return f"({alias}.TranYear > ? OR ({alias}.TranYear = ? AND {alias}.TranMonth >= ?))", (year, year, month)
@@ -2,6 +2,8 @@
 
 from flask import current_app
 from db_manager import DBManager, safe_float
+from inventory_index import InventorySearchIndex
+from stock_snapshot import StockSnapshot
 from datetime import datetime
 import config
 import pandas as pd 
@@ -12,6 +14,10 @@ class SalesLookupService:
     
     def __init__(self, db_manager: DBManager):
         self.db = db_manager
+        # Chỉ mục trigram IT1302 trong RAM (nạp nền, làm mới định kỳ)
+        self.inventory_index = InventorySearchIndex(db_manager) if config.INVENTORY_INDEX_ENABLED else None
+        # Tồn/BO gom theo mã trong RAM (thay GROUP BY trên view Back Order mỗi lần tra)
+        self.stock_snapshot = StockSnapshot(db_manager) if config.STOCK_SNAPSHOT_ENABLED else None
 
     def get_sales_lookup_data(self, item_search_term, object_id):
         """
@@ -52,51 +58,7 @@ class SalesLookupService:
             if not search_terms_list:
                 return []
 
-            where_conditions = []
-            params = []
-
-            # Xây dựng query động an toàn với tham số hóa
-            for term in search_terms_list:
-                like_val = f"%{term}%"
-                where_conditions.append("(T1.InventoryID LIKE ? OR T1.InventoryName LIKE ?)")
-                params.extend([like_val, like_val])
-
-            where_clause = " AND ".join(where_conditions)
-
-            # [CONFIG]: Sử dụng ERP_IT1302 và VIEW_BACK_ORDER từ config
-            query = f"""
-                SELECT 
-                    T1.InventoryID, 
-                    T1.InventoryName,
-                    ISNULL(T2_Sum.Ton, 0) AS Ton, 
-                    ISNULL(T2_Sum.BackOrder, 0) AS BackOrder,
-                    ISNULL(T1.SalePrice01, 0) AS GiaBanQuyDinh
-                FROM {config.ERP_IT1302} AS T1
-                LEFT JOIN (
-                    SELECT 
-                        InventoryID, 
-                        SUM(Ton) as Ton, 
-                        SUM(con) as BackOrder 
-                    FROM {config.VIEW_BACK_ORDER}
-                    GROUP BY InventoryID
-                ) AS T2_Sum ON T1.InventoryID = T2_Sum.InventoryID
-                WHERE 
-                    ({where_clause})
-                ORDER BY
-                    T1.InventoryID
-            """
-            
-            data = self.db.get_data(query, tuple(params))
-            
-            if not data: return []
-                
-            formatted_data = []
-            for row in data:
-                row['Ton'] = safe_float(row.get('Ton'))
-                row['BackOrder'] = safe_float(row.get('BackOrder'))
-                row['GiaBanQuyDinh'] = safe_float(row.get('GiaBanQuyDinh'))
-                formatted_data.append(row)
-            return formatted_data
+            return self._lookup_stock_price(search_terms_list, 'AND')
 
         except Exception as e:
             current_app.logger.error(f"Lỗi get_quick_lookup_data: {str(e)}", exc_info=True)
@@ -114,54 +76,113 @@ class SalesLookupService:
             if not search_terms_list:
                 return []
 
-            or_conditions = []
-            params = []
+            return self._lookup_stock_price(search_terms_list, 'OR')
 
-            # Xây dựng query động an toàn với tham số hóa (OR condition)
-            for term in search_terms_list:
-                like_val = f"%{term}%"
-                or_conditions.append("(T1.InventoryID LIKE ? OR T1.InventoryName LIKE ?)")
-                params.extend([like_val, like_val])
+        except Exception as e:
+            current_app.logger.error(f"Lỗi get_multi_lookup_data: {str(e)}", exc_info=True)
+            return []
 
-            where_clause = " OR ".join(or_conditions)
+    def _lookup_stock_price(self, search_terms_list, mode):
+        """
+        Tìm mã hàng bằng chỉ mục trigram trong RAM (inventory_index.py), chỉ gửi danh sách InventoryID khớp xuống SQL
+        để lấy Giá. Tồn/BO đọc từ ảnh chụp trong RAM (stock_snapshot.py), kèm StockAsOf (thời điểm chụp).
+        Chỉ mục chưa sẵn sàng -> dùng đường LIKE cũ; ảnh chụp chưa có/quá cũ -> gom nhóm view Back Order như cũ.
+        """
+        matched_ids = self.inventory_index.search(search_terms_list, mode) if self.inventory_index else None
+        snapshot = self.stock_snapshot.get_state() if self.stock_snapshot else None
+        with_stock = snapshot is None
 
-            query = f"""
-                SELECT 
-                    T1.InventoryID, 
-                    T1.InventoryName,
-                    ISNULL(T2_Sum.Ton, 0) AS Ton, 
-                    ISNULL(T2_Sum.BackOrder, 0) AS BackOrder,
-                    ISNULL(T1.SalePrice01, 0) AS GiaBanQuyDinh
-                FROM {config.ERP_IT1302} AS T1
-                LEFT JOIN (
-                    SELECT 
-                        InventoryID, 
-                        SUM(Ton) as Ton, 
-                        SUM(con) as BackOrder 
-                    FROM {config.VIEW_BACK_ORDER}
-                    GROUP BY InventoryID
-                ) AS T2_Sum ON T1.InventoryID = T2_Sum.InventoryID
-                WHERE 
-                    ({where_clause})
-                ORDER BY
-                    T1.InventoryID
-            """
+        if matched_ids is None:
+            data = self._query_stock_price_like(search_terms_list, mode, with_stock)
+        elif not matched_ids:
+            return []
+        else:
+            data = []
+            # SQL Server giới hạn ~2100 tham số/câu -> chia lô
+            chunk = config.INVENTORY_LOOKUP_CHUNK
+            for i in range(0, len(matched_ids), chunk):
+                data.extend(self._query_stock_price_by_ids(matched_ids[i:i + chunk], with_stock))
+            data.sort(key=lambda r: r['InventoryID'])
 
-            data = self.db.get_data(query, tuple(params))
+        if not data: return []
 
-            if not data: return []
+        if snapshot:
+            stock, as_of = snapshot
+            stock_as_of = as_of.strftime('%H:%M %d/%m/%Y')
 
-            formatted_data = []
-            for row in data:
+        formatted_data = []
+        for row in data:
+            if snapshot:
+                row['Ton'], row['BackOrder'] = stock.get(str(row['InventoryID']).strip(), (0.0, 0.0))
+                row['StockAsOf'] = stock_as_of
+            else:
                 row['Ton'] = safe_float(row.get('Ton'))
                 row['BackOrder'] = safe_float(row.get('BackOrder'))
-                row['GiaBanQuyDinh'] = safe_float(row.get('GiaBanQuyDinh'))
-                formatted_data.append(row)
-            return formatted_data
+            row['GiaBanQuyDinh'] = safe_float(row.get('GiaBanQuyDinh'))
+            formatted_data.append(row)
+        return formatted_data
 
-        except Exception as e:
-            current_app.logger.error(f"Lỗi get_multi_lookup_data: {str(e)}", exc_info=True)
-            return []
+    def _stock_join_sql(self, with_stock, id_filter=''):
+        """(cột Tồn/BO, LEFT JOIN view Back Order) - rỗng khi đã có ảnh chụp tồn kho."""
+        if not with_stock:
+            return '', ''
+        columns = """
+                ISNULL(T2_Sum.Ton, 0) AS Ton, 
+                ISNULL(T2_Sum.BackOrder, 0) AS BackOrder,"""
+        join = f"""
+            LEFT JOIN (
+                SELECT 
+                    InventoryID, 
+                    SUM(Ton) as Ton, 
+                    SUM(con) as BackOrder 
+                FROM {config.VIEW_BACK_ORDER}
+                {id_filter}
+                GROUP BY InventoryID
+            ) AS T2_Sum ON T1.InventoryID = T2_Sum.InventoryID"""
+        return columns, join
+
+    def _query_stock_price_by_ids(self, inventory_ids, with_stock=True):
+        placeholders = ', '.join(['?'] * len(inventory_ids))
+        stock_columns, stock_join = self._stock_join_sql(with_stock, f"WHERE InventoryID IN ({placeholders})")
+        # [CONFIG]: Sử dụng ERP_IT1302 và VIEW_BACK_ORDER từ config
+        query = f"""
+            SELECT 
+                T1.InventoryID, 
+                T1.InventoryName,{stock_columns}
+                ISNULL(T1.SalePrice01, 0) AS GiaBanQuyDinh
+            FROM {config.ERP_IT1302} AS T1{stock_join}
+            WHERE 
+                T1.InventoryID IN ({placeholders})
+        """
+        params = tuple(inventory_ids) * 2 if with_stock else tuple(inventory_ids)
+        return self.db.get_data(query, params)
+
+    def _query_stock_price_like(self, search_terms_list, mode, with_stock=True):
+        """Đường cũ: LIKE '%x%' trên IT1302 (dự phòng khi chỉ mục chưa nạp xong)."""
+        where_conditions = []
+        params = []
+
+        # Xây dựng query động an toàn với tham số hóa
+        for term in search_terms_list:
+            like_val = f"%{term}%"
+            where_conditions.append("(T1.InventoryID LIKE ? OR T1.InventoryName LIKE ?)")
+            params.extend([like_val, like_val])
+
+        where_clause = f" {mode} ".join(where_conditions)
+        stock_columns, stock_join = self._stock_join_sql(with_stock)
+
+        query = f"""
+            SELECT 
+                T1.InventoryID, 
+                T1.InventoryName,{stock_columns}
+                ISNULL(T1.SalePrice01, 0) AS GiaBanQuyDinh
+            FROM {config.ERP_IT1302} AS T1{stock_join}
+            WHERE 
+                ({where_clause})
+            ORDER BY
+                T1.InventoryID
+        """
+        return self.db.get_data(query, tuple(params))
 
     def _format_date_safe(self, date_val):
         """Helper format ngày tháng an toàn"""
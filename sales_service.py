@@ -6,11 +6,16 @@ from operator import itemgetter
 
 # Import từ các module khác
 from db_manager import DBManager, safe_float, parse_filter_string, evaluate_condition
+from sales_fact import get_sales_fact
+from inventory_aging_snapshot import InventoryAgingSnapshot
+from backlog_snapshot import SalesBacklogSnapshot
 import config # Import config để lấy tham số chuẩn
 
 class SalesService:
     def __init__(self, db_manager: DBManager):
         self.db = db_manager
+        # Backlog YTD gom sẵn theo NVKD / KH, dùng chung cho KPI Sales + Realtime Dashboard (backlog_snapshot.py)
+        self.backlog_snapshot = SalesBacklogSnapshot(db_manager) if config.BACKLOG_SNAPSHOT_ENABLED else None
 
     def get_sales_performance_data(self, current_year, user_code, is_admin, division=None):
         """
@@ -36,12 +41,16 @@ class SalesService:
             # Lọc theo quyền: Admin lấy hết, User chỉ lấy của mình
             salesman_filter = None if is_admin else user_code
             
+            # Năm hiện tại: tổng theo NVKD đọc từ ảnh chụp backlog dùng chung (không gọi lại SP Backlog)
+            backlog_map = self.get_ytd_backlog_by_salesman(salesman_filter) if int(current_year) == datetime.now().year else None
+            
             # Gọi hàm Backlog nội bộ
             # Lưu ý: Hàm này trả về {'details': [...], 'summary': {...}}
-            backlog_result = self.get_sales_backlog(start_date, end_date, salesman_filter)
+            backlog_result = self.get_sales_backlog(start_date, end_date, salesman_filter) if backlog_map is None else None
             
             # 3. Gom nhóm Backlog theo SalesmanID (Map: SalesManID -> Tổng tiền backlog)
-            backlog_map = {}
+            if backlog_map is None:
+                backlog_map = {}
             if backlog_result and 'details' in backlog_result:
                 for row in backlog_result['details']:
                     # SalesManID có thể bị NULL hoặc khoảng trắng
@@ -121,38 +130,151 @@ class SalesService:
         """
         Lấy DS chi tiết theo khách hàng (Refactored with Config).
         """
+        client_dict, total_registered_sales_raw = self._client_detail_rows(employee_id, current_year)
+
+        # 5. FINAL CLEANUP
+        registered_clients = []
+        new_business_clients = []
+        total_poa_amount = 0 
+        
+        small_customer_group = {'RegisteredSales': 0.0, 'CurrentMonthSales': 0.0, 'TotalSalesAmount': 0.0, 'TotalOrders': 0, 'PendingOrdersAmount': 0.0}
+        small_customer_count = 0
+
+        for client_id, row in client_dict.items():
+            raw_poa = safe_float(row.get('PendingOrdersAmount'))
+            raw_current_sales = safe_float(row.get('CurrentMonthSales'))
+            raw_total_sales = safe_float(row.get('TotalSalesAmount'))
+            raw_registered_sales = safe_float(row.get('RegisteredSales'))
+            
+            total_poa_amount += raw_poa
+
+            # [CONFIG]: LIMIT_SMALL_CUSTOMER
+            if raw_total_sales < config.LIMIT_SMALL_CUSTOMER and (raw_total_sales > 0 or raw_registered_sales > 0 or raw_poa > 0):
+                small_customer_group['RegisteredSales'] += raw_registered_sales
+                small_customer_group['CurrentMonthSales'] += raw_current_sales
+                small_customer_group['TotalSalesAmount'] += raw_total_sales
+                small_customer_group['TotalOrders'] += int(row.get('TotalOrders', 0))
+                small_customer_group['PendingOrdersAmount'] += raw_poa
+                small_customer_count += 1
+                continue
+
+            # [CONFIG]: DIVISOR_VIEW
+            row['RegisteredSales'] = raw_registered_sales / config.DIVISOR_VIEW
+            row['CurrentMonthSales'] = raw_current_sales / config.DIVISOR_VIEW
+            row['TotalSalesAmount'] = raw_total_sales / config.DIVISOR_VIEW
+            row['PendingOrdersAmount'] = raw_poa / config.DIVISOR_VIEW
+            
+            if raw_registered_sales > 0:
+                row['ClientType'] = row['ClientName']
+                registered_clients.append(row)
+            elif raw_total_sales > 0:
+                row['ClientType'] = f'--- PS mới - {row["ClientName"]}'
+                new_business_clients.append(row)
+            elif raw_poa > 0:
+                 row['ClientType'] = f'--- Chờ giao - {row["ClientName"]}'
+                 new_business_clients.append(row)
+
+        if small_customer_count > 0:
+            # [CONFIG]: DIVISOR_VIEW
+            small_customer_row = {
+                'ClientID': 'NHÓM',
+                'ClientName': f'--- KHÁCH NHỎ LẺ ({small_customer_count} KH) ---',
+                'RegisteredSales': small_customer_group['RegisteredSales'] / config.DIVISOR_VIEW, 
+                'CurrentMonthSales': small_customer_group['CurrentMonthSales'] / config.DIVISOR_VIEW,
+                'TotalSalesAmount': small_customer_group['TotalSalesAmount'] / config.DIVISOR_VIEW,
+                'TotalOrders': small_customer_group['TotalOrders'],
+                'PendingOrdersAmount': small_customer_group['PendingOrdersAmount'] / config.DIVISOR_VIEW
+            }
+            new_business_clients.insert(0, small_customer_row) 
+
+        registered_clients = sorted(registered_clients, key=itemgetter('RegisteredSales', 'TotalSalesAmount'), reverse=True)
+        new_business_clients = sorted(new_business_clients, key=itemgetter('TotalSalesAmount'), reverse=True)
+
+        return registered_clients, new_business_clients, total_poa_amount, total_registered_sales_raw
+
+    def _client_detail_rows(self, employee_id, current_year):
+        """
+        ({ClientID: dòng}, Tổng DS đăng ký thô) của 1 NVKD: doanh số năm / tháng, số đơn, DS đăng ký, PO chờ giao.
+        1 round trip qua SP_SALESMAN_CLIENT_DETAILS (set-based, điều kiện lọc seek được index - xem ghi chú migration
+        trong sp_GetSalesmanClientDetails.sql). SP chưa triển khai / lỗi -> 4 câu truy vấn cũ.
+        """
+        try:
+            rows = self.db.fetch_data(
+                f"EXEC {config.SP_SALESMAN_CLIENT_DETAILS} ?, ?, ?, ?",
+                (str(employee_id).strip(), current_year, datetime.now().month, 1 if get_sales_fact() else 0),
+                readonly=True
+            )
+        except Exception as e:
+            current_app.logger.warning(f"ClientDetails: lỗi gọi {config.SP_SALESMAN_CLIENT_DETAILS}, dùng truy vấn cũ: {e}")
+            return self._client_detail_rows_legacy(employee_id, current_year)
+
+        client_dict = {}
+        for row in rows:
+            client_id = row['ClientID']
+            client_dict[client_id] = {
+                'ClientID': client_id,
+                'ClientName': row.get('ClientName') or 'N/A',
+                'TotalSalesAmount': safe_float(row.get('TotalSalesAmount')),
+                'CurrentMonthSales': safe_float(row.get('CurrentMonthSales')),
+                'TotalOrders': int(row.get('TotalOrders') or 0),
+                'RegisteredSales': safe_float(row.get('RegisteredSales')),
+                'PendingOrdersAmount': safe_float(row.get('PendingOrdersAmount'))
+            }
+        # Tổng DS đăng ký lặp lại trên mọi dòng (gồm cả KH không lên danh sách)
+        total_registered_sales_raw = safe_float(rows[0].get('TotalRegisteredSalesRaw')) if rows else self._total_registered_sales(employee_id, current_year)
+        return client_dict, total_registered_sales_raw
+
+    def _total_registered_sales(self, employee_id, current_year):
+        """Tổng DS đăng ký thô của NVKD (cache theo tag DTCL)."""
+        total_reg_data = self.db.get_data_cached(
+            f"SELECT SUM(ISNULL(DK, 0)) AS TotalRegisteredSalesRaw FROM {config.CRM_DTCL} WHERE [PHU TRACH DS] = ? AND Nam = ?",
+            (employee_id, current_year), tags=[config.CACHE_TAG_DTCL]
+        )
+        return safe_float(total_reg_data[0].get('TotalRegisteredSalesRaw')) if total_reg_data else 0.0
+
+    def _client_detail_rows_legacy(self, employee_id, current_year):
+        """Bản cũ của _client_detail_rows: 4 truy vấn riêng + ghép dict trong Python."""
         current_month = datetime.now().month
         today_str = datetime.now().strftime('%Y-%m-%d')
         
-        # 1. TRUY VẤN TỔNG DS ĐĂNG KÝ THÔ
-        # [CONFIG]: CRM_DTCL
-        total_registered_query = f"""
-            SELECT SUM(ISNULL(DK, 0)) AS TotalRegisteredSalesRaw
-            FROM {config.CRM_DTCL}
-            WHERE RTRIM([PHU TRACH DS]) = ? AND Nam = ?
-        """
-        total_reg_data = self.db.get_data(total_registered_query, (employee_id, current_year))
-        total_registered_sales_raw = safe_float(total_reg_data[0].get('TotalRegisteredSalesRaw')) if total_reg_data else 0.0
+        # 1. TỔNG DS ĐĂNG KÝ THÔ
+        total_registered_sales_raw = self._total_registered_sales(employee_id, current_year)
 
         # 2. TRUY VẤN CHI TIẾT THEO KHÁCH HÀNG
         # [CONFIG]: ERP_GIAO_DICH, ERP_IT1202, ACC_DOANH_THU, ACC_PHAI_THU_KH
-        base_client_sales_query = f"""
-            SELECT 
-                RTRIM(T1.ObjectID) AS ClientID,
-                T4.ShortObjectName AS ClientName,
-                SUM(CASE WHEN T1.TranYear = ? THEN T1.ConvertedAmount ELSE 0 END) AS TotalSalesAmount,
-                SUM(CASE WHEN T1.TranMonth = ? AND T1.TranYear = ? THEN T1.ConvertedAmount ELSE 0 END) AS CurrentMonthSales,
-                COUNT(DISTINCT T1.VoucherNo) AS TotalOrders
-            FROM {config.ERP_GIAO_DICH} AS T1
-            LEFT JOIN {config.ERP_IT1202} AS T4 ON T1.ObjectID = T4.ObjectID
-            WHERE 
-                RTRIM(T1.SalesManID) = ?
-                AND T1.DebitAccountID = '{config.ACC_PHAI_THU_KH}' 
-                AND T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}'
-                AND T1.TranYear >= ?
-            GROUP BY 
-                RTRIM(T1.ObjectID), T4.ShortObjectName
-        """
+        # Fact doanh số tháng: RevenueAR = Nợ 13111 / Có 511, OrderCount cộng dồn = số VoucherNo khác nhau
+        if get_sales_fact():
+            base_client_sales_query = f"""
+                SELECT 
+                    F.ObjectID AS ClientID,
+                    T4.ShortObjectName AS ClientName,
+                    SUM(CASE WHEN F.TranYear = ? THEN F.RevenueAR ELSE 0 END) AS TotalSalesAmount,
+                    SUM(CASE WHEN F.TranMonth = ? AND F.TranYear = ? THEN F.RevenueAR ELSE 0 END) AS CurrentMonthSales,
+                    SUM(F.OrderCount) AS TotalOrders
+                FROM {config.CRM_SALES_FACT_MONTHLY} AS F
+                LEFT JOIN {config.ERP_IT1202} AS T4 ON F.ObjectID = T4.ObjectID
+                WHERE F.SalesManID = ? AND F.TranYear >= ?
+                GROUP BY F.ObjectID, T4.ShortObjectName
+                HAVING SUM(F.OrderCount) > 0 OR SUM(F.RevenueAR) <> 0
+            """
+        else:
+            base_client_sales_query = f"""
+                SELECT 
+                    RTRIM(T1.ObjectID) AS ClientID,
+                    T4.ShortObjectName AS ClientName,
+                    SUM(CASE WHEN T1.TranYear = ? THEN T1.ConvertedAmount ELSE 0 END) AS TotalSalesAmount,
+                    SUM(CASE WHEN T1.TranMonth = ? AND T1.TranYear = ? THEN T1.ConvertedAmount ELSE 0 END) AS CurrentMonthSales,
+                    COUNT(DISTINCT T1.VoucherNo) AS TotalOrders
+                FROM {config.ERP_GIAO_DICH} AS T1
+                LEFT JOIN {config.ERP_IT1202} AS T4 ON T1.ObjectID = T4.ObjectID
+                WHERE 
+                    T1.SalesManID = ?
+                    AND T1.DebitAccountID = '{config.ACC_PHAI_THU_KH}' 
+                    AND T1.CreditAccountID LIKE '{config.ACC_DOANH_THU}'
+                    AND T1.TranYear >= ?
+                GROUP BY 
+                    RTRIM(T1.ObjectID), T4.ShortObjectName
+            """
         base_client_sales = self.db.get_data(
             base_client_sales_query, 
             (current_year, current_month, current_year, employee_id, current_year - 1)
@@ -176,7 +298,7 @@ class SalesService:
         registered_query = f"""
             SELECT RTRIM(T1.[MA KH]) AS ClientID, SUM(ISNULL(T1.DK, 0)) AS RegisteredSales
             FROM {config.CRM_DTCL} AS T1
-            WHERE RTRIM(T1.[PHU TRACH DS]) = ? AND T1.Nam = ? 
+            WHERE T1.[PHU TRACH DS] = ? AND T1.Nam = ?
             GROUP BY RTRIM(T1.[MA KH])
         """
         registered_data = self.db.get_data(registered_query, (employee_id, current_year))
@@ -198,7 +320,7 @@ class SalesService:
                 SELECT DISTINCT G.orderID FROM {config.ERP_GIAO_DICH} AS G WHERE G.VoucherTypeID = 'BH' 
             ) AS Delivered ON T1.sorderid = Delivered.orderID
             WHERE 
-                RTRIM(T1.SalesManID) = ?
+                T1.SalesManID = ?
                 AND T1.orderStatus = 1 AND Delivered.orderID IS NULL 
                 AND T1.orderDate >= DATEADD(YEAR, -1, ?) 
             GROUP BY RTRIM(T1.ObjectID)
@@ -212,66 +334,8 @@ class SalesService:
                     client_dict[client_id]['PendingOrdersAmount'] = raw_poa
                 elif raw_poa > 0:
                      client_dict[client_id] = {'ClientID': client_id, 'RegisteredSales': 0.0, 'ClientName': 'N/A', 'TotalSalesAmount': 0.0, 'CurrentMonthSales': 0.0, 'TotalOrders': 0, 'PendingOrdersAmount': raw_poa}
-                 
-        # 5. FINAL CLEANUP
-        registered_clients = []
-        new_business_clients = []
-        total_poa_amount = 0 
-        
-        small_customer_group = {'RegisteredSales': 0.0, 'CurrentMonthSales': 0.0, 'TotalSalesAmount': 0.0, 'TotalOrders': 0, 'PendingOrdersAmount': 0.0}
-        small_customer_count = 0
-
-        for client_id, row in client_dict.items():
-            raw_poa = safe_float(row.get('PendingOrdersAmount'))
-            raw_current_sales = safe_float(row.get('CurrentMonthSales'))
-            raw_total_sales = safe_float(row.get('TotalSalesAmount'))
-            raw_registered_sales = safe_float(row.get('RegisteredSales'))
-            
-            total_poa_amount += raw_poa
-
-            # [CONFIG]: LIMIT_SMALL_CUSTOMER
-            if raw_total_sales < config.LIMIT_SMALL_CUSTOMER and (raw_total_sales > 0 or raw_registered_sales > 0 or raw_poa > 0):
-                small_customer_group['RegisteredSales'] += raw_registered_sales
-                small_customer_group['CurrentMonthSales'] += raw_current_sales
-                small_customer_group['TotalSalesAmount'] += raw_total_sales
-                small_customer_group['TotalOrders'] += int(row.get('TotalOrders', 0))
-                small_customer_group['PendingOrdersAmount'] += raw_poa
-                small_customer_count += 1
-                continue
-
-            # [CONFIG]: DIVISOR_VIEW
-            row['RegisteredSales'] = raw_registered_sales / config.DIVISOR_VIEW
-            row['CurrentMonthSales'] = raw_current_sales / config.DIVISOR_VIEW
-            row['TotalSalesAmount'] = raw_total_sales / config.DIVISOR_VIEW
-            row['PendingOrdersAmount'] = raw_poa / config.DIVISOR_VIEW
-            
-            if raw_registered_sales > 0:
-                row['ClientType'] = row['ClientName']
-                registered_clients.append(row)
-            elif raw_total_sales > 0:
-                row['ClientType'] = f'--- PS mới - {row["ClientName"]}'
-                new_business_clients.append(row)
-            elif raw_poa > 0:
-                 row['ClientType'] = f'--- Chờ giao - {row["ClientName"]}'
-                 new_business_clients.append(row)
 
-        if small_customer_count > 0:
-            # [CONFIG]: DIVISOR_VIEW
-            small_customer_row = {
-                'ClientID': 'NHÓM',
-                'ClientName': f'--- KHÁCH NHỎ LẺ ({small_customer_count} KH) ---',
-                'RegisteredSales': small_customer_group['RegisteredSales'] / config.DIVISOR_VIEW, 
-                'CurrentMonthSales': small_customer_group['CurrentMonthSales'] / config.DIVISOR_VIEW,
-                'TotalSalesAmount': small_customer_group['TotalSalesAmount'] / config.DIVISOR_VIEW,
-                'TotalOrders': small_customer_group['TotalOrders'],
-                'PendingOrdersAmount': small_customer_group['PendingOrdersAmount'] / config.DIVISOR_VIEW
-            }
-            new_business_clients.insert(0, small_customer_row) 
-
-        registered_clients = sorted(registered_clients, key=itemgetter('RegisteredSales', 'TotalSalesAmount'), reverse=True)
-        new_business_clients = sorted(new_business_clients, key=itemgetter('TotalSalesAmount'), reverse=True)
-
-        return registered_clients, new_business_clients, total_poa_amount, total_registered_sales_raw
+        return client_dict, total_registered_sales_raw
 
     def get_profit_analysis(self, date_from, date_to, user_code, is_admin):
         """Lấy dữ liệu phân tích lợi nhuận gộp."""
@@ -367,29 +431,53 @@ class SalesService:
             current_app.logger.error(f"Lỗi Sales Backlog: {e}")
             return {'details': [], 'summary': {}}
 
+    def _ytd_backlog_totals(self):
+        return self.backlog_snapshot.get() if self.backlog_snapshot else None
+
+    def get_ytd_backlog_summary(self, salesman_id=None):
+        """Summary backlog từ 01/01 năm nay -> hôm nay (như get_sales_backlog) cho 1 NVKD hoặc tất cả."""
+        totals = self._ytd_backlog_totals()
+        if totals is not None:
+            return totals.summary(salesman_id)
+        today = datetime.now()
+        return self.get_sales_backlog(f"{today.year}-01-01", today.strftime('%Y-%m-%d'), salesman_id)['summary']
+
+    def get_ytd_backlog_by_salesman(self, salesman_id=None):
+        """{SalesManID (upper): Tổng GiaTriDonHang} YTD từ ảnh chụp; chỉ NVKD được lọc nếu có. Không có ảnh chụp -> None."""
+        totals = self._ytd_backlog_totals()
+        if totals is None:
+            return None
+        backlog_map = totals.salesman_totals()
+        if salesman_id:
+            key = str(salesman_id).strip().upper()
+            return {key: backlog_map[key]} if key in backlog_map else {}
+        return backlog_map
+
 class InventoryService:
     def __init__(self, db_manager: DBManager):
         self.db = db_manager
+        # Ảnh chụp SP tuổi tồn dạng DataFrame (inventory_aging_snapshot.py): lọc / gom nhóm vector hóa
+        self.aging_snapshot = InventoryAgingSnapshot(db_manager) if config.INVENTORY_AGING_SNAPSHOT_ENABLED else None
 
     def get_inventory_aging_data(self, item_filter_term, category_filter, qty_filter, value_filter, i05id_filter):
         """
         [UPDATED] Lấy dữ liệu tồn kho (Refactored with Config).
+        Ảnh chụp trong RAM còn dùng được -> lọc + gom nhóm trên DataFrame, không gọi SP.
         """
+        state = self.aging_snapshot.get_state() if self.aging_snapshot else None
+        if state:
+            frame, _as_of = state
+            return frame.grouped(frame.mask(item_filter_term, category_filter, qty_filter, value_filter, i05id_filter))
+
         # [CONFIG]: SP_GET_INVENTORY_AGING
+        # Đọc SP theo lô (iter_data) và cộng dồn ngay -> không giữ toàn bộ kết quả SP trong RAM
         sp_query = f"{{CALL {config.SP_GET_INVENTORY_AGING} (?)}}" 
-        aging_data = []
-        try:
-            raw_data = self.db.get_data(sp_query, (None,))
-            if raw_data: aging_data = raw_data
-        except Exception as e:
-            current_app.logger.error(f"Lỗi SP Aging: {e}")
-            return [], {'total_inventory': 0, 'total_quantity': 0, 'total_new_6_months': 0, 'total_over_2_years': 0, 'total_clc_value': 0}
 
         # [CONFIG]: ERP_IT1302
         i04_map = {}
         try:
             query_i04 = f"SELECT InventoryID, I04ID FROM {config.ERP_IT1302}"
-            i04_data = self.db.get_data(query_i04)
+            i04_data = self.db.get_data_cached(query_i04, tags=[config.CACHE_TAG_IT1302], readonly=True)
             if i04_data:
                 for row in i04_data:
                     i04_map[row['InventoryID']] = row['I04ID'] if row['I04ID'] and row['I04ID'].strip() else 'KHÁC'
@@ -400,7 +488,7 @@ class InventoryService:
         i04_name_map = {}
         try:
             query_name = f"SELECT [LOAI], [TEN] FROM {config.TEN_BANG_NOI_DUNG_HD}"
-            name_data = self.db.get_data(query_name)
+            name_data = self.db.get_data_cached(query_name, tags=[config.CACHE_TAG_NOI_DUNG_HD])
             if name_data:
                 for row in name_data:
                     i04_name_map[row['LOAI']] = row['TEN']
@@ -414,72 +502,90 @@ class InventoryService:
         val_op, val_thresh = parse_filter_string(value_filter)
         search_terms = [t.strip().lower() for t in item_filter_term.split(';') if t.strip()]
 
-        for row in aging_data:
-            # Ép kiểu an toàn
-            row['TotalCurrentValue'] = safe_float(row.get('TotalCurrentValue'))
-            row['TotalCurrentQuantity'] = safe_float(row.get('TotalCurrentQuantity'))
-            row['Range_0_180_V'] = safe_float(row.get('Range_0_180_V'))
-            row['Range_181_360_V'] = safe_float(row.get('Range_181_360_V'))
-            row['Range_361_540_V'] = safe_float(row.get('Range_361_540_V'))
-            row['Range_541_720_V'] = safe_float(row.get('Range_541_720_V'))
-            row['Range_Over_720_V'] = safe_float(row.get('Range_Over_720_V'))
+        try:
+            for batch in self.db.iter_data(sp_query, (None,), readonly=True):
+                for row in batch:
+                    # Ép kiểu an toàn
+                    row['TotalCurrentValue'] = safe_float(row.get('TotalCurrentValue'))
+                    row['TotalCurrentQuantity'] = safe_float(row.get('TotalCurrentQuantity'))
+                    row['Range_0_180_V'] = safe_float(row.get('Range_0_180_V'))
+                    row['Range_181_360_V'] = safe_float(row.get('Range_181_360_V'))
+                    row['Range_361_540_V'] = safe_float(row.get('Range_361_540_V'))
+                    row['Range_541_720_V'] = safe_float(row.get('Range_541_720_V'))
+                    row['Range_Over_720_V'] = safe_float(row.get('Range_Over_720_V'))
             
-            # [CONFIG]: RISK_INVENTORY_VALUE
-            stock_class = str(row.get('StockClass', '')).strip().upper()
-            row['Risk_CLC_Value'] = 0.0
-            if stock_class != 'D' and row['Range_Over_720_V'] > config.RISK_INVENTORY_VALUE:
-                row['Risk_CLC_Value'] = row['Range_Over_720_V']
-
-            is_match = True
-            if search_terms:
-                inv_str = str(row.get('InventoryID', '')).lower()
-                name_str = str(row.get('InventoryName', '')).lower()
-                if not any(term in inv_str or term in name_str for term in search_terms): is_match = False
+                    # [CONFIG]: RISK_INVENTORY_VALUE
+                    stock_class = str(row.get('StockClass', '')).strip().upper()
+                    row['Risk_CLC_Value'] = 0.0
+                    if stock_class != 'D' and row['Range_Over_720_V'] > config.RISK_INVENTORY_VALUE:
+                        row['Risk_CLC_Value'] = row['Range_Over_720_V']
+
+                    is_match = True
+                    if search_terms:
+                        inv_str = str(row.get('InventoryID', '')).lower()
+                        name_str = str(row.get('InventoryName', '')).lower()
+                        if not any(term in inv_str or term in name_str for term in search_terms): is_match = False
             
-            if is_match and category_filter:
-                cat_filter_val = category_filter.replace('!=', '').replace('<>', '').strip().lower()
-                item_cat = str(row.get('InventoryTypeName', '')).lower()
-                item_cat_code = str(row.get('ItemCategory', '')).lower()
-                is_cat_match = (cat_filter_val in item_cat) or (cat_filter_val == item_cat_code)
-                if category_filter.startswith(('!=', '<>')):
-                    if is_cat_match: is_match = False
-                else:
-                    if not is_cat_match: is_match = False
-
-            if is_match and i05id_filter:
-                i05_val = i05id_filter.replace('!=', '').replace('<>', '').strip().upper()
-                if i05id_filter.startswith(('!=', '<>')):
-                    if stock_class == i05_val: is_match = False
-                else:
-                    if stock_class != i05_val: is_match = False
-
-            if is_match and qty_thresh is not None: is_match = evaluate_condition(row['TotalCurrentQuantity'], qty_op, qty_thresh)
-            if is_match and val_thresh is not None: is_match = evaluate_condition(row['TotalCurrentValue'], val_op, val_thresh)
-
-            if is_match:
-                totals['total_inventory'] += row['TotalCurrentValue']
-                totals['total_quantity'] += row['TotalCurrentQuantity']
-                totals['total_new_6_months'] += row['Range_0_180_V']
-                totals['total_over_2_years'] += row['Range_Over_720_V']
-                totals['total_clc_value'] += row['Risk_CLC_Value']
-
-                i04_code = i04_map.get(row['InventoryID'], 'KHÁC')
-                i04_name = i04_name_map.get(i04_code, i04_code)
-                if i04_code == 'KHÁC': i04_name = 'Khác / Chưa phân loại'
+                    if is_match and category_filter:
+                        cat_filter_val = category_filter.replace('!=', '').replace('<>', '').strip().lower()
+                        item_cat = str(row.get('InventoryTypeName', '')).lower()
+                        item_cat_code = str(row.get('ItemCategory', '')).lower()
+                        is_cat_match = (cat_filter_val in item_cat) or (cat_filter_val == item_cat_code)
+                        if category_filter.startswith(('!=', '<>')):
+                            if is_cat_match: is_match = False
+                        else:
+                            if not is_cat_match: is_match = False
+
+                    if is_match and i05id_filter:
+                        i05_val = i05id_filter.replace('!=', '').replace('<>', '').strip().upper()
+                        if i05id_filter.startswith(('!=', '<>')):
+                            if stock_class == i05_val: is_match = False
+                        else:
+                            if stock_class != i05_val: is_match = False
+
+                    if is_match and qty_thresh is not None: is_match = evaluate_condition(row['TotalCurrentQuantity'], qty_op, qty_thresh)
+                    if is_match and val_thresh is not None: is_match = evaluate_condition(row['TotalCurrentValue'], val_op, val_thresh)
+
+                    if is_match:
+                        totals['total_inventory'] += row['TotalCurrentValue']
+                        totals['total_quantity'] += row['TotalCurrentQuantity']
+                        totals['total_new_6_months'] += row['Range_0_180_V']
+                        totals['total_over_2_years'] += row['Range_Over_720_V']
+                        totals['total_clc_value'] += row['Risk_CLC_Value']
+
+                        i04_code = i04_map.get(row['InventoryID'], 'KHÁC')
+                        i04_name = i04_name_map.get(i04_code, i04_code)
+                        if i04_code == 'KHÁC': i04_name = 'Khác / Chưa phân loại'
                 
-                if i04_code not in groups:
-                    groups[i04_code] = {'GroupID': i04_code, 'GroupName': i04_name, 'Items': [], 'Group_TotalVal': 0.0, 'Group_TotalQty': 0.0, 'Group_Over720': 0.0, 'Group_CLC': 0.0}
+                        if i04_code not in groups:
+                            groups[i04_code] = {'GroupID': i04_code, 'GroupName': i04_name, 'Items': [], 'Group_TotalVal': 0.0, 'Group_TotalQty': 0.0, 'Group_Over720': 0.0, 'Group_CLC': 0.0}
                 
-                groups[i04_code]['Items'].append(row)
-                groups[i04_code]['Group_TotalVal'] += row['TotalCurrentValue']
-                groups[i04_code]['Group_TotalQty'] += row['TotalCurrentQuantity']
-                groups[i04_code]['Group_Over720'] += row['Range_Over_720_V']
-                groups[i04_code]['Group_CLC'] += row['Risk_CLC_Value']
+                        groups[i04_code]['Items'].append(row)
+                        groups[i04_code]['Group_TotalVal'] += row['TotalCurrentValue']
+                        groups[i04_code]['Group_TotalQty'] += row['TotalCurrentQuantity']
+                        groups[i04_code]['Group_Over720'] += row['Range_Over_720_V']
+                        groups[i04_code]['Group_CLC'] += row['Risk_CLC_Value']
+        except Exception as e:
+            # Lỗi giữa chừng -> không trả tổng dở dang như thể đầy đủ
+            current_app.logger.error(f"Lỗi SP Aging: {e}")
+            return [], {'total_inventory': 0, 'total_quantity': 0, 'total_new_6_months': 0, 'total_over_2_years': 0, 'total_clc_value': 0}
 
         sorted_groups = sorted(groups.values(), key=lambda g: (g['Group_CLC'], g['Group_Over720']), reverse=True)
         for group in sorted_groups:
             group['Items'] = sorted(group['Items'], key=lambda i: (i['Risk_CLC_Value'], i['Range_Over_720_V']), reverse=True)
 
         return sorted_groups, totals
+
+    def get_inventory_group_items(self, group_id):
+        """Các dòng chi tiết của 1 nhóm I04 (không lọc) cho lazy-load. Không có nhóm -> None."""
+        state = self.aging_snapshot.get_state() if self.aging_snapshot else None
+        if state:
+            return state[0].group_items(group_id)
+
+        all_groups, _ = self.get_inventory_aging_data(
+            item_filter_term='', category_filter='', qty_filter='', value_filter='', i05id_filter=''
+        )
+        group_data = next((g for g in all_groups if g['GroupID'] == group_id), None)
+        return group_data['Items'] if group_data else None
     
     
\ No newline at end of file
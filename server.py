@@ -10,8 +10,12 @@ import threading
 
 # Import ứng dụng Flask (Biến 'app' này đã chứa sẵn chatbot_service nhờ factory.py)
 from app import app
+from data_version import poll_sales_changes
+from cache_warmup import warm_up_dashboards, log_daily_cache_report
+import config
 from waitress import serve
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 
 # =======================================================
 # 1. ĐỊNH NGHĨA HÀM SCHEDULER (SỬ DỤNG SERVICE CỦA APP)
@@ -102,6 +106,71 @@ def run_grading_job():
         except Exception as e:
             print(f"❌ Lỗi Job chấm điểm: {e}")
 
+def run_stock_snapshot_job():
+    """Gom nhóm lại Tồn/BO theo mã hàng (ảnh chụp dùng cho tra nhanh / chatbot)."""
+    with app.app_context():
+        try:
+            snapshot = getattr(app.lookup_service, 'stock_snapshot', None)
+            if snapshot:
+                snapshot.refresh()
+        except Exception as e:
+            logging.error(f"Lỗi Job ảnh chụp tồn kho: {e}")
+
+def run_data_version_job():
+    """Đọc mốc nước OT2001/OT2101/GT9000; đổi -> tăng phiên bản (Realtime Dashboard tính lại) + bỏ ảnh chụp backlog."""
+    with app.app_context():
+        try:
+            if poll_sales_changes(app.db_manager):
+                snapshot = getattr(app.sales_service, 'backlog_snapshot', None)
+                if snapshot:
+                    snapshot.invalidate()
+        except Exception as e:
+            logging.error(f"Lỗi Job phiên bản dữ liệu bán hàng: {e}")
+
+def run_inventory_aging_job():
+    """Gọi lại SP tuổi tồn, dựng ảnh chụp DataFrame (trang Tuổi tồn / biểu đồ Cockpit)."""
+    with app.app_context():
+        try:
+            snapshot = getattr(app.inventory_service, 'aging_snapshot', None)
+            if snapshot:
+                snapshot.refresh()
+        except Exception as e:
+            logging.error(f"Lỗi Job ảnh chụp tuổi tồn: {e}")
+
+def run_cross_sell_matrix_job():
+    """Dựng lại ma trận bán chéo khách × nhóm I04 (doanh số 12 tháng gần nhất)."""
+    with app.app_context():
+        try:
+            matrix = getattr(app.cross_sell_service, 'matrix', None)
+            if matrix:
+                matrix.refresh()
+        except Exception as e:
+            logging.error(f"Lỗi Job ma trận bán chéo: {e}")
+
+def run_cache_warmup_job():
+    """Tính sẵn sales_dashboard / sales_detail / portal cho NVKD + Admin (trước giờ làm, sau đồng bộ ERP)."""
+    with app.app_context():
+        try:
+            warm_up_dashboards()
+        except Exception as e:
+            logging.error(f"Lỗi Job làm nóng cache Dashboard: {e}")
+
+def run_cache_report_job():
+    """Ghi log thời gian làm nóng + tỉ lệ hit cache trong ngày."""
+    with app.app_context():
+        try:
+            log_daily_cache_report()
+        except Exception as e:
+            logging.error(f"Lỗi Job báo cáo cache: {e}")
+
+def run_sales_fact_job():
+    """Tính lại các tháng còn mở của fact doanh số tháng (CRM_SALES_FACT_MONTHLY)."""
+    with app.app_context():
+        try:
+            app.sales_fact.refresh()
+        except Exception as e:
+            logging.error(f"Lỗi Job fact doanh số: {e}")
+
 # =========================================================================
 # 4. MAIN ENTRY POINT (CẬP NHẬT SCHEDULER)
 # =========================================================================
@@ -109,7 +178,8 @@ if __name__ == '__main__':
     logger_setup()
 
     # --- CẤU HÌNH APSCHEDULER ---
-    scheduler = BackgroundScheduler()
+    # Số luồng job giới hạn theo ngân sách kết nối Pool (config.SCHEDULER_MAX_WORKERS), job thừa xếp hàng chờ
+    scheduler = BackgroundScheduler(executors={'default': ThreadPoolExecutor(config.SCHEDULER_MAX_WORKERS)})
     
     # [1] Lên lịch gửi câu hỏi (Các mốc sếp đang chạy)
     scheduler.add_job(run_daily_challenge_job, 'cron', hour=9, minute=5)
@@ -126,6 +196,39 @@ if __name__ == '__main__':
     
     # [3] Lên lịch quét quà tổng kết ngày (20:00)
     scheduler.add_job(run_daily_gamification, 'cron', hour=20, minute=0)
+
+    # [4] Làm mới ảnh chụp Tồn/BO (chạy ngay khi khởi động, sau đó theo chu kỳ)
+    if config.STOCK_SNAPSHOT_ENABLED:
+        scheduler.add_job(run_stock_snapshot_job, 'interval', seconds=config.STOCK_SNAPSHOT_REFRESH_SECONDS,
+                          next_run_time=datetime.now(), max_instances=1, coalesce=True)
+
+    # [5] Làm mới fact doanh số tháng (chỉ các tháng còn mở)
+    if config.SALES_FACT_ENABLED:
+        scheduler.add_job(run_sales_fact_job, 'interval', seconds=config.SALES_FACT_REFRESH_SECONDS,
+                          next_run_time=datetime.now(), max_instances=1, coalesce=True)
+
+    # [6] Dựng lại ma trận bán chéo mỗi sáng (sau khi fact doanh số đã làm mới)
+    if config.CROSS_SELL_MATRIX_ENABLED:
+        scheduler.add_job(run_cross_sell_matrix_job, 'cron', hour=config.CROSS_SELL_MATRIX_REFRESH_HOUR, minute=30,
+                          max_instances=1, coalesce=True)
+
+    # [7] Làm mới ảnh chụp tuổi tồn kho (chạy ngay khi khởi động, sau đó theo chu kỳ)
+    if config.INVENTORY_AGING_SNAPSHOT_ENABLED:
+        scheduler.add_job(run_inventory_aging_job, 'interval', seconds=config.INVENTORY_AGING_REFRESH_SECONDS,
+                          next_run_time=datetime.now(), max_instances=1, coalesce=True)
+
+    # [8] Phát hiện thay đổi dữ liệu bán hàng (Realtime Dashboard chỉ tính lại khi dữ liệu đổi)
+    if config.DATA_VERSION_ENABLED:
+        scheduler.add_job(run_data_version_job, 'interval', seconds=config.DATA_VERSION_POLL_SECONDS,
+                          next_run_time=datetime.now(), max_instances=1, coalesce=True)
+
+    # [9] Làm nóng cache Dashboard theo NVKD (trước giờ làm + sau các đợt đồng bộ ERP) + báo cáo hit cache cuối ngày
+    if config.CACHE_WARMUP_ENABLED:
+        for run_at in config.CACHE_WARMUP_TIMES:
+            hour, minute = map(int, run_at.split(':'))
+            scheduler.add_job(run_cache_warmup_job, 'cron', hour=hour, minute=minute, max_instances=1, coalesce=True)
+        hour, minute = map(int, config.CACHE_WARMUP_REPORT_TIME.split(':'))
+        scheduler.add_job(run_cache_report_job, 'cron', hour=hour, minute=minute)
     
     scheduler.start()
 
@@ -136,4 +239,4 @@ if __name__ == '__main__':
     print("Server is running at: http://0.0.0.0:5000")
     print("-------------------------------------------------------")
     
-    serve(app, host='0.0.0.0', port=5000, threads=12)
\ No newline at end of file
+    serve(app, host='0.0.0.0', port=5000, threads=config.WAITRESS_THREADS)
\ No newline at end of file
@@ -0,0 +1,141 @@
+USE [CRM_STDD]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- =========================================================================
+-- CHI TIẾT HIỆU SUẤT THEO KHÁCH HÀNG CỦA 1 NVKD (trang sales_detail/<NVKD>)
+-- Thay cho 4 câu riêng trong SalesService.get_client_details_for_salesman (Tổng DS đăng ký, Doanh số theo KH,
+-- DS đăng ký theo KH, PO chờ giao theo KH) + ghép dict trong Python: 1 round trip, 1 bảng kết quả.
+--
+-- Điều kiện lọc dùng được index (sargable):
+--   - Bỏ RTRIM(cột) = ? : SQL Server so sánh chuỗi bằng '=' đã bỏ qua khoảng trắng cuối -> kết quả giống hệt,
+--     nhưng không còn Index Scan toàn bảng GT9000 / DTCL / OT2001.
+--   - Tham số @SalesManID NVARCHAR(50) (pyodbc gửi chuỗi Unicode) được chuyển 1 lần sang biến cục bộ
+--     @SalesMan VARCHAR(50): cột VARCHAR -> so sánh trực tiếp; cột NVARCHAR -> chỉ biến được chuyển kiểu.
+--     (Câu ad-hoc cũ so sánh thẳng tham số NVARCHAR -> CONVERT_IMPLICIT trên cột VARCHAR, mất seek.)
+--   - Đơn đã giao: NOT EXISTS theo từng SOrderID thay vì SELECT DISTINCT orderID trên TOÀN BỘ GT9000 mỗi lần gọi.
+--
+-- MIGRATION - INDEX CẦN CHO TỪNG ĐIỀU KIỆN LỌC
+--   1. DTCL: [PHU TRACH DS] = @SalesMan AND Nam = @Year
+--        -> IX_DTCL_PhuTrachDS_Nam ([PHU TRACH DS], Nam) INCLUDE ([MA KH], DK)     (tạo ở cuối file, DB CRM)
+--   2. CRM_SALES_FACT_MONTHLY: SalesManID = @SalesMan AND TranYear >= @Year - 1
+--        -> IX_CRM_SALES_FACT_MONTHLY_SalesMan (đã có, sp_RefreshSalesFactMonthly.sql)
+--   3. GT9000 (khi fact chưa sẵn sàng): SalesManID = @SalesMan AND TranYear >= @Year - 1
+--                                      AND DebitAccountID = '13111' AND CreditAccountID LIKE '511%'
+--        -> IX_GT9000_SalesMan_TranYear (SalesManID, TranYear)
+--           INCLUDE (DebitAccountID, CreditAccountID, TranMonth, ObjectID, VoucherNo, ConvertedAmount)
+--   4. OT2001: SalesManID = @SalesMan AND OrderStatus = 1 AND OrderDate >= @OrderFrom
+--        -> IX_OT2001_SalesMan_Status_Date (SalesManID, OrderStatus, OrderDate) INCLUDE (SOrderID, ObjectID, SaleAmount)
+--   5. GT9000 (đơn đã giao): OrderID = T1.SOrderID AND VoucherTypeID = 'BH'
+--        -> IX_GT9000_OrderID_VoucherType (OrderID, VoucherTypeID)
+--   6. IT1202: ObjectID = ... (khóa chính sẵn có của ERP)
+--   Index 3-5 nằm trên DB ERP [OMEGA_STDD] -> DBA chạy script ghi chú cuối file (ngoài giờ, ONLINE nếu bản Enterprise).
+-- =========================================================================
+CREATE OR ALTER PROCEDURE [dbo].[sp_GetSalesmanClientDetails]
+    @SalesManID NVARCHAR(50),
+    @Year INT,
+    @Month INT,
+    @UseFact BIT = 1          -- 1: doanh số đọc CRM_SALES_FACT_MONTHLY (fact còn tươi), 0: đọc GT9000
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @SalesMan VARCHAR(50) = RTRIM(@SalesManID);
+    DECLARE @Today DATE = GETDATE();
+    DECLARE @OrderFrom DATE = DATEADD(YEAR, -1, @Today);
+    DECLARE @TotalRegistered DECIMAL(28, 8);
+
+    -- 1. Doanh số theo KH (năm hiện tại, tháng hiện tại, số chứng từ từ đầu năm trước)
+    CREATE TABLE #Sales (
+        ClientID          NVARCHAR(50)  COLLATE DATABASE_DEFAULT NULL,
+        ClientName        NVARCHAR(250) COLLATE DATABASE_DEFAULT NULL,
+        TotalSalesAmount  DECIMAL(28, 8) NOT NULL,
+        CurrentMonthSales DECIMAL(28, 8) NOT NULL,
+        TotalOrders       INT NOT NULL
+    );
+
+    IF @UseFact = 1
+        INSERT INTO #Sales (ClientID, ClientName, TotalSalesAmount, CurrentMonthSales, TotalOrders)
+        SELECT
+            F.ObjectID,
+            T4.ShortObjectName,
+            SUM(CASE WHEN F.TranYear = @Year THEN F.RevenueAR ELSE 0 END),
+            SUM(CASE WHEN F.TranMonth = @Month AND F.TranYear = @Year THEN F.RevenueAR ELSE 0 END),
+            SUM(F.OrderCount)
+        FROM dbo.CRM_SALES_FACT_MONTHLY AS F
+        LEFT JOIN [OMEGA_STDD].[dbo].[IT1202] AS T4 ON F.ObjectID = T4.ObjectID
+        WHERE F.SalesManID = @SalesMan AND F.TranYear >= @Year - 1
+        GROUP BY F.ObjectID, T4.ShortObjectName
+        HAVING SUM(F.OrderCount) > 0 OR SUM(F.RevenueAR) <> 0;
+    ELSE
+        INSERT INTO #Sales (ClientID, ClientName, TotalSalesAmount, CurrentMonthSales, TotalOrders)
+        SELECT
+            T1.ObjectID,
+            T4.ShortObjectName,
+            ISNULL(SUM(CASE WHEN T1.TranYear = @Year THEN T1.ConvertedAmount ELSE 0 END), 0),
+            ISNULL(SUM(CASE WHEN T1.TranMonth = @Month AND T1.TranYear = @Year THEN T1.ConvertedAmount ELSE 0 END), 0),
+            COUNT(DISTINCT T1.VoucherNo)
+        FROM [OMEGA_STDD].[dbo].[GT9000] AS T1
+        LEFT JOIN [OMEGA_STDD].[dbo].[IT1202] AS T4 ON T1.ObjectID = T4.ObjectID
+        WHERE T1.SalesManID = @SalesMan
+            AND T1.DebitAccountID = '13111'
+            AND T1.CreditAccountID LIKE '511%'
+            AND T1.TranYear >= @Year - 1
+        GROUP BY T1.ObjectID, T4.ShortObjectName;
+
+    -- 2. DS đăng ký theo KH (+ tổng của NVKD, kể cả dòng không lên danh sách)
+    SELECT T1.[MA KH] AS ClientID, SUM(ISNULL(T1.DK, 0)) AS RegisteredSales
+    INTO #Registered
+    FROM dbo.DTCL AS T1
+    WHERE T1.[PHU TRACH DS] = @SalesMan AND T1.Nam = @Year
+    GROUP BY T1.[MA KH];
+
+    SELECT @TotalRegistered = SUM(RegisteredSales) FROM #Registered;
+
+    -- 3. PO chờ giao theo KH (đơn duyệt trong 1 năm, chưa có phiếu BH)
+    ;WITH Pending AS (
+        SELECT T1.ObjectID AS ClientID, SUM(T1.SaleAmount) AS PendingOrdersAmount
+        FROM [OMEGA_STDD].[dbo].[OT2001] AS T1
+        WHERE T1.SalesManID = @SalesMan
+            AND T1.OrderStatus = 1
+            AND T1.OrderDate >= @OrderFrom
+            AND NOT EXISTS (
+                SELECT 1 FROM [OMEGA_STDD].[dbo].[GT9000] AS G
+                WHERE G.OrderID = T1.SOrderID AND G.VoucherTypeID = 'BH'
+            )
+        GROUP BY T1.ObjectID
+    )
+    -- 4. Hợp nhất theo KH, cùng quy tắc với bản Python cũ:
+    --    KH có doanh số luôn lên; chỉ có đăng ký -> khi DK > 0; chỉ có PO chờ giao -> khi PO > 0
+    SELECT
+        RTRIM(COALESCE(S.ClientID, R.ClientID, P.ClientID)) AS ClientID,
+        S.ClientName,
+        ISNULL(S.TotalSalesAmount, 0) AS TotalSalesAmount,
+        ISNULL(S.CurrentMonthSales, 0) AS CurrentMonthSales,
+        ISNULL(S.TotalOrders, 0) AS TotalOrders,
+        CASE WHEN S.ClientID IS NOT NULL OR R.RegisteredSales > 0 THEN ISNULL(R.RegisteredSales, 0) ELSE 0 END AS RegisteredSales,
+        ISNULL(P.PendingOrdersAmount, 0) AS PendingOrdersAmount,
+        ISNULL(@TotalRegistered, 0) AS TotalRegisteredSalesRaw
+    FROM #Sales AS S
+    FULL OUTER JOIN #Registered AS R ON R.ClientID = S.ClientID
+    FULL OUTER JOIN Pending AS P ON P.ClientID = COALESCE(S.ClientID, R.ClientID)
+    WHERE S.ClientID IS NOT NULL OR R.RegisteredSales > 0 OR P.PendingOrdersAmount > 0;
+END
+GO
+
+-- Index cho điều kiện 1 (DB CRM)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DTCL_PhuTrachDS_Nam' AND object_id = OBJECT_ID('dbo.DTCL'))
+    CREATE INDEX IX_DTCL_PhuTrachDS_Nam ON dbo.DTCL ([PHU TRACH DS], Nam) INCLUDE ([MA KH], DK);
+GO
+
+-- Index cho điều kiện 3-5 (DB ERP - DBA chạy trên [OMEGA_STDD]):
+-- CREATE INDEX IX_GT9000_SalesMan_TranYear ON [OMEGA_STDD].[dbo].[GT9000] (SalesManID, TranYear)
+--     INCLUDE (DebitAccountID, CreditAccountID, TranMonth, ObjectID, VoucherNo, ConvertedAmount);
+-- CREATE INDEX IX_OT2001_SalesMan_Status_Date ON [OMEGA_STDD].[dbo].[OT2001] (SalesManID, OrderStatus, OrderDate)
+--     INCLUDE (SOrderID, ObjectID, SaleAmount);
+-- CREATE INDEX IX_GT9000_OrderID_VoucherType ON [OMEGA_STDD].[dbo].[GT9000] (OrderID, VoucherTypeID);
@@ -0,0 +1,177 @@
+USE [CRM_STDD]
+GO
+
+SET ANSI_NULLS ON
+GO
+
+SET QUOTED_IDENTIFIER ON
+GO
+
+-- FACT DOANH SỐ THEO THÁNG (tổng hợp sẵn từ GT9000 cho Dashboard / Cockpit / Bán chéo / Portal)
+-- Grain: Năm, Tháng, Khách hàng, NVKD, Nhóm hàng (I04ID), Mã hàng. Chỉ lấy dòng Có 511 hoặc Nợ 632.
+IF OBJECT_ID('dbo.CRM_SALES_FACT_MONTHLY', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CRM_SALES_FACT_MONTHLY (
+        TranYear     SMALLINT       NOT NULL,
+        TranMonth    TINYINT        NOT NULL,
+        ObjectID     NVARCHAR(50)   NOT NULL,
+        SalesManID   NVARCHAR(50)   NOT NULL,
+        I04ID        NVARCHAR(50)   NOT NULL, -- '' nếu mã hàng không có nhóm
+        InventoryID  NVARCHAR(50)   NOT NULL,
+        ItemMatched  BIT            NOT NULL CONSTRAINT DF_CRM_SALES_FACT_MONTHLY_ItemMatched DEFAULT 1,
+                                              -- 0: mã hàng không có trong IT1302 (báo cáo theo nhóm hàng bỏ qua,
+                                              --    giống INNER JOIN IT1302 của câu GT9000 cũ)
+        Revenue      DECIMAL(28, 8) NOT NULL, -- Có 511 (mọi chứng từ)
+        RevenueOT    DECIMAL(28, 8) NOT NULL, -- Có 511 có OTransactionID (doanh thu theo đơn hàng)
+        RevenueAR    DECIMAL(28, 8) NOT NULL, -- Nợ 13111 / Có 511 (doanh số bán hàng của NVKD)
+        COGS         DECIMAL(28, 8) NOT NULL, -- Nợ 632 (mọi chứng từ)
+        COGSOT       DECIMAL(28, 8) NOT NULL, -- Nợ 632 có OTransactionID
+        OrderCount   INT            NOT NULL, -- Số chứng từ bán (VoucherNo, Nợ 13111 / Có 511):
+                                              -- mỗi chứng từ chỉ đếm ở 1 dòng -> SUM theo KH/NVKD/tháng/năm vẫn đúng
+        CONSTRAINT PK_CRM_SALES_FACT_MONTHLY
+            PRIMARY KEY CLUSTERED (TranYear, TranMonth, ObjectID, SalesManID, I04ID, InventoryID)
+    );
+
+    CREATE INDEX IX_CRM_SALES_FACT_MONTHLY_Object
+        ON dbo.CRM_SALES_FACT_MONTHLY (ObjectID, TranYear, TranMonth)
+        INCLUDE (I04ID, Revenue, RevenueOT, COGS);
+
+    CREATE INDEX IX_CRM_SALES_FACT_MONTHLY_SalesMan
+        ON dbo.CRM_SALES_FACT_MONTHLY (SalesManID, TranYear, TranMonth)
+        INCLUDE (ObjectID, Revenue, RevenueAR, OrderCount);
+END
+GO
+
+-- Migration: bảng tạo trước khi có cột ItemMatched -> thêm cột, đánh dấu lại các dòng mã hàng không có trong IT1302
+IF COL_LENGTH('dbo.CRM_SALES_FACT_MONTHLY', 'ItemMatched') IS NULL
+BEGIN
+    ALTER TABLE dbo.CRM_SALES_FACT_MONTHLY
+        ADD ItemMatched BIT NOT NULL CONSTRAINT DF_CRM_SALES_FACT_MONTHLY_ItemMatched DEFAULT 1;
+
+    EXEC('UPDATE F SET ItemMatched = 0
+          FROM dbo.CRM_SALES_FACT_MONTHLY AS F
+          WHERE NOT EXISTS (SELECT 1 FROM [OMEGA_STDD].[dbo].[IT1302] AS I WHERE I.InventoryID = F.InventoryID)');
+END
+GO
+
+-- Trạng thái từng tháng: tháng đã khóa (IsClosed = 1) không bao giờ bị tính lại
+IF OBJECT_ID('dbo.CRM_SALES_FACT_PERIODS', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CRM_SALES_FACT_PERIODS (
+        TranYear     SMALLINT NOT NULL,
+        TranMonth    TINYINT  NOT NULL,
+        IsClosed     BIT      NOT NULL,
+        RowsLoaded   INT      NOT NULL,
+        RefreshedAt  DATETIME NOT NULL,
+        CONSTRAINT PK_CRM_SALES_FACT_PERIODS PRIMARY KEY CLUSTERED (TranYear, TranMonth)
+    );
+END
+GO
+
+-- Làm mới tăng dần: chỉ tính lại các tháng còn mở (+ các tháng chưa từng nạp), rồi khóa tháng đã ra khỏi cửa sổ mở.
+-- Job: server.py run_sales_fact_job (mỗi SALES_FACT_REFRESH_SECONDS giây)
+-- Kế toán hạch toán bổ sung vào tháng đã khóa: EXEC sp_RefreshSalesFactMonthly @ReopenFrom = '2025-03-01'
+CREATE OR ALTER PROCEDURE [dbo].[sp_RefreshSalesFactMonthly]
+    @OpenMonths INT = 2,       -- Số tháng gần nhất (kể cả tháng hiện tại) còn mở
+    @ReopenFrom DATE = NULL    -- Mở lại mọi tháng từ ngày này trở đi
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @Today DATE = GETDATE();
+    DECLARE @OpenFrom DATE = DATEADD(MONTH, 1 - @OpenMonths, DATEFROMPARTS(YEAR(@Today), MONTH(@Today), 1));
+    DECLARE @From DATE;
+
+    IF @ReopenFrom IS NOT NULL
+        UPDATE dbo.CRM_SALES_FACT_PERIODS SET IsClosed = 0
+        WHERE DATEFROMPARTS(TranYear, TranMonth, 1) >= DATEFROMPARTS(YEAR(@ReopenFrom), MONTH(@ReopenFrom), 1);
+
+    -- 1. Tháng bắt đầu: ngay sau tháng khóa cuối cùng (lần đầu chạy: tháng 1 của năm nhỏ nhất trong GT9000)
+    SELECT @From = DATEADD(MONTH, 1, MAX(DATEFROMPARTS(TranYear, TranMonth, 1)))
+    FROM dbo.CRM_SALES_FACT_PERIODS
+    WHERE IsClosed = 1;
+
+    IF @From IS NULL
+        SELECT @From = DATEFROMPARTS(MIN(TranYear), 1, 1) FROM [OMEGA_STDD].[dbo].[GT9000];
+
+    IF @From IS NULL OR @From > @OpenFrom
+        SET @From = @OpenFrom;
+
+    CREATE TABLE #Months (TranYear SMALLINT NOT NULL, TranMonth TINYINT NOT NULL, PRIMARY KEY (TranYear, TranMonth));
+    WHILE @From <= @Today
+    BEGIN
+        INSERT INTO #Months (TranYear, TranMonth) VALUES (YEAR(@From), MONTH(@From));
+        SET @From = DATEADD(MONTH, 1, @From);
+    END
+
+    -- 2. Tổng hợp các tháng cần tính (đọc GT9000 ngoài transaction)
+    ;WITH Src AS (
+        SELECT
+            G.TranYear, G.TranMonth,
+            ISNULL(RTRIM(G.ObjectID), '') AS ObjectID,
+            ISNULL(RTRIM(G.SalesManID), '') AS SalesManID,
+            ISNULL(I.I04ID, '') AS I04ID,
+            ISNULL(RTRIM(G.InventoryID), '') AS InventoryID,
+            CASE WHEN I.InventoryID IS NULL THEN 0 ELSE 1 END AS ItemMatched,
+            G.ConvertedAmount, G.OTransactionID, G.VoucherNo,
+            CASE WHEN G.CreditAccountID LIKE '511%' THEN 1 ELSE 0 END AS IsRevenue,
+            CASE WHEN G.DebitAccountID LIKE '632%' THEN 1 ELSE 0 END AS IsCOGS,
+            CASE WHEN G.DebitAccountID = '13111' AND G.CreditAccountID LIKE '511%' THEN 1 ELSE 0 END AS IsARSale
+        FROM [OMEGA_STDD].[dbo].[GT9000] AS G
+        INNER JOIN #Months AS M ON G.TranYear = M.TranYear AND G.TranMonth = M.TranMonth
+        LEFT JOIN [OMEGA_STDD].[dbo].[IT1302] AS I ON G.InventoryID = I.InventoryID
+        WHERE G.CreditAccountID LIKE '511%' OR G.DebitAccountID LIKE '632%'
+    ),
+    Ranked AS (
+        SELECT Src.*,
+            CASE WHEN IsARSale = 1 AND VoucherNo IS NOT NULL AND ROW_NUMBER() OVER (
+                    PARTITION BY IsARSale, TranYear, TranMonth, ObjectID, SalesManID, VoucherNo
+                    ORDER BY I04ID, InventoryID) = 1
+                 THEN 1 ELSE 0 END AS FirstVoucherLine
+        FROM Src
+    )
+    SELECT
+        TranYear, TranMonth, ObjectID, SalesManID, I04ID, InventoryID, ItemMatched,
+        SUM(CASE WHEN IsRevenue = 1 THEN ConvertedAmount ELSE 0 END) AS Revenue,
+        SUM(CASE WHEN IsRevenue = 1 AND OTransactionID IS NOT NULL THEN ConvertedAmount ELSE 0 END) AS RevenueOT,
+        SUM(CASE WHEN IsARSale = 1 THEN ConvertedAmount ELSE 0 END) AS RevenueAR,
+        SUM(CASE WHEN IsCOGS = 1 THEN ConvertedAmount ELSE 0 END) AS COGS,
+        SUM(CASE WHEN IsCOGS = 1 AND OTransactionID IS NOT NULL THEN ConvertedAmount ELSE 0 END) AS COGSOT,
+        SUM(FirstVoucherLine) AS OrderCount
+    INTO #Fact
+    FROM Ranked
+    GROUP BY TranYear, TranMonth, ObjectID, SalesManID, I04ID, InventoryID, ItemMatched;
+
+    -- 3. Thay dữ liệu các tháng đó + cập nhật trạng thái trong 1 transaction (người đọc không thấy tháng dở dang)
+    BEGIN TRANSACTION;
+
+    DELETE F
+    FROM dbo.CRM_SALES_FACT_MONTHLY AS F
+    INNER JOIN #Months AS M ON F.TranYear = M.TranYear AND F.TranMonth = M.TranMonth;
+
+    INSERT INTO dbo.CRM_SALES_FACT_MONTHLY
+        (TranYear, TranMonth, ObjectID, SalesManID, I04ID, InventoryID, ItemMatched,
+         Revenue, RevenueOT, RevenueAR, COGS, COGSOT, OrderCount)
+    SELECT TranYear, TranMonth, ObjectID, SalesManID, I04ID, InventoryID, ItemMatched, Revenue, RevenueOT, RevenueAR, COGS, COGSOT, OrderCount
+    FROM #Fact;
+
+    MERGE dbo.CRM_SALES_FACT_PERIODS AS P
+    USING (
+        SELECT M.TranYear, M.TranMonth,
+               CASE WHEN DATEFROMPARTS(M.TranYear, M.TranMonth, 1) < @OpenFrom THEN 1 ELSE 0 END AS IsClosed,
+               (SELECT COUNT(*) FROM #Fact AS F WHERE F.TranYear = M.TranYear AND F.TranMonth = M.TranMonth) AS RowsLoaded
+        FROM #Months AS M
+    ) AS S
+    ON P.TranYear = S.TranYear AND P.TranMonth = S.TranMonth
+    WHEN MATCHED THEN
+        UPDATE SET IsClosed = S.IsClosed, RowsLoaded = S.RowsLoaded, RefreshedAt = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (TranYear, TranMonth, IsClosed, RowsLoaded, RefreshedAt)
+        VALUES (S.TranYear, S.TranMonth, S.IsClosed, S.RowsLoaded, GETDATE());
+
+    COMMIT TRANSACTION;
+
+    SELECT COUNT(*) AS MonthsRefreshed, (SELECT COUNT(*) FROM #Fact) AS RowsLoaded FROM #Months;
+END
+GO
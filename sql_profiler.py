@@ -0,0 +1,265 @@
+# sql_profiler.py
+# --- ĐO ĐẾM SQL THEO REQUEST + PHÁT HIỆN N+1 + SLOW QUERY LOG ---
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from logging.handlers import TimedRotatingFileHandler
+from flask import current_app, g, has_app_context, has_request_context, request, session
+import config
+
+# Các file "hạ tầng" bỏ qua khi tìm hàm Service đã gọi câu SQL
+_INTERNAL_FILES = ('db_manager.py', 'sql_profiler.py')
+
+_RE_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPACES = re.compile(r"\s+")
+
+# Request không khớp route nào (404, quét URL...) gộp chung 1 nhóm -> số nhóm thống kê luôn hữu hạn
+_UNMATCHED_ROUTE = '<không khớp route>'
+
+
+def fingerprint(sql):
+    """
+    Chuẩn hóa câu SQL thành 'dấu vân tay': bỏ literal chuỗi/số, gộp IN (?, ?, ...) và khoảng trắng.
+    Hai câu chỉ khác tham số sẽ có cùng fingerprint (dùng để phát hiện N+1).
+    """
+    if not sql:
+        return ''
+    fp = _RE_STRING.sub('?', sql)
+    fp = _RE_NUMBER.sub('?', fp)
+    fp = _RE_IN_LIST.sub('(?+)', fp)
+    return _RE_SPACES.sub(' ', fp).strip()
+
+
+def _find_caller():
+    """Tìm frame đầu tiên ngoài tầng DB -> 'Class.method' (hoặc 'module.function')."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.basename(frame.f_code.co_filename)
+        if filename not in _INTERNAL_FILES:
+            owner = frame.f_locals.get('self')
+            if owner is not None:
+                return f"{type(owner).__name__}.{frame.f_code.co_name}"
+            return f"{filename[:-3]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class ProfiledCursor:
+    """Bọc cursor pyodbc: đo thời gian execute/fetch và đếm số dòng trả về."""
+
+    def __init__(self, cursor, profiler):
+        self._cursor = cursor
+        self._profiler = profiler
+        self._entry = None
+
+    def execute(self, sql, *params):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *params)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._entry = self._profiler.record(sql, elapsed_ms, _find_caller())
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_params)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._entry = self._profiler.record(sql, elapsed_ms, _find_caller())
+        return self
+
+    def _track_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        if self._entry is not None:
+            self._entry['ms'] += (time.perf_counter() - start) * 1000
+            if isinstance(result, list):
+                self._entry['rows'] += len(result)
+            elif result is not None:
+                self._entry['rows'] += 1
+        return result
+
+    def fetchone(self):
+        return self._track_fetch(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._track_fetch(self._cursor.fetchall)
+
+    def fetchmany(self, *args):
+        return self._track_fetch(self._cursor.fetchmany, *args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # Thuộc tính của cursor thật (VD: fast_executemany) phải gán xuống cursor pyodbc
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class ProfiledConnection:
+    """Bọc raw connection từ Pool: mọi cursor tạo ra đều được đo đếm."""
+
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(self._conn.cursor(*args, **kwargs), self._profiler)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class QueryProfiler:
+    """
+    Thu thập SQL theo từng request (flask.g):
+    - Mỗi câu: fingerprint, thời gian (ms), số dòng, hàm Service gọi.
+    - Cuối request: cộng dồn tổng theo route, cảnh báo N+1 (cùng fingerprint lặp >= ngưỡng).
+    - Câu chậm hơn SQL_SLOW_QUERY_MS ghi vào logs/slow_queries.log.
+    """
+
+    def __init__(self, slow_ms=None, n_plus_one_threshold=None):
+        self.slow_ms = slow_ms if slow_ms is not None else config.SQL_SLOW_QUERY_MS
+        self.n_plus_one_threshold = n_plus_one_threshold or config.SQL_N_PLUS_ONE_THRESHOLD
+        self.slow_logger = logging.getLogger('titan.slow_sql')
+        self._lock = threading.Lock()
+        self._route_stats = {}
+
+    def init_app(self, app):
+        """Gắn hook request + handler file cho slow query log."""
+        if not self.slow_logger.handlers:
+            if not os.path.exists('logs'):
+                os.mkdir('logs')
+            handler = TimedRotatingFileHandler(
+                filename='logs/slow_queries.log', when='midnight', interval=1,
+                backupCount=30, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s: %(message)s'))
+            self.slow_logger.addHandler(handler)
+            self.slow_logger.setLevel(logging.INFO)
+            self.slow_logger.propagate = False
+
+        app.before_request(self._start_request)
+        app.after_request(self._add_headers)
+        app.teardown_request(self._finish_request)
+
+    def wrap_connection(self, conn):
+        return ProfiledConnection(conn, self)
+
+    # --- GHI NHẬN ---
+    def record(self, sql, elapsed_ms, caller):
+        entry = {'fp': fingerprint(sql), 'ms': elapsed_ms, 'rows': 0, 'caller': caller}
+
+        if elapsed_ms >= self.slow_ms:
+            route = request.endpoint if has_request_context() else 'background'
+            self.slow_logger.warning(
+                f"[SLOW {elapsed_ms:.0f}ms] route={route} caller={caller} sql={entry['fp'][:500]}"
+            )
+
+        if has_app_context():
+            queries = g.get('_sql_queries')
+            if queries is not None:
+                queries.append(entry)
+        return entry
+
+    # --- CHIA SẺ NGỮ CẢNH CHO LUỒNG PHỤ (fan_out) ---
+    def capture_context(self):
+        """Lấy danh sách SQL của request hiện tại để luồng phụ ghi chung vào."""
+        if has_app_context():
+            return g.get('_sql_queries')
+        return None
+
+    def bind_context(self, queries):
+        """Gắn danh sách SQL của request cha vào app context của luồng phụ."""
+        g._sql_queries = queries
+
+    # --- HOOK THEO REQUEST ---
+    def _start_request(self):
+        g._sql_queries = []
+
+    def _add_headers(self, response):
+        """X-SQL-Count / X-SQL-Time-Ms chỉ gửi cho Admin hoặc khi chạy debug (không lộ số liệu DB cho người ngoài)."""
+        queries = g.get('_sql_queries')
+        if queries is not None and self._can_see_headers():
+            response.headers['X-SQL-Count'] = str(len(queries))
+            response.headers['X-SQL-Time-Ms'] = f"{sum(q['ms'] for q in queries):.1f}"
+        return response
+
+    @staticmethod
+    def _can_see_headers():
+        if current_app.debug:
+            return True
+        return str(session.get('user_role') or '').strip().upper() == config.ROLE_ADMIN
+
+    def _finish_request(self, exc=None):
+        queries = g.pop('_sql_queries', None)
+        if not queries:
+            return
+
+        route = request.endpoint or _UNMATCHED_ROUTE
+        counts = Counter(q['fp'] for q in queries)
+        n_plus_one = {fp: n for fp, n in counts.items() if n >= self.n_plus_one_threshold}
+
+        for fp, n in n_plus_one.items():
+            callers = sorted({q['caller'] for q in queries if q['fp'] == fp})
+            self.slow_logger.warning(
+                f"[N+1] route={route} x{n} caller={', '.join(callers)} sql={fp[:500]}"
+            )
+
+        total_ms = sum(q['ms'] for q in queries)
+        total_rows = sum(q['rows'] for q in queries)
+
+        with self._lock:
+            stats = self._route_stats.setdefault(route, {
+                'requests': 0, 'queries': 0, 'db_ms': 0.0, 'rows': 0,
+                'max_queries': 0, 'n_plus_one_requests': 0, 'n_plus_one_samples': {}
+            })
+            stats['requests'] += 1
+            stats['queries'] += len(queries)
+            stats['db_ms'] += total_ms
+            stats['rows'] += total_rows
+            stats['max_queries'] = max(stats['max_queries'], len(queries))
+            if n_plus_one:
+                stats['n_plus_one_requests'] += 1
+                for fp, n in n_plus_one.items():
+                    stats['n_plus_one_samples'][fp[:300]] = max(n, stats['n_plus_one_samples'].get(fp[:300], 0))
+
+    # --- BÁO CÁO ---
+    def get_route_stats(self):
+        """Tổng hợp theo route, sắp xếp theo tổng thời gian DB giảm dần."""
+        with self._lock:
+            result = []
+            for route, stats in self._route_stats.items():
+                requests = stats['requests'] or 1
+                result.append({
+                    'route': route,
+                    'requests': stats['requests'],
+                    'queries': stats['queries'],
+                    'avg_queries': round(stats['queries'] / requests, 1),
+                    'max_queries': stats['max_queries'],
+                    'db_ms': round(stats['db_ms'], 1),
+                    'avg_db_ms': round(stats['db_ms'] / requests, 1),
+                    'rows': stats['rows'],
+                    'n_plus_one_requests': stats['n_plus_one_requests'],
+                    'n_plus_one_samples': dict(stats['n_plus_one_samples']),
+                })
+        return sorted(result, key=lambda r: r['db_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._route_stats.clear()
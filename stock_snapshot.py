@@ -0,0 +1,59 @@
+# stock_snapshot.py
+# --- ẢNH CHỤP TỒN KHO / BACK ORDER THEO MÃ HÀNG (TRONG RAM) ---
+#
+# Thay cho "SELECT InventoryID, SUM(Ton), SUM(con) FROM [CRM_TON KHO BACK ORDER] GROUP BY InventoryID" chạy lại
+# ở mỗi lần tra nhanh / tra nhiều mã / chatbot:
+#   - Gom nhóm toàn bộ view 1 lần (luồng nền hoặc job server.py) -> dict {InventoryID: (Ton, BackOrder)}.
+#   - Tra cứu = đọc dict (point lookup), kèm thời điểm chụp (as_of) để hiển thị độ tươi.
+#   - Ảnh chụp quá STOCK_SNAPSHOT_MAX_AGE giây (job nền lỗi liên tục) -> coi như chưa có, nơi gọi dùng view như cũ.
+
+import time
+from datetime import datetime
+from flask import current_app
+from background_refresh import BackgroundRefresher
+from db_manager import safe_float
+import config
+
+
+class StockSnapshot:
+    """Tồn kho + Back Order gom theo InventoryID, làm mới định kỳ, thay nguyên khối khi nạp lại."""
+
+    def __init__(self, db_manager, refresh_seconds=None, max_age_seconds=None):
+        self.db = db_manager
+        self._refresher = BackgroundRefresher(
+            self.refresh, 'stock_snapshot_refresh', 'StockSnapshot: lỗi nạp ảnh chụp tồn kho',
+            refresh_seconds or config.STOCK_SNAPSHOT_REFRESH_SECONDS,
+            max_age_seconds or config.STOCK_SNAPSHOT_MAX_AGE
+        )
+        self._state = None # (stock_dict, as_of datetime, built_ts)
+
+    # --- NẠP / LÀM MỚI ---
+    def refresh(self):
+        """Gom nhóm lại view Back Order (đồng bộ). Lỗi -> raise, giữ ảnh chụp cũ."""
+        start = time.perf_counter()
+        query = f"""
+            SELECT InventoryID, SUM(Ton) AS Ton, SUM(con) AS BackOrder
+            FROM {config.VIEW_BACK_ORDER}
+            WHERE InventoryID IS NOT NULL
+            GROUP BY InventoryID
+        """
+        rows = self.db.fetch_data(query, readonly=True)
+        stock = {
+            str(row['InventoryID']).strip(): (safe_float(row.get('Ton')), safe_float(row.get('BackOrder')))
+            for row in rows
+        }
+        self._state = (stock, datetime.now(), time.time())
+        current_app.logger.info(
+            f"StockSnapshot: {len(stock):,} mã trong {time.perf_counter() - start:.1f}s"
+        )
+
+    # --- ĐỌC ---
+    def get_state(self):
+        """
+        Trả về (stock_dict, as_of) nếu ảnh chụp còn dùng được, ngược lại None (nơi gọi dùng view trực tiếp).
+        Tự kích hoạt nạp lại ở nền khi quá refresh_seconds.
+        """
+        state = self._state
+        if not self._refresher.check(state[2] if state else None):
+            return None
+        return state[0], state[1]
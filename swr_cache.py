@@ -0,0 +1,187 @@
+# swr_cache.py
+# --- CACHE STALE-WHILE-REVALIDATE + SINGLE-FLIGHT (REDIS LOCK) ---
+#
+# Mỗi entry lưu {'value', 'fresh_until', 'version'} với timeout = hard_ttl:
+#   - Còn tươi (< soft_ttl, cùng phiên bản dữ liệu nếu nơi gọi truyền version) -> trả ngay.
+#   - Khác phiên bản (dữ liệu nguồn đã đổi) -> coi như đã cũ: key giữ nguyên nên vẫn trả bản cũ + làm mới nền.
+#   - Đã cũ (soft < t < hard) -> trả giá trị cũ ngay, 1 worker duy nhất (giữ lock Redis) tính lại ở nền.
+#   - Không có (quá hard_ttl) -> 1 worker tính đồng bộ, các worker khác chờ ngắn rồi đọc kết quả.
+#
+# Thống kê theo ngày (Redis hash cache_stats:YYYYMMDD): số lượt hit / stale / miss theo nhóm trang,
+# dùng cho báo cáo tỉ lệ hit cache (cache_warmup.py).
+
+import time
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+import config
+
+_KEY_PREFIX = 'swr:'
+_LOCK_PREFIX = 'swr_lock:'
+_STATS_PREFIX = 'cache_stats:'
+_STATS_KEEP_SECONDS = 8 * 86400
+
+# Xóa lock chỉ khi đúng chủ (tránh xóa nhầm lock của worker khác khi lock đã hết hạn)
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_refresh_executor = ThreadPoolExecutor(max_workers=config.SWR_REFRESH_WORKERS, thread_name_prefix='swr_refresh')
+
+
+def _acquire_lock(redis_client, key, lock_timeout):
+    token = uuid.uuid4().hex
+    if redis_client.set(_LOCK_PREFIX + key, token, nx=True, ex=lock_timeout):
+        return token
+    return None
+
+
+def _release_lock(redis_client, key, token):
+    try:
+        redis_client.eval(_RELEASE_SCRIPT, 1, _LOCK_PREFIX + key, token)
+    except Exception:
+        pass
+
+
+def _store(cache, key, value, soft_ttl, hard_ttl, is_partial=None, version=None):
+    # Kết quả thiếu phần (is_partial) lưu ở trạng thái "đã cũ": vẫn phục vụ được, lượt xem sau tự làm mới nền
+    fresh_until = time.time() if is_partial and is_partial(value) else time.time() + soft_ttl
+    cache.set(key, {'value': value, 'fresh_until': fresh_until, 'version': version}, timeout=hard_ttl)
+
+
+def _is_fresh(entry, version):
+    if not entry or time.time() >= entry.get('fresh_until', 0):
+        return False
+    return version is None or entry.get('version') == version
+
+
+def _refresh(app, key, compute, soft_ttl, hard_ttl, token, is_partial=None, version=None):
+    """Chạy ở luồng nền: tính lại và ghi cache, luôn nhả lock."""
+    with app.app_context():
+        try:
+            _store(app.cache, key, compute(), soft_ttl, hard_ttl, is_partial, version)
+            app.logger.info(f"SWR: Làm mới nền xong ({key})")
+        except Exception as e:
+            app.logger.error(f"SWR: Lỗi làm mới nền ({key}): {e}")
+        finally:
+            _release_lock(app.redis_client, key, token)
+
+
+# --- THỐNG KÊ HIT THEO NGÀY ---
+def record_cache_lookup(group, outcome, count=1):
+    """Cộng lượt tra cache trong ngày: outcome = 'hit' | 'stale' | 'miss'. Lỗi Redis bỏ qua."""
+    if not group or count <= 0:
+        return
+    try:
+        stats_key = _STATS_PREFIX + datetime.now().strftime('%Y%m%d')
+        redis_client = current_app.redis_client
+        redis_client.hincrby(stats_key, f"{group}:{outcome}", count)
+        redis_client.expire(stats_key, _STATS_KEEP_SECONDS)
+    except Exception:
+        pass
+
+
+def get_daily_cache_stats(day=None):
+    """[{'group', 'hits', 'stale', 'misses', 'hit_rate'}] của 1 ngày (mặc định hôm nay); hit_rate tính cả stale."""
+    day = day or datetime.now().strftime('%Y%m%d')
+    try:
+        raw = current_app.redis_client.hgetall(_STATS_PREFIX + day) or {}
+    except Exception as e:
+        current_app.logger.error(f"SWR: lỗi đọc thống kê cache ngày {day}: {e}")
+        return []
+
+    stats = {}
+    for field, count in raw.items():
+        group, _, outcome = field.rpartition(':')
+        entry = stats.setdefault(group, {'group': group, 'hits': 0, 'stale': 0, 'misses': 0})
+        entry['misses' if outcome == 'miss' else 'stale' if outcome == 'stale' else 'hits'] += int(count)
+
+    for entry in stats.values():
+        total = entry['hits'] + entry['stale'] + entry['misses']
+        entry['hit_rate'] = round((entry['hits'] + entry['stale']) / total * 100, 1) if total else 0
+    return sorted(stats.values(), key=lambda e: e['group'])
+
+
+# --- ĐỌC / GHI ---
+def prime(key, compute, soft_ttl, hard_ttl, is_partial=None, version=None):
+    """Tính và ghi đè entry (làm nóng cache trước khi có người xem). Lỗi compute -> raise."""
+    app = current_app._get_current_object()
+    _store(app.cache, _KEY_PREFIX + key, compute(), soft_ttl, hard_ttl, is_partial, version)
+
+
+def get_or_refresh(key, compute, soft_ttl, hard_ttl, lock_timeout=None, wait_timeout=None, stats_group=None,
+                   is_partial=None, version=None):
+    """
+    Đọc cache theo kiểu stale-while-revalidate.
+    compute: hàm không tham số, KHÔNG được dùng request/session (có thể chạy ở luồng nền, chỉ có app context).
+    soft_ttl: số giây dữ liệu được coi là tươi. hard_ttl: số giây tối đa giữ dữ liệu cũ trong Redis.
+    lock_timeout: thời hạn lock tính lại (mặc định config.SWR_LOCK_TIMEOUT).
+    wait_timeout: khi cache trống và worker khác đang tính, chờ tối đa bấy nhiêu giây trước khi tự tính.
+    stats_group: tên nhóm trang để đếm hit / stale / miss trong ngày (None -> không đếm).
+    is_partial: hàm(value) -> True nếu kết quả thiếu phần (VD: khối fan_out lỗi) -> lưu ở trạng thái đã cũ.
+    version: phiên bản dữ liệu nguồn hiện tại (VD: data_version). Lưu kèm entry; entry khác phiên bản -> đã cũ
+             (trả bản cũ, làm mới nền) thay vì đổi key và bắt người xem đầu tiên chờ tính đồng bộ.
+    """
+    key = _KEY_PREFIX + key
+    lock_timeout = lock_timeout or config.SWR_LOCK_TIMEOUT
+    wait_timeout = config.SWR_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+    app = current_app._get_current_object()
+
+    try:
+        cache = app.cache
+        redis_client = app.redis_client
+        entry = cache.get(key)
+    except Exception as e:
+        app.logger.warning(f"SWR: Cache không khả dụng ({key}): {e}")
+        return compute()
+
+    # 1. Còn tươi (và đúng phiên bản dữ liệu)
+    if _is_fresh(entry, version):
+        record_cache_lookup(stats_group, 'hit')
+        return entry['value']
+
+    record_cache_lookup(stats_group, 'stale' if entry else 'miss')
+
+    # 2. Đã cũ: trả giá trị cũ, 1 worker làm mới ở nền
+    if entry:
+        try:
+            token = _acquire_lock(redis_client, key, lock_timeout)
+            if token:
+                _refresh_executor.submit(_refresh, app, key, compute, soft_ttl, hard_ttl, token, is_partial, version)
+        except Exception as e:
+            app.logger.warning(f"SWR: Không lấy được lock ({key}): {e}")
+        return entry['value']
+
+    # 3. Cache trống: 1 worker tính đồng bộ, các worker khác chờ kết quả
+    try:
+        token = _acquire_lock(redis_client, key, lock_timeout)
+        lock_busy = token is None
+    except Exception:
+        token, lock_busy = None, False  # Redis lỗi -> tự tính, không chờ
+
+    if lock_busy:
+        deadline = time.time() + wait_timeout
+        while time.time() < deadline:
+            time.sleep(config.SWR_POLL_INTERVAL)
+            try:
+                entry = cache.get(key)
+            except Exception:
+                entry = None
+            if entry:
+                return entry['value']
+        app.logger.warning(f"SWR: Chờ quá {wait_timeout}s ({key}) -> tự tính")
+
+    try:
+        value = compute()
+        try:
+            _store(cache, key, value, soft_ttl, hard_ttl, is_partial, version)
+        except Exception as e:
+            app.logger.warning(f"SWR: Không ghi được cache ({key}): {e}")
+        return value
+    finally:
+        if token:
+            _release_lock(redis_client, key, token)
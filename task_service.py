@@ -1,5 +1,6 @@
 from flask import current_app
 from db_manager import DBManager, safe_float
+from data_version import bump_data_version
 import datetime as dt # Import thư viện gốc với alias
 from datetime import datetime, timedelta # Import các đối tượng phổ biến
 import config
@@ -62,7 +63,7 @@ class TaskService:
         query = f"""
             SELECT [ROLE] FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ? AND RTRIM([ROLE]) = config.ROLE_ADMIN
         """
-        return bool(self.db.get_data(query, (user_code,)))
+        return bool(self.db.get_data_cached(query, (user_code,), tags=[config.CACHE_TAG_NGUOI_DUNG]))
     
     # THÊM: Helper để kiểm tra mối quan hệ Cấp trên (Req 2)
     def _is_helper_subordinate(self, helper_code, supervisor_code):
@@ -80,7 +81,7 @@ class TaskService:
             FROM {config.TEN_BANG_NGUOI_DUNG}
             WHERE USERCODE = ?
         """
-        data = self.db.get_data(query, (helper_code,))
+        data = self.db.get_data_cached(query, (helper_code,), tags=[config.CACHE_TAG_NGUOI_DUNG])
         
         if data and data[0].get('CAP TREN'):
             return data[0]['CAP TREN'].strip().upper() == supervisor_code.strip().upper()
@@ -176,6 +177,7 @@ class TaskService:
                 cursor.execute(log_query, (new_task_id, user_code, initial_note))
                 
                 conn.commit()
+                bump_data_version('tasks') # Khối Task trên Portal
                 return True
             else:
                 conn.rollback()
@@ -385,6 +387,7 @@ class TaskService:
             WHERE TaskID = ?
         """
         self.db.execute_non_query(update_object_query, (object_id, task_id))
+        bump_data_version('tasks')
         
         return log_id is not None
 
@@ -425,7 +428,10 @@ class TaskService:
         """
         params = (new_priority.upper(), task_id)
         try:
-            return self.db.execute_non_query(update_query, params)
+            updated = self.db.execute_non_query(update_query, params)
+            if updated:
+                bump_data_version('tasks')
+            return updated
         except Exception as e:
             current_app.logger.error(f"LỖI CẬP NHẬT PRIORITY: {e}")
             return False
@@ -452,12 +458,9 @@ class TaskService:
 
 
     # THÊM: Hàm tạo Task mới cho Helper (Req 3)
-    def create_help_request_task(self, helper_code, original_task_id, current_user_code, original_title, original_object_id, original_detail_content, new_task_type):
-        
-        # 1. KIỂM TRA MỐI QUAN HỆ (KD004 giao việc cho KD021)
-        is_delegated_task = self._is_helper_subordinate(helper_code, current_user_code)
-
-        # 2. XỬ LÝ NỘI DUNG VÀ ƯU TIÊN
+    def _build_help_request_params(self, is_delegated_task, helper_code, current_user_code, original_title, original_object_id, original_detail_content, new_task_type):
+        """Dựng bộ tham số INSERT cho 1 task hỗ trợ/giao việc (dùng chung cho tạo đơn lẻ và hàng loạt)."""
+        # XỬ LÝ NỘI DUNG VÀ ƯU TIÊN
         if is_delegated_task:
             # Logic Giao việc (Priority HIGH)
             new_priority = 'HIGH' 
@@ -469,12 +472,7 @@ class TaskService:
             new_title = f"HELP - [{current_user_code}] - {original_title}"
             new_detail_content = f"[Hãy giúp tôi:] {original_detail_content}"
 
-        # 3. CHÈN TASK MỚI (Đã thêm TaskType)
-        insert_query = f"""
-            INSERT INTO {self.TASK_TABLE} (UserCode, TaskDate, Status, Priority, Title, CapTren, ObjectID, DetailContent, LastUpdated, SupervisorCode, TaskType)
-            VALUES (?, GETDATE(), 'HELP_NEEDED', ?, ?, ?, ?, ?, GETDATE(), 'KD000', ?)
-        """
-        params = (
+        return (
             helper_code, 
             new_priority,
             new_title, 
@@ -483,9 +481,30 @@ class TaskService:
             new_detail_content,
             new_task_type  # Gán TaskType của task mới
         )
+
+    def _help_request_insert_query(self):
+        return f"""
+            INSERT INTO {self.TASK_TABLE} (UserCode, TaskDate, Status, Priority, Title, CapTren, ObjectID, DetailContent, LastUpdated, SupervisorCode, TaskType)
+            VALUES (?, GETDATE(), 'HELP_NEEDED', ?, ?, ?, ?, ?, GETDATE(), 'KD000', ?)
+        """
+
+    def create_help_request_task(self, helper_code, original_task_id, current_user_code, original_title, original_object_id, original_detail_content, new_task_type):
         
+        # 1. KIỂM TRA MỐI QUAN HỆ (KD004 giao việc cho KD021)
+        is_delegated_task = self._is_helper_subordinate(helper_code, current_user_code)
+
+        # 2. XỬ LÝ NỘI DUNG VÀ ƯU TIÊN
+        params = self._build_help_request_params(
+            is_delegated_task, helper_code, current_user_code,
+            original_title, original_object_id, original_detail_content, new_task_type
+        )
+
+        # 3. CHÈN TASK MỚI (Đã thêm TaskType)
         try:
-            return self.db.execute_non_query(insert_query, params)
+            created = self.db.execute_non_query(self._help_request_insert_query(), params)
+            if created:
+                bump_data_version('tasks')
+            return created
         except Exception as e:
             current_app.logger.error(f"LỖI TẠO TASK YÊU CẦU HỖ TRỢ/GIAO VIỆC: {e}")
             return False
@@ -575,6 +594,7 @@ class TaskService:
             WHERE TaskID = ?
         """
         self.db.execute_non_query(update_master_query, (progress_percent, new_status, content, task_id))
+        bump_data_version('tasks')
 
         return log_id
 
@@ -615,7 +635,7 @@ class TaskService:
     def get_users_by_department(self, dept_code):
         """Lấy danh sách UserCode thuộc một bộ phận."""
         query = f"SELECT USERCODE FROM {config.TEN_BANG_NGUOI_DUNG} WHERE [BO PHAN] = ?"
-        data = self.db.get_data(query, (dept_code,))
+        data = self.db.get_data_cached(query, (dept_code,), tags=[config.CACHE_TAG_NGUOI_DUNG])
         return [row['USERCODE'] for row in data] if data else []
 
     def process_help_request_multicast(self, helper_codes_list, original_task_id, current_user_code, detail_content):
@@ -639,19 +659,36 @@ class TaskService:
         if current_user_code in final_helpers:
             final_helpers.remove(current_user_code)
 
-        # 2. Vòng lặp tạo Task cho từng người
-        count = 0
+        final_helpers = [h for h in final_helpers if h]
+        if not final_helpers:
+            return 0
+
+        # 2. Xác định quan hệ cấp trên cho TẤT CẢ helper trong 1 lần (thay vì 2 query/người)
+        supervisor = (current_user_code or '').strip().upper()
+        is_admin = self._is_admin_user(current_user_code) if current_user_code else False
+        cap_tren_map = {}
+        if current_user_code and not is_admin:
+            placeholders = ', '.join('?' for _ in final_helpers)
+            query = f"SELECT USERCODE, [CAP TREN] FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE IN ({placeholders})"
+            for row in self.db.get_data(query, tuple(final_helpers)):
+                cap_tren_map[row['USERCODE'].upper()] = (row.get('CAP TREN') or '').strip().upper()
+
+        # 3. Tạo Task cho từng người bằng 1 lần ghi hàng loạt
+        rows = []
         for helper in final_helpers:
-            self.create_help_request_task(
-                helper_code=helper,
-                original_task_id=original_task_id,
-                current_user_code=current_user_code,
-                original_title=original_task.get('Title', 'N/A'),
-                original_object_id=original_task.get('ObjectID', None),
-                original_detail_content=detail_content,
-                new_task_type='NOI_BO' # Hoặc giữ nguyên loại cũ
-            )
-            count += 1
+            is_delegated_task = bool(current_user_code) and (is_admin or cap_tren_map.get(helper.strip().upper()) == supervisor)
+            rows.append(self._build_help_request_params(
+                is_delegated_task, helper, current_user_code,
+                original_task.get('Title', 'N/A'),
+                original_task.get('ObjectID', None),
+                detail_content,
+                'NOI_BO' # Hoặc giữ nguyên loại cũ
+            ))
+
+        if not self.db.bulk_execute(self._help_request_insert_query(), rows):
+            current_app.logger.error("LỖI TẠO TASK YÊU CẦU HỖ TRỢ/GIAO VIỆC (hàng loạt)")
+            return 0
+        bump_data_version('tasks')
             
-        return count # Trả về số lượng task đã tạo    
+        return len(rows) # Trả về số lượng task đã tạo    
     
\ No newline at end of file
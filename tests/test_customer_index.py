@@ -0,0 +1,64 @@
+# tests/test_customer_index.py
+# --- MỐC LÀM MỚI TĂNG DẦN CỦA CustomerNameIndex (LastModifyDate NULL -> NaT) ---
+# Chạy: python -m pytest -q tests/test_customer_index.py
+# Không cần SQL Server: DB giả trả dòng giống fetch_data (cột ngày NULL -> pd.NaT) và ghi lại tham số mốc.
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'test')
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+from customer_index import CustomerNameIndex
+
+
+class FakeDB:
+    """DB giả: trả `rows` cho mỗi lần nạp và ghi lại tham số (mốc LastModifyDate) của từng câu."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = []
+
+    def fetch_data(self, query, params=None, readonly=False):
+        self.params.append(params)
+        return self.rows
+
+
+def row(obj_id, name, modified):
+    return {'ID': obj_id, 'FullName': name, 'ObjectName': name, 'Address': '', 'ModifiedAt': modified}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def test_null_modify_date_does_not_become_watermark(app):
+    latest = pd.Timestamp(datetime(2026, 10, 1, 8, 30))
+    db = FakeDB([row('KH001', 'Hoa Sen', pd.NaT), row('KH002', 'Sen Vang', latest)])
+    index = CustomerNameIndex(db, refresh_seconds=10 ** 9, full_reload_seconds=10 ** 9)
+
+    index.refresh()
+    assert index._watermark == latest
+
+    index.refresh()
+    assert db.params[-1] == (latest,)
+
+
+def test_all_null_modify_dates_keep_full_reload(app):
+    db = FakeDB([row('KH001', 'Hoa Sen', pd.NaT)])
+    index = CustomerNameIndex(db, refresh_seconds=10 ** 9, full_reload_seconds=10 ** 9)
+
+    index.refresh()
+    assert index._watermark is None
+
+    index.refresh()
+    assert db.params[-1] is None
+    assert [e[4] for e in index._state['entries']] == ['KH001']
@@ -0,0 +1,91 @@
+# tests/test_inject_user.py
+# --- SỐ CÂU SQL MỖI LẦN RENDER (context processor inject_user + UserService.get_user_context) ---
+# Chạy: python -m pytest -q tests/test_inject_user.py
+# Không cần SQL Server/Redis: DB giả đếm số câu, cache dùng SimpleCache của flask_caching.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('APP_SECRET_KEY', 'test')
+
+import pytest
+from flask import Flask, render_template_string, session
+from flask_caching import Cache
+
+from factory import inject_user
+from services.user_service import UserService
+
+NAVBAR_TEMPLATE = "{{ user_context.stats.Level }}|{{ user_context.stats.ProgressPercent }}|{{ user_context.unlocked_themes|join(',') }}"
+
+
+class CountingDB:
+    """DB giả: trả về 1 dòng profile (đã JOIN XP cấp kế + cờ Theme) và đếm mọi câu SQL."""
+
+    def __init__(self):
+        self.queries = []
+        self.level = 3
+
+    def get_data(self, query, params=None):
+        self.queries.append(query)
+        return [{
+            'USERCODE': 'KD010', 'SHORTNAME': 'KD010', 'Level': self.level, 'CurrentXP': 500,
+            'TotalCoins': 90, 'ThemeColor': 'dark', 'Title': '', 'Nickname': '', 'AvatarUrl': None,
+            'NextLevelXP': 2000, 'Theme_dark': 1, 'Theme_fantasy': 0, 'Theme_adorable': 0,
+        }]
+
+    def execute_non_query(self, query, params=None):
+        self.queries.append(query)
+        return True
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+    app.user_service = UserService(CountingDB())
+    app.context_processor(inject_user)
+    return app
+
+
+def render_navbar(app, user_code='KD010'):
+    """Render 1 trang như request thật: inject_user chạy qua context processor."""
+    with app.test_request_context('/'):
+        session['user_code'] = user_code
+        return render_template_string(NAVBAR_TEMPLATE)
+
+
+def test_cold_cache_loads_context_in_one_query(app):
+    assert render_navbar(app) == '3|25|light,dark'
+    assert len(app.user_service.db.queries) == 1
+
+
+def test_warm_cache_renders_without_queries(app):
+    render_navbar(app)
+    app.user_service.db.queries.clear()
+
+    for _ in range(5):
+        assert render_navbar(app) == '3|25|light,dark'
+    assert app.user_service.db.queries == []
+
+
+def test_invalidate_user_context_reloads_once(app):
+    render_navbar(app)
+    db = app.user_service.db
+    db.queries.clear()
+    db.level = 4
+
+    with app.app_context():
+        app.user_service.invalidate_user_context('KD010')
+
+    assert render_navbar(app) == '4|25|light,dark'
+    assert render_navbar(app) == '4|25|light,dark'
+    assert len(db.queries) == 1
+
+
+def test_anonymous_render_skips_db(app):
+    with app.test_request_context('/'):
+        html = render_template_string(NAVBAR_TEMPLATE)
+    assert html == '1|0|light'
+    assert app.user_service.db.queries == []
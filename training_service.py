@@ -1,18 +1,21 @@
 import random
-import re
 import difflib
 import json
 import os
-import PyPDF2
 from datetime import datetime, timedelta
 import google.generativeai as genai
 from flask import current_app
+from knowledge_index import KnowledgeIndex
+from page_index import ensure_page_index, retrieve_context, resolve_page_citations
+import config
 
 class TrainingService:
     def __init__(self, db_manager, gamification_service):
         self.db = db_manager
         self.gamification = gamification_service
         self.ACTIVITY_CODE_WIN = 'DAILY_QUIZ_WIN'
+        # Chỉ mục BM25 ngân hàng câu hỏi (lưu đĩa, đồng bộ tăng dần) cho lookup_knowledge của Chatbot
+        self.knowledge_index = KnowledgeIndex(db_manager) if config.KNOWLEDGE_INDEX_ENABLED else None
 
     # =========================================================================
     # PHẦN 1: GAME & DAILY CHALLENGE
@@ -21,6 +24,15 @@ class TrainingService:
     # 1. TÌM KIẾM KIẾN THỨC (Cho Chatbot)
     def search_knowledge(self, query):
         if not query: return None
+
+        # Đường chính: BM25 (xếp hạng theo BM25, ngưỡng chọn theo tỉ lệ từ khóa khớp như cũ)
+        if self.knowledge_index:
+            ranked = self.knowledge_index.search(query, k=10)
+            if ranked is not None:
+                if not ranked: return "⚠️ Không tìm thấy kiến thức nào khớp."
+                return self._pick_knowledge_answer([(coverage, row) for _, coverage, row in ranked])
+
+        # Dự phòng (chỉ mục chưa có dữ liệu): LIKE trên Content
         stop_words = {'là', 'gì', 'của', 'hãy', 'nêu', 'cho', 'biết', 'trong', 'với', 'tại', 'sao', 'như', 'thế', 'nào', 'em', 'anh', 'chị', 'ad', 'bot', 'bạn', 'tôi', 'mình'}
         clean_query = query.lower()
         for char in "?!,.:;\"'()[]{}":
@@ -50,6 +62,10 @@ class TrainingService:
             scored_candidates.append((overlap_score, row))
 
         scored_candidates.sort(key=lambda x: x[0], reverse=True)
+        return self._pick_knowledge_answer(scored_candidates)
+
+    def _pick_knowledge_answer(self, scored_candidates):
+        """scored_candidates: list (tỉ lệ từ khóa khớp, row) đã xếp hạng. Khớp rõ -> trả lời, không thì gợi ý tối đa 3 câu."""
         if not scored_candidates: return None
         best_score, best_row = scored_candidates[0]
         
@@ -86,24 +102,33 @@ class TrainingService:
         user_groups = [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)]
         messages_to_send = []
 
-        for idx, group in enumerate(user_groups):
-            if idx >= len(questions): break
-            q_id = questions[idx]['ID']
-            mail_title = f"⚡ Thử thách N3H lúc {datetime.now().strftime('%H:%M')}"
-            
-            mail_content = f"""
+        # Gom tham số cho cả 3 bước rồi ghi hàng loạt trong 1 transaction (thay vì 3 round trip/user)
+        expire_rows, session_rows, mail_rows = [], [], []
+        mail_title = f"⚡ Thử thách N3H lúc {datetime.now().strftime('%H:%M')}"
+        mail_content = f"""
 Thử thách mới đã xuất hiện! <br>
 <a href='/training/daily-challenge' class='btn btn-sm btn-primary mt-2'>Vào Đấu Trường Ngay</a>
 """
+        # Tạo phiên mới (Hạn 15 phút)
+        expired_at = datetime.now() + timedelta(minutes=15)
+
+        for idx, group in enumerate(user_groups):
+            if idx >= len(questions): break
+            q_id = questions[idx]['ID']
             for user_code in group:
-                # Đánh dấu phiên cũ hết hạn
-                self.db.execute_non_query("UPDATE TRAINING_DAILY_SESSION SET Status='EXPIRED' WHERE UserCode=? AND Status='PENDING'", (user_code,))
-                # Tạo phiên mới (Hạn 4 tiếng)
-                expired_at = datetime.now() + timedelta(minutes=15)
-                self.db.execute_non_query("INSERT INTO TRAINING_DAILY_SESSION (UserCode, QuestionID, Status, ExpiredAt) VALUES (?, ?, 'PENDING', ?)", (user_code, q_id, expired_at))
-                # Gửi thông báo
-                self.db.execute_non_query("INSERT INTO TitanOS_Game_Mailbox (UserCode, Title, Content, CreatedTime, IsClaimed) VALUES (?, ?, ?, GETDATE(), 0)", (user_code, mail_title, mail_content))
+                expire_rows.append((user_code,))
+                session_rows.append((user_code, q_id, expired_at))
+                mail_rows.append((user_code, mail_title, mail_content))
                 messages_to_send.append({"user_code": user_code})
+
+        success = self.db.bulk_transaction([
+            # Đánh dấu phiên cũ hết hạn
+            ("UPDATE TRAINING_DAILY_SESSION SET Status='EXPIRED' WHERE UserCode=? AND Status='PENDING'", expire_rows),
+            ("INSERT INTO TRAINING_DAILY_SESSION (UserCode, QuestionID, Status, ExpiredAt) VALUES (?, ?, 'PENDING', ?)", session_rows),
+            # Gửi thông báo
+            ("INSERT INTO TitanOS_Game_Mailbox (UserCode, Title, Content, CreatedTime, IsClaimed) VALUES (?, ?, ?, GETDATE(), 0)", mail_rows),
+        ])
+        if not success: return []
         return messages_to_send
 
     # 3. LẤY TRẠNG THÁI CHALLENGE (Cho Frontend hiển thị)
@@ -419,33 +444,29 @@ Thử thách mới đã xuất hiện! <br>
         if file_path.startswith('/'): 
             real_path = os.path.join(current_app.root_path, file_path.lstrip('/'))
 
-        if not os.path.exists(real_path):
-             return {"text": f"Không tìm thấy file gốc: {file_path}", "page": None}
-
-        # Live Read PDF
-        pdf_text = ""
+        # Chỉ mục trang (<pdf>.pidx, dựng 1 lần): chọn top-k trang liên quan thay vì đọc lại PDF mỗi câu hỏi
         try:
-            reader = PyPDF2.PdfReader(real_path)
-            for i, page in enumerate(reader.pages[:10]): # Đọc 10 trang đầu
-                text = page.extract_text()
-                if text: pdf_text += f"\n--- TRANG {i+1} ---\n{text}"
+            index = ensure_page_index(real_path)
         except Exception as e:
             return {"text": f"Lỗi đọc PDF: {str(e)}", "page": None}
+        if index is None:
+             return {"text": f"Không tìm thấy file gốc: {file_path}", "page": None}
 
+        pdf_text, ranked_pages = retrieve_context(index, user_question)
         if not pdf_text.strip():
-            return {"text": "Tài liệu này là file ảnh scan, AI chưa đọc được chữ.", "page": None}
+            if not any(index.page_lengths):
+                return {"text": "Tài liệu này là file ảnh scan, AI chưa đọc được chữ.", "page": None}
+            return {"text": "Không tìm thấy thông tin liên quan trong tài liệu này.", "page": None}
 
         try:
             model = genai.GenerativeModel('gemini-2.5-flash')
-            prompt = f"Trả lời câu hỏi dựa trên tài liệu. Nếu thấy thông tin ở trang nào, ghi [[PAGE:số_trang]]. Câu hỏi: {user_question}. Dữ liệu: {pdf_text[:15000]}"
+            prompt = f"Trả lời câu hỏi dựa trên tài liệu. Nếu thấy thông tin ở trang nào, ghi [[PAGE:số_trang]]. Câu hỏi: {user_question}. Dữ liệu: {pdf_text}"
             res = model.generate_content(prompt)
             reply = res.text
             
-            target_page = None
-            match = re.search(r'\[\[PAGE:(\d+)\]\]', reply)
-            if match:
-                target_page = int(match.group(1))
-                reply = reply.replace(match.group(0), f"(Xem trang {target_page})")
+            # Trang để UI cuộn: trang khớp nhất theo chỉ mục (AI trích trang khác trong số trang đã gửi thì theo AI,
+            # trang không được gửi -> bỏ tag thay vì ghi sai số trang)
+            reply, target_page = resolve_page_citations(reply, ranked_pages)
             return {"text": reply, "page": target_page}
         except Exception as e:
             return {"text": f"Lỗi AI: {e}", "page": None}
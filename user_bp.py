@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, flash, current_app
 from utils import login_required, permission_required
+from backlog_snapshot import SalesBacklogSnapshot
+from cache_warmup import get_warmup_report
 import config
 import pandas as pd # <--- [THÊM] Import thư viện này để xử lý lỗi ngày tháng
 
@@ -51,6 +53,30 @@ def api_update_user():
     success = current_app.user_service.update_user(data)
     return jsonify({'success': success})
 
+@user_bp.route('/api/admin/sql_stats', methods=['GET'])
+@login_required
+def api_sql_stats():
+    """
+    Thống kê SQL theo route (số câu, thời gian DB, N+1) + hit/miss query cache theo tag
+    + số lần tính lại backlog tránh được nhờ ảnh chụp dùng chung
+    + làm nóng cache Dashboard hôm nay (thời gian từng lần, tỉ lệ hit theo trang). ?reset=1 để xóa số liệu.
+    """
+    if not check_admin_access(): return jsonify({}), 403
+    profiler = current_app.db_manager.profiler
+    backlog = SalesBacklogSnapshot.get_stats()
+    warmup = get_warmup_report()
+    if not profiler:
+        return jsonify({'enabled': False, 'routes': [], 'query_cache': current_app.db_manager.get_query_cache_stats(),
+                        'backlog_snapshot': backlog, 'cache_warmup': warmup})
+    routes = profiler.get_route_stats()
+    query_cache = current_app.db_manager.get_query_cache_stats()
+    if request.args.get('reset') == '1':
+        profiler.reset()
+        current_app.db_manager.reset_query_cache_stats()
+        SalesBacklogSnapshot.reset_stats()
+    return jsonify({'enabled': True, 'routes': routes, 'query_cache': query_cache, 'backlog_snapshot': backlog,
+                    'cache_warmup': warmup})
+
 @user_bp.route('/api/permissions/matrix', methods=['GET'])
 @login_required
 def api_get_permissions():
@@ -270,6 +296,7 @@ def claim_mail():
         cursor.execute("UPDATE TitanOS_Game_Mailbox SET IsClaimed=1, ClaimedTime=GETDATE() WHERE MailID=?", (mail_id,))
         
         conn.commit()
+        current_app.user_service.invalidate_user_context(user_code)
         return jsonify({'success': True, 'level_up': level_up, 'new_level': new_lvl, 'coins_earned': coins})
         
     except Exception as e:
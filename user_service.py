@@ -3,8 +3,12 @@ import config
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from utils import bump_credential_version
 
 class UserService:
+    # Theme mua trong Shop được hiện trên switcher của Navbar (Light luôn có)
+    UNLOCKABLE_THEMES = ('dark', 'fantasy', 'adorable')
+
     def __init__(self, db_manager):
         self.db = db_manager
 
@@ -55,6 +59,7 @@ class UserService:
             # Init Stats & Profile (Dùng cột chuẩn EquippedTheme)
             self.db.execute_non_query("INSERT INTO TitanOS_UserStats (UserCode, Level, CurrentXP, TotalCoins) VALUES (?, 1, 0, 0)", (user_data['user_code'],))
             self.db.execute_non_query("INSERT INTO TitanOS_UserProfile (UserCode, EquippedTheme, EquippedPet) VALUES (?, 'light', 'fox')", (user_data['user_code'],))
+            self.db.invalidate_tags(config.CACHE_TAG_NGUOI_DUNG)
             
             return {'success': True, 'message': 'Tạo nhân viên thành công!'}
         except Exception as e:
@@ -73,6 +78,9 @@ class UserService:
                 user_data['user_code']
             )
             self.db.execute_non_query(sql, params)
+            self.db.invalidate_tags(config.CACHE_TAG_NGUOI_DUNG)
+            self.invalidate_user_context(user_data['user_code'])
+            bump_credential_version(user_data['user_code']) # Buộc đăng nhập lại để nhận Role/Bộ phận mới
             return {'success': True, 'message': 'Cập nhật thành công!'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -84,6 +92,9 @@ class UserService:
                 self.db.execute_non_query(f"DELETE FROM {t} WHERE UserCode=?", (user_code,))
             
             self.db.execute_non_query(f"DELETE FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?", (user_code,))
+            self.db.invalidate_tags(config.CACHE_TAG_NGUOI_DUNG)
+            self.invalidate_user_context(user_code)
+            bump_credential_version(user_code)
             return {'success': True, 'message': 'Đã xóa nhân viên.'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -91,6 +102,7 @@ class UserService:
     def admin_reset_password(self, user_code, new_pass):
         try:
             self.db.execute_non_query(f"UPDATE {config.TEN_BANG_NGUOI_DUNG} SET PASSWORD = ? WHERE USERCODE = ?", (new_pass, user_code))
+            bump_credential_version(user_code)
             return {'success': True, 'message': 'Đã reset mật khẩu.'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -157,11 +169,20 @@ class UserService:
     # 3. GAMIFICATION & PROFILE (USER FRONTEND) - [ĐÃ SỬA CỘT DB]
     # =========================================================================
     
-    def get_user_profile(self, user_code):
+    def get_user_profile(self, user_code, include_themes=False):
         """
         Lấy thông tin profile.
         [FIX]: Map đúng cột EquippedTheme của DB thành ThemeColor cho Frontend.
+        XP cấp kế tiếp (TitanOS_Game_Levels) lấy chung 1 câu; include_themes=True thêm cờ Theme_<mã>
+        cho từng theme trong UNLOCKABLE_THEMES (dùng cho get_user_context).
         """
+        theme_columns = ''
+        if include_themes:
+            theme_columns = ''.join(
+                f", CASE WHEN EXISTS (SELECT 1 FROM TitanOS_UserInventory AS I "
+                f"WHERE I.UserCode = T1.USERCODE AND I.ItemCode = '{t}') THEN 1 ELSE 0 END AS [Theme_{t}]"
+                for t in self.UNLOCKABLE_THEMES
+            )
         query = f"""
             SELECT 
                 T1.USERCODE, T1.USERNAME, T1.SHORTNAME, T1.[CHUC VU], T1.[BO PHAN], T1.EMAIL,
@@ -173,10 +194,13 @@ class UserService:
                 ISNULL(P.EquippedPet, '') as EquippedPet,
                 ISNULL(P.IsFlexing, 0) as IsFlexing,
                 P.AvatarUrl,
-                ISNULL(P.Nickname, '') as Nickname -- <--- THÊM DÒNG NÀY
+                ISNULL(P.Nickname, '') as Nickname, -- <--- THÊM DÒNG NÀY
+                ISNULL(L.XP_Required, 2000) as NextLevelXP
+                {theme_columns}
             FROM {config.TEN_BANG_NGUOI_DUNG} AS T1
             LEFT JOIN TitanOS_UserStats AS S ON T1.USERCODE = S.UserCode
             LEFT JOIN TitanOS_UserProfile AS P ON T1.USERCODE = P.UserCode
+            LEFT JOIN TitanOS_Game_Levels AS L ON L.Level = ISNULL(S.Level, 1)
             WHERE T1.USERCODE = ?
         """
         data = self.db.get_data(query, (user_code,))
@@ -197,18 +221,51 @@ class UserService:
                 user_profile['ThemeColor'] = 'light'
              except: pass
 
-        # XP Calculation
-        current_lvl = user_profile['Level']
+        # XP Calculation (NextLevelXP đã JOIN sẵn TitanOS_Game_Levels)
         current_xp = user_profile['CurrentXP']
-        xp_data = self.db.get_data("SELECT XP_Required FROM TitanOS_Game_Levels WHERE Level = ?", (current_lvl,))
-        next_level_xp = xp_data[0]['XP_Required'] if xp_data else 2000
+        next_level_xp = user_profile['NextLevelXP']
         
         progress_percent = int((current_xp / next_level_xp) * 100) if next_level_xp > 0 else 100
-        user_profile['NextLevelXP'] = next_level_xp
         user_profile['ProgressPercent'] = min(progress_percent, 100)
 
         return user_profile
 
+    def get_user_context(self, user_code):
+        """
+        Profile + Stats + Theme + Theme đã mở khóa cho Navbar (inject_user), cache Redis theo user.
+        Phải gọi invalidate_user_context khi XP/Coins/Trang bị/Inventory thay đổi.
+        Cache trống -> đúng 1 câu SQL (Profile + Stats + XP cấp kế + cờ Theme).
+        """
+        cache_key = f"user_ctx_{user_code}"
+        try:
+            cached = current_app.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            current_app.logger.warning(f"Cache Warning (user_ctx): {e}")
+
+        profile = self.get_user_profile(user_code, include_themes=True)
+        unlocked_themes = ['light']
+        if profile:
+            # Chỉ lọc lấy các item là theme để đưa vào switcher
+            for t in self.UNLOCKABLE_THEMES:
+                if profile.pop(f'Theme_{t}', 0):
+                    unlocked_themes.append(t)
+
+        context = {'profile': profile, 'unlocked_themes': unlocked_themes}
+        try:
+            current_app.cache.set(cache_key, context, timeout=config.USER_CONTEXT_CACHE_TTL)
+        except Exception:
+            pass
+        return context
+
+    def invalidate_user_context(self, user_code):
+        """Xóa cache Navbar của user (gọi sau mọi thay đổi XP/Coins/Profile/Inventory)."""
+        try:
+            current_app.cache.delete(f"user_ctx_{user_code}")
+        except Exception as e:
+            current_app.logger.warning(f"Không xóa được cache user_ctx {user_code}: {e}")
+
     def update_user_theme_preference(self, user_code, theme_code):
         """Cập nhật theme vào bảng UserProfile (cột EquippedTheme)."""
         # Kiểm tra tồn tại
@@ -216,6 +273,7 @@ class UserService:
              self.db.execute_non_query("INSERT INTO TitanOS_UserProfile (UserCode, EquippedTheme) VALUES (?, ?)", (user_code, theme_code))
         else:
              self.db.execute_non_query("UPDATE TitanOS_UserProfile SET EquippedTheme = ? WHERE UserCode = ?", (theme_code, user_code))
+        self.invalidate_user_context(user_code)
         return True
 
     def update_avatar(self, user_code, file):
@@ -234,6 +292,7 @@ class UserService:
                 self.db.execute_non_query("UPDATE TitanOS_UserProfile SET AvatarUrl=? WHERE UserCode=?", (db_url, user_code))
             else:
                 self.db.execute_non_query("INSERT INTO TitanOS_UserProfile (UserCode, AvatarUrl, EquippedTheme) VALUES (?, ?, 'light')", (user_code, db_url))
+            self.invalidate_user_context(user_code)
             return {'success': True, 'url': db_url}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -261,6 +320,7 @@ class UserService:
         try:
             self.db.execute_non_query("UPDATE TitanOS_UserStats SET TotalCoins = TotalCoins - ? WHERE UserCode = ?", (price, user_code))
             self.db.execute_non_query("INSERT INTO TitanOS_UserInventory (UserCode, ItemCode, AcquiredDate, IsActive) VALUES (?, ?, GETDATE(), 1)", (user_code, item_code))
+            self.invalidate_user_context(user_code)
             return {'success': True, 'message': f'Mua thành công "{item_name}"!'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
@@ -289,6 +349,7 @@ class UserService:
                 self.db.execute_non_query("INSERT INTO TitanOS_UserProfile (UserCode, IsFlexing, EquippedTheme) VALUES (?, 1, 'light')", (user_code,))
             
             self.db.execute_non_query(f"UPDATE TitanOS_UserProfile SET {target_col} = ?, IsFlexing = 1 WHERE UserCode = ?", (item_code, user_code))
+            self.invalidate_user_context(user_code)
             return {'success': True, 'message': 'Đã trang bị!'}
         
         return {'success': True, 'message': 'Đã kích hoạt!'}
@@ -318,6 +379,7 @@ class UserService:
             cursor.execute("DELETE FROM TitanOS_UserInventory WHERE ID = ?", (item_id,))
             
             conn.commit()
+            self.invalidate_user_context(user_code)
             return {'success': True, 'message': f'Đã đổi tên thành công sang: "{new_nickname}"'}
         except Exception as e:
             if conn: conn.rollback()
@@ -336,6 +398,7 @@ class UserService:
             return {'success': False, 'message': 'Mật khẩu cũ không đúng!'}
         try:
             self.db.execute_non_query(f"UPDATE {config.TEN_BANG_NGUOI_DUNG} SET PASSWORD = ? WHERE USERCODE = ?", (new_pass, user_code))
+            bump_credential_version(user_code)
             return {'success': True, 'message': 'Đổi mật khẩu thành công!'}
         except Exception as e:
             return {'success': False, 'message': str(e)}
\ No newline at end of file
@@ -3,6 +3,7 @@ from flask import session, redirect, url_for, flash, request, current_app, jsoni
 from functools import wraps
 import config
 import os
+import uuid
 from datetime import datetime
 from werkzeug.utils import secure_filename
 
@@ -25,6 +26,41 @@ def get_user_ip():
     else:
        return request.remote_addr
 
+# --- Phiên bản thông tin đăng nhập (Redis) ---
+# Mỗi user có 1 token ngẫu nhiên trong Redis, đổi token mới khi đổi mật khẩu / Admin sửa user.
+# Session lưu token lúc đăng nhập -> login_required so sánh O(1), không cần query DB.
+# Dùng token ngẫu nhiên (không dùng bộ đếm): Redis mất key (flush/restart) thì token tạo lại
+# không thể trùng token cũ -> session cũ không lọt qua đường nhanh mà phải kiểm tra lại DB.
+def _credential_version_key(user_code):
+    return f"cred_ver:{user_code}"
+
+def get_credential_version(user_code):
+    """Phiên bản hiện tại (chuỗi) hoặc None nếu Redis chưa có key."""
+    return current_app.redis_client.get(_credential_version_key(user_code))
+
+def stamp_credential_version(user_code):
+    """Tạo token nếu chưa có và trả về phiên bản hiện tại (gọi khi đăng nhập / sau khi kiểm tra DB)."""
+    try:
+        key = _credential_version_key(user_code)
+        current_app.redis_client.set(key, uuid.uuid4().hex, nx=True)
+        return current_app.redis_client.get(key)
+    except Exception as e:
+        current_app.logger.warning(f"Không lấy được cred_ver {user_code}: {e}")
+        return None
+
+def bump_credential_version(user_code):
+    """
+    Vô hiệu hóa mọi phiên đăng nhập hiện có của user (đổi mật khẩu, Admin sửa/xóa user).
+    Trả về phiên bản mới (None nếu Redis lỗi) để phiên đang thao tác tự đóng dấu lại nếu cần giữ đăng nhập.
+    """
+    token = uuid.uuid4().hex
+    try:
+        current_app.redis_client.set(_credential_version_key(user_code), token)
+        return token
+    except Exception as e:
+        current_app.logger.error(f"Lỗi tăng cred_ver {user_code}: {e}")
+        return None
+
 # --- Decorator Login ---
 def login_required(f):
     @wraps(f)
@@ -37,17 +73,33 @@ def login_required(f):
         
         if user_code and security_hash:
             try:
-                db = current_app.db_manager
-                # Sử dụng tham số binding để tránh SQL Injection
-                query = f"SELECT [PASSWORD] FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?"
-                data = db.get_data(query, (user_code,))
-                
-                if not data or data[0]['PASSWORD'] != security_hash:
+                current_ver = get_credential_version(user_code)
+            except Exception:
+                current_ver = None # Redis lỗi -> kiểm tra DB như cũ
+
+            session_ver = session.get('cred_ver')
+            if current_ver is not None and session_ver is not None:
+                # Đường nhanh: so sánh phiên bản, không query DB
+                if session_ver != current_ver:
                     session.clear()
                     flash("Phiên đăng nhập hết hạn.", "warning")
                     return redirect(url_for('login'))
-            except Exception:
-                pass 
+            else:
+                # Session cũ (chưa có cred_ver) hoặc Redis mất key -> kiểm tra DB 1 lần rồi đóng dấu phiên bản
+                try:
+                    db = current_app.db_manager
+                    # Sử dụng tham số binding để tránh SQL Injection
+                    query = f"SELECT [PASSWORD] FROM {config.TEN_BANG_NGUOI_DUNG} WHERE USERCODE = ?"
+                    data = db.get_data(query, (user_code,))
+                    
+                    if not data or data[0]['PASSWORD'] != security_hash:
+                        session.clear()
+                        flash("Phiên đăng nhập hết hạn.", "warning")
+                        return redirect(url_for('login'))
+
+                    session['cred_ver'] = stamp_credential_version(user_code)
+                except Exception:
+                    pass 
                 
         return f(*args, **kwargs)
     return decorated_function